@@ -0,0 +1,231 @@
+import os
+import argparse
+import csv
+import glob
+import json
+import sqlite3
+import sys
+from datetime import datetime
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import start_run
+from config_schema import ConfigSchema, Field
+from artifact_registry import ArtifactRegistry, sha256_file
+from process_runner import ProcessStep, run_processes
+from inference_benchmark import model_format, thread_env
+
+WORKER_SCRIPT = os.path.join(PROJECT_ROOT, "utils", "inference_benchmark.py")
+FIELDNAMES = ["timestamp", "model_path", "format", "digest", "threads", "batch_size", "latency_p50_ms", "latency_p90_ms",
+              "latency_p99_ms", "samples_per_sec", "calls", "regression", "error"]
+
+# 設定スキーマ (yggdrasil.py が実行前に検証する)
+CONFIG_SCHEMA = ConfigSchema({
+    "model_paths": Field((list, str), [os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras")], item_type=str), # パスまたはglobのリスト (カンマ区切り文字列も可)。.keras/.h5, .tflite, joblib を計測できる
+    "batch_sizes": Field(list, [1, 8, 32, 128], item_type=int), # 計測するバッチサイズ (1 は1件ずつの推論の遅延)
+    "threads": Field(list, [1, 0], item_type=int), # 計測する推論のスレッド数 (0 はライブラリの既定)
+    "requests": Field(int, 200, min=1), # バッチサイズ1での計測回数 (バッチサイズに反比例して減らす)
+    "warmup": Field(int, 10, min=0),
+    "min_seconds": Field(float, 1.0, min=0), # バッチサイズごとの最短の計測時間 (秒)
+    "output_file": Field(str, os.path.join(PROJECT_ROOT, "logs", "inference_benchmark.csv")),
+    "regression_threshold": Field(float, 0.2, min=0), # 前回の計測より p50 の遅延がこの割合を超えて増えたら回帰として警告する
+    "fail_on_regression": Field(bool, False), # 回帰があれば終了コード1で終了する (CIなどでの検出用)
+    "timeout_seconds": Field(int, 600, min=1), # モデルとスレッド数の組み合わせごとの制限時間
+    "parent_run_id": Field(str, None) # 指定した場合、計測結果をこのMLflow Runの子Runとして記録する
+})
+
+# デフォルト設定
+DEFAULT_CONFIG = CONFIG_SCHEMA.defaults()
+
+def resolve_model_paths(model_paths):
+    """
+    パス・globパターンのリスト (またはカンマ区切り文字列) を、重複のないモデルパスのリストに展開する。
+    """
+    if isinstance(model_paths, str):
+        model_paths = [p.strip() for p in model_paths.split(",") if p.strip()]
+
+    resolved = []
+    for pattern in model_paths:
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(PROJECT_ROOT, pattern)
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in resolved:
+                resolved.append(path)
+    return resolved
+
+def benchmark_model(model_path, threads, batch_sizes, requests, warmup, min_seconds, timeout_seconds):
+    """
+    1つのモデルを指定したスレッド数ごとに別プロセスで計測し、(スレッド数, バッチサイズ) ごとの結果の行を返す。
+    スレッド数は BLAS や TF のランタイムがプロセスの起動時に決めるため、組み合わせごとにプロセスを分ける。
+    """
+    digest = sha256_file(model_path)
+    rows = []
+    for thread_count in threads:
+        command = [sys.executable, WORKER_SCRIPT, "--model_path", model_path, "--threads", str(thread_count),
+                   "--batch_sizes", ",".join(str(size) for size in batch_sizes), "--requests", str(requests),
+                   "--warmup", str(warmup), "--min_seconds", str(min_seconds)]
+        # 計測結果の行を混ぜないよう、ワーカーの出力は表示せず末尾だけを使う
+        result, = run_processes([ProcessStep(f"threads{thread_count}", command, env=thread_env(thread_count), timeout=timeout_seconds)],
+                                on_line=lambda step, stream_name, line: None)
+        measured = [json.loads(line) for line in result.tail if line.startswith("{")]
+        error = "" if result.status == "ok" else (result.output.strip().splitlines() or [result.status])[-1]
+        for batch_size in batch_sizes:
+            row = {"model_path": model_path, "format": model_format(model_path), "digest": digest, "threads": thread_count,
+                   "batch_size": batch_size, "regression": "", "error": ""}
+            match = next((item for item in measured if item["batch_size"] == batch_size), None)
+            if match:
+                row.update(match)
+            else:
+                row["error"] = error or "no result"
+            rows.append(row)
+    return rows
+
+def load_previous_results(output_file):
+    """
+    前回までの計測結果から、(モデルのパス, 形式, スレッド数, バッチサイズ) ごとの最新の p50 の遅延を返す。
+    """
+    previous = {}
+    if not output_file or not os.path.isfile(output_file):
+        return previous
+    with open(output_file, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            try:
+                previous[(row["model_path"], row["format"], int(row["threads"]), int(row["batch_size"]))] = float(row["latency_p50_ms"])
+            except (KeyError, TypeError, ValueError):
+                continue
+    return previous
+
+def check_regressions(rows, previous, threshold):
+    """
+    前回の計測より p50 の遅延が threshold の割合を超えて増えた行に、増加率を記録して返す。
+    """
+    regressions = []
+    for row in rows:
+        baseline = previous.get((row["model_path"], row["format"], int(row["threads"]), int(row["batch_size"])))
+        if row["error"] or not baseline:
+            continue
+        ratio = row["latency_p50_ms"] / baseline
+        if ratio > 1 + threshold:
+            row["regression"] = f"{ratio:.2f}x"
+            regressions.append((row, baseline))
+    return regressions
+
+def log_results(output_file, rows):
+    """
+    計測結果をCSVに追記する。
+    """
+    output_dir = os.path.dirname(output_file)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    file_exists = os.path.isfile(output_file)
+    with open(output_file, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, extrasaction='ignore')
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(rows)
+
+def track_results(model_path, rows, config):
+    """
+    1つのモデルの計測結果を MLflow の Run (指標名はスレッド数ごと、ステップはバッチサイズ) と成果物レジストリに記録する。
+    レジストリには1件ずつの推論の遅延と最大のスループットを記録し、model_selector_agent で比較できるようにする。
+    """
+    measured = [row for row in rows if not row["error"]]
+    with start_run("benchmark_agent", params={"model_path": model_path, "format": model_format(model_path),
+                                              "batch_sizes": ",".join(str(size) for size in config["batch_sizes"]),
+                                              "threads": ",".join(str(count) for count in config["threads"])},
+                   parent_run_id=config["parent_run_id"]) as run:
+        for row in measured:
+            run.log_metrics({f"threads_{row['threads']}.{key}": row[key] for key in ("latency_p50_ms", "latency_p90_ms", "latency_p99_ms", "samples_per_sec")},
+                            step=row["batch_size"])
+    single = [row for row in measured if row["batch_size"] == 1]
+    if not measured:
+        return
+    metrics = {"samples_per_sec": max(row["samples_per_sec"] for row in measured)}
+    if single:
+        fastest = min(single, key=lambda row: row["latency_p50_ms"])
+        metrics.update({key: fastest[key] for key in ("latency_p50_ms", "latency_p90_ms", "latency_p99_ms")})
+    try:
+        with ArtifactRegistry() as registry:
+            registry.record_evaluation(model_path, "benchmark_agent", metrics)
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 計測結果を成果物レジストリに記録できませんでした: {e}", file=sys.stderr)
+
+def print_results(rows):
+    print("\n========== 推論ベンチマーク ==========")
+    print(f"{'model':<40} {'threads':>7} {'batch':>5} {'p50(ms)':>9} {'p90(ms)':>9} {'p99(ms)':>9} {'samples/sec':>12}")
+    for row in rows:
+        name = os.path.basename(row["model_path"])
+        if row["error"]:
+            print(f"{name:<40} {row['threads']:>7} {row['batch_size']:>5} エラー: {row['error']}")
+            continue
+        regression = f"  回帰 {row['regression']}" if row["regression"] else ""
+        print(f"{name:<40} {row['threads']:>7} {row['batch_size']:>5} {row['latency_p50_ms']:>9.3f} {row['latency_p90_ms']:>9.3f} "
+              f"{row['latency_p99_ms']:>9.3f} {row['samples_per_sec']:>12.1f}{regression}")
+    print("(threads=0 はライブラリの既定のスレッド数)")
+    print("=====================================")
+
+def main(args, config):
+    """
+    学習済みモデルの推論の遅延 (百分位) とバッチごとのスループットを、バッチサイズとスレッド数ごとに計測するエージェント。
+    入力はモデルの入力シグネチャから合成する。前回の計測より遅くなった組み合わせは回帰として警告する。
+    """
+    print("Benchmark Agent: 開始")
+
+    batch_sizes = list(config["batch_sizes"])
+    threads = list(config["threads"])
+    if not batch_sizes or min(batch_sizes) < 1 or not threads or min(threads) < 0:
+        print("エラー: batch_sizes は1以上、threads は0以上の整数を指定してください。", file=sys.stderr)
+        sys.exit(1)
+
+    model_paths = resolve_model_paths(config["model_paths"])
+    missing = [path for path in model_paths if not os.path.isfile(path)]
+    if not model_paths or missing:
+        print(f"エラー: 計測するモデルが見つかりません: {', '.join(missing) or config['model_paths']}", file=sys.stderr)
+        sys.exit(1)
+
+    output_file = config["output_file"]
+    previous = load_previous_results(output_file)
+    results = []
+    for model_path in model_paths:
+        print(f"--- 計測中: {model_path} (スレッド数: {threads}, バッチサイズ: {batch_sizes}) ---")
+        rows = benchmark_model(model_path, threads, batch_sizes, config["requests"], config["warmup"], config["min_seconds"], config["timeout_seconds"])
+        track_results(model_path, rows, config)
+        results.extend(rows)
+
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for row in results:
+        row["timestamp"] = timestamp
+    regressions = check_regressions(results, previous, config["regression_threshold"])
+    print_results(results)
+
+    if output_file:
+        log_results(output_file, results)
+        print(f"--- ベンチマーク結果を記録しました: {output_file} ---")
+
+    for row, baseline in regressions:
+        print(f"警告: 推論の遅延が前回より増えています: {row['model_path']} (threads={row['threads']}, batch={row['batch_size']}) "
+              f"{baseline:.3f}ms -> {row['latency_p50_ms']:.3f}ms", file=sys.stderr)
+    print("Benchmark Agent: 終了")
+    if any(row["error"] for row in results):
+        sys.exit(1)
+    if regressions and config["fail_on_regression"]:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='推論ベンチマークエージェント (遅延の百分位とスループット)')
+    parser.add_argument('--model_paths', type=str, nargs='+', default=DEFAULT_CONFIG["model_paths"], help='計測するモデルのパスまたはglobパターン')
+    parser.add_argument('--batch_sizes', type=str, default=DEFAULT_CONFIG["batch_sizes"], help='計測するバッチサイズのカンマ区切り')
+    parser.add_argument('--threads', type=str, default=DEFAULT_CONFIG["threads"], help='計測するスレッド数のカンマ区切り (0 は既定)')
+    parser.add_argument('--requests', type=int, default=DEFAULT_CONFIG["requests"], help='バッチサイズ1での計測回数')
+    parser.add_argument('--warmup', type=int, default=DEFAULT_CONFIG["warmup"], help='計測前に捨てる推論の回数')
+    parser.add_argument('--min_seconds', type=float, default=DEFAULT_CONFIG["min_seconds"], help='バッチサイズごとの最短の計測時間 (秒)')
+    parser.add_argument('--output_file', type=str, default=DEFAULT_CONFIG["output_file"], help='結果の記録用CSVファイル')
+    parser.add_argument('--regression_threshold', type=float, default=DEFAULT_CONFIG["regression_threshold"], help='回帰とみなす遅延の増加率')
+    parser.add_argument('--fail_on_regression', action='store_true', help='回帰があれば終了コード1で終了する')
+    args = parser.parse_args()
+
+    main([], CONFIG_SCHEMA.resolve(vars(args)))
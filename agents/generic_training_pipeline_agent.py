@@ -6,29 +6,66 @@ import argparse
 # プロジェクトルートを定義
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import start_run
+from resource_monitor import format_summary
+from execution_supervisor import ExecutionCancelled, check_cancelled, run_supervised
+from process_runner import step_log_path
+from config_schema import ConfigSchema, Field
+
 # 仮想環境のPythonインタプリタのパス
 PYTHON_EXECUTABLE = os.path.join(PROJECT_ROOT, ".venv", "bin", "python")
 
 # Yggdrasilフレームワークのメインスクリプトのパス
 YGGDDRASIL_MAIN_SCRIPT = os.path.join(PROJECT_ROOT, "yggdrasil.py")
 
-# デフォルト設定 (必要に応じて拡張)
-DEFAULT_CONFIG = {
-    "model_type": "", # 例: "image_classification", "text_classification", "tabular_classification"
-    "training_script_path": "", # 訓練スクリプトのパス
-    "evaluation_script_path": "", # 評価スクリプトのパス
-    "dataset_path": "", # データセットのパス
-    "output_model_path": os.path.join(PROJECT_ROOT, "trained_models", "generic_model.keras"),
-    "log_file": os.path.join(PROJECT_ROOT, "logs", "generic_pipeline_log.csv"),
-    "epochs": 10,
-    "batch_size": 32,
-    "learning_rate": 0.001,
-    "optimizer_type": "adam"
-}
-
-def run_agent(agent_name, agent_config):
+# 設定スキーマ (yggdrasil.py が実行前に検証する。必要に応じて拡張)
+CONFIG_SCHEMA = ConfigSchema({
+    "model_type": Field(str, ""), # 例: "image_classification", "text_classification", "tabular_classification"
+    "training_script_path": Field(str, ""), # 訓練スクリプトのパス
+    "evaluation_script_path": Field(str, ""), # 評価スクリプトのパス
+    "dataset_path": Field(str, ""), # データセットのパス
+    "output_model_path": Field(str, os.path.join(PROJECT_ROOT, "trained_models", "generic_model.keras")),
+    "log_file": Field(str, os.path.join(PROJECT_ROOT, "logs", "generic_pipeline_log.csv")),
+    "epochs": Field(int, 10, min=1),
+    "batch_size": Field(int, 32, min=1),
+    "learning_rate": Field(float, 0.001, min=0.0),
+    "optimizer_type": Field(str, "adam"),
+    # 学習の高速化オプション (model_trainer 経由で学習スクリプトに渡される)
+    "jit_compile": Field(bool, False),
+    "mixed_precision": Field(bool, False),
+    "intra_op_threads": Field(int, 0, min=0),
+    "inter_op_threads": Field(int, 0, min=0),
+    "onednn": Field(bool, None), # None の場合は TensorFlow のデフォルトに従う
+    # 検証データ・早期終了・学習率スケジュール
+    "validation_split": Field(float, 0.1, min=0.0, max=0.99),
+    "early_stopping_patience": Field(int, 0, min=0), # 0 の場合は早期終了しない
+    "lr_schedule": Field(str, "none", choices=["none", "plateau", "cosine"]), # "plateau" (ReduceLROnPlateau), "cosine" (CosineDecay)
+    "lr_patience": Field(int, 2, min=0),
+    "lr_factor": Field(float, 0.5, min=0.0, max=1.0),
+    "min_lr": Field(float, 1e-6, min=0.0),
+    # CSVの読み込み (スキーマを省略した場合はCSVから推定する)
+    "schema_path": Field(str, ""),
+    "chunksize": Field(int, 100000, min=1),
+    "step_timeout_seconds": Field((int, float), None, min=0), # 各ステップ (子プロセス) の制限時間 (秒)。超えた場合はプロセスグループごと停止する
+    "step_log_dir": Field(str, None), # 指定すると各ステップの出力を <step_log_dir>/<ステップ名>.log にも書き出す
+    # 学習後に推論用の TFLite のモデル (<output_model_pathの名前>.<量子化>.tflite) を書き出す。"none" の場合は書き出さない
+    "export_quantization": Field(str, "none", choices=["none", "float32", "dynamic", "int8"]),
+    "export_calibration_samples": Field(int, 200, min=1) # int8 の校正に使う学習データのサンプル数
+})
+
+# デフォルト設定
+DEFAULT_CONFIG = CONFIG_SCHEMA.defaults()
+
+ACCELERATION_KEYS = ["jit_compile", "mixed_precision", "intra_op_threads", "inter_op_threads", "onednn"]
+SCHEDULE_KEYS = ["validation_split", "early_stopping_patience", "lr_schedule", "lr_patience", "lr_factor", "min_lr"]
+DATA_KEYS = ["schema_path", "chunksize"]
+
+def run_agent(agent_name, agent_config, timeout=None, log_path=None):
     """
     指定されたエージェントを、設定を渡して実行するヘルパー関数。
+    出力は表示しながら log_path (指定した場合) にも書き出し、失敗した場合は出力の末尾をエラーとして表示する。
     """
     command = [
         PYTHON_EXECUTABLE,
@@ -47,13 +84,16 @@ def run_agent(agent_name, agent_config):
     print(f"実行コマンド: {' '.join(command)}")
 
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        for line in process.stdout:
-            sys.stdout.write(line)
-        process.wait()
+        # 新しいプロセスグループで実行し、制限時間を超えた場合はグループごと停止する
+        result = run_supervised(command, timeout=timeout, log_path=log_path)
+        print(f"--- エージェント '{agent_name}' のリソース使用量: {format_summary(result.usage)} ---")
+        check_cancelled() # このエージェント自体がキャンセルされた場合は yggdrasil.py に伝える
 
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, command)
+        if result.timed_out:
+            print(f"エラー: エージェント '{agent_name}' が制限時間 ({timeout}秒) を超えたため停止しました。", file=sys.stderr)
+            sys.exit(1) # パイプラインを停止
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, output=result.output)
 
     except subprocess.CalledProcessError as e:
         print(f"エラー: エージェント '{agent_name}' の実行に失敗しました。リターンコード: {e.returncode}", file=sys.stderr)
@@ -61,6 +101,8 @@ def run_agent(agent_name, agent_config):
             print("--- stdout/stderr ---", file=sys.stderr)
             print(e.stdout, file=sys.stderr)
         sys.exit(1) # パイプラインを停止
+    except ExecutionCancelled:
+        raise
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}", file=sys.stderr)
         sys.exit(1) # パイプラインを停止
@@ -70,41 +112,63 @@ def main(args, config):
     汎用モデル訓練パイプラインをオーケストレーションするエージェント。
     """
     print("Generic Training Pipeline Agent: 開始")
+    step_timeout = config["step_timeout_seconds"]
+    step_log_dir = config["step_log_dir"]
+    if step_log_dir and not os.path.isabs(step_log_dir):
+        step_log_dir = os.path.join(PROJECT_ROOT, step_log_dir)
 
     # 設定の取得 (コマンドライン引数やデフォルト設定から)
-    model_type = config.get("model_type", DEFAULT_CONFIG["model_type"])
-    training_script_path = config.get("training_script_path", DEFAULT_CONFIG["training_script_path"])
-    evaluation_script_path = config.get("evaluation_script_path", DEFAULT_CONFIG["evaluation_script_path"])
-    dataset_path = config.get("dataset_path", DEFAULT_CONFIG["dataset_path"])
-    output_model_path = config.get("output_model_path", DEFAULT_CONFIG["output_model_path"])
+    model_type = config["model_type"]
+    training_script_path = config["training_script_path"]
+    evaluation_script_path = config["evaluation_script_path"]
+    dataset_path = config["dataset_path"]
+    output_model_path = config["output_model_path"]
     print(f"Debug: output_model_path (absolute) = {os.path.join(PROJECT_ROOT, output_model_path) if not os.path.isabs(output_model_path) else output_model_path}")
-    log_file = config.get("log_file", DEFAULT_CONFIG["log_file"])
-    epochs = config.get("epochs", DEFAULT_CONFIG["epochs"])
-    batch_size = config.get("batch_size", DEFAULT_CONFIG["batch_size"])
-    learning_rate = config.get("learning_rate", DEFAULT_CONFIG["learning_rate"])
-    optimizer_type = config.get("optimizer_type", DEFAULT_CONFIG["optimizer_type"])
+    log_file = config["log_file"]
+    epochs = config["epochs"]
+    batch_size = config["batch_size"]
+    learning_rate = config["learning_rate"]
+    optimizer_type = config["optimizer_type"]
 
-    # 1. モデル訓練ステップ
+    # 1. モデル訓練ステップ (パイプラインを親Run、学習スクリプトの実行を子Runとして MLflow に記録する)
     if training_script_path:
-        train_config = {
-            "script_path": training_script_path,
-            "dataset_path": dataset_path,
-            "output_path": output_model_path,
-            "log_file": log_file,
-            "epochs": epochs,
-            "batch_size": batch_size,
-            "learning_rate": learning_rate,
-            "optimizer_type": optimizer_type
-        }
-        # model_trainer エージェントは script_path を特別扱いするため、直接渡す
-        run_agent("model_trainer", {"script_path": training_script_path, **train_config})
+        with start_run("generic_training_pipeline", params={"model_type": model_type, "dataset_path": dataset_path,
+                                                             "training_script_path": training_script_path}) as parent_run:
+            train_config = {
+                "script_path": training_script_path,
+                "dataset_path": dataset_path,
+                "output_path": output_model_path,
+                "log_file": log_file,
+                "epochs": epochs,
+                "batch_size": batch_size,
+                "learning_rate": learning_rate,
+                "optimizer_type": optimizer_type
+            }
+            if parent_run.run_id:
+                train_config["parent_run_id"] = parent_run.run_id
+            for key in ACCELERATION_KEYS + SCHEDULE_KEYS + DATA_KEYS:
+                value = config[key]
+                if value is not None and value != "":
+                    train_config[key] = value
+            # model_trainer エージェントは script_path を特別扱いするため、直接渡す
+            run_agent("model_trainer", {"script_path": training_script_path, **train_config}, step_timeout, step_log_path(step_log_dir, "1_train"))
+
+            # 2. エクスポートステップ (学習したモデルを TFLite に変換し、量子化する)
+            if config["export_quantization"] != "none":
+                export_config = {"model_path": output_model_path, "quantization": config["export_quantization"],
+                                 "num_calibration_samples": config["export_calibration_samples"]}
+                if dataset_path:
+                    export_config["calibration_data_path"] = dataset_path
+                if parent_run.run_id:
+                    export_config["parent_run_id"] = parent_run.run_id
+                run_agent("model_exporter_agent", export_config, step_timeout, step_log_path(step_log_dir, "2_export"))
     else:
         print("警告: 訓練スクリプトのパスが指定されていないため、訓練ステップをスキップします。")
 
-    # 2. モデル評価ステップは generic_trainer.py 内で行われるため、ここではスキップ
+    # 3. モデル評価ステップは generic_trainer.py 内で行われるため、ここではスキップ
     print("評価ステップは訓練スクリプト内で実行されました。")
 
-    # 3. レポート生成ステップ (必要に応じて)
+    # 4. レポート生成ステップ (必要に応じて)
     # report_generator_agent を呼び出すロジックをここに追加することも可能
 
     print("Generic Training Pipeline Agent: 終了")
@@ -123,10 +187,25 @@ if __name__ == '__main__':
     parser.add_argument("--batch_size", type=int, default=DEFAULT_CONFIG["batch_size"])
     parser.add_argument("--learning_rate", type=float, default=DEFAULT_CONFIG["learning_rate"])
     parser.add_argument("--optimizer_type", type=str, default=DEFAULT_CONFIG["optimizer_type"])
+    parser.add_argument("--jit_compile", action="store_true")
+    parser.add_argument("--mixed_precision", action="store_true")
+    parser.add_argument("--intra_op_threads", type=int, default=DEFAULT_CONFIG["intra_op_threads"])
+    parser.add_argument("--inter_op_threads", type=int, default=DEFAULT_CONFIG["inter_op_threads"])
+    parser.add_argument("--onednn", type=str, default=DEFAULT_CONFIG["onednn"])
+    parser.add_argument("--validation_split", type=float, default=DEFAULT_CONFIG["validation_split"])
+    parser.add_argument("--early_stopping_patience", type=int, default=DEFAULT_CONFIG["early_stopping_patience"])
+    parser.add_argument("--lr_schedule", type=str, default=DEFAULT_CONFIG["lr_schedule"], choices=["none", "plateau", "cosine"])
+    parser.add_argument("--lr_patience", type=int, default=DEFAULT_CONFIG["lr_patience"])
+    parser.add_argument("--lr_factor", type=float, default=DEFAULT_CONFIG["lr_factor"])
+    parser.add_argument("--min_lr", type=float, default=DEFAULT_CONFIG["min_lr"])
+    parser.add_argument("--schema_path", type=str, default=DEFAULT_CONFIG["schema_path"])
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CONFIG["chunksize"])
+    parser.add_argument("--export_quantization", type=str, default=DEFAULT_CONFIG["export_quantization"], choices=["none", "float32", "dynamic", "int8"])
+    parser.add_argument("--export_calibration_samples", type=int, default=DEFAULT_CONFIG["export_calibration_samples"])
 
     cli_args = parser.parse_args()
 
     # argparseのNamespaceオブジェクトを辞書に変換
     config_from_cli = vars(cli_args)
 
-    main([], config_from_cli)
+    main([], CONFIG_SCHEMA.resolve(config_from_cli))
@@ -1,30 +1,387 @@
 import os
 import argparse
+import glob
+import hashlib
+import time
+import multiprocessing
 import numpy as np
-import tensorflow as tf
 import csv
+import sqlite3
 from datetime import datetime
 import sys
 
 # プロジェクトルートを定義
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import start_run
+from config_schema import ConfigSchema, Field
+from artifact_registry import ArtifactRegistry
+from model_export import load_inference_model, single_request_latency_ms
+
+# 設定スキーマ (yggdrasil.py が実行前に検証する)
+CONFIG_SCHEMA = ConfigSchema({
+    "model_path": Field(str, os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras")),
+    "test_data_path": Field(str, None), # 評価に使用するテストデータのパス
+    "evaluation_log_file": Field(str, os.path.join(PROJECT_ROOT, "logs", "model_evaluation_log.csv")),
+    "model_paths": Field((list, str), None, item_type=str), # 複数モデル評価: パスまたはglobのリスト (カンマ区切り文字列も可)。.tflite も評価できる
+    "num_workers": Field(int, 1, min=1), # 複数モデル評価時のワーカープロセス数 (1の場合は単一プロセスで順次評価)
+    "leaderboard_path": Field(str, os.path.join(PROJECT_ROOT, "logs", "model_leaderboard.csv")),
+    "test_data_cache_dir": Field(str, os.path.join(PROJECT_ROOT, "data", "cache", "evaluation")),
+    "parent_run_id": Field(str, None), # 指定した場合、評価結果をこのMLflow Runの子Runとして記録する
+    "latency_requests": Field(int, 50, min=0) # 1件ずつの推論時間の計測回数 (0 の場合は計測しない)
+})
+
 # デフォルト設定
-DEFAULT_CONFIG = {
-    "model_path": os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras"),
-    "test_data_path": None, # 評価に使用するテストデータのパス
-    "evaluation_log_file": os.path.join(PROJECT_ROOT, "logs", "model_evaluation_log.csv")
-}
+DEFAULT_CONFIG = CONFIG_SCHEMA.defaults()
+
+# ワーカープロセス内で共有されるテストデータ (メモリマップ)
+_shared_x_test = None
+_shared_y_test = None
+_latency_requests = 0
+
+def load_test_data(test_data_path):
+    """
+    テストデータをロードし、前処理済みの (x_test, y_test) を返す。
+    test_data_path が X_test/y_test を含むNPZファイルであればそれを使用し、それ以外はMNISTを使用する。
+    """
+    if test_data_path and test_data_path.endswith(".npz") and os.path.exists(test_data_path):
+        data = np.load(test_data_path)
+        x_test = data['X_test']
+        y_test = data['y_test']
+    else:
+        # MNISTデータセットを想定
+        import tensorflow as tf
+        (_, _), (x_test, y_test) = tf.keras.datasets.mnist.load_data()
+
+    # 画像データを0-1の範囲に正規化 (整数型の画像データのみ)
+    if np.issubdtype(x_test.dtype, np.integer):
+        x_test = x_test.astype("float32") / 255
+    else:
+        x_test = x_test.astype("float32")
+
+    # モデルが扱いやすいように画像の次元を追加 (もし必要なら)
+    if len(x_test.shape) == 3: # (samples, height, width) の場合
+        x_test = x_test[..., np.newaxis]
+
+    return x_test, y_test
+
+def to_categorical_labels(y_test, num_classes):
+    """
+    ラベルがone-hot形式でなければカテゴリカル形式に変換する。
+    """
+    if len(y_test.shape) == 1 or y_test.shape[1] == 1:
+        import tensorflow as tf
+        return tf.keras.utils.to_categorical(y_test, num_classes=num_classes)
+    return y_test
+
+def prepare_shared_test_set(test_data_path, cache_dir):
+    """
+    前処理済みのテストデータを .npy としてキャッシュに書き出し、そのパスを返す。
+    ワーカープロセスはこれを np.load(mmap_mode='r') で開くため、データは一度だけロード・前処理される。
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    if test_data_path and os.path.exists(test_data_path):
+        # 同じ名前の別のファイルや、同じ秒のうちに書き換えられたファイルと区別するため、
+        # 絶対パスのハッシュ・サイズ・ナノ秒単位の更新時刻をキーにする
+        source = os.path.abspath(test_data_path)
+        stat = os.stat(source)
+        path_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        cache_key = f"{os.path.splitext(os.path.basename(source))[0]}_{path_hash}_{stat.st_size}_{stat.st_mtime_ns}"
+    else:
+        cache_key = "mnist"
+    x_path = os.path.join(cache_dir, f"{cache_key}_x_test.npy")
+    y_path = os.path.join(cache_dir, f"{cache_key}_y_test.npy")
+
+    if os.path.exists(x_path) and os.path.exists(y_path):
+        print(f"--- キャッシュ済みのテストデータを使用します: {x_path} ---")
+        return x_path, y_path
+
+    x_test, y_test = load_test_data(test_data_path)
+    # 書き込み途中のファイルを他のプロセスが読まないよう、一時ファイル経由で配置する
+    for path, array in ((x_path, x_test), (y_path, y_test)):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, np.ascontiguousarray(array))
+        os.replace(tmp_path, path)
+    print(f"--- テストデータをキャッシュしました: {x_path} ---")
+    return x_path, y_path
+
+def resolve_model_paths(model_paths):
+    """
+    パス・globパターンのリスト (またはカンマ区切り文字列) を、重複のないモデルパスのリストに展開する。
+    """
+    if isinstance(model_paths, str):
+        model_paths = [p.strip() for p in model_paths.split(",") if p.strip()]
+
+    resolved = []
+    for pattern in model_paths:
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(PROJECT_ROOT, pattern)
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in resolved:
+                resolved.append(path)
+    return resolved
+
+def evaluate_loaded_model(model, model_path, x_test, y_test):
+    """
+    ロード済みのモデルを評価し、(loss, accuracy) を返す。
+    """
+    # 強化学習モデルの場合は評価をスキップ（別途シミュレーションで評価）
+    if "reinforce" in model_path.lower(): # モデルパスに"reinforce"が含まれるかで簡易的に判別
+        return "N/A", "N/A"
+
+    # メモリマップ配列はコピーせずに通常のndarrayビューとして渡す
+    y_eval = to_categorical_labels(np.asarray(y_test), model.output_shape[-1])
+    score = model.evaluate(np.asarray(x_test), y_eval, verbose=0)
+    return float(score[0]), float(score[1])
+
+def measure_model(model, model_path, x_test, requests):
+    """
+    精度とレイテンシの比較に使う、1件あたりの推論時間 (ミリ秒, 中央値) とモデルファイルのサイズ (MB) を返す。
+    """
+    if not requests or "reinforce" in model_path.lower():
+        return "N/A", round(os.path.getsize(model_path) / (1024 * 1024), 3)
+    return round(single_request_latency_ms(model, x_test, requests), 3), round(os.path.getsize(model_path) / (1024 * 1024), 3)
+
+def _init_worker(x_path, y_path, intra_op_threads, latency_requests):
+    """
+    ワーカープロセスの初期化。テストデータをメモリマップで開き、TFのスレッド数を割り当てる。
+    """
+    import tensorflow as tf
+
+    global _shared_x_test, _shared_y_test, _latency_requests
+    _latency_requests = latency_requests
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:
+        # 単一プロセスでの評価で、同じプロセスが既にTFを使っている場合は変更できないため既定のまま評価する
+        pass
+    _shared_x_test = np.load(x_path, mmap_mode='r')
+    _shared_y_test = np.load(y_path, mmap_mode='r')
+
+def _evaluate_model_worker(model_path):
+    """
+    ワーカープロセスで1つのモデルを評価し、リーダーボードの1行分の辞書を返す。
+    """
+    import tensorflow as tf
+
+    result = {"model_path": model_path, "loss": "N/A", "accuracy": "N/A", "latency_ms": "N/A", "size_mb": "N/A", "eval_seconds": 0.0, "error": ""}
+    start_time = time.perf_counter()
+    try:
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"学習済みモデルが見つかりません: {model_path}")
+        model = load_inference_model(model_path)
+        result["loss"], result["accuracy"] = evaluate_loaded_model(model, model_path, _shared_x_test, _shared_y_test)
+        result["latency_ms"], result["size_mb"] = measure_model(model, model_path, _shared_x_test, _latency_requests)
+        tf.keras.backend.clear_session()
+    except Exception as e:
+        result["error"] = str(e)
+    result["eval_seconds"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+def print_latency_comparison(ranked):
+    """
+    最も精度の高いモデルを基準に、各モデルの精度の差・推論時間の比・サイズを表示する
+    (量子化したモデルと元のモデルを比べる場合など)。
+    """
+    measured = [row for row in ranked if isinstance(row["accuracy"], float) and isinstance(row.get("latency_ms"), float)]
+    if len(measured) < 2:
+        return
+    baseline = measured[0]
+    print(f"\n========== 精度とレイテンシの比較 (基準: {os.path.basename(baseline['model_path'])}) ==========")
+    for row in sorted(measured, key=lambda r: r["latency_ms"]):
+        ratio = row["latency_ms"] / baseline["latency_ms"] if baseline["latency_ms"] else float("inf")
+        print(f"  精度: {row['accuracy']:.4f} ({round(row['accuracy'] - baseline['accuracy'], 4) + 0.0:+.4f})  "
+              f"1件あたり: {row['latency_ms']:.3f}ms (基準の {ratio:.2f}倍)  サイズ: {row['size_mb']:.2f}MB  {row['model_path']}")
+    print("=" * 70)
+
+def write_leaderboard(results, leaderboard_path):
+    """
+    評価結果を精度の降順に並べ、統合されたリーダーボードとして表示・保存する。
+    """
+    ranked = sorted(results, key=lambda r: r["accuracy"] if isinstance(r["accuracy"], float) else -1.0, reverse=True)
+
+    print("\n========== モデルリーダーボード ==========")
+    for rank, row in enumerate(ranked, start=1):
+        row["rank"] = rank
+        accuracy = f"{row['accuracy']:.4f}" if isinstance(row["accuracy"], float) else row["accuracy"]
+        loss = f"{row['loss']:.4f}" if isinstance(row["loss"], float) else row["loss"]
+        status = f" (エラー: {row['error']})" if row["error"] else ""
+        print(f"{rank:>3}. 精度: {accuracy}  損失: {loss}  {row['model_path']}{status}")
+    print("==========================================")
+    print_latency_comparison(ranked)
+
+    if leaderboard_path:
+        leaderboard_dir = os.path.dirname(leaderboard_path)
+        if leaderboard_dir and not os.path.exists(leaderboard_dir):
+            os.makedirs(leaderboard_dir)
+        with open(leaderboard_path, 'w', newline='') as csvfile:
+            fieldnames = ['rank', 'model_path', 'loss', 'accuracy', 'latency_ms', 'size_mb', 'eval_seconds', 'digest', 'producer', 'error']
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+            for row in ranked:
+                writer.writerow({
+                    **row,
+                    'loss': f"{row['loss']:.4f}" if isinstance(row['loss'], float) else row['loss'],
+                    'accuracy': f"{row['accuracy']:.4f}" if isinstance(row['accuracy'], float) else row['accuracy']
+                })
+        print(f"--- リーダーボードを保存しました: {leaderboard_path} ---")
+    return ranked
+
+def log_evaluation(evaluation_log_file, model_path, test_data_path, loss, accuracy):
+    """
+    評価結果を評価ログCSVに追記する。
+    """
+    log_dir = os.path.dirname(evaluation_log_file)
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+
+    file_exists = os.path.isfile(evaluation_log_file)
+    with open(evaluation_log_file, 'a', newline='') as csvfile:
+        fieldnames = ['timestamp', 'model_path', 'test_data_path', 'loss', 'accuracy']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+        if not file_exists:
+            writer.writeheader()
+
+        writer.writerow({
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'model_path': model_path,
+            'test_data_path': test_data_path,
+            'loss': f"{loss:.4f}" if isinstance(loss, float) else loss,
+            'accuracy': f"{accuracy:.4f}" if isinstance(accuracy, float) else accuracy
+        })
+
+def track_evaluation(model_path, test_data_path, loss, accuracy, parent_run_id=None):
+    """
+    評価結果を MLflow の Run として記録する。
+    """
+    with start_run("model_evaluator_agent", params={"model_path": model_path, "test_data_path": test_data_path},
+                   parent_run_id=parent_run_id) as run:
+        run.log_metrics({"loss": loss, "accuracy": accuracy})
+
+def lookup_artifacts(model_paths):
+    """
+    成果物レジストリから、モデルのパスごとの (内容のハッシュ, 作成したスクリプト) を返す。
+    同じ内容のモデルを一度だけ評価するために使う。レジストリを開けない場合は空の辞書。
+    """
+    artifacts = {}
+    try:
+        with ArtifactRegistry() as registry:
+            for path in model_paths:
+                if os.path.isfile(path):
+                    manifest = registry.producer(path)
+                    artifacts[path] = (registry.file_digest(path), manifest["script"] if manifest and manifest["script"] else "")
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 成果物レジストリを参照できませんでした: {e}", file=sys.stderr)
+    return artifacts
+
+def record_evaluations(rows, test_data_path):
+    """
+    登録済みの成果物であれば、評価結果を成果物レジストリに記録する (同じ内容のモデルは1回だけ)。
+    """
+    recorded = set()
+    try:
+        with ArtifactRegistry() as registry:
+            for row in rows:
+                if row["error"] or not isinstance(row["accuracy"], float) or row.get("digest") in recorded:
+                    continue
+                if registry.record_evaluation(row["model_path"], "model_evaluator_agent", {"loss": row["loss"], "accuracy": row["accuracy"]}, test_data_path):
+                    recorded.add(row.get("digest"))
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 評価結果を成果物レジストリに記録できませんでした: {e}", file=sys.stderr)
+
+def evaluate_models(model_paths, test_data_path, evaluation_log_file, leaderboard_path, num_workers, cache_dir, parent_run_id=None, latency_requests=0):
+    """
+    共有テストセットに対して複数のモデルを評価し、統合リーダーボードを出力する。
+    テストセットは一度だけロードしてキャッシュし、各ワーカーはメモリマップで参照する。
+    latency_requests を指定すると1件ずつの推論時間も計測する (ワーカーが複数の場合は互いに影響するため目安)。
+    """
+    resolved_paths = resolve_model_paths(model_paths)
+    if not resolved_paths:
+        print(f"エラー: 評価対象のモデルが見つかりません: {model_paths}", file=sys.stderr)
+        return []
+    # 内容が同じモデル (コピーや同じ成果物へのリンク) は一度だけ評価し、結果を共有する
+    artifacts = lookup_artifacts(resolved_paths)
+    unique_paths = {}
+    for path in resolved_paths:
+        unique_paths.setdefault(artifacts[path][0] if path in artifacts else path, path)
+    if len(unique_paths) < len(resolved_paths):
+        print(f"--- 内容が同じモデルが {len(resolved_paths) - len(unique_paths)} 個あるため、一度だけ評価します ---")
+    print(f"--- {len(unique_paths)} 個のモデルを評価します (ワーカー数: {num_workers}) ---")
+
+    print(f"--- テストデータを準備中: {test_data_path} ---")
+    try:
+        x_path, y_path = prepare_shared_test_set(test_data_path, cache_dir)
+    except Exception as e:
+        print(f"エラー: テストデータのロードまたは前処理に失敗しました: {e}", file=sys.stderr)
+        return []
+
+    num_workers = max(1, min(int(num_workers), len(unique_paths)))
+    intra_op_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    if num_workers == 1:
+        # 単一プロセス: TFランタイムとテストデータを共有して順次評価
+        _init_worker(x_path, y_path, intra_op_threads, latency_requests)
+        results = [_evaluate_model_worker(path) for path in unique_paths.values()]
+    else:
+        # TFはfork後の利用が安全でないため spawn でワーカーを起動する
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=num_workers, initializer=_init_worker, initargs=(x_path, y_path, intra_op_threads, latency_requests)) as pool:
+            results = []
+            for result in pool.imap_unordered(_evaluate_model_worker, list(unique_paths.values())):
+                print(f"評価完了: {result['model_path']} ({result['eval_seconds']:.2f}秒)")
+                results.append(result)
+
+    evaluated = {result["model_path"]: result for result in results}
+    results = []
+    for path in resolved_paths:
+        digest, producer = artifacts.get(path, (None, ""))
+        result = evaluated.get(path) or {**evaluated[unique_paths[digest]], "model_path": path, "eval_seconds": 0.0}
+        results.append({**result, "digest": digest[:12] if digest else "", "producer": producer})
+
+    ranked = write_leaderboard(results, leaderboard_path)
+    record_evaluations(ranked, test_data_path)
+    for row in ranked:
+        if not row["error"]:
+            track_evaluation(row["model_path"], test_data_path, row["loss"], row["accuracy"], parent_run_id)
+
+    if evaluation_log_file:
+        print(f"--- 評価結果を記録中: {evaluation_log_file} ---")
+        for row in ranked:
+            if not row["error"]:
+                log_evaluation(evaluation_log_file, row["model_path"], test_data_path, row["loss"], row["accuracy"])
+        print("--- 記録が完了しました ---")
+    return ranked
 
 def main(args, config):
     """
     学習済みモデルをロードし、テストデータで評価するエージェント。
+    model_paths が指定された場合は、複数モデルを共有テストセットで評価してリーダーボードを出力する。
     """
     print("Model Evaluator Agent: 開始")
 
-    model_path = config.get("model_path", DEFAULT_CONFIG["model_path"])
-    test_data_path = config.get("test_data_path", DEFAULT_CONFIG["test_data_path"])
-    evaluation_log_file = config.get("evaluation_log_file", DEFAULT_CONFIG["evaluation_log_file"])
+    model_path = config["model_path"]
+    test_data_path = config["test_data_path"]
+    evaluation_log_file = config["evaluation_log_file"]
+    model_paths = config["model_paths"]
+
+    if model_paths:
+        evaluate_models(
+            model_paths,
+            test_data_path,
+            evaluation_log_file,
+            config["leaderboard_path"],
+            config["num_workers"],
+            config["test_data_cache_dir"],
+            config["parent_run_id"],
+            config["latency_requests"]
+        )
+        print("Model Evaluator Agent: 終了")
+        return
 
     print(f"Debug: model_path (absolute) = {model_path}")
     print(f"Debug: os.path.exists(model_path) = {os.path.exists(model_path)}")
@@ -36,7 +393,7 @@ def main(args, config):
     # 1. モデルのロード
     print(f"--- モデルをロード中: {model_path} ---")
     try:
-        model = tf.keras.models.load_model(model_path)
+        model = load_inference_model(model_path)
         print("--- モデルのロードが完了しました ---")
     except Exception as e:
         print(f"エラー: モデルのロードに失敗しました: {e}", file=sys.stderr)
@@ -45,19 +402,7 @@ def main(args, config):
     # 2. テストデータのロードと前処理
     print(f"--- テストデータをロード中: {test_data_path} ---")
     try:
-        # MNISTデータセットを想定
-        (_, _), (x_test, y_test) = tf.keras.datasets.mnist.load_data()
-
-        # 画像データを0-1の範囲に正規化
-        x_test = x_test.astype("float32") / 255
-
-        # モデルが扱いやすいように画像の次元を追加 (もし必要なら)
-        if len(x_test.shape) == 3: # (samples, height, width) の場合
-            x_test = x_test[..., tf.newaxis]
-
-        # ラベルをカテゴリカル形式に変換
-        y_test = tf.keras.utils.to_categorical(y_test, num_classes=10)
-
+        x_test, y_test = load_test_data(test_data_path)
         print("--- テストデータのロードと前処理が完了しました ---")
     except Exception as e:
         print(f"エラー: テストデータのロードまたは前処理に失敗しました: {e}", file=sys.stderr)
@@ -65,39 +410,22 @@ def main(args, config):
 
     # 3. モデルの評価
     print("--- モデルを評価中 ---")
-    
-    # 強化学習モデルの場合は評価をスキップ（別途シミュレーションで評価）
-    if "reinforce" in model_path.lower(): # モデルパスに"reinforce"が含まれるかで簡易的に判別
+    loss, accuracy = evaluate_loaded_model(model, model_path, x_test, y_test)
+    if accuracy == "N/A":
         print("強化学習モデルのため、評価をスキップします。")
-        loss = "N/A"
-        accuracy = "N/A"
     else:
-        loss, accuracy = model.evaluate(x_test, y_test, verbose=0)
         print(f"評価結果 - 損失: {loss:.4f}, 精度: {accuracy:.4f}")
+        latency_ms, size_mb = measure_model(model, model_path, x_test, config["latency_requests"])
+        if latency_ms != "N/A":
+            print(f"1件あたりの推論時間 (中央値): {latency_ms:.3f}ms, モデルのサイズ: {size_mb:.2f}MB")
     print("--- モデル評価が完了しました ---")
+    track_evaluation(model_path, test_data_path, loss, accuracy, config["parent_run_id"])
+    record_evaluations([{"model_path": model_path, "loss": loss, "accuracy": accuracy, "error": ""}], test_data_path)
 
     # 4. 評価結果のロギング
     if evaluation_log_file:
         print(f"--- 評価結果を記録中: {evaluation_log_file} ---")
-        log_dir = os.path.dirname(evaluation_log_file)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-        
-        file_exists = os.path.isfile(evaluation_log_file)
-        with open(evaluation_log_file, 'a', newline='') as csvfile:
-            fieldnames = ['timestamp', 'model_path', 'test_data_path', 'loss', 'accuracy']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            if not file_exists:
-                writer.writeheader()
-            
-            writer.writerow({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'model_path': model_path,
-                'test_data_path': test_data_path,
-                'loss': f"{loss:.4f}" if isinstance(loss, float) else loss,
-                'accuracy': f"{accuracy:.4f}" if isinstance(accuracy, float) else accuracy
-            })
+        log_evaluation(evaluation_log_file, model_path, test_data_path, loss, accuracy)
         print("--- 記録が完了しました ---")
 
     print("Model Evaluator Agent: 終了")
@@ -108,11 +436,19 @@ if __name__ == '__main__':
     parser.add_argument('--model_path', type=str, default=DEFAULT_CONFIG["model_path"], help='評価する学習済みモデルのパス')
     parser.add_argument('--test_data_path', type=str, default=DEFAULT_CONFIG["test_data_path"], help='評価に使用するテストデータのパス')
     parser.add_argument('--evaluation_log_file', type=str, default=DEFAULT_CONFIG["evaluation_log_file"], help='評価結果の記録用CSVファイル')
+    parser.add_argument('--model_paths', type=str, nargs='+', default=DEFAULT_CONFIG["model_paths"], help='複数モデル評価: モデルのパスまたはglobパターン')
+    parser.add_argument('--num_workers', type=int, default=DEFAULT_CONFIG["num_workers"], help='複数モデル評価時のワーカープロセス数')
+    parser.add_argument('--leaderboard_path', type=str, default=DEFAULT_CONFIG["leaderboard_path"], help='統合リーダーボードの出力先CSV')
+    parser.add_argument('--latency_requests', type=int, default=DEFAULT_CONFIG["latency_requests"], help='1件ずつの推論時間の計測回数 (0 の場合は計測しない)')
     args = parser.parse_args()
     
     config = {
         "model_path": args.model_path,
         "test_data_path": args.test_data_path,
-        "evaluation_log_file": args.evaluation_log_file
+        "evaluation_log_file": args.evaluation_log_file,
+        "model_paths": args.model_paths,
+        "num_workers": args.num_workers,
+        "leaderboard_path": args.leaderboard_path,
+        "latency_requests": args.latency_requests
     }
-    main([], config)
\ No newline at end of file
+    main([], CONFIG_SCHEMA.resolve(config))
@@ -0,0 +1,103 @@
+import os
+import argparse
+import sys
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import start_run
+from config_schema import ConfigSchema, Field
+from artifact_registry import register_output
+from model_export import QUANTIZATION_MODES, DEFAULT_CALIBRATION_SAMPLES, export_tflite, load_inference_model, load_calibration_data, single_request_latency_ms
+from inference_benchmark import synthesize_inputs
+
+# 設定スキーマ (yggdrasil.py が実行前に検証する)
+CONFIG_SCHEMA = ConfigSchema({
+    "model_path": Field(str, os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras")), # 変換する Keras のモデル
+    "output_path": Field(str, None), # 省略時は <モデル名>.<quantization>.tflite
+    "quantization": Field(str, "dynamic", choices=QUANTIZATION_MODES),
+    "calibration_data_path": Field(str, None), # int8 の校正に使う学習データ (NPZ、または前処理バンドルのあるモデルのCSV)。省略時はMNIST
+    "num_calibration_samples": Field(int, DEFAULT_CALIBRATION_SAMPLES, min=1),
+    "parent_run_id": Field(str, None) # 指定した場合、エクスポートの記録をこのMLflow Runの子Runにする
+})
+
+# デフォルト設定
+DEFAULT_CONFIG = CONFIG_SCHEMA.defaults()
+
+def main(args, config):
+    """
+    学習済みの Keras モデルを TFLite に変換 (必要に応じて量子化) し、サイズと1件あたりの推論時間を比較するエージェント。
+    """
+    print("Model Exporter Agent: 開始")
+
+    model_path = config["model_path"]
+    output_path = config["output_path"]
+    calibration_data_path = config["calibration_data_path"]
+    if not os.path.isabs(model_path):
+        model_path = os.path.join(PROJECT_ROOT, model_path)
+    if output_path and not os.path.isabs(output_path):
+        output_path = os.path.join(PROJECT_ROOT, output_path)
+    if calibration_data_path and not os.path.isabs(calibration_data_path):
+        calibration_data_path = os.path.join(PROJECT_ROOT, calibration_data_path)
+
+    if not os.path.exists(model_path):
+        print(f"エラー: 学習済みモデルが見つかりません: {model_path}", file=sys.stderr)
+        sys.exit(1)
+    if calibration_data_path and not os.path.exists(calibration_data_path):
+        print(f"エラー: 校正データが見つかりません: {calibration_data_path}", file=sys.stderr)
+        sys.exit(1)
+
+    with start_run("model_exporter_agent", params={"model_path": model_path, "quantization": config["quantization"],
+                                                   "calibration_data_path": calibration_data_path},
+                   parent_run_id=config["parent_run_id"]) as run:
+        print(f"--- モデルを TFLite に変換中 ({config['quantization']}): {model_path} ---")
+        try:
+            output_path, info = export_tflite(model_path, output_path, config["quantization"], calibration_data_path,
+                                              config["num_calibration_samples"])
+        except Exception as e:
+            print(f"エラー: モデルの変換に失敗しました: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"--- 変換したモデルを保存しました: {output_path} ---")
+
+        # 変換前後のモデルで、1件ずつの推論時間を比較する。校正データがなければ (MNIST はモデルの入力と合わないことがあるため)
+        # モデルの入力シグネチャから入力を合成する
+        source_model = load_inference_model(model_path)
+        samples = None
+        if calibration_data_path:
+            try:
+                samples = load_calibration_data(model_path, calibration_data_path, num_samples=50)
+            except ValueError as e:
+                print(f"警告: 校正データを推論時間の計測に使えないため、入力を合成します: {e}", file=sys.stderr)
+        if samples is None or not len(samples):
+            samples = synthesize_inputs(source_model, "keras", 50)
+        source_latency = single_request_latency_ms(source_model, samples)
+        exported_latency = single_request_latency_ms(load_inference_model(output_path), samples)
+
+        print("\n========== エクスポート結果 ==========")
+        print(f"サイズ: {info['source_size_bytes'] / (1024 * 1024):.2f}MB -> {info['size_bytes'] / (1024 * 1024):.2f}MB "
+              f"({info['size_bytes'] / info['source_size_bytes']:.2f}倍)")
+        print(f"1件あたりの推論時間 (中央値): {source_latency:.3f}ms -> {exported_latency:.3f}ms ({source_latency / exported_latency:.1f}倍速)")
+        if info["calibration_samples"]:
+            print(f"int8 の校正に {info['calibration_samples']} 件の学習データを使用しました" + (" (一部の演算は float のまま)" if info["int8_fallback"] else ""))
+        print("精度の比較は model_evaluator_agent に元のモデルと変換したモデルの両方を渡してください。")
+        print("=====================================")
+
+        run.log_metrics({"source_size_bytes": info["source_size_bytes"], "size_bytes": info["size_bytes"],
+                         "source_latency_ms": source_latency, "latency_ms": exported_latency})
+        run.log_artifact(output_path, "model")
+    register_output(output_path, run, datasets=[calibration_data_path or "keras.datasets.mnist"], kind="tflite", script="model_exporter_agent")
+
+    print("Model Exporter Agent: 終了")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='モデルエクスポートエージェント (Keras -> TFLite)')
+    parser.add_argument('--model_path', type=str, default=DEFAULT_CONFIG["model_path"], help='変換する Keras のモデル')
+    parser.add_argument('--output_path', type=str, default=DEFAULT_CONFIG["output_path"], help='TFLite のモデルの保存先')
+    parser.add_argument('--quantization', type=str, default=DEFAULT_CONFIG["quantization"], choices=QUANTIZATION_MODES, help='量子化の方法')
+    parser.add_argument('--calibration_data_path', type=str, default=DEFAULT_CONFIG["calibration_data_path"], help='int8 の校正に使う学習データ')
+    parser.add_argument('--num_calibration_samples', type=int, default=DEFAULT_CONFIG["num_calibration_samples"], help='int8 の校正に使うサンプル数')
+    args = parser.parse_args()
+
+    main([], CONFIG_SCHEMA.resolve(vars(args)))
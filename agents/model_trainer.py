@@ -2,14 +2,94 @@
 import subprocess
 import sys
 import os
+import json
+import hashlib
 
 # このエージェントファイルの場所を基準にプロジェクトルートを特定
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from training_acceleration import onednn_env
+from resource_monitor import format_summary
+from execution_supervisor import ExecutionCancelled, check_cancelled, run_supervised, run_supervised_steps
+from process_runner import ProcessStep
+from distributed_training import DISTRIBUTED_SCRIPTS, free_local_addresses, worker_env
+from config_schema import ConfigSchema, Field
+
+# 設定スキーマ (yggdrasil.py が実行前に検証する)。スキーマにない項目は学習スクリプトに引数として渡す
+CONFIG_SCHEMA = ConfigSchema({
+    "script_path": Field(str, os.path.join(PROJECT_ROOT, "training_scripts", "mnist_trainer.py")),
+    "checkpointing": Field(bool, True), # チェックポイントに対応したスクリプトで定期保存と自動再開を行う
+    "checkpoint_dir": Field(str, None), # 省略時は学習スクリプトと設定から決まるジョブ固有のディレクトリ
+    "timeout_seconds": Field((int, float), None, min=0), # 学習スクリプトの制限時間 (秒)。超えた場合はプロセスグループごと停止する
+    "onednn": Field(bool, None), # None の場合は TensorFlow のデフォルトに従う
+    "parent_run_id": Field(str, None), # 学習の記録を子Runにする親Run (パイプラインが指定する)
+    # データ並列の分散学習 (DISTRIBUTED_SCRIPTS のみ)。batch_size はワーカーごとのバッチサイズになる
+    "num_workers": Field(int, 1, min=1), # 2以上の場合は、このホストでワーカーを num_workers 個起動する
+    "worker_hosts": Field((list, str), None), # 複数ホストで学習する場合の全ワーカーのアドレス (例: "host1:23456,host2:23456")。0番がチーフ
+    "worker_index": Field((int, str, list), None), # worker_hosts のうち、このホストで起動するワーカーの番号 (例: 1 または "2,3")
+}, allow_extra=True)
+
 # デフォルト設定
-DEFAULT_CONFIG = {
-    "script_path": os.path.join(PROJECT_ROOT, "training_scripts", "mnist_trainer.py"),
-}
+DEFAULT_CONFIG = CONFIG_SCHEMA.defaults()
+
+# チェックポイント (--checkpoint_dir) に対応した学習スクリプト
+CHECKPOINT_SCRIPTS = ["mnist_trainer.py", "character_recognizer.py", "generic_trainer.py", "reinforce_cartpole_trainer.py"]
+CHECKPOINTS_DIR = os.path.join(PROJECT_ROOT, "checkpoints")
+
+# ジョブの同一性の判定に含めない設定キー
+NON_JOB_KEYS = ["parent_run_id", "checkpointing", "checkpoint_dir", "checkpoint_every", "timeout_seconds", "worker_hosts", "worker_index"]
+# 学習スクリプトに引数として渡さない、このエージェント自身の設定
+AGENT_KEYS = ["script_path", "onednn", "checkpointing", "checkpoint_dir", "timeout_seconds", "num_workers", "worker_hosts", "worker_index"]
+
+def job_checkpoint_dir(script_path, config):
+    """
+    学習スクリプトと設定から、同じジョブの再実行で同じになるチェックポイントディレクトリを決定する。
+    """
+    # 値が None の項目は学習スクリプトに渡されないため、ジョブの同一性にも含めない
+    job_config = {k: v for k, v in config.items() if k not in NON_JOB_KEYS and k != "script_path" and v is not None}
+    job_key = json.dumps({"script_path": os.path.abspath(script_path), "config": job_config}, sort_keys=True, default=str)
+    job_hash = hashlib.sha1(job_key.encode("utf-8")).hexdigest()[:12]
+    script_name = os.path.splitext(os.path.basename(script_path))[0]
+    return os.path.join(CHECKPOINTS_DIR, f"{script_name}_{job_hash}")
+
+def _as_list(value):
+    # --agent-set で渡された "a,b" 形式の文字列とリストの両方を受け付ける
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value]
+    return [item.strip() for item in str(value).split(",") if item.strip()]
+
+def distributed_workers(config):
+    """
+    分散学習のワーカーのアドレスと、このホストで起動するワーカーの番号を (workers, indices) で返す。
+    分散学習でなければ None。
+    """
+    worker_hosts = config.get("worker_hosts")
+    if worker_hosts:
+        workers = _as_list(worker_hosts)
+        if config.get("worker_index") is None:
+            raise ValueError("worker_hosts を指定した場合は、このホストで起動するワーカーの番号 (worker_index) も指定してください。")
+        indices = [int(index) for index in _as_list(config["worker_index"])]
+        invalid = [index for index in indices if not 0 <= index < len(workers)]
+        if invalid:
+            raise ValueError(f"worker_index {invalid} が worker_hosts の範囲 (0〜{len(workers) - 1}) の外です。")
+        return workers, indices
+    num_workers = int(config.get("num_workers") or 1)
+    if num_workers < 2:
+        return None
+    return free_local_addresses(num_workers), list(range(num_workers))
+
+def run_distributed(command, workers, indices, timeout, env):
+    """
+    このホストのワーカーを並行して起動し、結果のリストを返す。1つでも失敗した場合は、
+    他のワーカーが集約処理で待ち続けないよう残りのワーカーも停止する。
+    """
+    steps = [ProcessStep(f"worker{index}", command + ["--distributed", "True"], timeout=timeout, prefix=f"[worker {index}] ",
+                         env=worker_env(workers, index, env, local_workers=len(indices)))
+             for index in indices]
+    print(f"--- 分散学習: ワーカー {', '.join(map(str, indices))} を起動します (全 {len(workers)} ワーカー: {', '.join(workers)}) ---")
+    return run_supervised_steps(steps, fail_fast=True)
 
 def main(args, config):
     """
@@ -18,7 +98,7 @@ def main(args, config):
     print("Model Trainer Agent: 開始")
 
     # 実行する学習スクリプトのパスを取得
-    script_path = config.get("script_path", DEFAULT_CONFIG.get("script_path"))
+    script_path = config["script_path"]
     if not script_path:
         print("エラー: 実行する学習スクリプトのパスが指定されていません。", file=sys.stderr)
         return
@@ -42,7 +122,9 @@ def main(args, config):
     # config内のすべてのパラメータをコマンドライン引数として追加
     for key, value in config.items():
         # script_path は既に処理済みなのでスキップ
-        if key == "script_path":
+        # onednn は TensorFlow のインポート前に効く必要があるため、引数ではなく環境変数で渡す
+        # checkpointing, timeout_seconds, 分散学習の設定はこのエージェント自身の設定
+        if key in AGENT_KEYS:
             continue
         
         # data_preprocessor.py には parent_run_id を渡さない
@@ -60,29 +142,54 @@ def main(args, config):
         
         command.extend([f"--{key}", str(value)])
 
+    # 同じジョブを再実行した場合に途中から再開できるよう、ジョブ固有のチェックポイントディレクトリを渡す
+    if os.path.basename(script_path) in CHECKPOINT_SCRIPTS and config["checkpointing"]:
+        checkpoint_dir = config["checkpoint_dir"] or job_checkpoint_dir(script_path, config)
+        command.extend(["--checkpoint_dir", checkpoint_dir])
+
+    try:
+        distributed = distributed_workers(config)
+    except ValueError as e:
+        print(f"エラー: {e}", file=sys.stderr)
+        sys.exit(1)
+    if distributed and os.path.basename(script_path) not in DISTRIBUTED_SCRIPTS:
+        print(f"エラー: {os.path.basename(script_path)} は分散学習に対応していません (対応: {', '.join(DISTRIBUTED_SCRIPTS)})。", file=sys.stderr)
+        sys.exit(1)
+
     try:
         # 学習スクリプトをサブプロセスとして実行
         print(f"実行コマンド: {' '.join(command)}")
         
-        # Popenを使用してリアルタイムで出力を取得
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        
-        # 出力をリアルタイムで表示
-        for line in process.stdout:
-            sys.stdout.write(line)
-        
-        process.wait()
-
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, command)
+        # 新しいプロセスグループで実行し、出力をリアルタイムで表示する
+        timeout = config["timeout_seconds"]
+        if distributed:
+            results = run_distributed(command, *distributed, timeout, onednn_env(config["onednn"]))
+            for result in results:
+                print(f"--- {result.name} のリソース使用量: {format_summary(result.usage)} ---")
+            # 最初に失敗したワーカーを報告する (他のワーカーはそれを受けて停止されている)
+            result = next((r for r in results if r.status not in ("ok", "cancelled")), results[0])
+        else:
+            result = run_supervised(command, timeout=timeout, env=onednn_env(config["onednn"]))
+            print(f"--- 学習スクリプトのリソース使用量: {format_summary(result.usage)} ---")
+        check_cancelled() # エージェント自体がキャンセルされた場合は yggdrasil.py に伝える
+
+        if result.timed_out:
+            print(f"エラー: 学習スクリプトが制限時間 ({timeout}秒) を超えたため停止しました。", file=sys.stderr)
+            sys.exit(1) # 呼び出し元 (パイプラインやジョブのスケジューラ) に失敗を伝える
+        elif result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, output=result.output)
 
     except subprocess.CalledProcessError as e:
         print(f"エラー: 学習スクリプトの実行に失敗しました。リターンコード: {e.returncode}", file=sys.stderr)
         if e.stdout:
             print("--- stdout/stderr ---", file=sys.stderr)
             print(e.stdout, file=sys.stderr)
+        sys.exit(1) # 呼び出し元 (パイプラインやジョブのスケジューラ) に失敗を伝える
+    except ExecutionCancelled:
+        raise
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}", file=sys.stderr)
+        sys.exit(1) # 呼び出し元 (パイプラインやジョブのスケジューラ) に失敗を伝える
 
     print("Model Trainer Agent: 終了")
 
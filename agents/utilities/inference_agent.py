@@ -1,16 +1,21 @@
 import os
+import sys
 import argparse
 import numpy as np
-import tensorflow as tf
 from PIL import Image, ImageOps
 
 # このエージェントファイルの場所を基準にプロジェクトルートを特定
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# utilsディレクトリをパスに追加 (このファイルは agents/utilities/ にあるため、utils はさらに1つ上の階層)
+sys.path.append(os.path.join(os.path.dirname(PROJECT_ROOT), "utils"))
+from model_export import load_inference_model
+
 # デフォルト設定
 DEFAULT_CONFIG = {
-    "model_path": os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras"),
-    "image_path": None
+    "model_path": os.path.join(PROJECT_ROOT, "trained_models", "mnist_model_latest.keras"), # .tflite (model_exporter_agent で変換したモデル) も指定できる
+    "image_path": None,
+    "num_threads": 0 # TFLite のモデルの推論に使うスレッド数 (0 の場合は自動)
 }
 
 def preprocess_image(image_path):
@@ -71,7 +76,7 @@ def main(args, config):
     
     print(f"--- モデルをロード中: {model_path} ---")
     try:
-        model = tf.keras.models.load_model(model_path)
+        model = load_inference_model(model_path, config.get("num_threads", DEFAULT_CONFIG["num_threads"]))
         print("--- モデルのロードが完了しました ---")
     except Exception as e:
         print(f"エラー: モデルのロードに失敗しました: {e}")
@@ -87,7 +92,7 @@ def main(args, config):
     # 3. 推論の実行
     print("--- 推論を実行中 ---")
     try:
-        predictions = model.predict(processed_image)
+        predictions = model.predict(processed_image, verbose=0)
         predicted_class = np.argmax(predictions, axis=1)
         confidence = np.max(predictions)
         print("--- 推論が完了しました ---")
@@ -109,7 +114,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='MNIST推論エージェント')
     parser.add_argument('--model_path', type=str, default=DEFAULT_CONFIG["model_path"], help='学習済みモデルのパス')
     parser.add_argument('--image_path', type=str, required=True, help='推論する画像のパス')
+    parser.add_argument('--num_threads', type=int, default=DEFAULT_CONFIG["num_threads"], help='TFLite のモデルの推論に使うスレッド数')
     args = parser.parse_args()
     
-    config = {"model_path": args.model_path, "image_path": args.image_path}
+    config = {"model_path": args.model_path, "image_path": args.image_path, "num_threads": args.num_threads}
     main([], config)
\ No newline at end of file
@@ -4,12 +4,15 @@ import os
 import joblib
 import numpy as np
 
-# プロジェクトルートを定義
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# プロジェクトルートを定義 (このファイルは agents/utilities/ にある)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # utilsディレクトリをパスに追加
 sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
 from csv_analyzer import analyze_csv_features
+from resource_monitor import format_summary
+from execution_supervisor import ExecutionCancelled, check_cancelled, run_supervised
+from process_runner import step_log_path
 
 # Yggdrasilフレームワークのメインスクリプトのパス
 YGGDDRASIL_MAIN_SCRIPT = os.path.join(PROJECT_ROOT, "yggdrasil.py")
@@ -20,12 +23,15 @@ PYTHON_EXECUTABLE = os.path.join(PROJECT_ROOT, ".venv", "bin", "python")
 # デフォルト設定
 DEFAULT_CONFIG = {
     "data_file_path": None, # 学習させたいデータが含まれるCSVファイル
-    "classifier_model_path": os.path.join(PROJECT_ROOT, "trained_models", "csv_classifier_model.joblib")
+    "classifier_model_path": os.path.join(PROJECT_ROOT, "trained_models", "csv_classifier_model.joblib"),
+    "step_timeout_seconds": None, # 各ステップ (子プロセス) の制限時間 (秒)。超えた場合はプロセスグループごと停止する
+    "step_log_dir": None # 指定すると各ステップの出力を <step_log_dir>/<ステップ名>.log にも書き出す
 }
 
-def run_agent(agent_name, agent_config):
+def run_agent(agent_name, agent_config, timeout=None, log_path=None):
     """
     指定されたエージェントを、設定を渡して実行するヘルパー関数。
+    出力は表示しながら log_path (指定した場合) にも書き出し、失敗した場合は出力の末尾をエラーとして表示する。
     """
     command = [
         PYTHON_EXECUTABLE,
@@ -45,13 +51,16 @@ def run_agent(agent_name, agent_config):
     print(f"実行コマンド: {' '.join(command)}")
 
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        for line in process.stdout:
-            sys.stdout.write(line)
-        process.wait()
+        # 新しいプロセスグループで実行し、制限時間を超えた場合はグループごと停止する
+        result = run_supervised(command, timeout=timeout, log_path=log_path)
+        print(f"--- エージェント '{agent_name}' のリソース使用量: {format_summary(result.usage)} ---")
+        check_cancelled() # このエージェント自体がキャンセルされた場合は yggdrasil.py に伝える
 
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, command)
+        if result.timed_out:
+            print(f"エラー: エージェント '{agent_name}' が制限時間 ({timeout}秒) を超えたため停止しました。", file=sys.stderr)
+            sys.exit(1) # パイプラインを停止
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, output=result.output)
 
     except subprocess.CalledProcessError as e:
         print(f"エラー: エージェント '{agent_name}' の実行に失敗しました。リターンコード: {e.returncode}", file=sys.stderr)
@@ -59,6 +68,8 @@ def run_agent(agent_name, agent_config):
             print("--- stdout/stderr ---", file=sys.stderr)
             print(e.stdout, file=sys.stderr)
         sys.exit(1) # パイプラインを停止
+    except ExecutionCancelled:
+        raise
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}", file=sys.stderr)
         sys.exit(1) # パイプラインを停止
@@ -68,6 +79,10 @@ def main(args, config):
     CSVファイルのタイプを判別し、適切な学習エージェントを呼び出すメタトレーナーエージェント。
     """
     print("Meta Trainer Agent: 開始")
+    step_timeout = config.get("step_timeout_seconds", DEFAULT_CONFIG["step_timeout_seconds"])
+    step_log_dir = config.get("step_log_dir", DEFAULT_CONFIG["step_log_dir"])
+    if step_log_dir and not os.path.isabs(step_log_dir):
+        step_log_dir = os.path.join(PROJECT_ROOT, step_log_dir)
 
     data_file_path = config.get("data_file_path", DEFAULT_CONFIG["data_file_path"])
     classifier_model_path = config.get("classifier_model_path", DEFAULT_CONFIG["classifier_model_path"])
@@ -109,7 +124,7 @@ def main(args, config):
             "batch_size": 32, # デフォルトのバッチサイズ
             "learning_rate": 0.001 # デフォルトの学習率
         }
-        run_agent("model_trainer", mnist_trainer_config)
+        run_agent("model_trainer", mnist_trainer_config, step_timeout, step_log_path(step_log_dir, "1_mnist_trainer"))
 
         # モデル評価エージェントを呼び出す
         model_evaluator_config = {
@@ -117,7 +132,7 @@ def main(args, config):
             "test_data_path": "dummy_path_for_mnist_evaluation.npz", # model_evaluator_agentが内部でload_data()を呼ぶためダミー
             "evaluation_log_file": os.path.join(PROJECT_ROOT, "logs", "model_evaluation_log.csv")
         }
-        run_agent("model_evaluator_agent", model_evaluator_config)
+        run_agent("model_evaluator_agent", model_evaluator_config, step_timeout, step_log_path(step_log_dir, "2_model_evaluator"))
 
         # レポート生成エージェントを呼び出す
         report_output_filename = os.path.splitext(os.path.basename(data_file_path))[0] + "_Report.md"
@@ -125,14 +140,14 @@ def main(args, config):
             "log_file_path": mnist_trainer_config["log_file"],
             "report_output_path": os.path.join(PROJECT_ROOT, report_output_filename)
         }
-        run_agent("report_generator_agent", report_generator_config)
+        run_agent("report_generator_agent", report_generator_config, step_timeout, step_log_path(step_log_dir, "3_report_generator"))
 
         # モデル選択エージェントを呼び出す
         model_selector_config = {
             "evaluation_log_file": model_evaluator_config["evaluation_log_file"],
             "output_best_model_path": os.path.join(PROJECT_ROOT, "trained_models", "best_model_from_meta.txt")
         }
-        run_agent("model_selector_agent", model_selector_config)
+        run_agent("model_selector_agent", model_selector_config, step_timeout, step_log_path(step_log_dir, "4_model_selector"))
 
     elif predicted_log_type == "reinforce":
         print("強化学習データタイプを検出しました。CartPole強化学習モデルの学習を開始します。")
@@ -143,7 +158,7 @@ def main(args, config):
             "learning_rate": 0.001, # デフォルトの学習率
             "gamma": 0.99 # デフォルトの割引率
         }
-        run_agent("reinforcement_learner", reinforce_trainer_config)
+        run_agent("reinforcement_learner", reinforce_trainer_config, step_timeout, step_log_path(step_log_dir, "1_reinforce_trainer"))
 
         # モデル評価エージェントを呼び出す
         # 強化学習モデルの評価は、通常、環境でのシミュレーションを通じて行われるため、
@@ -153,7 +168,7 @@ def main(args, config):
             "test_data_path": "dummy_path_for_reinforce_evaluation.npz", # 強化学習では通常使わないが引数として必要
             "evaluation_log_file": os.path.join(PROJECT_ROOT, "logs", "model_evaluation_log.csv")
         }
-        run_agent("model_evaluator_agent", model_evaluator_config)
+        run_agent("model_evaluator_agent", model_evaluator_config, step_timeout, step_log_path(step_log_dir, "2_model_evaluator"))
 
         # レポート生成エージェントを呼び出す
         report_output_filename = os.path.splitext(os.path.basename(data_file_path))[0] + "_Report.md"
@@ -161,14 +176,14 @@ def main(args, config):
             "log_file_path": reinforce_trainer_config["log_file"],
             "report_output_path": os.path.join(PROJECT_ROOT, report_output_filename)
         }
-        run_agent("report_generator_agent", report_generator_config)
+        run_agent("report_generator_agent", report_generator_config, step_timeout, step_log_path(step_log_dir, "3_report_generator"))
 
         # モデル選択エージェントを呼び出す
         model_selector_config = {
             "evaluation_log_file": model_evaluator_config["evaluation_log_file"],
             "output_best_model_path": os.path.join(PROJECT_ROOT, "trained_models", "best_model_from_meta.txt")
         }
-        run_agent("model_selector_agent", model_selector_config)
+        run_agent("model_selector_agent", model_selector_config, step_timeout, step_log_path(step_log_dir, "4_model_selector"))
 
     else:
         print(f"警告: 未知のデータタイプ '{predicted_log_type}' が予測されました。学習エージェントは呼び出されません。", file=sys.stderr)
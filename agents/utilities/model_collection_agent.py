@@ -1,87 +1,235 @@
 import os
-import json
 import argparse
+import json
+import sqlite3
 
 # プロジェクトルートを定義 (このスクリプトがどこにあっても動作するように調整)
 # このスクリプトが my_yggdrasil_framework/agents/ の直下にあると仮定
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODELS_FILE = os.path.join(PROJECT_ROOT, "data", "models.json")
 
-def load_models():
-    if not os.path.exists(MODELS_FILE):
-        return []
+# utilsディレクトリをパスに追加 (このファイルは agents/utilities/ にあるため、utils はさらに1つ上の階層)
+os.sys.path.append(os.path.join(os.path.dirname(PROJECT_ROOT), "utils"))
+from artifact_registry import ArtifactRegistry
+from model_catalog import ModelCatalog, DEFAULT_PAGE_SIZE
+
+# カタログに取り込む旧形式のJSONファイル (このファイルの位置から求めた場所と、リポジトリの data/ の両方)
+LEGACY_MODELS_FILES = [MODELS_FILE, os.path.join(os.path.dirname(PROJECT_ROOT), "data", "models.json")]
+
+def open_catalog():
+    """
+    モデルカタログを開き、旧形式の models.json があれば一度だけ取り込む。
+    """
+    catalog = ModelCatalog()
+    for legacy_file in LEGACY_MODELS_FILES:
+        try:
+            migrated = catalog.migrate_json(legacy_file)
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: Could not migrate {legacy_file}: {e}", file=os.sys.stderr)
+            continue
+        if migrated is not None:
+            print(f"Migrated {migrated} models from {legacy_file} to {catalog.path}.")
+    return catalog
+
+def parse_metrics(items):
+    """
+    "name=value" のリストを指標の辞書に変換する。
+    """
+    metrics = {}
+    for item in items or ():
+        key, sep, value = item.partition("=")
+        try:
+            if not sep:
+                raise ValueError(item)
+            metrics[key.strip()] = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid metric (expected name=value): {item}")
+    return metrics
+
+def register_artifact(path):
+    """
+    モデルファイルを成果物レジストリに登録し、(ハッシュ, 学習時の指標と評価結果) を返す。
+    """
+    with ArtifactRegistry() as registry:
+        digest = registry.register(path, kind="model", script="model_collection_agent")["digest"]
+        metrics = {}
+        artifact = registry.lookup(digest)
+        for record in artifact["manifests"] + artifact["evaluations"]:
+            metrics.update(record["metrics"] or {})
+    return digest, metrics
+
+def add_model(name, comment, path=None, tags=(), metrics=None):
+    digest, artifact_metrics = None, {}
+    if path:
+        # モデルファイルを成果物レジストリに登録し、内容のハッシュで参照する
+        try:
+            digest, artifact_metrics = register_artifact(path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error: Could not register {path} in the artifact registry: {e}", file=os.sys.stderr)
+            return
     try:
-        with open(MODELS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        print(f"Error: Could not decode JSON from {MODELS_FILE}. Returning empty list.", file=os.sys.stderr)
-        return []
-
-def save_models(models):
-    os.makedirs(os.path.dirname(MODELS_FILE), exist_ok=True)
-    with open(MODELS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(models, f, ensure_ascii=False, indent=4)
-
-def add_model(name, comment):
-    models = load_models()
-    models.append({"name": name, "comment": comment})
-    save_models(models)
+        with open_catalog() as catalog:
+            catalog.add(name, comment, path=path, digest=digest, tags=tags, metrics={**artifact_metrics, **(metrics or {})})
+    except ValueError as e:
+        print(f"Error: {e}", file=os.sys.stderr)
+        return
     print(f"Model '{name}' added to collection.")
 
-def list_models():
-    models = load_models()
-    if not models:
-        print("No models in the collection yet.")
+def artifact_details(models):
+    """
+    成果物レジストリから、ハッシュを持つモデルの (サイズ, 作成したスクリプト) を返す。
+    """
+    details = {}
+    digests = [model["digest"] for model in models if model.get("digest")]
+    if not digests:
+        return details
+    try:
+        with ArtifactRegistry() as registry:
+            for digest in digests:
+                artifact = registry.lookup(digest)
+                if artifact:
+                    producer = registry.producer(digest)
+                    details[digest] = (artifact["size"], producer["script"] if producer else None)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: Could not read the artifact registry: {e}", file=os.sys.stderr)
+    return details
+
+def list_models(text=None, tags=(), metric=None, min_value=None, max_value=None, sort_by=None, ascending=False, page=1, page_size=DEFAULT_PAGE_SIZE):
+    with open_catalog() as catalog:
+        models, total = catalog.search(text, tags, metric, min_value, max_value, sort_by, not ascending, page, page_size)
+        tag_counts = catalog.tag_counts()
+    if not total:
+        print("No models in the collection yet." if not (text or tags or metric or sort_by) else "No models match the given conditions.")
         return
 
-    print("\n--- Model Collection ---")
-    for i, model in enumerate(models):
-        print(f"{i + 1}. Name: {model['name']}")
+    details = artifact_details(models)
+    pages = (total + page_size - 1) // page_size
+    print(f"\n--- Model Collection (page {page}/{pages}, {total} models) ---")
+    for i, model in enumerate(models, start=(page - 1) * page_size + 1):
+        print(f"{i}. Name: {model['name']}")
         print(f"   Comment: {model['comment']}")
+        if model["tags"]:
+            print(f"   Tags: {', '.join(model['tags'])}")
+        if model["metrics"]:
+            print(f"   Metrics: {', '.join(f'{key}={value:.4f}' for key, value in model['metrics'].items())}")
+        if model.get("digest"):
+            size, script = details.get(model["digest"], (None, None))
+            print(f"   Artifact: {model['digest'][:12]}" + (f" ({size / (1024 * 1024):.1f}MB, produced by {script or 'unknown'})" if size is not None else " (not in registry)"))
         print("-" * 20)
+    if tag_counts:
+        # 絞り込みに使えるタグの一覧 (--tag で指定する)
+        print(f"Tags in collection: {', '.join(f'{tag} ({count})' for tag, count in tag_counts.items())}")
     print("--------------------")
 
-def update_model(name, comment):
-    models = load_models()
-    found = False
-    for model in models:
-        if model["name"] == name:
-            model["comment"] = comment
-            found = True
-            break
-    if found:
-        save_models(models)
-        print(f"Model '{name}' comment updated successfully.")
+def show_model(name):
+    with open_catalog() as catalog:
+        model = catalog.get(name)
+    if model is None:
+        print(f"Error: Model '{name}' not found.", file=os.sys.stderr)
+        return
+    if model.get("digest"):
+        # 成果物のマニフェスト (作成したスクリプト・実験・データセット) と評価結果をあわせて表示する
+        try:
+            with ArtifactRegistry() as registry:
+                model["artifact"] = registry.lookup(model["digest"])
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Could not read the artifact registry: {e}", file=os.sys.stderr)
+    print(json.dumps(model, ensure_ascii=False, indent=2))
+
+def update_model(name, comment=None, path=None, add_tags=(), remove_tags=(), metrics=None):
+    digest, artifact_metrics = None, {}
+    if path:
+        try:
+            digest, artifact_metrics = register_artifact(path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Error: Could not register {path} in the artifact registry: {e}", file=os.sys.stderr)
+            return
+    with open_catalog() as catalog:
+        model = catalog.update(name, comment=comment, path=path, digest=digest, add_tags=add_tags, remove_tags=remove_tags,
+                               metrics={**artifact_metrics, **(metrics or {})})
+    if model is not None:
+        print(f"Model '{name}' updated successfully.")
     else:
         print(f"Error: Model '{name}' not found.", file=os.sys.stderr)
 
+def remove_model(name):
+    with open_catalog() as catalog:
+        removed = catalog.remove(name)
+    if removed:
+        print(f"Model '{name}' removed from collection.")
+    else:
+        print(f"Error: Model '{name}' not found.", file=os.sys.stderr)
+
+def sync_metrics(names=None):
+    try:
+        with open_catalog() as catalog, ArtifactRegistry() as registry:
+            updated = catalog.sync_from_registry(registry, names)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error: Could not read the artifact registry: {e}", file=os.sys.stderr)
+        return
+    print(f"Updated metrics of {updated} models from the artifact registry.")
+
 def main(args, config):
     parser = argparse.ArgumentParser(description='Learning Model Collection Tool')
     parser.add_argument('--add', action='store_true', help='Add a new model to the collection.')
-    parser.add_argument('--list', action='store_true', help='List models in the collection.')
-    parser.add_argument('--update', action='store_true', help="Update an existing model's comment.")
+    parser.add_argument('--list', action='store_true', help='List (and search) models in the collection.')
+    parser.add_argument('--show', action='store_true', help='Show a model with its artifact manifests and evaluations.')
+    parser.add_argument('--update', action='store_true', help="Update an existing model's comment, tags, metrics or file.")
+    parser.add_argument('--remove', action='store_true', help='Remove a model from the collection.')
+    parser.add_argument('--sync', action='store_true', help='Update model metrics from the evaluations in the artifact registry.')
     parser.add_argument('--name', type=str, help='Name of the model.')
     parser.add_argument('--comment', type=str, help='Comment about the model.')
+    parser.add_argument('--path', type=str, help='Model file to register in the artifact registry (with --add or --update).')
+    parser.add_argument('--tag', action='append', default=[], help='Tag to add (with --add/--update) or to filter by (with --list). Repeatable.')
+    parser.add_argument('--untag', action='append', default=[], help='Tag to remove (with --update). Repeatable.')
+    parser.add_argument('--metric', action='append', default=[], help='Metric as name=value (with --add/--update). Repeatable.')
+    parser.add_argument('--search', type=str, help='Text to search for in names and comments (with --list).')
+    parser.add_argument('--filter_metric', type=str, help='Metric to filter by with --min/--max (with --list).')
+    parser.add_argument('--min', type=float, help='Minimum value of --filter_metric.')
+    parser.add_argument('--max', type=float, help='Maximum value of --filter_metric.')
+    parser.add_argument('--sort', type=str, help='Sort by this metric, best first (with --list).')
+    parser.add_argument('--ascending', action='store_true', help='Sort in ascending order (e.g. for loss).')
+    parser.add_argument('--page', type=int, default=1, help='Page number (with --list).')
+    parser.add_argument('--page_size', type=int, default=DEFAULT_PAGE_SIZE, help='Models per page (with --list).')
 
     # yggdrasil.pyから渡される引数をパース
     parsed_args = parser.parse_args(args)
 
+    try:
+        metrics = parse_metrics(parsed_args.metric)
+    except ValueError as e:
+        print(f"Error: {e}", file=os.sys.stderr)
+        return
+
     if parsed_args.add:
         if not parsed_args.name or not parsed_args.comment:
             print("Error: Name and comment are required to add a model.", file=os.sys.stderr)
         else:
-            add_model(parsed_args.name, parsed_args.comment)
+            add_model(parsed_args.name, parsed_args.comment, parsed_args.path, parsed_args.tag, metrics)
     elif parsed_args.list:
-        list_models()
+        list_models(parsed_args.search, parsed_args.tag, parsed_args.filter_metric, parsed_args.min, parsed_args.max,
+                    parsed_args.sort, parsed_args.ascending, max(1, parsed_args.page), max(1, parsed_args.page_size))
+    elif parsed_args.show:
+        if not parsed_args.name:
+            print("Error: Model name is required to show a model.", file=os.sys.stderr)
+        else:
+            show_model(parsed_args.name)
     elif parsed_args.update:
-        if not parsed_args.name or not parsed_args.comment:
-            print("Error: Model name and new comment are required to update a model.", file=os.sys.stderr)
+        if not parsed_args.name or not (parsed_args.comment or parsed_args.path or parsed_args.tag or parsed_args.untag or metrics):
+            print("Error: Model name and a new comment, file, tag or metric are required to update a model.", file=os.sys.stderr)
+        else:
+            update_model(parsed_args.name, parsed_args.comment, parsed_args.path, parsed_args.tag, parsed_args.untag, metrics)
+    elif parsed_args.remove:
+        if not parsed_args.name:
+            print("Error: Model name is required to remove a model.", file=os.sys.stderr)
         else:
-            update_model(parsed_args.name, parsed_args.comment)
+            remove_model(parsed_args.name)
+    elif parsed_args.sync:
+        sync_metrics([parsed_args.name] if parsed_args.name else None)
     else:
-        print("Please specify a command: --add, --list, or --update", file=os.sys.stderr)
+        print("Please specify a command: --add, --list, --show, --update, --remove or --sync", file=os.sys.stderr)
 
 if __name__ == '__main__':
     # このスクリプトが直接実行された場合のテスト用
     # yggdrasil.pyから呼び出される場合は、main関数に引数が渡される
-    main(os.sys.argv[1:], {}) # コマンドライン引数を渡し、空のconfigを渡す
\ No newline at end of file
+    main(os.sys.argv[1:], {}) # コマンドライン引数を渡し、空のconfigを渡す
@@ -1,33 +1,52 @@
 import os
 import argparse
 import csv
+import sqlite3
 import sys
 
 # プロジェクトルートを定義
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# utilsディレクトリをパスに追加 (このファイルは agents/utilities/ にあるため、utils はさらに1つ上の階層)
+sys.path.append(os.path.join(os.path.dirname(PROJECT_ROOT), "utils"))
+from artifact_registry import ArtifactRegistry
+
 # デフォルト設定
 DEFAULT_CONFIG = {
+    "source": "evaluation_log", # 'evaluation_log' (評価ログのCSV) または 'registry' (成果物レジストリの評価結果)
+    "metric": "accuracy", # source が 'registry' の場合に比較する指標
     "evaluation_log_file": os.path.join(PROJECT_ROOT, "logs", "model_evaluation_log.csv"),
     "output_best_model_path": os.path.join(PROJECT_ROOT, "trained_models", "best_model.txt")
 }
 
-def main(args, config):
+def select_from_registry(metric):
     """
-    モデル評価ログを解析し、最適なモデルを選択するエージェント。
+    成果物レジストリに記録された評価結果から、指標 metric が最も良いモデルの (パス, 値) を返す。
+    推論時間の指標 (benchmark_agent の latency_p50_ms など、名前が _ms で終わるもの) は小さいほど良いとみなす。
+    同じ内容のモデルは1つの成果物として比較し、作成したスクリプトと実験の情報を表示する。
     """
-    print("Model Selector Agent: 開始")
-
-    evaluation_log_file = config.get("evaluation_log_log_file", DEFAULT_CONFIG["evaluation_log_file"])
-    output_best_model_path = config.get("output_best_model_path", DEFAULT_CONFIG["output_best_model_path"])
-
-    if not os.path.exists(evaluation_log_file):
-        print(f"エラー: 評価ログファイルが見つかりません: {evaluation_log_file}", file=sys.stderr)
-        return
+    print(f"--- 成果物レジストリの評価結果から選択中 (指標: {metric}) ---")
+    try:
+        with ArtifactRegistry() as registry:
+            best = registry.best(metric, lower_is_better=metric.endswith("_ms"))
+            if best is None:
+                return None, None
+            digest, value = best
+            manifest = registry.producer(digest)
+            if manifest:
+                print(f"作成: {manifest['script'] or '-'} (実験: {manifest['run_name'] or '-'}, データセット: {manifest['dataset_digest'][:12] if manifest['dataset_digest'] else '-'})")
+            return registry.current_path(digest), value
+    except (OSError, sqlite3.Error) as e:
+        print(f"エラー: 成果物レジストリを参照できませんでした: {e}", file=sys.stderr)
+        return None, None
 
+def select_from_evaluation_log(evaluation_log_file):
+    """
+    評価ログのCSVから、精度が最も高いモデルの (パス, 精度) を返す。
+    """
     best_accuracy = -1.0
     best_model_path = None
-    
+
     print(f"--- 評価ログを解析中: {evaluation_log_file} ---")
     try:
         with open(evaluation_log_file, 'r', newline='', encoding='utf-8') as csvfile:
@@ -46,12 +65,32 @@ def main(args, config):
 
     except (IOError, csv.Error) as e:
         print(f"エラー: 評価ログファイルの読み込みまたは解析に失敗しました: {e}", file=sys.stderr)
-        return
+        return None, None
+    return best_model_path, best_accuracy
+
+def main(args, config):
+    """
+    モデル評価ログを解析し、最適なモデルを選択するエージェント。
+    """
+    print("Model Selector Agent: 開始")
+
+    evaluation_log_file = config.get("evaluation_log_file", DEFAULT_CONFIG["evaluation_log_file"])
+    output_best_model_path = config.get("output_best_model_path", DEFAULT_CONFIG["output_best_model_path"])
+
+    metric_label = "精度"
+    if config.get("source", DEFAULT_CONFIG["source"]) == "registry":
+        metric_label = config.get("metric", DEFAULT_CONFIG["metric"])
+        best_model_path, best_accuracy = select_from_registry(metric_label)
+    else:
+        if not os.path.exists(evaluation_log_file):
+            print(f"エラー: 評価ログファイルが見つかりません: {evaluation_log_file}", file=sys.stderr)
+            return
+        best_model_path, best_accuracy = select_from_evaluation_log(evaluation_log_file)
 
     if best_model_path:
         print(f"\n========== 最適なモデル ==========")
         print(f"パス: {best_model_path}")
-        print(f"精度: {best_accuracy:.4f}")
+        print(f"{metric_label}: {best_accuracy:.4f}")
         print(f"==============================")
 
         # 最適なモデルのパスをファイルに保存
@@ -72,11 +111,15 @@ def main(args, config):
 if __name__ == '__main__':
     import argparse
     parser = argparse.ArgumentParser(description='モデル選択エージェント')
+    parser.add_argument('--source', type=str, default=DEFAULT_CONFIG["source"], choices=['evaluation_log', 'registry'], help='選択に使う評価結果')
+    parser.add_argument('--metric', type=str, default=DEFAULT_CONFIG["metric"], help='source が registry の場合に比較する指標 (例: accuracy, latency_p50_ms)')
     parser.add_argument('--evaluation_log_file', type=str, default=DEFAULT_CONFIG["evaluation_log_file"], help='評価ログファイルのパス')
     parser.add_argument('--output_best_model_path', type=str, default=DEFAULT_CONFIG["output_best_model_path"], help='最適なモデルのパスの出力先')
     args = parser.parse_args()
     
     config = {
+        "source": args.source,
+        "metric": args.metric,
         "evaluation_log_file": args.evaluation_log_file,
         "output_best_model_path": args.output_best_model_path
     }
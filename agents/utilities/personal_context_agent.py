@@ -1,13 +1,21 @@
 import json
 import datetime
+import hashlib
+import heapq
+import math
 import os
+import sys
 from collections import Counter
-from sklearn.feature_extraction.text import TfidfVectorizer
-import re
-from janome.tokenizer import Tokenizer # 追加
+from operator import itemgetter
 
-# プロジェクトルートを定義
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# プロジェクトルートを定義 (このファイルは agents/utilities/ にある)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from japanese_tokenizer import iter_file_tokens, content_words
+from text_analyzers import WORD_PATTERN, get_analyzer
+import user_log
 
 # Define paths
 LOGS_DIR = "logs/user_logs"
@@ -15,10 +23,22 @@ DATA_DIR = "data"
 USER_PROFILE_PATH = os.path.join(DATA_DIR, "user_profile.json")
 SUMMARY_FOR_GEMINI_PATH = os.path.join(DATA_DIR, "summary_for_gemini.txt")
 USER_UTTERANCES_FILE = os.path.join(PROJECT_ROOT, 'data', 'user_utterances.txt') # 追加
+STATE_PATH = os.path.join(DATA_DIR, "personal_context_state.json")
+
+DEFAULT_CONFIG = {
+    "user_message": None,
+    # Running word/document frequencies, so each run only processes messages added since the last one
+    "state_path": STATE_PATH,
+    # Splits messages into TF-IDF terms: "janome" (morphological), "regex" or "char_ngram"
+    "analyzer": "janome",
+    "frequent_words_top_k": 50,
+    "keywords_top_k": 10,
+    "state_retention_days": 7
+}
 
 def get_log_file_path(date_obj):
-    """Generates the log file path for a given date."""
-    return os.path.join(LOGS_DIR, date_obj.strftime("%Y%m%d_user_log.json"))
+    """Generates the (JSON lines) log file path for a given date."""
+    return user_log.get_log_file_path(LOGS_DIR, date_obj)
 
 def load_json_file(file_path, default_value=None):
     """Loads a JSON file, returning default_value if not found or invalid."""
@@ -40,85 +60,184 @@ def save_json_file(file_path, data):
     with open(file_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=4)
 
-def tokenize_japanese(text):
+def file_checksum_before(file_path, offset, window=4096):
+    """Hash of the bytes just before offset, used to detect that a file was rewritten."""
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, offset - window))
+        return hashlib.sha1(f.read(min(offset, window))).hexdigest()
+
+def new_state():
+    return {
+        "document_count": 0,
+        "document_frequencies": {},
+        "word_counts": {},
+        "days": {},
+        "utterances": {"offset": 0, "checksum": None, "word_counts": {}}
+    }
+
+def load_state(state_path, user_profile, analyzer_name):
+    """
+    Loads the incremental state. On the first run it is seeded from the existing profile
+    so that previously accumulated word counts are not lost.
+    """
+    state = load_json_file(state_path, None)
+    if state is None:
+        state = new_state()
+        state["word_counts"] = dict(user_profile.get("frequent_words", {}))
+    elif state.get("analyzer") != analyzer_name:
+        # TF-IDF terms from a different analyzer are not comparable, so start the IDF over
+        state["document_count"] = 0
+        state["document_frequencies"] = {}
+        for day in state["days"].values():
+            day["tf_sums"] = {}
+    state["analyzer"] = analyzer_name
+    return state
+
+def save_state(state_path, state):
+    """Saves the state atomically so an interrupted run never leaves a half-written file."""
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+def update_day_state(state, day_key, log_path, analyzer):
     """
-    A very basic tokenizer for Japanese text using regex.
-    Splits text by common delimiters and extracts sequences of Japanese characters.
-    This is a simplification for TF-IDF without a proper morphological analyzer.
+    Folds log entries appended since the last run into the running document frequencies,
+    word counts and the day's term-frequency sums. Returns the number of new messages.
     """
-    # Split by spaces, punctuation, etc.
-    tokens = re.findall(r'[ぁ-んァ-ヶー一-龠々]+|[a-zA-Z0-9]+', text)
-    return " ".join(tokens) # TfidfVectorizer expects space-separated words
+    day = state["days"].setdefault(day_key, {"offset": 0, "tf_sums": {}, "total_length": 0, "message_count": 0})
+    if "entries_processed" in day: # state written before the logs became JSON lines
+        processed = day.pop("entries_processed")
+        day["offset"] = 0
+        for i, (_, offset) in enumerate(user_log.iter_entries(log_path)):
+            if i == processed - 1:
+                day["offset"] = offset
+                break
+    if os.path.exists(log_path) and os.path.getsize(log_path) < day["offset"]:
+        print(f"Warning: {log_path} is shorter than the part already processed. Skipping it.")
+        day["offset"] = os.path.getsize(log_path)
+        return 0
 
-def main(agent_args):
+    new_messages = []
+    for entry, offset in user_log.iter_entries(log_path, day["offset"]):
+        if "message" in entry:
+            new_messages.append(entry["message"])
+        day["offset"] = offset
+    document_frequencies = state["document_frequencies"]
+    word_counts = state["word_counts"]
+    tf_sums = day["tf_sums"]
+    for message in new_messages:
+        terms = analyzer(message)
+        if terms:
+            state["document_count"] += 1
+            for term, count in Counter(terms).items():
+                document_frequencies[term] = document_frequencies.get(term, 0) + 1
+                tf_sums[term] = tf_sums.get(term, 0.0) + count / len(terms)
+        for word in WORD_PATTERN.findall(message):
+            word_counts[word] = word_counts.get(word, 0) + 1
+        day["total_length"] += len(message)
+        day["message_count"] += 1
+    return len(new_messages)
+
+def top_keywords(state, day_key, top_k):
+    """
+    Top TF-IDF keywords of a day, using smoothed IDF over every message processed so far.
+    """
+    day = state["days"].get(day_key)
+    if not day or not day["tf_sums"]:
+        return []
+    n_documents = state["document_count"]
+    document_frequencies = state["document_frequencies"]
+    def score(item):
+        term, tf_sum = item
+        return tf_sum * (math.log((1 + n_documents) / (1 + document_frequencies.get(term, 0))) + 1)
+    return [term for term, _ in heapq.nlargest(top_k, day["tf_sums"].items(), key=score)]
+
+def update_utterance_counts(state, utterances_file):
+    """
+    Tokenizes only the lines appended to user_utterances.txt since the last run.
+    If the file was truncated or rewritten with different content, counting starts over.
+    """
+    utterances = state["utterances"]
+    offset = utterances["offset"]
+    if offset and (os.path.getsize(utterances_file) < offset or file_checksum_before(utterances_file, offset) != utterances["checksum"]):
+        print(f"警告: {utterances_file} が書き換えられたため、頻出単語を最初から集計し直します。")
+        offset = 0
+        utterances["word_counts"] = {}
+
+    word_counts = utterances["word_counts"]
+    new_lines = 0
+    # An unterminated last line is still being written; count it next run together with the rest of the line
+    for _, tokens, next_offset in iter_file_tokens(utterances_file, start_offset=offset, include_partial=False):
+        for word in content_words(tokens):
+            word_counts[word] = word_counts.get(word, 0) + 1
+        offset = next_offset
+        new_lines += 1
+    utterances["offset"] = offset
+    utterances["checksum"] = file_checksum_before(utterances_file, offset)
+    return new_lines
+
+def main(args, config=None):
+    final_config = DEFAULT_CONFIG.copy()
+    if config:
+        final_config.update(config)
     print("personal_context_agent started.")
 
     # 1. Handle user_message and log it
-    user_message = agent_args.get("user_message")
+    user_message = final_config.get("user_message")
     current_date = datetime.date.today()
     current_log_path = get_log_file_path(current_date)
 
-    current_log_data = load_json_file(current_log_path, [])
+    # Convert any daily logs still in the old JSON-array format
+    user_log.migrate_logs_dir(LOGS_DIR)
+
     if user_message:
         timestamp = datetime.datetime.now().isoformat()
-        current_log_data.append({"timestamp": timestamp, "message": user_message})
-        save_json_file(current_log_path, current_log_data)
+        user_log.append_entry(current_log_path, {"timestamp": timestamp, "message": user_message})
         print(f"Logged user message to {current_log_path}")
 
-    # 2. Read previous day's log
+    user_profile = load_json_file(USER_PROFILE_PATH, {
+        "frequent_words": {},
+        "topic_trends": [],
+        "usage_style": {},
+        "top_frequent_words_from_all_logs": {} # 新しいキーを追加
+    })
+    state_path = final_config["state_path"]
+    state = load_state(state_path, user_profile, final_config["analyzer"])
+    analyzer = get_analyzer(final_config["analyzer"])
+
+    # 2. Fold messages from yesterday's log that were not processed yet into the running state
     yesterday = current_date - datetime.timedelta(days=1)
+    yesterday_key = yesterday.strftime("%Y%m%d")
     yesterday_log_path = get_log_file_path(yesterday)
-    yesterday_log_data = load_json_file(yesterday_log_path, [])
-
-    all_messages_yesterday = [entry["message"] for entry in yesterday_log_data if "message" in entry]
-    if not all_messages_yesterday:
+    new_message_count = update_day_state(state, yesterday_key, yesterday_log_path, analyzer)
+    if state["days"][yesterday_key]["message_count"] == 0:
         print(f"No messages found in yesterday's log: {yesterday_log_path}. Skipping keyword extraction and profile update.")
-        # Still proceed to generate summary, but it will be based on existing profile or empty.
-        # If no previous log, the summary will be minimal.
-        # We should still generate a summary for Gemini, even if it's just a "no new context" message.
-        # For now, I'll let the rest of the code run, which will use an empty text for TF-IDF.
-        # This means the profile won't be updated based on yesterday's log if it's empty.
-        pass
+    else:
+        print(f"Processed {new_message_count} new messages from {yesterday_log_path}.")
+
+    # Drop per-day state that is too old to be "yesterday" again
+    oldest_key = (current_date - datetime.timedelta(days=final_config["state_retention_days"])).strftime("%Y%m%d")
+    state["days"] = {key: value for key, value in state["days"].items() if key >= oldest_key}
 
     # 3. Keyword extraction (TF-IDF)
-    # Prepare text for TF-IDF
-    processed_text_for_tfidf = [tokenize_japanese(msg) for msg in all_messages_yesterday]
-    
-    keywords = []
-    if processed_text_for_tfidf:
-        try:
-            vectorizer = TfidfVectorizer(min_df=1, stop_words=None) # min_df=1 to include all words
-            tfidf_matrix = vectorizer.fit_transform(processed_text_for_tfidf)
-            feature_names = vectorizer.get_feature_names_out()
-
-            # Get top keywords from the combined text
-            # Sum TF-IDF scores for each word across all documents
-            sums = tfidf_matrix.sum(axis=0)
-            ranking = [(feature_names[col], sums[0, col]) for col in sums.argsort()[0, ::-1]]
-            
-            # Extract top N keywords (e.g., top 10)
-            keywords = [word for word, score in ranking[:10]]
-            print(f"Extracted keywords from yesterday's log: {keywords}")
-        except Exception as e:
-            print(f"Error during TF-IDF keyword extraction: {e}")
-            keywords = [] # Fallback to empty keywords
+    keywords = top_keywords(state, yesterday_key, final_config["keywords_top_k"])
+    if keywords:
+        print(f"Extracted keywords from yesterday's log: {keywords}")
 
     # --- Start: Analyze all user utterances for overall frequent words ---
     overall_frequent_words = {}
     if os.path.exists(USER_UTTERANCES_FILE):
-        t = Tokenizer()
-        all_words_from_all_logs = []
         try:
-            with open(USER_UTTERANCES_FILE, 'r', encoding='utf-8') as f:
-                for line in f:
-                    for token in t.tokenize(line.strip()):
-                        part_of_speech = token.part_of_speech.split(',')[0]
-                        if part_of_speech in ['名詞', '動詞', '形容詞']:
-                            all_words_from_all_logs.append(token.base_form)
-            print(f"ユーザーの発言全体 ({USER_UTTERANCES_FILE}) を読み込み、形態素解析しました。")
-            if all_words_from_all_logs:
-                overall_frequent_words = dict(Counter(all_words_from_all_logs).most_common(50)) # 上位50件
-                print(f"全体からの頻出単語を抽出しました (上位50件)。")
+            # 前回の続きから、追記された発言だけを形態素解析する
+            new_lines = update_utterance_counts(state, USER_UTTERANCES_FILE)
+            print(f"ユーザーの発言全体 ({USER_UTTERANCES_FILE}) のうち、新しい {new_lines} 行を形態素解析しました。")
+            word_counts = state["utterances"]["word_counts"]
+            if word_counts:
+                top_k = final_config["frequent_words_top_k"]
+                overall_frequent_words = dict(heapq.nlargest(top_k, word_counts.items(), key=itemgetter(1)))
+                print(f"全体からの頻出単語を抽出しました (上位{top_k}件)。")
             else:
                 print("警告: ユーザーの発言全体から解析できる単語が見つかりませんでした。")
         except Exception as e:
@@ -127,26 +246,14 @@ def main(agent_args):
         print(f"警告: ユーザーの発言全体ファイルが見つかりません: {USER_UTTERANCES_FILE}")
     # --- End: Analyze all user utterances for overall frequent words ---
 
-    # 4. Update user_profile.json
-    user_profile = load_json_file(USER_PROFILE_PATH, {
-        "frequent_words": {},
-        "topic_trends": [],
-        "usage_style": {},
-        "top_frequent_words_from_all_logs": {} # 新しいキーを追加
-    })
+    # Persist the state before the profile: the profile can always be rebuilt from the state,
+    # but messages folded into a lost state would be counted twice on the next run.
+    save_state(state_path, state)
 
-    # Update frequent words (simple count for now, can be refined with TF-IDF scores)
-    if all_messages_yesterday:
-        combined_text = " ".join(all_messages_yesterday)
-        words = re.findall(r'[ぁ-んァ-ヶー一-龠々]+|[a-zA-Z0-9]+', combined_text)
-        word_counts = Counter(words)
-        
-        # Merge with existing frequent words, keeping top N
-        for word, count in word_counts.items():
-            user_profile["frequent_words"][word] = user_profile["frequent_words"].get(word, 0) + count
-        
-        # Keep only top 50 frequent words
-        user_profile["frequent_words"] = dict(sorted(user_profile["frequent_words"].items(), key=lambda item: item[1], reverse=True)[:50])
+    # 4. Update user_profile.json
+    # Keep only the top N frequent words (running counts of every word are kept in the state)
+    if state["word_counts"]:
+        user_profile["frequent_words"] = dict(heapq.nlargest(final_config["frequent_words_top_k"], state["word_counts"].items(), key=itemgetter(1)))
 
     # Update topic trends with extracted keywords
     if keywords:
@@ -158,9 +265,9 @@ def main(agent_args):
         user_profile["topic_trends"] = user_profile["topic_trends"][-20:]
 
     # Update usage style (e.g., average message length, can add more metrics)
-    if all_messages_yesterday:
-        total_length = sum(len(msg) for msg in all_messages_yesterday)
-        avg_length = total_length / len(all_messages_yesterday) if all_messages_yesterday else 0
+    yesterday_state = state["days"][yesterday_key]
+    if yesterday_state["message_count"]:
+        avg_length = yesterday_state["total_length"] / yesterday_state["message_count"]
         user_profile["usage_style"]["avg_message_length_yesterday"] = round(avg_length, 2)
         # You can add more metrics here, e.g., sentiment analysis if a library is available.
 
@@ -181,7 +288,7 @@ def main(agent_args):
 
     summary_text += "\nユーザーの頻出語:\n"
     if user_profile["frequent_words"]:
-        top_frequent = dict(sorted(user_profile["frequent_words"].items(), key=lambda item: item[1], reverse=True)[:5])
+        top_frequent = dict(heapq.nlargest(5, user_profile["frequent_words"].items(), key=itemgetter(1)))
         summary_text += "・" + "、".join([f"{word} ({count})" for word, count in top_frequent.items()]) + "\n"
     else:
         summary_text += "（特になし）\n"
@@ -203,7 +310,7 @@ def main(agent_args):
 if __name__ == "__main__":
     # This block is for direct testing, not for yggdrasil.py execution
     # Example usage:
-    # main({"user_message": "今日はAIの倫理について考えていた"})
-    # main({}) # To process yesterday's log without new message
+    # main([], {"user_message": "今日はAIの倫理について考えていた"})
+    # main([], {}) # To process yesterday's log without new message
     print("This agent is designed to be run via yggdrasil.py.")
     print("Example: python yggdrasil.py personal_context_agent --agent-set user_message=\"今日の天気は晴れです\"")
\ No newline at end of file
@@ -3,8 +3,15 @@ import subprocess
 import sys
 import os
 
-# このエージェントファイルの場所を基準にプロジェクトルートを特定
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# このエージェントファイルの場所を基準にプロジェクトルートを特定 (このファイルは agents/utilities/ にある)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import start_run
+from resource_monitor import format_summary
+from execution_supervisor import ExecutionCancelled, check_cancelled, run_supervised
+from process_runner import step_log_path
 
 # 仮想環境のPythonインタプリタのパス
 PYTHON_EXECUTABLE = os.path.join(PROJECT_ROOT, ".venv", "bin", "python")
@@ -20,12 +27,23 @@ DEFAULT_CONFIG = {
     "epochs": 1, # パイプラインでのデフォルトエポック数
     "batch_size": 32, # パイプラインでのデフォルトバッチサイズ
     "learning_rate": 0.001, # デフォルトの学習率
-    "optimizer_type": "adam" # デフォルトのオプティマイザ
+    "optimizer_type": "adam", # デフォルトのオプティマイザ
+    # 学習の高速化オプション (model_trainer 経由で学習スクリプトに渡される)
+    "jit_compile": False,
+    "mixed_precision": False,
+    "intra_op_threads": 0,
+    "inter_op_threads": 0,
+    "onednn": None, # None の場合は TensorFlow のデフォルトに従う
+    "step_timeout_seconds": None, # 各ステップ (子プロセス) の制限時間 (秒)。超えた場合はプロセスグループごと停止する
+    "step_log_dir": None # 指定すると各ステップの出力を <step_log_dir>/<ステップ名>.log にも書き出す
 }
 
-def run_agent(agent_name, agent_config):
+ACCELERATION_KEYS = ["jit_compile", "mixed_precision", "intra_op_threads", "inter_op_threads", "onednn"]
+
+def run_agent(agent_name, agent_config, timeout=None, log_path=None):
     """
     指定されたエージェントを、設定を渡して実行するヘルパー関数。
+    出力は表示しながら log_path (指定した場合) にも書き出し、失敗した場合は出力の末尾をエラーとして表示する。
     """
     command = [
         PYTHON_EXECUTABLE,
@@ -55,13 +73,16 @@ def run_agent(agent_name, agent_config):
     print(f"実行コマンド: {' '.join(command)}")
 
     try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
-        for line in process.stdout:
-            sys.stdout.write(line)
-        process.wait()
+        # 新しいプロセスグループで実行し、制限時間を超えた場合はグループごと停止する
+        result = run_supervised(command, timeout=timeout, log_path=log_path)
+        print(f"--- エージェント '{agent_name}' のリソース使用量: {format_summary(result.usage)} ---")
+        check_cancelled() # このエージェント自体がキャンセルされた場合は yggdrasil.py に伝える
 
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(process.returncode, command)
+        if result.timed_out:
+            print(f"エラー: エージェント '{agent_name}' が制限時間 ({timeout}秒) を超えたため停止しました。", file=sys.stderr)
+            sys.exit(1) # パイプラインを停止
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(result.returncode, command, output=result.output)
 
     except subprocess.CalledProcessError as e:
         print(f"エラー: エージェント '{agent_name}' の実行に失敗しました。リターンコード: {e.returncode}", file=sys.stderr)
@@ -69,6 +90,8 @@ def run_agent(agent_name, agent_config):
             print("--- stdout/stderr ---", file=sys.stderr)
             print(e.stdout, file=sys.stderr)
         sys.exit(1) # パイプラインを停止
+    except ExecutionCancelled:
+        raise
     except Exception as e:
         print(f"予期せぬエラーが発生しました: {e}", file=sys.stderr)
         sys.exit(1) # パイプラインを停止
@@ -78,6 +101,10 @@ def main(args, config):
     AIワークフローパイプラインをオーケストレーションするエージェント。
     """
     print("Pipeline Orchestrator Agent: 開始")
+    step_timeout = config.get("step_timeout_seconds", DEFAULT_CONFIG["step_timeout_seconds"])
+    step_log_dir = config.get("step_log_dir", DEFAULT_CONFIG["step_log_dir"])
+    if step_log_dir and not os.path.isabs(step_log_dir):
+        step_log_dir = os.path.join(PROJECT_ROOT, step_log_dir)
 
     # 設定の取得
     processed_data_path = config.get("processed_data_path", DEFAULT_CONFIG["processed_data_path"])
@@ -88,33 +115,45 @@ def main(args, config):
     learning_rate = config.get("learning_rate", DEFAULT_CONFIG["learning_rate"])
     optimizer_type = config.get("optimizer_type", DEFAULT_CONFIG["optimizer_type"])
 
-    # 1. 文字認識モデル学習ステップ
-    character_recognizer_config = {
-        "script_path": "training_scripts/character_recognizer.py",
-        "output_path": trained_model_path,
-        "log_file": experiment_log_file,
-        "epochs": epochs,
-        "batch_size": batch_size,
-        "learning_rate": learning_rate,
-        "optimizer_type": optimizer_type
-    }
-    run_agent("model_trainer", character_recognizer_config)
-
-    # 2. モデル評価ステップ
-    model_evaluator_config = {
-        "script_path": "training_scripts/model_evaluator.py",
-        "model_path": trained_model_path,
-        "input_data_path": os.path.join(PROJECT_ROOT, "data", "neo_world_characters.npz"), # 評価にも同じデータセットのテスト部分を使用
-        "log_file": experiment_log_file # 学習ログと同じファイルに追記
-    }
-    run_agent("model_trainer", model_evaluator_config)
-
-    # 3. レポート生成ステップ
-    report_generator_config = {
-        "log_file_path": experiment_log_file,
-        "report_output_path": os.path.join(PROJECT_ROOT, "Experiment_Report.md") # デフォルトのレポート出力パス
-    }
-    run_agent("report_generator_agent", report_generator_config)
+    # パイプライン全体を親Run、各ステップ (学習・評価) を子Runとして MLflow に記録する
+    with start_run("pipeline_orchestrator", params={"epochs": epochs, "batch_size": batch_size, "learning_rate": learning_rate,
+                                                    "optimizer_type": optimizer_type, "trained_model_path": trained_model_path}) as parent_run:
+        tracking_config = {"parent_run_id": parent_run.run_id} if parent_run.run_id else {}
+
+        # 1. 文字認識モデル学習ステップ
+        character_recognizer_config = {
+            "script_path": "training_scripts/character_recognizer.py",
+            "output_path": trained_model_path,
+            "log_file": experiment_log_file,
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "learning_rate": learning_rate,
+            "optimizer_type": optimizer_type,
+            **tracking_config
+        }
+        for key in ACCELERATION_KEYS:
+            value = config.get(key, DEFAULT_CONFIG[key])
+            if value is not None:
+                character_recognizer_config[key] = value
+        run_agent("model_trainer", character_recognizer_config, step_timeout, step_log_path(step_log_dir, "1_character_recognizer"))
+
+        # 2. モデル評価ステップ
+        model_evaluator_config = {
+            "script_path": "training_scripts/model_evaluator.py",
+            "model_path": trained_model_path,
+            "input_data_path": os.path.join(PROJECT_ROOT, "data", "neo_world_characters.npz"), # 評価にも同じデータセットのテスト部分を使用
+            "log_file": experiment_log_file, # 学習ログと同じファイルに追記
+            **tracking_config
+        }
+        run_agent("model_trainer", model_evaluator_config, step_timeout, step_log_path(step_log_dir, "2_model_evaluator"))
+
+        # 3. レポート生成ステップ
+        report_generator_config = {
+            "log_file_path": experiment_log_file,
+            "report_output_path": os.path.join(PROJECT_ROOT, "Experiment_Report.md") # デフォルトのレポート出力パス
+        }
+        run_agent("report_generator_agent", report_generator_config, step_timeout, step_log_path(step_log_dir, "3_report_generator"))
+        parent_run.log_artifact(report_generator_config["report_output_path"], "report")
 
     print("Pipeline Orchestrator Agent: 終了")
 
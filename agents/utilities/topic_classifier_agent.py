@@ -1,34 +1,128 @@
-
-
 import joblib
+import json
 import os
 import sys
+from itertools import islice
 
-# プロジェクトのルートディレクトリを基準にパスを設定
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# プロジェクトのルートディレクトリを基準にパスを設定 (このファイルは agents/utilities/ にある)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 MODEL_PATH = os.path.join(PROJECT_ROOT, 'trained_models', 'topic_classifier.joblib')
 
+# utilsディレクトリをパスに追加 (モデルに含まれるアナライザの読み込みに必要)
+sys.path.append(os.path.join(PROJECT_ROOT, 'utils'))
+from text_analyzers import prefetch
+
 # デフォルト設定
 DEFAULT_CONFIG = {
-    "text": None # 分類したいテキスト
+    "text": None, # 分類したいテキスト
+    # バッチモード: input_path の各行を分類し、結果を JSON lines で output_path に書き出す
+    "input_path": None, # "-" の場合は標準入力から読む
+    "output_path": None, # 省略した場合は標準出力に書き出す
+    "batch_size": 10000, # 一度にベクトル化・分類する行数
+    "include_probabilities": True
 }
 
+_model_cache = {}
+
+def load_model(model_path=MODEL_PATH):
+    """
+    学習済みモデルをロードする。同じプロセス内では、ファイルが更新されていない限り再利用する。
+    """
+    mtime = os.path.getmtime(model_path)
+    cached = _model_cache.get(model_path)
+    if cached is None or cached[0] != mtime:
+        _model_cache[model_path] = (mtime, joblib.load(model_path))
+    return _model_cache[model_path][1]
+
+def classify_texts(pipeline, texts):
+    """
+    テキストのリストを1回のベクトル化で分類し、(予測トピックのリスト, 確率の配列) を返す。
+    予測トピックは predict_proba の結果から求める (predict を別に呼ぶとベクトル化が2回行われるため)。
+    """
+    if hasattr(pipeline, "steps"):
+        prefetch(getattr(pipeline.steps[0][1], "analyzer", None), texts)
+    probabilities = pipeline.predict_proba(texts)
+    topics = pipeline.classes_[probabilities.argmax(axis=1)]
+    return topics, probabilities
+
+def iter_text_chunks(stream, batch_size):
+    """
+    入力ストリームを batch_size 行ずつ読み、(行番号のリスト, テキストのリスト) を返す。空行は飛ばす。
+    """
+    line_number = 0
+    while True:
+        lines = list(islice(stream, batch_size))
+        if not lines:
+            return
+        numbers, texts = [], []
+        for line in lines:
+            line_number += 1
+            text = line.strip()
+            if text:
+                numbers.append(line_number)
+                texts.append(text)
+        if texts:
+            yield numbers, texts
+
+def classify_stream(pipeline, input_stream, output_stream, batch_size, include_probabilities=True):
+    """
+    入力ストリームの各行を分類し、1行1件の JSON として出力ストリームに書き出す。分類した件数を返す。
+    """
+    classes = [str(topic) for topic in pipeline.classes_]
+    count = 0
+    for numbers, texts in iter_text_chunks(input_stream, batch_size):
+        topics, probabilities = classify_texts(pipeline, texts)
+        records = []
+        for number, text, topic, row in zip(numbers, texts, topics, probabilities):
+            record = {"line": number, "text": text, "topic": str(topic)}
+            if include_probabilities:
+                record["probabilities"] = {name: round(float(p), 6) for name, p in zip(classes, row)}
+            records.append(json.dumps(record, ensure_ascii=False))
+        output_stream.write("\n".join(records) + "\n")
+        count += len(texts)
+    output_stream.flush()
+    return count
+
+def run_batch(pipeline, config):
+    input_path = config["input_path"]
+    output_path = config.get("output_path")
+    batch_size = int(config.get("batch_size") or DEFAULT_CONFIG["batch_size"])
+    include_probabilities = config.get("include_probabilities", DEFAULT_CONFIG["include_probabilities"])
+    # 結果を標準出力に書き出す場合は、進捗メッセージを標準エラー出力に出す
+    log = sys.stderr if not output_path else sys.stdout
+
+    input_stream = sys.stdin if input_path == "-" else open(input_path, 'r', encoding='utf-8')
+    try:
+        if output_path:
+            os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+            with open(output_path, 'w', encoding='utf-8') as output_stream:
+                count = classify_stream(pipeline, input_stream, output_stream, batch_size, include_probabilities)
+        else:
+            count = classify_stream(pipeline, input_stream, sys.stdout, batch_size, include_probabilities)
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+    print(f"{count} 件のテキストを分類しました。" + (f" 結果: {output_path}" if output_path else ""), file=log)
+
 def main(args, config):
     """
     学習済みモデルをロードし、与えられたテキストのトピックを分類するエージェント。
+    input_path を指定すると、ファイルまたは標準入力の各行をまとめて分類するバッチモードになる。
     """
-    print("Topic Classifier Agent: 開始")
+    batch_mode = bool(config.get("input_path", DEFAULT_CONFIG["input_path"]))
+    log = sys.stderr if batch_mode and not config.get("output_path") else sys.stdout
+    print("Topic Classifier Agent: 開始", file=log)
 
     text_to_classify = config.get("text", DEFAULT_CONFIG["text"])
 
-    if not text_to_classify:
+    if not text_to_classify and not batch_mode:
         print("エラー: 分類するテキストが指定されていません。--agent-set text=\"your text\" で指定してください。", file=sys.stderr)
         return
 
     # 1. モデルのロード
     try:
-        pipeline = joblib.load(MODEL_PATH)
-        print(f"学習済みモデルをロードしました: {MODEL_PATH}")
+        pipeline = load_model(MODEL_PATH)
+        print(f"学習済みモデルをロードしました: {MODEL_PATH}", file=log)
     except FileNotFoundError:
         print(f"エラー: 学習済みモデルが見つかりません: {MODEL_PATH}", file=sys.stderr)
         print("モデルを学習するには、training_scripts/topic_model_trainer.py を実行してください。", file=sys.stderr)
@@ -37,15 +131,21 @@ def main(args, config):
         print(f"エラー: モデルのロード中に予期せぬエラーが発生しました: {e}", file=sys.stderr)
         return
 
+    if batch_mode:
+        try:
+            run_batch(pipeline, config)
+        except OSError as e:
+            print(f"エラー: 入出力ファイルの処理中にエラーが発生しました: {e}", file=sys.stderr)
+        print("Topic Classifier Agent: 終了", file=log)
+        return
+
     # 2. テキストの分類
     print(f'入力テキスト: "{text_to_classify}"')
-    
+
     # モデルはリスト形式の入力を期待するため、テキストをリストに入れる
-    input_text_list = [text_to_classify]
-    
-    predicted_topic = pipeline.predict(input_text_list)[0]
-    predicted_probabilities = pipeline.predict_proba(input_text_list)
-    
+    topics, predicted_probabilities = classify_texts(pipeline, [text_to_classify])
+    predicted_topic = topics[0]
+
     # 確率をトピック名とセットで表示
     classes = pipeline.classes_
     probabilities_dict = dict(zip(classes, predicted_probabilities[0]))
@@ -61,4 +161,4 @@ if __name__ == '__main__':
     # このエージェントは yggdrasil.py 経由での実行を想定
     print("このエージェントは yggdrasil.py 経由で実行してください。")
     print("例: python yggdrasil.py topic_classifier_agent --agent-set text=\"AIモデルの学習について知りたい\"")
-
+    print("例: python yggdrasil.py topic_classifier_agent --agent-set input_path=data/user_utterances.txt --agent-set output_path=data/utterance_topics.jsonl")
@@ -8,6 +8,8 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 YGGDDRASIL_MAIN_SCRIPT = os.path.join(PROJECT_ROOT, "yggdrasil.py")
 PYTHON_EXECUTABLE = os.path.join(PROJECT_ROOT, ".venv", "bin", "python")
 MLFLOW_EXECUTABLE = os.path.join(PROJECT_ROOT, ".venv", "bin", "mlflow")
+# 学習・評価スクリプトが記録するローカルのMLflowストア (utils/experiment_tracking.py と同じ場所)
+MLRUNS_DIR = os.path.join(PROJECT_ROOT, "mlruns")
 LOG_FILE_PATH = os.path.join(PROJECT_ROOT, "logs", "pipeline_experiment_log.csv")
 REPORT_OUTPUT_PATH = os.path.join(PROJECT_ROOT, "Experiment_Report.md")
 
@@ -90,7 +92,9 @@ def main_menu():
                     command.extend(["--agent-set", f"{key}={value}"])
                 run_command(command)
         elif choice == "2":
-            run_command([MLFLOW_EXECUTABLE, "ui"])
+            # MLflow 3 ではファイルベースのストアを使うために明示的な許可が必要
+            os.environ.setdefault("MLFLOW_ALLOW_FILE_STORE", "true")
+            run_command([MLFLOW_EXECUTABLE, "ui", "--backend-store-uri", MLRUNS_DIR])
         elif choice == "3":
             run_command([PYTHON_EXECUTABLE, YGGDDRASIL_MAIN_SCRIPT, "report_generator_agent"])
             if os.path.exists(REPORT_OUTPUT_PATH):
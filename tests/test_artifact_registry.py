@@ -0,0 +1,39 @@
+import os
+import stat
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.artifact_registry import ArtifactRegistry
+
+def test_artifact_registry_deduplicates(tmp_path):
+    first, second = tmp_path / "a.keras", tmp_path / "b.keras"
+    first.write_bytes(b"model weights")
+    second.write_bytes(b"model weights")
+    with ArtifactRegistry(str(tmp_path / "artifacts")) as registry:
+        manifest = registry.register(str(first), script="mnist_trainer.py", metrics={"test_accuracy": 0.9})
+        duplicate = registry.register(str(second), script="mnist_trainer.py")
+        assert duplicate["digest"] == manifest["digest"] and duplicate["deduplicated"]
+        assert duplicate["method"] in ("reflink", None) and not os.path.samefile(first, second)
+        assert registry.record_evaluation(str(second), "model_evaluator_agent", {"accuracy": 0.8})
+        assert registry.best("accuracy") == (manifest["digest"], 0.8)
+        assert registry.producer(manifest["digest"][:12])["script"] == "mnist_trainer.py"
+        assert registry.stats()["objects"] == 1 and registry.verify() == []
+
+def test_artifact_registry_keeps_registered_files_independent(tmp_path):
+    """
+    登録したファイルが書き込み可能なまま残り、上書きしても同じ内容の他のファイルや保存済みの成果物が変わらないことを確認
+    """
+    first, second = tmp_path / "a.keras", tmp_path / "b.keras"
+    first.write_bytes(b"model weights")
+    second.write_bytes(b"model weights")
+    with ArtifactRegistry(str(tmp_path / "artifacts")) as registry:
+        manifest = registry.register(str(first))
+        registry.register(str(second))
+        assert not os.stat(manifest["object_path"]).st_mode & stat.S_IWUSR
+        for path in (first, second):
+            assert os.stat(path).st_mode & stat.S_IWUSR
+        # model.save と同じく、その場で上書きする
+        with open(first, "r+b") as f:
+            f.write(b"MODEL")
+        assert second.read_bytes() == b"model weights"
+        assert registry.verify() == []
@@ -0,0 +1,84 @@
+import functools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import chat_log_parser
+from utils.chat_log_parser import extract_utterances
+
+@pytest.fixture
+def chat_logs(tmp_path, monkeypatch):
+    """チャットログ・出力ファイル・マニフェストを一時ディレクトリに向けるフィクスチャ"""
+    logs_dir = tmp_path / "chat_logs"
+    logs_dir.mkdir()
+    output_path = tmp_path / "data" / "user_utterances.txt"
+    manifest_path = str(tmp_path / "data" / "manifest.json")
+    monkeypatch.setattr(chat_log_parser, "CHAT_LOGS_DIR", str(logs_dir))
+    monkeypatch.setattr(chat_log_parser, "OUTPUT_FILE_PATH", str(output_path))
+    monkeypatch.setattr(chat_log_parser, "load_manifest", functools.partial(chat_log_parser.load_manifest, manifest_path=manifest_path))
+    monkeypatch.setattr(chat_log_parser, "save_manifest", functools.partial(chat_log_parser.save_manifest, manifest_path=manifest_path))
+    return logs_dir, output_path
+
+def test_extract_utterances_leaves_partial_line(tmp_path):
+    log_file = tmp_path / "gemini_chat_1.txt"
+    log_file.write_text("あなた: こんにちは\nGemini: はい\nあなた:   \nあなた: 途中", encoding="utf-8")
+    utterances, offset = extract_utterances(str(log_file))
+    assert utterances == ["こんにちは"]
+    assert offset == len("あなた: こんにちは\nGemini: はい\nあなた:   \n".encode("utf-8"))
+    assert extract_utterances(str(log_file), include_partial=True) == (["こんにちは", "途中"], log_file.stat().st_size)
+
+def test_parse_chat_logs_appends_only_new_lines(chat_logs):
+    """
+    2回目の実行では追記された部分と新しいファイルだけが解析され、出力ファイルに追記されることを確認
+    """
+    logs_dir, output_path = chat_logs
+    first = logs_dir / "gemini_chat_1.txt"
+    first.write_text("あなた: 一つ目\nGemini: 返答\n", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "一つ目\n"
+
+    with open(first, "a", encoding="utf-8") as f:
+        f.write("あなた: 二つ目\n")
+    (logs_dir / "gemini_chat_2.txt").write_text("あなた: 三つ目\n", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "一つ目\n二つ目\n三つ目\n"
+
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "一つ目\n二つ目\n三つ目\n"
+
+def test_parse_chat_logs_reparses_rewritten_logs(chat_logs):
+    """
+    ログが書き換えられた場合は、小さくなったときも同じ大きさ以上のときも、すべてのログを解析し直して出力を作り直すことを確認
+    """
+    logs_dir, output_path = chat_logs
+    log_file = logs_dir / "gemini_chat_1.txt"
+    log_file.write_text("あなた: 古い発言です\nあなた: もう一つ\n", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    log_file.write_text("あなた: 新しい\n", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "新しい\n"
+
+    log_file.write_text("あなた: 書き換え\nあなた: 追記\n", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "書き換え\n追記\n"
+
+def test_parse_chat_logs_parses_final_line_without_newline(chat_logs):
+    """
+    改行で終わらない最終行は、書き込み中の可能性がある間は解析せず、更新が止まった後や全体の再解析では解析することを確認
+    """
+    logs_dir, output_path = chat_logs
+    log_file = logs_dir / "gemini_chat_1.txt"
+    log_file.write_text("あなた: 一つ目\nあなた: 最後", encoding="utf-8")
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "一つ目\n"
+
+    old = log_file.stat().st_mtime - chat_log_parser.TAIL_STABLE_SECONDS
+    os.utime(log_file, (old, old))
+    chat_log_parser.parse_chat_logs()
+    assert output_path.read_text(encoding="utf-8") == "一つ目\n最後\n"
+
+    log_file.write_text("あなた: 全体\nあなた: 途中", encoding="utf-8")
+    chat_log_parser.parse_chat_logs(incremental=False)
+    assert output_path.read_text(encoding="utf-8") == "全体\n途中\n"
@@ -0,0 +1,75 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.checkpointing import CheckpointCallback, TrainingCheckpointer, create_keras_checkpointer
+
+def build_model():
+    model = tf.keras.Sequential([tf.keras.Input((3,)), tf.keras.layers.Dense(2)])
+    model.compile(optimizer=tf.keras.optimizers.Adam(), loss="mse")
+    return model
+
+def test_keras_training_resumes_from_latest_checkpoint(tmp_path):
+    """
+    エポックごとに非同期で保存されたチェックポイントから、重み・オプティマイザの状態・エポック数が復元され、古いものは削除されることを確認
+    """
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    x, y = np.ones((8, 3), dtype="float32"), np.zeros((8, 2), dtype="float32")
+    model = build_model()
+    checkpointer, initial_epoch = create_keras_checkpointer(checkpoint_dir, model, model.optimizer)
+    assert initial_epoch == 0
+    checkpointer.max_to_keep = 2
+    model.fit(x, y, epochs=4, verbose=0, callbacks=[CheckpointCallback(checkpointer)])
+    assert sorted(name for name in os.listdir(checkpoint_dir) if name.endswith(".npz")) == ["ckpt-3.npz", "ckpt-4.npz"]
+
+    resumed = build_model()
+    _, initial_epoch = create_keras_checkpointer(checkpoint_dir, resumed, resumed.optimizer)
+    assert initial_epoch == 4
+    for saved, restored in zip(model.weights, resumed.weights):
+        np.testing.assert_array_equal(saved.numpy(), restored.numpy())
+    assert int(resumed.optimizer.iterations.numpy()) == int(model.optimizer.iterations.numpy())
+
+def test_extra_state_and_clear(tmp_path):
+    """
+    追加状態が同じチェックポイントに保存・復元され、clear で削除されることを確認
+    """
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    generator = tf.random.Generator.from_seed(1)
+    checkpointer = TrainingCheckpointer(checkpoint_dir, async_write=False, rng=generator)
+    assert checkpointer.restore() == 0
+    rewards = [1.0, 2.0]
+    checkpointer.save(10, {"rewards": rewards})
+    rewards.append(3.0)
+    expected = generator.normal([2]).numpy()
+
+    restored = TrainingCheckpointer(checkpoint_dir, async_write=False, rng=tf.random.Generator.from_seed(2))
+    assert restored.restore() == 10
+    assert restored.extra_state == {"rewards": [1.0, 2.0]}
+    np.testing.assert_array_equal(restored.trackables["rng"].normal([2]).numpy(), expected)
+    restored.clear()
+    assert not os.path.exists(checkpoint_dir)
+
+def test_restore_rejects_mismatched_structure(tmp_path):
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    TrainingCheckpointer(checkpoint_dir, async_write=False, model=build_model()).save(1)
+    bigger = tf.keras.Sequential([tf.keras.Input((3,)), tf.keras.layers.Dense(2), tf.keras.layers.Dense(1)])
+    with pytest.raises(ValueError):
+        TrainingCheckpointer(checkpoint_dir, async_write=False, model=bigger).restore()
+
+def test_clear_keeps_unrelated_files(tmp_path):
+    """
+    clear がチェックポイントのファイルだけを削除し、同じディレクトリの他のファイル (学習済みモデルなど) を残すことを確認
+    """
+    checkpoint_dir = tmp_path / "trained_models"
+    checkpoint_dir.mkdir()
+    (checkpoint_dir / "mnist.keras").write_bytes(b"model")
+    checkpointer = TrainingCheckpointer(str(checkpoint_dir), async_write=False, rng=tf.random.Generator.from_seed(1))
+    checkpointer.save(1)
+    (checkpoint_dir / "ckpt-2.npz.tmp.npz").write_bytes(b"")
+    checkpointer.clear()
+    assert sorted(os.listdir(checkpoint_dir)) == ["mnist.keras"]
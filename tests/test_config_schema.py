@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.config_schema import ConfigError, ConfigSchema, Field
+from yggdrasil import parse_set_args
+
+def test_config_schema_validation():
+    """
+    --set の値がスキーマの型で解釈されて凍結された設定になり、不正な値や未知のキーがまとめて報告されることを確認
+    """
+    schema = ConfigSchema({
+        "epochs": Field(int, 10, min=1),
+        "lr_schedule": Field(str, "none", choices=["none", "cosine"]),
+        "run_id": Field(str, None),
+        "paths": Field((list, str), None)
+    })
+    config = schema.resolve(parse_set_args(["epochs=3", "run_id=12e45", "paths=[a, b]"], schema))
+    assert config == {"epochs": 3, "lr_schedule": "none", "run_id": "12e45", "paths": ("a", "b")}
+    assert hash(config) == hash(schema.resolve({"epochs": 3, "run_id": "12e45", "paths": ["a", "b"]}))
+    with pytest.raises(TypeError):
+        config["epochs"] = 5
+    with pytest.raises(ConfigError) as error_info:
+        schema.resolve({"epochs": 0, "lr_schedule": "step", "epoch": 2})
+    message = str(error_info.value)
+    assert "epochs" in message and "lr_schedule" in message and "もしかして: epochs" in message
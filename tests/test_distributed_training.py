@@ -0,0 +1,67 @@
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.distributed_training import (TF_CONFIG_ENV, INTRA_OP_THREADS_ENV, DistributedTrainer, array_datasets, check_resume_consistency,
+                                        create_strategy, free_local_addresses, is_chief, worker_env)
+
+def test_worker_env_and_chief(monkeypatch):
+    """
+    各ワーカーに同じクラスタ構成と自身の番号が渡され、0番のワーカー (または chief) だけがチーフになることを確認
+    """
+    workers = free_local_addresses(2)
+    assert len(set(workers)) == 2 and all(address.startswith("localhost:") for address in workers)
+    env = worker_env(workers, 1, base_env={}, local_workers=2)
+    assert json.loads(env[TF_CONFIG_ENV]) == {"cluster": {"worker": workers}, "task": {"type": "worker", "index": 1}}
+    assert int(env[INTRA_OP_THREADS_ENV]) >= 1
+    assert INTRA_OP_THREADS_ENV not in worker_env(workers, 0, base_env={})
+
+    monkeypatch.delenv(TF_CONFIG_ENV, raising=False)
+    assert is_chief()
+    for index, expected in ((0, True), (1, False)):
+        monkeypatch.setenv(TF_CONFIG_ENV, worker_env(workers, index, base_env={})[TF_CONFIG_ENV])
+        assert is_chief() is expected
+    monkeypatch.setenv(TF_CONFIG_ENV, json.dumps({"cluster": {"chief": ["a:1"], "worker": ["b:1"]}, "task": {"type": "worker", "index": 0}}))
+    assert not is_chief()
+
+def test_create_strategy_requires_tf_config(monkeypatch):
+    monkeypatch.delenv(TF_CONFIG_ENV, raising=False)
+    assert create_strategy(False) is None
+    with pytest.raises(ValueError):
+        create_strategy(True)
+
+def test_distributed_trainer_matches_keras_callbacks():
+    """
+    独自の学習ループでも損失が下がり、History と早期終了のコールバックが model.fit と同じように動くことを確認
+    (同期的なデータ並列のストラテジーとして、1デバイスの MirroredStrategy で確認する)
+    """
+    tf = pytest.importorskip("tensorflow")
+    strategy = tf.distribute.MirroredStrategy(["/cpu:0"])
+    rng = np.random.default_rng(0)
+    x = rng.random((256, 4), dtype=np.float32)
+    y = (x[:, 0] + x[:, 1] > 1).astype("int64")
+    with strategy.scope():
+        model = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2, activation="softmax")])
+        model.compile(optimizer=tf.keras.optimizers.Adam(0.05))
+    train, validation = array_datasets(x, y, 32, strategy, validation_split=0.25)
+    trainer = DistributedTrainer(model, "sparse_categorical_crossentropy", strategy)
+
+    history = trainer.fit(train, epochs=5, validation_data=validation, verbose=False)
+    losses = history.history["loss"]
+    assert set(history.history) == {"loss", "accuracy", "val_loss", "val_accuracy"}
+    assert len(losses) == 5 and losses[-1] < losses[0]
+    loss, accuracy = trainer.evaluate(validation)
+    assert loss == pytest.approx(history.history["val_loss"][-1], rel=1e-5) and 0.0 <= accuracy <= 1.0
+
+    # 改善しない指標を監視すると patience 後に止まる
+    stop = tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=1, min_delta=10.0)
+    history = trainer.fit(train, epochs=10, validation_data=validation, callbacks=[stop], verbose=False)
+    assert len(history.history["loss"]) == 2
+
+    check_resume_consistency(strategy, 3)
+    with pytest.raises(ValueError):
+        DistributedTrainer(model, "mse", strategy)
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.experiment_tracking import METRICS_FILE_ENV, add_tracking_args, start_run, start_script_run
+
+@pytest.fixture
+def tracking_uri(tmp_path, monkeypatch):
+    """記録先を一時ディレクトリのファイルストアにするフィクスチャ"""
+    uri = (tmp_path / "mlruns").as_uri()
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", uri)
+    return uri
+
+def test_runs_are_batched_and_nested(tracking_uri, tmp_path):
+    """
+    パラメータ・エポックごとのメトリクス・アーティファクトが Run の終了時までに書き込まれ、子Runが親Runの下に記録されることを確認
+    """
+    mlflow = pytest.importorskip("mlflow")
+    artifact = tmp_path / "model.txt"
+    artifact.write_text("weights", encoding="utf-8")
+    with start_run("pipeline", {"epochs": 3, "skipped": None}) as parent:
+        with start_run("trainer", parent_run_id=parent.run_id) as child:
+            for epoch in range(3):
+                child.log_metrics({"loss": 1.0 / (epoch + 1), "note": "not a number"}, step=epoch)
+            child.log_artifact(str(artifact), "model")
+    assert child.metrics == {"loss": pytest.approx(1 / 3)}
+
+    client = mlflow.tracking.MlflowClient(tracking_uri=tracking_uri)
+    parent_run, child_run = client.get_run(parent.run_id), client.get_run(child.run_id)
+    assert parent_run.data.params == {"epochs": "3"} and parent_run.info.status == "FINISHED"
+    assert child_run.data.tags["mlflow.parentRunId"] == parent.run_id
+    assert child_run.info.experiment_id == parent_run.info.experiment_id
+    assert [metric.step for metric in client.get_metric_history(child.run_id, "loss")] == [0, 1, 2]
+    assert [item.path for item in client.list_artifacts(child.run_id, "model")] == ["model/model.txt"]
+
+def test_failed_run_and_metrics_file(tracking_uri, tmp_path, monkeypatch):
+    """
+    例外で終了した Run が FAILED になり、環境変数で指定したファイルにもメトリクスが書き出されることを確認
+    """
+    mlflow = pytest.importorskip("mlflow")
+    metrics_file = tmp_path / "metrics.jsonl"
+    monkeypatch.setenv(METRICS_FILE_ENV, str(metrics_file))
+    with pytest.raises(RuntimeError):
+        with start_run("trainer") as run:
+            run.log_metric("loss", 0.5, step=2)
+            raise RuntimeError("学習に失敗")
+    assert mlflow.tracking.MlflowClient(tracking_uri=tracking_uri).get_run(run.run_id).info.status == "FAILED"
+    entry = json.loads(metrics_file.read_text(encoding="utf-8"))
+    assert entry["run"] == "trainer" and entry["step"] == 2 and entry["metrics"] == {"loss": 0.5}
+
+def test_start_script_run_records_arguments(tracking_uri):
+    """
+    スクリプトの引数がパラメータとして記録され、記録先や結果に影響しない引数は除かれることを確認
+    """
+    parser = argparse.ArgumentParser()
+    add_tracking_args(parser)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--checkpoint_dir", default="/tmp/ckpt")
+    with start_script_run("trainer", parser.parse_args(["--experiment_name", "test"])) as run:
+        pass
+    assert run.params == {"epochs": 5}
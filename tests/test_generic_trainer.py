@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("tensorflow")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'training_scripts')))
+from generic_trainer import build_training_callbacks, make_learning_rate
+from tensorflow import keras
+
+def test_make_learning_rate():
+    """
+    cosine の場合は min_lr まで減衰するスケジュールになり、それ以外は固定の学習率のままであることを確認
+    """
+    assert make_learning_rate(0.01, "none", 100, 1e-4) == 0.01
+    assert make_learning_rate(0.01, "plateau", 100, 1e-4) == 0.01
+    schedule = make_learning_rate(0.01, "cosine", 100, 1e-4)
+    assert isinstance(schedule, keras.optimizers.schedules.CosineDecay)
+    assert float(schedule(0)) == pytest.approx(0.01)
+    assert float(schedule(100)) == pytest.approx(1e-4)
+
+def test_build_training_callbacks():
+    """
+    早期終了は patience が 1 以上の場合だけ、ReduceLROnPlateau は plateau の場合だけ作成されることを確認
+    """
+    callbacks, early_stopping = build_training_callbacks("val_loss", 0, "none", 2, 0.5, 1e-6)
+    assert callbacks == [] and early_stopping is None
+
+    callbacks, early_stopping = build_training_callbacks("val_loss", 3, "plateau", 2, 0.5, 1e-6)
+    assert callbacks[0] is early_stopping
+    assert early_stopping.monitor == "val_loss" and early_stopping.patience == 3 and early_stopping.restore_best_weights
+    assert isinstance(callbacks[1], keras.callbacks.ReduceLROnPlateau) and callbacks[1].factor == 0.5
+
+    callbacks, _ = build_training_callbacks("loss", 0, "cosine", 2, 0.5, 1e-6)
+    assert callbacks == []
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+from utils.inference_benchmark import load_model, measure, model_format, parse_int_list, predict_function, synthesize_inputs, thread_env
+
+def test_model_format_and_thread_env():
+    """
+    拡張子からモデルの形式が決まり、スレッド数の指定が環境変数に反映されることを確認
+    """
+    assert [model_format(path) for path in ("m.keras", "m.h5", "m.tflite", "m.joblib")] == ["keras", "keras", "tflite", "joblib"]
+    env = thread_env(2, base_env={})
+    assert env["OMP_NUM_THREADS"] == env["TF_NUM_INTRAOP_THREADS"] == "2" and env["TF_NUM_INTEROP_THREADS"] == "1"
+    assert thread_env(0, base_env={"A": "1"}) == {"A": "1"}
+    assert parse_int_list("1, 8,32") == [1, 8, 32]
+
+def test_inference_benchmark_synthesizes_text_inputs(tmp_path, monkeypatch):
+    """
+    テキストのパイプラインの語彙から入力が合成され、バッチごとの所要時間と件数が計測されることを確認
+    """
+    pytest.importorskip("sklearn")
+    # テキストのパイプラインの推論は、エージェントと同じく utils を直接インポートする
+    monkeypatch.syspath_prepend(os.path.join(PROJECT_ROOT, "utils"))
+    import joblib
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    model_path = str(tmp_path / "topic.joblib")
+    joblib.dump(make_pipeline(TfidfVectorizer(), LogisticRegression()).fit(["cat sat", "dog ran", "cat ran", "dog sat"], [0, 1, 0, 1]), model_path)
+    model, fmt = load_model(model_path, threads=1)
+    inputs = synthesize_inputs(model, fmt, 8)
+    assert fmt == "joblib" and len(inputs) == 8 and set(" ".join(inputs).split()) <= {"cat", "dog", "ran", "sat"}
+    result = measure(predict_function(model, fmt), inputs, batch_size=4, requests=5, min_seconds=0, warmup=1)
+    assert result["calls"] == 5 and result["latency_p50_ms"] <= result["latency_p99_ms"] and result["samples_per_sec"] > 0
@@ -0,0 +1,52 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("janome")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import japanese_tokenizer
+from utils.japanese_tokenizer import content_words, iter_file_tokens, tokenize_batch, tokenize_text
+
+def test_tokenize_text_and_content_words():
+    tokens = tokenize_text("猫が走った")
+    assert [surface for surface, _, _ in tokens] == ["猫", "が", "走っ", "た"]
+    assert content_words(tokens) == ["猫", "走る"]
+
+def test_tokenize_batch_reuses_persistent_cache(tmp_path, monkeypatch):
+    """
+    同じテキストは一度だけ解析され、2回目以降はキャッシュから入力と同じ順序で返されることを確認
+    """
+    cache_path = str(tmp_path / "cache" / "tokens.sqlite")
+    analyzed = []
+    tokenize_many = japanese_tokenizer._tokenize_many
+    monkeypatch.setattr(japanese_tokenizer, "_tokenize_many", lambda texts: analyzed.extend(texts) or tokenize_many(texts))
+
+    first = tokenize_batch(["猫が走った", "犬", "猫が走った"], cache_path)
+    assert analyzed == ["猫が走った", "犬"]
+    assert first[0] == first[2] == tokenize_text("猫が走った")
+
+    second = tokenize_batch(["犬", "猫が走った", "鳥"], cache_path)
+    assert analyzed == ["猫が走った", "犬", "鳥"]
+    assert second[:2] == [first[1], first[0]]
+
+    tokenize_batch(["犬"], None)
+    assert analyzed[-1] == "犬"
+
+def test_iter_file_tokens_resumes_from_offset(tmp_path):
+    """
+    空行が飛ばされ、改行で終わらない最終行は既定では返され、include_partial=False では飛ばして
+    返されたバイト位置から続きを読めることを確認
+    """
+    file_path = tmp_path / "corpus.txt"
+    file_path.write_bytes("猫が走った\n\n犬が鳴いた\n書き込み途中".encode("utf-8"))
+    assert [line for line, _, _ in iter_file_tokens(str(file_path), cache_path=None)] == ["猫が走った", "犬が鳴いた", "書き込み途中"]
+    results = list(iter_file_tokens(str(file_path), batch_size=1, cache_path=None, include_partial=False))
+    assert [line for line, _, _ in results] == ["猫が走った", "犬が鳴いた"]
+
+    with open(file_path, "ab") as f:
+        f.write("の行\n".encode("utf-8"))
+    resumed = list(iter_file_tokens(str(file_path), cache_path=None, start_offset=results[-1][2], include_partial=False))
+    assert [line for line, _, _ in resumed] == ["書き込み途中の行"]
+    assert resumed[0][2] == os.path.getsize(file_path)
@@ -0,0 +1,94 @@
+import asyncio
+import base64
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import job_cluster
+from utils.job_queue import FINISHED_STATES, JobQueue
+
+def test_job_cluster_requeues_on_worker_loss(tmp_path, monkeypatch):
+    """
+    ワーカーとの接続が切れると実行中のジョブが再投入され、別のワーカーで完了して出力とアーティファクトが回収されることを確認
+    """
+    output_path = tmp_path / "model.txt"
+    script = f"import time; print('training'); time.sleep(1); open({str(output_path)!r}, 'w').write('weights')"
+    monkeypatch.setattr(job_cluster, "build_command", lambda job, python_executable=None: [sys.executable, "-c", script])
+
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        job_id = queue.submit("model_trainer", ["--agent-set", f"output_path={output_path}"])
+
+        async def scenario():
+            coordinator = job_cluster.Coordinator(queue, "127.0.0.1", 0, lease_seconds=5,
+                                                  log_dir=str(tmp_path / "logs"), artifact_dir=str(tmp_path / "artifacts"))
+            ready = asyncio.Event()
+            server = asyncio.ensure_future(coordinator.serve(ready))
+            await ready.wait()
+            first = job_cluster.Worker("127.0.0.1", coordinator.port, "first", cpu_slots=1, memory_mb=0, poll_interval=0.05, grace_seconds=1)
+            first_task = asyncio.ensure_future(first.run())
+            while not first.running:
+                await asyncio.sleep(0.05)
+            second = job_cluster.Worker("127.0.0.1", coordinator.port, "second", cpu_slots=1, memory_mb=0, poll_interval=0.05, grace_seconds=1)
+            second_task = asyncio.ensure_future(second.run())
+            first.stop()
+            await first_task
+            deadline = time.monotonic() + 20
+            while queue.get(job_id)["status"] not in FINISHED_STATES and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            second.stop()
+            await second_task
+            coordinator.stop()
+            await server
+
+        asyncio.run(scenario())
+        job = queue.get(job_id)
+        assert job["status"] == "succeeded"
+        assert job["worker"] == "second"
+        assert job["attempts"] == 1
+        assert "training" in (tmp_path / "logs" / f"{job_id}.log").read_text(encoding="utf-8")
+        assert (tmp_path / "artifacts" / str(job_id) / "model.txt").read_text() == "weights"
+
+def test_coordinator_requires_token_off_loopback(tmp_path):
+    """
+    トークンなしでは他のホストから接続できるアドレスで待ち受けないことを確認
+    """
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        with pytest.raises(ValueError):
+            job_cluster.Coordinator(queue, "0.0.0.0")
+        assert job_cluster.Coordinator(queue).host == "127.0.0.1"
+        job_cluster.Coordinator(queue, "::1")
+        job_cluster.Coordinator(queue, "localhost")
+        job_cluster.Coordinator(queue, "0.0.0.0", token="secret")
+
+class _RecordingConnection:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+def test_coordinator_rejects_malformed_artifact_chunks(tmp_path):
+    """
+    先頭のチャンクがないアーティファクトや位置の合わないチャンクは、接続を切らずにエラーを返して破棄することを確認
+    """
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        coordinator = job_cluster.Coordinator(queue, log_dir=str(tmp_path / "logs"), artifact_dir=str(tmp_path / "artifacts"))
+        connection = _RecordingConnection()
+        worker = job_cluster._WorkerState("w1", "host", 1, None, connection)
+        lease = job_cluster._Lease(1, "w1", time.monotonic() + 30, str(tmp_path / "1.log"))
+        coordinator.leases[1] = lease
+
+        def chunk(offset, data, final=False):
+            message = {"type": "artifact", "job_id": 1, "lease": lease.lease_id, "path": "model.bin", "offset": offset,
+                       "data": base64.b64encode(data).decode("ascii"), "final": final}
+            return asyncio.run(coordinator._dispatch(worker, message))
+
+        chunk(100, b"middle")
+        assert connection.sent[-1]["type"] == "error" and not lease.uploads
+        chunk(0, b"head")
+        chunk(10, b"gap")
+        assert connection.sent[-1]["type"] == "error" and not lease.uploads
+        assert not (tmp_path / "artifacts" / "1" / "model.bin.part").exists()
@@ -0,0 +1,62 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.job_queue import YGGDRASIL_MAIN_SCRIPT, JobQueue, build_command
+
+def test_job_queue_priority_and_retry(tmp_path):
+    """
+    優先度の高いジョブから実行され、資源の総量を超えるジョブは失敗し、失敗したジョブはバックオフ後に再実行されることを確認
+    """
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        low = queue.submit("model_trainer", priority=0)
+        high = queue.submit("model_trainer", priority=5, max_retries=1, retry_backoff_seconds=60)
+        too_large = queue.submit("model_trainer", priority=10, cpu_slots=4)
+
+        assert queue.claim_next(2, None, 2, None)["id"] == high
+        assert queue.get(too_large)["status"] == "failed"
+        # バックオフ中のジョブは実行されず、次のジョブが実行される
+        assert queue.finish(high, 1) == "queued"
+        assert queue.claim_next(2, None, 2, None)["id"] == low
+        assert queue.claim_next(1, None, 2, None) is None
+        assert queue.get(high)["attempts"] == 1
+
+def test_claim_next_keeps_oversized_jobs_queued_for_the_coordinator(tmp_path):
+    """
+    fail_oversized=False (コーディネーター) では、接続中のワーカーの資源を超えるジョブを失敗にせず待機させ、後続のジョブを実行することを確認
+    """
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        small = queue.submit("model_trainer", priority=0)
+        large = queue.submit("model_trainer", priority=10, cpu_slots=4)
+
+        assert queue.claim_next(2, None, 2, None, fail_oversized=False)["id"] == small
+        assert queue.get(large)["status"] == "queued"
+        # 大きなワーカーが接続すれば実行される
+        assert queue.claim_next(4, None, 4, None, fail_oversized=False)["id"] == large
+
+def test_job_queue_cancel_and_requeue(tmp_path):
+    """
+    待機中のジョブはすぐにキャンセルされ、実行中のジョブはキャンセルの依頼になり、再投入では試行回数が数えられないことを確認
+    """
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        queued = queue.submit("model_trainer")
+        running = queue.submit("model_trainer", priority=1)
+        requeued = queue.submit("model_trainer", priority=2)
+        assert queue.cancel(queued) == "cancelled"
+        assert queue.cancel(queued) is None
+
+        assert queue.claim_next(4, None, 4, None)["id"] == requeued
+        queue.requeue(requeued, "スケジューラの停止")
+        assert queue.get(requeued)["status"] == "queued" and queue.get(requeued)["attempts"] == 0
+
+        assert queue.claim_next(4, None, 4, None)["id"] == requeued
+        assert queue.claim_next(3, None, 4, None)["id"] == running
+        assert queue.cancel(running) == "cancelling"
+        assert queue.cancel_requested_ids() == {running}
+        assert queue.finish(running, -15) == "cancelled"
+        assert [job["id"] for job in queue.list_jobs(["cancelled"])] == [running, queued]
+
+def test_build_command_runs_agent_through_yggdrasil(tmp_path):
+    with JobQueue(str(tmp_path / "jobs.sqlite")) as queue:
+        job = queue.get(queue.submit("model_trainer", ["--epochs", "1"], ["--timeout", "60"]))
+    assert build_command(job, "python3") == ["python3", YGGDRASIL_MAIN_SCRIPT, "--timeout", "60", "model_trainer", "--epochs", "1"]
@@ -0,0 +1,26 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.model_catalog import ModelCatalog
+
+def test_model_catalog_search_and_migration(tmp_path):
+    legacy_file = tmp_path / "models.json"
+    legacy_file.write_text(json.dumps([{"name": "old", "comment": "first"}, {"name": "old", "comment": "second"}]), encoding="utf-8")
+    with ModelCatalog(str(tmp_path / "models.sqlite")) as catalog:
+        assert catalog.migrate_json(str(legacy_file)) == 2
+        assert catalog.migrate_json(str(legacy_file)) is None
+        assert catalog.get("old")["comment"] == "second"
+        for i in range(5):
+            catalog.add(f"model_{i}", "mnist", tags=["mnist"] if i % 2 == 0 else ["cifar"], metrics={"accuracy": i / 10})
+        with pytest.raises(ValueError):
+            catalog.add("model_0", "duplicate")
+        models, total = catalog.search(tags=["mnist"], sort_by="accuracy", page=1, page_size=2)
+        assert total == 3 and [model["name"] for model in models] == ["model_4", "model_2"]
+        assert catalog.search(metric="accuracy", min_value=0.3)[1] == 2
+        assert catalog.update("model_1", add_tags=["mnist"], metrics={"loss": 0.5})["tags"] == ["cifar", "mnist"]
+        assert catalog.tag_counts() == {"cifar": 2, "mnist": 4}
+        assert catalog.remove("old") and catalog.get("old") is None
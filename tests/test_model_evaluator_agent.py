@@ -0,0 +1,77 @@
+import csv
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# エージェントモジュールをインポートするためにsys.pathに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents')))
+import model_evaluator_agent
+
+def test_resolve_model_paths_expands_globs_without_duplicates(tmp_path):
+    """
+    カンマ区切りの文字列とglobが、重複のないモデルパスのリストに展開されることを確認
+    """
+    for name in ("a.keras", "b.keras", "c.tflite"):
+        (tmp_path / name).write_bytes(b"")
+    paths = model_evaluator_agent.resolve_model_paths(f"{tmp_path}/b.keras, {tmp_path}/*.keras")
+    assert paths == [str(tmp_path / "b.keras"), str(tmp_path / "a.keras")]
+
+def test_evaluate_models_builds_shared_leaderboard(tmp_path, monkeypatch):
+    """
+    複数のモデルが共有テストセットで評価され、精度順のリーダーボードになり、読み込めないモデルはエラーとして最後に並ぶことを確認
+    """
+    tf = pytest.importorskip("tensorflow")
+    # 成果物レジストリと MLflow には記録しない
+    monkeypatch.setattr(model_evaluator_agent, "lookup_artifacts", lambda paths: {})
+    monkeypatch.setattr(model_evaluator_agent, "record_evaluations", lambda rows, test_data_path: None)
+    monkeypatch.setattr(model_evaluator_agent, "track_evaluation", lambda *args, **kwargs: None)
+
+    rng = np.random.default_rng(0)
+    x_test = rng.random((32, 4), dtype=np.float32)
+    y_test = (x_test[:, 0] > 0.5).astype("int64")
+    test_data_path = str(tmp_path / "test.npz")
+    np.savez(test_data_path, X_test=x_test, y_test=y_test)
+
+    model_paths = []
+    for name in ("first", "second"):
+        model = tf.keras.Sequential([tf.keras.Input((4,)), tf.keras.layers.Dense(2, activation="softmax")])
+        model.compile(loss="categorical_crossentropy", metrics=["accuracy"])
+        model_paths.append(str(tmp_path / f"{name}.keras"))
+        model.save(model_paths[-1])
+    missing_path = str(tmp_path / "missing.keras")
+
+    leaderboard_path = str(tmp_path / "leaderboard.csv")
+    cache_dir = str(tmp_path / "cache")
+    ranked = model_evaluator_agent.evaluate_models(model_paths + [missing_path], test_data_path, None, leaderboard_path,
+                                                   num_workers=1, cache_dir=cache_dir)
+
+    assert [row["rank"] for row in ranked] == [1, 2, 3]
+    assert sorted(row["model_path"] for row in ranked[:2]) == sorted(model_paths)
+    assert ranked[0]["accuracy"] >= ranked[1]["accuracy"]
+    assert ranked[2]["model_path"] == missing_path and ranked[2]["error"]
+    # テストデータは一度だけ前処理され、キャッシュに保存される
+    assert len(os.listdir(cache_dir)) == 2
+    with open(leaderboard_path, newline="") as f:
+        assert [row["model_path"] for row in csv.DictReader(f)] == [row["model_path"] for row in ranked]
+
+def test_shared_test_set_cache_distinguishes_files(tmp_path):
+    """
+    同じ名前で別のディレクトリにあるファイルや、同じ秒のうちに書き換えられたファイルが、別のキャッシュになることを確認
+    """
+    cache_dir = str(tmp_path / "cache")
+    paths = []
+    for directory in ("a", "b"):
+        (tmp_path / directory).mkdir()
+        paths.append(str(tmp_path / directory / "test.npz"))
+        np.savez(paths[-1], X_test=np.full((2, 3), len(paths), dtype=np.float32), y_test=np.zeros(2, dtype="int64"))
+        mtime_ns = os.stat(paths[0]).st_mtime_ns
+        os.utime(paths[-1], ns=(mtime_ns, mtime_ns))
+    x_paths = [model_evaluator_agent.prepare_shared_test_set(path, cache_dir)[0] for path in paths]
+    assert x_paths[0] != x_paths[1]
+    assert [np.load(path)[0, 0] for path in x_paths] == [1.0, 2.0]
+
+    np.savez(paths[0], X_test=np.full((3, 3), 3, dtype=np.float32), y_test=np.zeros(3, dtype="int64"))
+    os.utime(paths[0], ns=(mtime_ns, mtime_ns))
+    assert np.load(model_evaluator_agent.prepare_shared_test_set(paths[0], cache_dir)[0])[0, 0] == 3.0
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.model_export import TFLiteModel, export_tflite, load_calibration_data
+
+def test_export_tflite_int8_matches_keras(tmp_path):
+    tf = pytest.importorskip("tensorflow")
+    rng = np.random.default_rng(0)
+    model = tf.keras.Sequential([tf.keras.Input((4, 4)), tf.keras.layers.Flatten(), tf.keras.layers.Dense(3, activation="softmax")])
+    model_path = str(tmp_path / "model.keras")
+    model.save(model_path)
+    np.savez(tmp_path / "data.npz", X_train=rng.random((64, 4, 4)).astype("float32"))
+    output_path, info = export_tflite(model_path, quantization="int8", calibration_data_path=str(tmp_path / "data.npz"))
+    assert output_path.endswith("model.int8.tflite") and info["calibration_samples"] == 64
+    x = rng.random((10, 4, 4, 1)).astype("float32")
+    exported = TFLiteModel(output_path)
+    assert exported.output_shape == (None, 3)
+    np.testing.assert_allclose(exported.predict(x, batch_size=4), model.predict(x.reshape(10, 4, 4), verbose=0), atol=0.05)
+
+def test_calibration_data_does_not_fall_back_to_mnist(tmp_path):
+    """
+    校正データのパスが指定されていれば、見つからない場合や対応していない形式の場合に MNIST を使わずエラーにすることを確認
+    """
+    with pytest.raises(FileNotFoundError):
+        load_calibration_data("model.keras", str(tmp_path / "missing.npz"))
+    (tmp_path / "images.txt").write_text("not a dataset")
+    with pytest.raises(ValueError):
+        load_calibration_data("model.keras", str(tmp_path / "images.txt"))
+    np.savez(tmp_path / "data.npz", X_train=np.arange(40, dtype=np.uint8).reshape(10, 4))
+    samples = load_calibration_data("model.keras", str(tmp_path / "data.npz"), num_samples=4)
+    assert samples.shape == (4, 4) and samples.dtype == np.float32 and samples.max() <= 1.0
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+# エージェントモジュールをインポートするためにsys.pathに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents')))
+import model_exporter_agent
+
+def test_export_without_calibration_data_measures_latency_with_synthesized_inputs(tmp_path, monkeypatch, capsys):
+    """
+    画像以外のモデルを校正データなしで変換しても、MNIST ではなく入力シグネチャから合成した入力で推論時間を比較できることを確認
+    """
+    tf = pytest.importorskip("tensorflow")
+    # 成果物レジストリには記録せず、MLflow の記録先は一時ディレクトリにする
+    monkeypatch.setattr(model_exporter_agent, "register_output", lambda *args, **kwargs: None)
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", (tmp_path / "mlruns").as_uri())
+    monkeypatch.setattr(tf.keras.datasets.mnist, "load_data", lambda: pytest.fail("MNIST が読み込まれました"))
+
+    model = tf.keras.Sequential([tf.keras.Input((3,)), tf.keras.layers.Dense(2, activation="softmax")])
+    model_path = str(tmp_path / "tabular.keras")
+    model.save(model_path)
+    config = model_exporter_agent.CONFIG_SCHEMA.resolve({"model_path": model_path, "quantization": "dynamic"})
+    model_exporter_agent.main([], config)
+    assert os.path.exists(tmp_path / "tabular.dynamic.tflite")
+    assert "1件あたりの推論時間" in capsys.readouterr().out
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+
+# エージェントモジュールをインポートするためにsys.pathに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents', 'utilities')))
+import personal_context_agent
+import user_log
+from text_analyzers import get_analyzer
+
+def test_update_day_state_processes_only_new_messages(tmp_path):
+    """
+    2回目の実行では前回以降に追記されたメッセージだけが文書頻度・単語数・その日の TF に加算されることを確認
+    """
+    log_path = str(tmp_path / "20260101.jsonl")
+    analyzer = get_analyzer("regex")
+    state = personal_context_agent.new_state()
+    user_log.append_entry(log_path, {"timestamp": "t1", "message": "cats and dogs"})
+    user_log.append_entry(log_path, {"timestamp": "t2", "message": "cats again"})
+    assert personal_context_agent.update_day_state(state, "20260101", log_path, analyzer) == 2
+    assert personal_context_agent.update_day_state(state, "20260101", log_path, analyzer) == 0
+
+    user_log.append_entry(log_path, {"timestamp": "t3", "message": "birds"})
+    assert personal_context_agent.update_day_state(state, "20260101", log_path, analyzer) == 1
+    day = state["days"]["20260101"]
+    assert state["document_count"] == 3 and day["message_count"] == 3
+    assert state["document_frequencies"]["cats"] == 2 and state["word_counts"]["cats"] == 2
+    assert day["total_length"] == len("cats and dogs") + len("cats again") + len("birds")
+    # 1通だけに含まれ、その通の中で比重の大きい語が上位になる
+    assert personal_context_agent.top_keywords(state, "20260101", 1) == ["birds"]
+
+def test_load_state_resets_idf_when_analyzer_changes(tmp_path):
+    """
+    初回は既存のプロフィールの頻出単語から始まり、アナライザが変わると TF-IDF の状態だけがやり直されることを確認
+    """
+    state_path = str(tmp_path / "state.json")
+    state = personal_context_agent.load_state(state_path, {"frequent_words": {"猫": 3}}, "regex")
+    assert state["word_counts"] == {"猫": 3} and state["analyzer"] == "regex"
+    state["document_count"] = 5
+    state["document_frequencies"] = {"猫": 5}
+    state["days"]["20260101"] = {"offset": 10, "tf_sums": {"猫": 1.0}, "total_length": 4, "message_count": 1}
+    personal_context_agent.save_state(state_path, state)
+
+    assert personal_context_agent.load_state(state_path, {}, "regex") == state
+    reloaded = personal_context_agent.load_state(state_path, {}, "char_ngram")
+    assert reloaded["document_count"] == 0 and reloaded["document_frequencies"] == {}
+    assert reloaded["days"]["20260101"] == {"offset": 10, "tf_sums": {}, "total_length": 4, "message_count": 1}
+    assert reloaded["word_counts"] == {"猫": 3}
+
+def test_update_utterance_counts_is_incremental(tmp_path, monkeypatch):
+    """
+    追記された発言だけが形態素解析され、ファイルが書き換えられた場合は最初から集計し直すことを確認
+    """
+    pytest.importorskip("janome")
+    iter_file_tokens = personal_context_agent.iter_file_tokens
+    monkeypatch.setattr(personal_context_agent, "iter_file_tokens", lambda path, **kwargs: iter_file_tokens(path, cache_path=None, **kwargs))
+    utterances_file = tmp_path / "user_utterances.txt"
+    utterances_file.write_text("猫が走った\n", encoding="utf-8")
+    state = personal_context_agent.new_state()
+    assert personal_context_agent.update_utterance_counts(state, str(utterances_file)) == 1
+    with open(utterances_file, "a", encoding="utf-8") as f:
+        f.write("猫が鳴いた\n")
+    assert personal_context_agent.update_utterance_counts(state, str(utterances_file)) == 1
+    assert state["utterances"]["word_counts"] == {"猫": 2, "走る": 1, "鳴く": 1}
+
+    utterances_file.write_text("犬が走った\n犬が鳴いた\n", encoding="utf-8")
+    assert personal_context_agent.update_utterance_counts(state, str(utterances_file)) == 2
+    assert state["utterances"]["word_counts"] == {"犬": 2, "走る": 1, "鳴く": 1}
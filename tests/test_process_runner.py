@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import process_runner
+from utils.process_runner import ProcessStep, run_processes, stream_processes
+
+def python_step(name, code, **kwargs):
+    return ProcessStep(name, [sys.executable, "-c", code], **kwargs)
+
+def collect_lines():
+    lines = []
+    return lines, lambda step, stream_name, line: lines.append((step.name, stream_name, line))
+
+def test_stdout_and_stderr_are_split_and_teed_to_log(tmp_path):
+    """
+    標準出力と標準エラー出力がそれぞれのストリーム名で渡され、ログファイルと末尾の行にも残ることを確認
+    """
+    lines, on_line = collect_lines()
+    code = "import sys; print('out', flush=True); print('err', file=sys.stderr, flush=True); sys.exit(2)"
+    result, = run_processes([python_step("job", code, log_path=str(tmp_path / "logs" / "job.log"))], on_line=on_line)
+    assert result.status == "failed" and result.returncode == 2
+    assert sorted(lines) == [("job", "stderr", "err\n"), ("job", "stdout", "out\n")]
+    assert sorted((tmp_path / "logs" / "job.log").read_text(encoding="utf-8").splitlines()) == ["err", "out"]
+    assert sorted(result.tail) == ["err\n", "out\n"]
+
+def test_tail_keeps_last_lines():
+    """
+    すべての行が on_line に渡され、末尾は最後の DEFAULT_TAIL_LINES 行だけが残ることを確認
+    """
+    lines, on_line = collect_lines()
+    result, = run_processes([python_step("job", "for i in range(500): print(i)")], on_line=on_line)
+    assert len(lines) == 500
+    assert len(result.tail) == process_runner.DEFAULT_TAIL_LINES == 200
+    assert result.tail[0] == "300\n" and result.tail[-1] == "499\n"
+
+def test_utf8_characters_split_across_reads():
+    """
+    UTF-8 の文字がパイプのチャンクの境目で分かれても、文字化けせずに1行になることを確認
+    """
+    class ChunkedReader:
+        def __init__(self, chunks):
+            self.chunks = list(chunks)
+
+        async def read(self, size):
+            return self.chunks.pop(0) if self.chunks else b""
+
+    data = "こんにちは\n世界".encode("utf-8")
+    # 各文字 (3バイト) の途中で区切る
+    reader = ChunkedReader([data[i:i + 2] for i in range(0, len(data), 2)])
+    state = process_runner._StepState(ProcessStep("job", []), 10)
+
+    async def pump():
+        queue = asyncio.Queue()
+        await process_runner._pump_lines(reader, state, "stdout", queue)
+        return [queue.get_nowait()[2] for _ in range(queue.qsize())]
+
+    assert asyncio.run(pump()) == ["こんにちは\n", "世界\n"]
+
+def test_fail_fast_cancels_remaining_steps():
+    """
+    fail_fast=True の場合、1つのステップが失敗すると実行中の他のステップが停止されることを確認
+    """
+    start = time.monotonic()
+    failed, slow = run_processes([python_step("failed", "import sys; sys.exit(3)"),
+                                  python_step("slow", "import time; time.sleep(30)")],
+                                 on_line=lambda *args: None, fail_fast=True, grace_seconds=1)
+    assert failed.status == "failed" and failed.returncode == 3
+    assert slow.status == "cancelled"
+    assert time.monotonic() - start < 15
+
+def test_step_timeout_stops_process_group():
+    result, = run_processes([python_step("slow", "import time; time.sleep(30)", timeout=0.5)], on_line=lambda *args: None, grace_seconds=1)
+    assert result.timed_out
+
+def test_slow_consumer_applies_backpressure(tmp_path):
+    """
+    on_line (コルーチン) が止まっている間は、キューとパイプが埋まって子プロセスの書き込みが待たされることを確認
+    """
+    marker = tmp_path / "done"
+    code = f"for i in range(4000): print('x' * 1000)\nopen({str(marker)!r}, 'w').close()"
+    released = None
+    received = []
+
+    async def on_line(step, stream_name, line):
+        await released.wait()
+        received.append(line)
+
+    async def scenario():
+        nonlocal released
+        released = asyncio.Event()
+        task = asyncio.ensure_future(stream_processes([python_step("job", code)], on_line=on_line, queue_size=4))
+        await asyncio.sleep(1.5)
+        blocked = not marker.exists()
+        released.set()
+        result, = await task
+        return blocked, result
+
+    blocked, result = asyncio.run(scenario())
+    assert blocked
+    assert result.status == "ok" and marker.exists() and len(received) == 4000
@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.resource_monitor import ResourceMonitor, format_bytes, format_summary, list_process_tree, proc_available
+
+pytestmark = pytest.mark.skipif(not proc_available(), reason="/proc が利用できない環境")
+
+# 子プロセスを起動し、子プロセスがCPUを使ってメモリを確保してから終了するまで待つ
+BUSY_TREE_CODE = """
+import subprocess, sys
+child = subprocess.Popen([sys.executable, "-c", "import time; data = b'x' * (64 * 1024 * 1024); sum(range(3_000_000)); time.sleep(0.3)"])
+child.wait()
+"""
+
+def test_monitor_counts_descendants_that_exit_between_samples():
+    """
+    サンプリングの間に終了した孫プロセスのCPU時間も失われず、子プロセスのツリーのピークRSSが計測されることを確認
+    """
+    process = subprocess.Popen([sys.executable, "-c", BUSY_TREE_CODE])
+    monitor = ResourceMonitor(process.pid, interval=0.05, keep_timeseries=True).start()
+    # 呼び出し元と同じく、終了を待ってから回収する前にサマリーを作る
+    os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+    summary = monitor.stop()
+    process.wait()
+    assert summary["cpu_seconds"] > 0.05
+    assert summary["cpu_seconds"] == pytest.approx(summary["user_seconds"] + summary["system_seconds"], abs=0.002)
+    assert summary["peak_rss_bytes"] > 64 * 1024 * 1024 and summary["max_processes"] == 2
+    assert summary["top_processes"][0]["peak_rss_bytes"] > 64 * 1024 * 1024
+    # 終了後 (ゾンビ状態) の最後のサンプルは RSS が 0 になる
+    assert max(sample["rss_bytes"] for sample in summary["timeseries"]) == summary["peak_rss_bytes"]
+    assert monitor.stop() is summary
+    assert "CPU" in format_summary(summary) and "ピークRSS" in format_summary(summary)
+
+def test_list_process_tree_includes_children():
+    process = subprocess.Popen([sys.executable, "-c", "import subprocess, sys; subprocess.run([sys.executable, '-c', 'import time; time.sleep(5)'])"])
+    try:
+        for _ in range(100):
+            pids = list_process_tree(process.pid)
+            if len(pids) == 2:
+                break
+            time.sleep(0.05)
+        assert pids[0] == process.pid and len(pids) == 2
+    finally:
+        for pid in reversed(list_process_tree(process.pid)):
+            os.kill(pid, 9)
+        process.wait()
+
+def test_format_helpers():
+    assert [format_bytes(value) for value in (None, 512, 2048, 5 * 1024 ** 3)] == ["N/A", "512B", "2.0KB", "5.0GB"]
+    assert format_summary({"wall_seconds": 1.5, "cpu_seconds": None}) == "実行時間 1.50秒 (/proc が利用できないためCPU・メモリ・I/Oは計測していません)"
@@ -0,0 +1,142 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.tabular_data import (build_scaler, count_rows, encode_chunk, infer_schema, iter_batches, load_preprocessing_bundle,
+                                load_split_arrays, read_chunks, save_preprocessing_bundle, split_assignments, split_counts)
+
+CSV_TEXT = """size,color,weight,label
+1,red,0.5,cat
+2,blue,,dog
+3,red,1.5,cat
+200,green,2.5,dog
+5,blue,3.5,cat
+"""
+
+def write_csv(tmp_path, text=CSV_TEXT):
+    path = tmp_path / "data.csv"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_infer_schema_types_and_categories(tmp_path):
+    """
+    チャンク単位の走査で、整数列のダウンキャスト・欠損値のある列・カテゴリ列・目的変数のクラスが推定されることを確認
+    """
+    dataset_path = write_csv(tmp_path)
+    schema = infer_schema(dataset_path, chunksize=2)
+    size, color, weight = schema["features"]
+    assert schema["num_rows"] == 5 == count_rows(dataset_path)
+    assert size["kind"] == "numeric" and size["dtype"] == "int16" and size["fill_value"] is None
+    # 補完値は全行ではなく訓練分割から求めるため、推定時には決めない
+    assert weight == {"name": "weight", "kind": "numeric", "dtype": "float32", "fill_value": None, "impute": "mean"}
+    assert color == {"name": "color", "kind": "categorical", "categories": ["blue", "green", "red"]}
+    assert schema["target"] == {"name": "label", "kind": "categorical", "classes": ["cat", "dog"]}
+
+    # 種類の多いカテゴリ列はハッシュでエンコードする
+    assert infer_schema(dataset_path, chunksize=2, max_categories=2)["features"][1] == {"name": "color", "kind": "hashed", "num_buckets": 2}
+
+def test_encode_chunk(tmp_path):
+    dataset_path = write_csv(tmp_path)
+    schema = infer_schema(dataset_path)
+    build_scaler(schema, dataset_path, {"test_size": 0.0})
+    (_, chunk), = read_chunks(dataset_path, schema)
+    X, y = encode_chunk(chunk, schema)
+    assert X.dtype == np.float32 and y.dtype == np.int32
+    np.testing.assert_array_equal(X[:, 1], [2, 0, 2, 1, 0])
+    np.testing.assert_array_equal(X[:, 2], [0.5, 2.0, 1.5, 2.5, 3.5])
+    np.testing.assert_array_equal(y, [0, 1, 0, 1, 0])
+
+def test_numeric_target_classes_sort_numerically(tmp_path):
+    dataset_path = write_csv(tmp_path, "x,label\n1,10\n2,2\n3,10\n")
+    schema = infer_schema(dataset_path)
+    assert schema["target"]["classes"] == [2, 10]
+    (_, chunk), = read_chunks(dataset_path, schema)
+    np.testing.assert_array_equal(encode_chunk(chunk, schema)[1], [1, 0, 1])
+
+def test_split_is_deterministic_and_independent_of_chunksize(tmp_path):
+    """
+    行分割が行番号だけで決まり、チャンクの大きさに関係なく同じ分割・同じ件数になることを確認
+    """
+    rows = np.arange(10_000)
+    assignments = split_assignments(rows, test_size=0.2, validation_split=0.25, seed=7)
+    np.testing.assert_array_equal(assignments, split_assignments(rows, test_size=0.2, validation_split=0.25, seed=7))
+    counts = np.bincount(assignments, minlength=3) / len(rows)
+    assert abs(counts[0] - 0.6) < 0.03 and abs(counts[1] - 0.2) < 0.03 and abs(counts[2] - 0.2) < 0.03
+    assert split_counts(10_000, 0.2, 0.25, 7, chunksize=999) == split_counts(10_000, 0.2, 0.25, 7, chunksize=10_000)
+
+    dataset_path = write_csv(tmp_path, "x,label\n" + "".join(f"{i},{i % 2}\n" for i in range(50)))
+    schema = infer_schema(dataset_path)
+    options = {"test_size": 0.3, "validation_split": 0.2, "seed": 1}
+    X_small, _ = load_split_arrays(dataset_path, schema, "test", chunksize=7, **options)
+    X_large, _ = load_split_arrays(dataset_path, schema, "test", chunksize=100, **options)
+    np.testing.assert_array_equal(X_small, X_large)
+    assert len(X_small) == split_counts(50, chunksize=7, **options)["test"]
+
+def test_iter_batches_spans_chunks(tmp_path):
+    """
+    チャンクの境目をまたいで batch_size ごとのバッチが作られ、最後の端数も返されることを確認
+    """
+    dataset_path = write_csv(tmp_path, "x,label\n" + "".join(f"{i},{i % 2}\n" for i in range(10)))
+    schema = infer_schema(dataset_path)
+    batches = list(iter_batches(dataset_path, schema, batch_size=4, chunksize=3))
+    assert [len(y) for _, y in batches] == [4, 4, 2]
+    np.testing.assert_array_equal(np.concatenate([X for X, _ in batches])[:, 0], np.arange(10))
+
+def test_scaler_matches_standard_scaler_on_imputed_training_rows(tmp_path):
+    """
+    スケーラが補完後の訓練分割に StandardScaler を当てはめた結果と一致し、数値列だけを標準化することを確認
+    """
+    dataset_path = write_csv(tmp_path)
+    schema = infer_schema(dataset_path)
+    options = {"test_size": 0.0, "validation_split": 0.0, "seed": 42}
+    scaler = build_scaler(schema, dataset_path, options)
+    assert schema["features"][2]["fill_value"] == 2.0 and scaler.n_samples_seen_ == 5
+    X, _ = load_split_arrays(dataset_path, schema, "train", **options)
+    expected = StandardScaler().fit(X)
+    np.testing.assert_allclose(scaler.mean_[[0, 2]], expected.mean_[[0, 2]], rtol=1e-6)
+    np.testing.assert_allclose(scaler.var_[[0, 2]], expected.var_[[0, 2]], rtol=1e-6)
+    assert scaler.mean_[1] == 0.0 and scaler.scale_[1] == 1.0
+
+def test_scaler_and_fill_values_use_only_training_rows(tmp_path):
+    """
+    標準化の統計量と欠損値の補完値に、検証・テスト分割の行の値が使われないことを確認
+    """
+    rows = np.arange(200)
+    options = {"test_size": 0.3, "validation_split": 0.2, "seed": 5}
+    train = split_assignments(rows, **options) == 0
+    # 訓練分割以外の行だけ極端な値にし、訓練分割の行の一部を欠損させる
+    values = np.where(train, rows % 7, 1000.0)
+    lines = ["" if train[i] and i % 5 == 0 else f"{values[i]:g}" for i in rows]
+    dataset_path = write_csv(tmp_path, "x,label\n" + "".join(f"{line},{i % 2}\n" for i, line in zip(rows, lines)))
+    schema = infer_schema(dataset_path)
+    scaler = build_scaler(schema, dataset_path, options)
+    observed = values[train & (rows % 5 != 0)]
+    assert schema["features"][0]["fill_value"] == pytest.approx(observed.mean())
+    assert scaler.mean_[0] == pytest.approx(observed.mean()) and scaler.n_samples_seen_ == train.sum()
+    assert scaler.scale_[0] < 10
+
+def test_preprocessing_bundle_round_trip(tmp_path, capsys):
+    """
+    モデルの隣に保存した前処理バンドルから同じスキーマ・分割・ラベルが復元され、データセットの変更が警告されることを確認
+    """
+    dataset_path = write_csv(tmp_path)
+    model_path = str(tmp_path / "model.keras")
+    schema = infer_schema(dataset_path)
+    split = {"test_size": 0.2, "validation_split": 0.1, "seed": 3}
+    assert load_preprocessing_bundle(model_path) is None
+
+    bundle_path = save_preprocessing_bundle(model_path, dataset_path, schema, split, build_scaler(schema, dataset_path, split))
+    assert bundle_path == str(tmp_path / "model_preprocessing.joblib")
+    bundle = load_preprocessing_bundle(model_path, dataset_path)
+    assert bundle["schema"] == schema and bundle["split"] == split
+    assert list(bundle["label_encoder"].inverse_transform([1, 0])) == ["dog", "cat"]
+    assert "警告" not in capsys.readouterr().out
+
+    with open(dataset_path, "a", encoding="utf-8") as f:
+        f.write("6,red,4.5,dog\n")
+    load_preprocessing_bundle(model_path, dataset_path)
+    assert "警告: データセットが学習時から変更されています" in capsys.readouterr().out
@@ -0,0 +1,49 @@
+import os
+import pickle
+import sys
+
+import pytest
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# text_analyzers は学習スクリプトやエージェントと同じく utils を直接インポートする
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "utils"))
+import text_analyzers
+from text_analyzers import get_analyzer, prefetch
+
+def test_regex_analyzers():
+    """
+    regex は文字種の連続を単語に、char_ngram は日本語の部分を文字2-gramに分割することを確認
+    """
+    text = "機械学習のModel 2つ"
+    assert get_analyzer("regex")(text) == ["機械学習の", "model"]
+    assert get_analyzer("char_ngram")(text) == ["機械", "械学", "学習", "習の", "model", "2", "つ"]
+    with pytest.raises(ValueError):
+        get_analyzer("unknown")
+
+def test_analyzers_are_picklable():
+    """
+    モデルと一緒に保存できるよう、アナライザが pickle で復元できることを確認
+    """
+    for name in ("regex", "char_ngram", "janome"):
+        analyzer = get_analyzer(name)
+        assert repr(pickle.loads(pickle.dumps(analyzer))) == repr(analyzer)
+
+def test_janome_analyzer_prefetch_fills_cache(monkeypatch):
+    """
+    prefetch で未解析のテキストだけがまとめて解析され、その後の呼び出しでは解析されないことを確認
+    """
+    pytest.importorskip("janome")
+    batches = []
+    monkeypatch.setattr(text_analyzers, "_token_cache", text_analyzers.OrderedDict())
+    monkeypatch.setattr(text_analyzers, "tokenize_batch",
+                        lambda texts: batches.append(sorted(texts)) or [text_analyzers.tokenize_text(text) for text in texts])
+    analyzer = get_analyzer("janome")
+    prefetch(analyzer, ["猫が走った", "犬が鳴いた", "猫が走った"])
+    prefetch(analyzer, ["猫が走った", "鳥"])
+    assert batches == [["犬が鳴いた", "猫が走った"], ["鳥"]]
+
+    monkeypatch.setattr(text_analyzers, "tokenize_text", lambda text: pytest.fail("キャッシュ済みのテキストが解析されました"))
+    assert analyzer("猫が走った") == ["猫", "走る"]
+
+    # 事前の一括解析に対応しないアナライザでは何もしない
+    prefetch(str.split, ["a b"])
@@ -0,0 +1,58 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("sklearn")
+
+# エージェントモジュールをインポートするためにsys.pathに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents', 'utilities')))
+import topic_classifier_agent
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+@pytest.fixture
+def pipeline():
+    texts = ["train the model", "model training loss", "cook rice", "rice and soup recipe"]
+    return make_pipeline(TfidfVectorizer(), LogisticRegression()).fit(texts, ["ml", "ml", "food", "food"])
+
+def test_classify_stream_batches_lines(pipeline):
+    """
+    空行を飛ばして batch_size 行ずつ分類され、元の行番号と predict と同じトピックが JSON lines で書き出されることを確認
+    """
+    lines = ["train a model", "", "cook soup", "model loss", "rice recipe"]
+    output = io.StringIO()
+    count = topic_classifier_agent.classify_stream(pipeline, io.StringIO("\n".join(lines) + "\n"), output, batch_size=2)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == 4
+    assert [record["line"] for record in records] == [1, 3, 4, 5]
+    assert [record["topic"] for record in records] == list(pipeline.predict([line for line in lines if line]))
+    assert set(records[0]["probabilities"]) == {"food", "ml"}
+    assert sum(records[0]["probabilities"].values()) == pytest.approx(1.0, abs=1e-5)
+
+    output = io.StringIO()
+    topic_classifier_agent.classify_stream(pipeline, io.StringIO("cook soup\n"), output, batch_size=2, include_probabilities=False)
+    assert json.loads(output.getvalue()) == {"line": 1, "text": "cook soup", "topic": "food"}
+
+def test_run_batch_writes_output_file(pipeline, tmp_path):
+    input_path = tmp_path / "input.txt"
+    input_path.write_text("train a model\ncook soup\n", encoding="utf-8")
+    output_path = tmp_path / "out" / "topics.jsonl"
+    topic_classifier_agent.run_batch(pipeline, {"input_path": str(input_path), "output_path": str(output_path), "batch_size": 1})
+    assert [json.loads(line)["topic"] for line in output_path.read_text(encoding="utf-8").splitlines()] == ["ml", "food"]
+
+def test_load_model_reuses_loaded_model_until_file_changes(pipeline, tmp_path):
+    """
+    同じプロセス内ではモデルが再利用され、ファイルが更新されると読み込み直されることを確認
+    """
+    import joblib
+    model_path = str(tmp_path / "topic.joblib")
+    joblib.dump(pipeline, model_path)
+    first = topic_classifier_agent.load_model(model_path)
+    assert topic_classifier_agent.load_model(model_path) is first
+    joblib.dump(pipeline, model_path)
+    os.utime(model_path, (0, os.path.getmtime(model_path) + 10))
+    assert topic_classifier_agent.load_model(model_path) is not first
@@ -0,0 +1,81 @@
+import json
+import os
+import sys
+
+import joblib
+import pytest
+
+pytest.importorskip("sklearn")
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'training_scripts')))
+import topic_model_trainer
+
+ROWS = [("train the model", "ml"), ("model loss curve", "ml"), ("cook rice", "food"), ("soup recipe", "food")]
+
+def write_rows(path, rows, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        if mode == "w":
+            f.write("text,topic\n")
+        f.writelines(f"{text},{topic}\n" for text, topic in rows)
+
+@pytest.fixture(autouse=True)
+def no_registry(monkeypatch):
+    # 成果物レジストリには記録しない
+    monkeypatch.setattr(topic_model_trainer, "register_output", lambda *args, **kwargs: None)
+
+def test_online_training_continues_with_new_rows(tmp_path, monkeypatch):
+    """
+    2回目のオンライン学習では前回以降に追加された行だけを学習し、学習済みの行数が記録されることを確認
+    """
+    data_path, model_path = str(tmp_path / "labeled.csv"), str(tmp_path / "topic.joblib")
+    write_rows(data_path, ROWS)
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=3, epochs=5, analyzer_name="regex")
+    state_path = topic_model_trainer.state_path_for(model_path)
+    with open(state_path, encoding="utf-8") as f:
+        assert json.load(f) == {"mode": "online", "data_path": os.path.abspath(data_path), "rows_seen": 4, "analyzer": "regex"}
+    pipeline = joblib.load(model_path)
+    assert list(pipeline.classes_) == ["food", "ml"]
+    assert pipeline.predict_proba(["cook soup"]).shape == (1, 2)
+
+    seen = []
+    iter_labeled_chunks = topic_model_trainer.iter_labeled_chunks
+    monkeypatch.setattr(topic_model_trainer, "iter_labeled_chunks",
+                        lambda *args: ((seen.extend(X) or X, y) for X, y in iter_labeled_chunks(*args)))
+    write_rows(data_path, [("rice soup", "food")], mode="a")
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=3, epochs=1, analyzer_name="regex")
+    assert seen == ["rice soup", "rice soup"] # クラスの収集と学習で1回ずつ
+    with open(state_path, encoding="utf-8") as f:
+        assert json.load(f)["rows_seen"] == 5
+
+def test_online_training_restarts_on_new_topic(tmp_path, capsys):
+    """
+    学習途中に新しいトピックが追加された場合は、最初から学習し直すことを確認
+    """
+    data_path, model_path = str(tmp_path / "labeled.csv"), str(tmp_path / "topic.joblib")
+    write_rows(data_path, ROWS)
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=2, epochs=1, analyzer_name="regex")
+    write_rows(data_path, [("walk in the park", "outdoor")], mode="a")
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=2, epochs=1, analyzer_name="regex")
+    assert "最初から学習し直します" in capsys.readouterr().out
+    assert list(joblib.load(model_path).classes_) == ["food", "ml", "outdoor"]
+
+def test_online_training_warns_when_data_path_changes(tmp_path, capsys):
+    """
+    前回と異なる学習データでは、黙って最初から学習せずに警告することを確認
+    """
+    data_path, other_path, model_path = str(tmp_path / "labeled.csv"), str(tmp_path / "other.csv"), str(tmp_path / "topic.joblib")
+    write_rows(data_path, ROWS)
+    write_rows(other_path, ROWS[1:3])
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=2, epochs=1, analyzer_name="regex")
+    topic_model_trainer.train_topic_model_online(other_path, model_path, chunksize=2, epochs=1, analyzer_name="regex")
+    assert f"学習データが前回 ({os.path.abspath(data_path)}) と異なるため、最初から学習し直します" in capsys.readouterr().out
+    with open(topic_model_trainer.state_path_for(model_path), encoding="utf-8") as f:
+        assert json.load(f)["rows_seen"] == 2
+
+def test_batch_training_removes_online_state(tmp_path):
+    data_path, model_path = str(tmp_path / "labeled.csv"), str(tmp_path / "topic.joblib")
+    write_rows(data_path, ROWS)
+    topic_model_trainer.train_topic_model_online(data_path, model_path, chunksize=2, epochs=1, analyzer_name="regex")
+    topic_model_trainer.train_topic_model(data_path, model_path, analyzer_name="regex")
+    assert not os.path.exists(topic_model_trainer.state_path_for(model_path))
+    assert joblib.load(model_path).predict(["cook rice"])[0] == "food"
@@ -0,0 +1,44 @@
+import argparse
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils import training_acceleration
+from utils.training_acceleration import ACCELERATION_DEFAULTS, acceleration_kwargs, add_acceleration_args, onednn_env, str2bool
+
+def test_str2bool():
+    assert [str2bool(value) for value in ("true", "Yes", "1", "on", True)] == [True] * 5
+    assert [str2bool(value) for value in ("false", "No", "0", "", "none", False)] == [False] * 6
+    with pytest.raises(ValueError):
+        str2bool("maybe")
+
+def test_acceleration_args_round_trip():
+    """
+    学習スクリプトの引数に高速化オプションが追加され、既定値と指定値がそのまま取り出せることを確認
+    """
+    parser = add_acceleration_args(argparse.ArgumentParser())
+    assert acceleration_kwargs(parser.parse_args([])) == ACCELERATION_DEFAULTS
+    args = parser.parse_args(["--jit_compile", "true", "--mixed_precision", "false", "--intra_op_threads", "4"])
+    assert acceleration_kwargs(args) == {"jit_compile": True, "mixed_precision": False, "intra_op_threads": 4, "inter_op_threads": 0}
+
+def test_onednn_env():
+    """
+    oneDNN の指定が子プロセス用の環境変数に反映され、None の場合は変更されないことを確認
+    """
+    assert onednn_env(True, {})["TF_ENABLE_ONEDNN_OPTS"] == "1"
+    assert onednn_env("false", {})["TF_ENABLE_ONEDNN_OPTS"] == "0"
+    assert onednn_env(None, {"TF_ENABLE_ONEDNN_OPTS": "1"}) == {"TF_ENABLE_ONEDNN_OPTS": "1"}
+
+def test_mixed_precision_falls_back_without_bf16(monkeypatch):
+    """
+    bfloat16 命令のない CPU では混合精度が無効になり、float32 で学習することを確認
+    """
+    tf = pytest.importorskip("tensorflow")
+    monkeypatch.setattr(training_acceleration, "cpu_supports_bf16", lambda: False)
+    try:
+        assert training_acceleration.configure_acceleration(mixed_precision=True) == "float32"
+        assert tf.keras.mixed_precision.global_policy().name == "float32"
+    finally:
+        tf.keras.mixed_precision.set_global_policy("float32")
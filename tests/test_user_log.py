@@ -0,0 +1,58 @@
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from utils.user_log import append_entry, get_log_file_path, iter_entries, migrate_logs_dir
+
+def _append_many(log_path, worker):
+    for i in range(200):
+        append_entry(log_path, {"worker": worker, "i": i, "message": "あ" * 500})
+
+def test_concurrent_appends_do_not_interleave(tmp_path):
+    """
+    複数のプロセスが同時に追記しても、各行が1件の完全なJSONとして残ることを確認
+    """
+    log_path = str(tmp_path / "logs" / "20260101_user_log.jsonl")
+    processes = [multiprocessing.Process(target=_append_many, args=(log_path, worker)) for worker in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    entries = [entry for entry, _ in iter_entries(log_path)]
+    assert len(entries) == 800
+    assert all(entry["message"] == "あ" * 500 for entry in entries)
+
+def test_iter_entries_skips_partial_and_malformed_lines(tmp_path, capsys):
+    """
+    壊れた行と書き込み途中の最終行は飛ばされ、返されたバイト位置から続きを読めることを確認
+    """
+    log_path = tmp_path / "20260101_user_log.jsonl"
+    log_path.write_bytes(b'{"message": "a"}\nnot json\n{"message": "b"}\n{"message": "c"')
+    entries = list(iter_entries(str(log_path)))
+    assert [entry["message"] for entry, _ in entries] == ["a", "b"]
+    assert "malformed" in capsys.readouterr().err
+
+    with open(log_path, "ab") as f:
+        f.write(b'}\n')
+    assert [entry["message"] for entry, _ in iter_entries(str(log_path), entries[-1][1])] == ["c"]
+    assert list(iter_entries(str(tmp_path / "missing.jsonl"))) == []
+
+def test_migrate_legacy_logs_keeps_appended_entries(tmp_path):
+    """
+    JSON配列形式の旧ログが JSON lines に変換され、移行前に追記されたエントリが後ろに残ることを確認
+    """
+    logs_dir = str(tmp_path)
+    date = datetime.date(2026, 1, 1)
+    legacy_path = os.path.join(logs_dir, "20260101_user_log.json")
+    with open(legacy_path, "w", encoding="utf-8") as f:
+        json.dump([{"message": "old1"}, {"message": "old2"}], f)
+    log_path = get_log_file_path(logs_dir, date)
+    append_entry(log_path, {"message": "new"})
+
+    assert migrate_logs_dir(logs_dir) == [log_path]
+    assert [entry["message"] for entry, _ in iter_entries(log_path)] == ["old1", "old2", "new"]
+    assert not os.path.exists(legacy_path) and os.path.exists(f"{legacy_path}.migrated")
+    assert migrate_logs_dir(logs_dir) == []
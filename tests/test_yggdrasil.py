@@ -4,6 +4,7 @@ import pytest
 from unittest.mock import patch, mock_open, MagicMock
 import sys
 import importlib.util
+import time
 
 # yggdrasil.py から load_config 関数と run_agent 関数、関連定数をインポート
 # テスト対象のモジュールをsys.pathに追加する必要がある
@@ -103,6 +104,11 @@ def test_parse_set_args_non_dict_override(mock_logger):
     assert result == expected
     mock_logger.warning.assert_called_with("設定できません a.b: a は辞書ではありません。")
 
+def test_parse_set_args_typed_values():
+    args = ["neg=-3", "lr=1e-5", "ratio=-0.25", "ids=[1, 2, 3]", "names=[a, b]", "hosts=h1:1,h2:2", "version=1.2.3"]
+    expected = {"neg": -3, "lr": 1e-5, "ratio": -0.25, "ids": [1, 2, 3], "names": ["a", "b"], "hosts": "h1:1,h2:2", "version": "1.2.3"}
+    assert parse_set_args(args) == expected
+
 # --- run_agent 関数のテスト (既存 + 修正) ---
 
 @pytest.fixture
@@ -224,6 +230,25 @@ def test_run_agent_with_cli_agent_config_override(mock_logger, mock_agent_module
             framework_config = {"framework_key": "framework_value"}
             run_agent("test_agent", [], framework_config)
 
+def test_run_agent_timeout(mock_logger, mock_agent_module):
+    """
+    エージェントが制限時間を超えた場合に中断され、タイムアウトがログに記録されることを確認
+    """
+    from utils.execution_supervisor import check_cancelled
+
+    def slow_main(args, config):
+        while True:
+            time.sleep(0.01)
+            check_cancelled()
+
+    mock_agent_module.main = MagicMock(side_effect=slow_main)
+    with patch('os.path.exists', return_value=True):
+        with patch('yggdrasil.load_agent_config', return_value={}): # load_agent_configをモック化
+            framework_config = {"agent_execution": {"timeout_seconds": 0.2}}
+            run_agent("test_agent", [], framework_config)
+            mock_logger.error.assert_called_with("エラー: エージェント 'test_agent' が制限時間 (0.2秒) を超えたため中断しました。")
+            mock_logger.info.assert_any_call("--- エージェント 'test_agent' の実行が完了しました ---")
+
 # --- main 関数のテスト (新規) ---
 @patch('yggdrasil.load_config', return_value={})
 @patch('yggdrasil.run_agent')
@@ -268,6 +293,29 @@ def test_main_no_agent_specified(mock_logger, mock_run_agent, mock_load_config):
             mock_logger.info.assert_any_call("- manage_agents")
             mock_run_agent.assert_not_called()
 
+@patch('yggdrasil.load_config', return_value={})
+@patch('yggdrasil.logger')
+def test_main_submit_job(mock_logger, mock_load_config, tmp_path):
+    """
+    submit コマンドでエージェントの実行がジョブキューに追加されることを確認
+    """
+    db_path = tmp_path / "jobs.sqlite"
+    test_sys_argv = ["yggdrasil.py", "--set", f"job_scheduler.db_path={db_path}", "submit", "--priority", "3", "model_trainer", "--agent-set", "epochs=2"]
+    with patch.object(sys, 'argv', test_sys_argv):
+        from yggdrasil import main
+        with pytest.raises(SystemExit) as exit_info:
+            main()
+    assert exit_info.value.code == 0
+    mock_logger.info.assert_any_call("ジョブ 1 (model_trainer) をキューに追加しました。")
+
+    from utils.job_queue import JobQueue
+    with JobQueue(str(db_path)) as queue:
+        job = queue.get(1)
+    assert job["status"] == "queued"
+    assert job["priority"] == 3
+    assert job["agent_args"] == ["--agent-set", "epochs=2"]
+    assert job["framework_args"] == ["--set", f"job_scheduler.db_path={db_path}"]
+
 # --- merge_configs 関数のテスト (既存) ---
 def test_merge_configs_simple():
     base = {"a": 1, "b": 2}
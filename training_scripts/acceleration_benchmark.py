@@ -0,0 +1,165 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import csv
+import time
+from datetime import datetime
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from training_acceleration import str2bool, onednn_env, cpu_supports_bf16
+
+# 計測対象のモデル (各学習スクリプトのモデル構築関数と入力形状)
+MODEL_SPECS = {
+    "mnist": {"input_shape": (28, 28, 1), "num_classes": 10},
+    "character": {"input_shape": (28, 28, 1), "num_classes": 50},
+    "tabular": {"input_shape": (32,), "num_classes": 5}
+}
+
+def build_benchmark_model(model_name):
+    """
+    学習スクリプトと同じモデル構築関数を使ってモデルを作成する。
+    """
+    spec = MODEL_SPECS[model_name]
+    if model_name == "mnist":
+        from mnist_trainer import build_mnist_model
+        return build_mnist_model(spec["input_shape"], spec["num_classes"])
+    if model_name == "character":
+        from character_recognizer import build_character_model
+        return build_character_model(spec["num_classes"], spec["input_shape"])
+    from generic_trainer import build_tabular_model
+    return build_tabular_model(spec["input_shape"][0], spec["num_classes"])
+
+def run_worker(model_name, num_samples, batch_size, epochs, jit_compile, mixed_precision, intra_op_threads, inter_op_threads):
+    """
+    1つの設定の組み合わせで合成データを学習し、samples/sec を JSON で標準出力に書き出す。
+    スレッド数と oneDNN はプロセス単位の設定のため、組み合わせごとに別プロセスで実行される。
+    """
+    from training_acceleration import configure_acceleration
+    import numpy as np
+    import tensorflow as tf
+
+    policy = configure_acceleration(mixed_precision, intra_op_threads, inter_op_threads)
+    spec = MODEL_SPECS[model_name]
+    rng = np.random.default_rng(42)
+    x = rng.random((num_samples, *spec["input_shape"]), dtype=np.float32)
+    y = tf.keras.utils.to_categorical(rng.integers(0, spec["num_classes"], num_samples), spec["num_classes"])
+
+    model = build_benchmark_model(model_name)
+    model.compile(optimizer=tf.keras.optimizers.Adam(), loss='categorical_crossentropy', metrics=['accuracy'], jit_compile=jit_compile)
+
+    # ウォームアップ (グラフ構築とXLAコンパイルの時間を計測から除外する)
+    model.fit(x[:batch_size * 2], y[:batch_size * 2], batch_size=batch_size, epochs=1, verbose=0)
+
+    start_time = time.perf_counter()
+    model.fit(x, y, batch_size=batch_size, epochs=epochs, verbose=0)
+    elapsed = time.perf_counter() - start_time
+
+    print(json.dumps({
+        "precision": policy,
+        "samples_per_sec": round(num_samples * epochs / elapsed, 2),
+        "elapsed_seconds": round(elapsed, 3)
+    }))
+
+def parse_thread_settings(thread_settings):
+    """
+    "intra:inter" をカンマで区切った文字列を (intra, inter) のリストに変換する。例: "0:0,1:1,4:2"
+    """
+    settings = []
+    for item in thread_settings.split(","):
+        intra, _, inter = item.strip().partition(":")
+        settings.append((int(intra or 0), int(inter or 0)))
+    return settings
+
+def run_benchmark(model_name, num_samples, batch_size, epochs, thread_settings, output_file):
+    """
+    jit_compile / 混合精度 / oneDNN / スレッド設定のすべての組み合わせを計測し、結果を表示・記録する。
+    """
+    mixed_precision_options = [False, True] if cpu_supports_bf16() else [False]
+    if len(mixed_precision_options) == 1:
+        print("注意: このCPUはbfloat16命令をサポートしていないため、混合精度の計測はスキップします。")
+
+    combinations = list(itertools.product([False, True], mixed_precision_options, [True, False], parse_thread_settings(thread_settings)))
+    print(f"--- 学習高速化ベンチマークを開始します (model: {model_name}, {len(combinations)} 通り) ---")
+
+    results = []
+    for jit_compile, mixed_precision, onednn, (intra, inter) in combinations:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker",
+            "--model", model_name,
+            "--num_samples", str(num_samples),
+            "--batch_size", str(batch_size),
+            "--epochs", str(epochs),
+            "--jit_compile", str(jit_compile),
+            "--mixed_precision", str(mixed_precision),
+            "--intra_op_threads", str(intra),
+            "--inter_op_threads", str(inter)
+        ]
+        row = {
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "model": model_name,
+            "jit_compile": jit_compile,
+            "mixed_precision": mixed_precision,
+            "onednn": onednn,
+            "intra_op_threads": intra,
+            "inter_op_threads": inter,
+            "batch_size": batch_size,
+            "samples_per_sec": "N/A",
+            "error": ""
+        }
+        completed = subprocess.run(command, capture_output=True, text=True, env=onednn_env(onednn))
+        result_lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+        if completed.returncode == 0 and result_lines:
+            row.update(json.loads(result_lines[-1]))
+        else:
+            row["error"] = (completed.stderr.strip().splitlines() or ["unknown error"])[-1]
+        print(f"jit={jit_compile!s:<5} mixed={mixed_precision!s:<5} onednn={onednn!s:<5} threads={intra}:{inter} -> {row['samples_per_sec']} samples/sec {row['error']}")
+        results.append(row)
+
+    ranked = sorted(results, key=lambda r: r["samples_per_sec"] if isinstance(r["samples_per_sec"], float) else -1.0, reverse=True)
+    if ranked and isinstance(ranked[0]["samples_per_sec"], float):
+        best = ranked[0]
+        print(f"\n最速の設定: jit_compile={best['jit_compile']}, mixed_precision={best['mixed_precision']}, "
+              f"onednn={best['onednn']}, threads={best['intra_op_threads']}:{best['inter_op_threads']} "
+              f"({best['samples_per_sec']} samples/sec)")
+
+    if output_file:
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        file_exists = os.path.isfile(output_file)
+        with open(output_file, 'a', newline='') as csvfile:
+            fieldnames = ['timestamp', 'model', 'jit_compile', 'mixed_precision', 'onednn', 'intra_op_threads', 'inter_op_threads', 'batch_size', 'precision', 'samples_per_sec', 'elapsed_seconds', 'error']
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(ranked)
+        print(f"--- ベンチマーク結果を記録しました: {output_file} ---")
+    return ranked
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='学習高速化オプションのベンチマークスクリプト')
+    parser.add_argument('--model', type=str, default='mnist', choices=sorted(MODEL_SPECS), help='計測するモデル')
+    parser.add_argument('--num_samples', type=int, default=8192, help='合成データのサンプル数')
+    parser.add_argument('--batch_size', type=int, default=128, help='バッチサイズ')
+    parser.add_argument('--epochs', type=int, default=2, help='計測するエポック数')
+    parser.add_argument('--thread_settings', type=str, default='0:0', help='計測するスレッド設定 "intra:inter" のカンマ区切り (0は自動)')
+    parser.add_argument('--output_file', type=str, default=os.path.join(PROJECT_ROOT, "logs", "acceleration_benchmark.csv"), help='結果の記録用CSVファイル')
+    # 以下はワーカープロセス用の内部オプション
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--jit_compile', type=str2bool, default=False, help=argparse.SUPPRESS)
+    parser.add_argument('--mixed_precision', type=str2bool, default=False, help=argparse.SUPPRESS)
+    parser.add_argument('--intra_op_threads', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--inter_op_threads', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.model, args.num_samples, args.batch_size, args.epochs, args.jit_compile, args.mixed_precision, args.intra_op_threads, args.inter_op_threads)
+    else:
+        run_benchmark(args.model, args.num_samples, args.batch_size, args.epochs, args.thread_settings, args.output_file)
@@ -6,11 +6,53 @@ import csv
 from datetime import datetime
 import numpy as np
 import json
+import sys
+from contextlib import nullcontext
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from training_acceleration import add_acceleration_args, acceleration_kwargs, configure_acceleration
+from checkpointing import CheckpointCallback, create_keras_checkpointer
+from experiment_tracking import add_tracking_args, start_script_run, keras_callback
+from artifact_registry import register_output, release_path
+from distributed_training import (add_distribution_args, create_strategy, strategy_scope, is_chief, array_datasets,
+                                  DistributedTrainer, check_resume_consistency, wait_for_all_workers, warn_ignored_option)
+
+def build_character_model(num_classes, input_shape=(28, 28, 1)):
+    return tf.keras.models.Sequential([
+        tf.keras.layers.Conv2D(64, (3, 3), activation='relu', input_shape=input_shape),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.MaxPooling2D((2, 2)),
+        tf.keras.layers.Conv2D(128, (3, 3), activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.MaxPooling2D((2, 2)),
+        tf.keras.layers.Conv2D(256, (3, 3), activation='relu'),
+        tf.keras.layers.BatchNormalization(),
+        tf.keras.layers.MaxPooling2D((2, 2)),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(512, activation='relu'),
+        tf.keras.layers.Dropout(0.5),
+        # 出力層のユニット数は文字数。混合精度でも数値的に安定するよう float32 で計算する
+        tf.keras.layers.Dense(num_classes, activation='softmax', dtype='float32')
+    ])
+
+def train_character_recognizer(epochs, batch_size, output_path, log_file, learning_rate=0.001, optimizer_type='adam',
+                               jit_compile=False, mixed_precision=False, intra_op_threads=0, inter_op_threads=0,
+                               checkpoint_dir=None, checkpoint_every=1, distributed=False, run=None):
+    # 0. 高速化設定 (TFランタイムの初期化前に適用する) と分散学習の準備
+    configure_acceleration(mixed_precision, intra_op_threads, inter_op_threads)
+    strategy = create_strategy(distributed)
+    chief = strategy is None or is_chief() # モデルの保存と結果の記録はチーフだけが行う
+    if strategy and jit_compile:
+        warn_ignored_option("jit_compile", jit_compile)
 
-def train_character_recognizer(epochs, batch_size, output_path, log_file, learning_rate=0.001, optimizer_type='adam'):
     # 1. データのロードと前処理
     print(f"--- 文字画像データセットをロード中: data/neo_world_characters.npz ---")
-    data = np.load(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "neo_world_characters.npz"))
+    data_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "neo_world_characters.npz")
+    data = np.load(data_path)
     x_train = data['X_train']
     y_train = data['y_train']
     x_test = data['X_test']
@@ -35,69 +77,86 @@ def train_character_recognizer(epochs, batch_size, output_path, log_file, learni
     y_train = tf.keras.utils.to_categorical(y_train, num_classes=num_classes)
     y_test = tf.keras.utils.to_categorical(y_test, num_classes=num_classes)
 
-    # 2. モデルの定義
-    model = tf.keras.models.Sequential([
-        tf.keras.layers.Conv2D(64, (3, 3), activation='relu', input_shape=(28, 28, 1)),
-        tf.keras.layers.BatchNormalization(),
-        tf.keras.layers.MaxPooling2D((2, 2)),
-        tf.keras.layers.Conv2D(128, (3, 3), activation='relu'),
-        tf.keras.layers.BatchNormalization(),
-        tf.keras.layers.MaxPooling2D((2, 2)),
-        tf.keras.layers.Conv2D(256, (3, 3), activation='relu'),
-        tf.keras.layers.BatchNormalization(),
-        tf.keras.layers.MaxPooling2D((2, 2)),
-        tf.keras.layers.Flatten(),
-        tf.keras.layers.Dense(512, activation='relu'),
-        tf.keras.layers.Dropout(0.5),
-        tf.keras.layers.Dense(num_classes, activation='softmax') # 出力層のユニット数を変更
-    ])
-
-    # 3. モデルのコンパイル
-    if optimizer_type == 'adam':
-        optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
-    elif optimizer_type == 'sgd':
-        optimizer = tf.keras.optimizers.SGD(learning_rate=learning_rate)
-    else:
-        print(f"警告: 未知のオプティマイザタイプ '{optimizer_type}' です。Adamを使用します。", file=sys.stderr)
-        optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
-
-    model.compile(
-        optimizer=optimizer,
-        loss='categorical_crossentropy',
-        metrics=['accuracy']
-    )
+    with strategy_scope(strategy):
+        # 2. モデルの定義
+        model = build_character_model(num_classes)
+
+        # 3. モデルのコンパイル
+        if optimizer_type == 'adam':
+            optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+        elif optimizer_type == 'sgd':
+            optimizer = tf.keras.optimizers.SGD(learning_rate=learning_rate)
+        else:
+            print(f"警告: 未知のオプティマイザタイプ '{optimizer_type}' です。Adamを使用します。", file=sys.stderr)
+            optimizer = tf.keras.optimizers.Adam(learning_rate=learning_rate)
+
+        model.compile(
+            optimizer=optimizer,
+            loss='categorical_crossentropy',
+            metrics=['accuracy'],
+            jit_compile=jit_compile and strategy is None
+        )
+
+        # チェックポイントがあれば途中のエポックから再開する
+        checkpointer, initial_epoch = create_keras_checkpointer(checkpoint_dir, model, optimizer)
+    if strategy:
+        check_resume_consistency(strategy, initial_epoch)
+    callbacks = [CheckpointCallback(checkpointer, checkpoint_every)] if checkpointer and chief else []
+    if run:
+        callbacks.append(keras_callback(run)) # エポックごとのメトリクスをMLflowに記録
 
     # 4. モデルの学習
     print(f"--- 文字認識モデルの学習を開始します (epochs: {epochs}, batch_size: {batch_size}) ---")
-    history = model.fit(
-        x_train,
-        y_train,
-        batch_size=batch_size,
-        epochs=epochs,
-        validation_split=0.2,
-        verbose=2 # 学習の進捗表示を少し簡潔に
-    )
+    if strategy:
+        # ワーカーごとに batch_size ずつ、グローバルバッチを分担して学習する
+        trainer = DistributedTrainer(model, 'categorical_crossentropy', strategy)
+        train_dataset, validation_dataset = array_datasets(x_train, y_train, batch_size, strategy, validation_split=0.2)
+        history = trainer.fit(train_dataset, epochs, initial_epoch=initial_epoch, validation_data=validation_dataset, callbacks=callbacks)
+    else:
+        history = model.fit(
+            x_train,
+            y_train,
+            batch_size=batch_size,
+            epochs=epochs,
+            initial_epoch=initial_epoch,
+            validation_split=0.2,
+            callbacks=callbacks,
+            verbose=2 # 学習の進捗表示を少し簡潔に
+        )
     print("--- 学習が完了しました ---")
 
     # 5. モデルの評価
     print("--- 学習済みモデルの評価 ---")
-    score = model.evaluate(x_test, y_test, verbose=0)
-    test_loss = score[0]
-    test_accuracy = score[1]
+    if strategy:
+        test_loss, test_accuracy = trainer.evaluate(array_datasets(x_test, y_test, batch_size, strategy, shuffle=False)[0])
+    else:
+        score = model.evaluate(x_test, y_test, verbose=0)
+        test_loss = score[0]
+        test_accuracy = score[1]
     print(f"Test loss: {test_loss:.4f}")
     print(f"Test accuracy: {test_accuracy:.4f}")
+    if run:
+        run.log_metrics({"test_loss": test_loss, "test_accuracy": test_accuracy}, step=epochs)
 
     # 6. モデルの保存
-    if output_path:
+    if output_path and chief:
         print(f"--- 学習済みモデルを保存中: {output_path} ---")
         output_dir = os.path.dirname(output_path)
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
+        release_path(output_path)
         model.save(output_path)
+        if run:
+            run.log_artifact(output_path, "model")
         print("--- 保存が完了しました ---")
+        register_output(output_path, run, datasets=[data_path])
+
+    # 学習が完了したのでチェックポイントは不要
+    if checkpointer and chief:
+        checkpointer.clear()
 
     # 7. 結果のロギング
-    if log_file:
+    if log_file and chief:
         print(f"--- 実験結果を記録中: {log_file} ---")
         log_dir = os.path.dirname(log_file)
         if log_dir and not os.path.exists(log_dir):
@@ -121,6 +180,10 @@ def train_character_recognizer(epochs, batch_size, output_path, log_file, learni
             })
         print("--- 記録が完了しました ---")
 
+    # チーフが保存と記録を終えるまで、他のワーカーもクラスタに残る
+    if strategy:
+        wait_for_all_workers(strategy)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='文字認識モデルの学習スクリプト')
     parser.add_argument('--epochs', type=int, default=5, help='学習のエポック数')
@@ -129,6 +192,13 @@ if __name__ == "__main__":
     parser.add_argument('--log_file', type=str, default=None, help='実験結果の記録用CSVファイル')
     parser.add_argument('--learning_rate', type=float, default=0.001, help='学習率')
     parser.add_argument('--optimizer_type', type=str, default='adam', help='オプティマイザのタイプ (adam, sgd)')
+    add_acceleration_args(parser)
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='チェックポイントの保存先 (指定時は既存のチェックポイントから自動再開)')
+    parser.add_argument('--checkpoint_every', type=int, default=1, help='チェックポイントを保存するエポック間隔')
+    add_distribution_args(parser)
+    add_tracking_args(parser)
     args = parser.parse_args()
 
-    train_character_recognizer(epochs=args.epochs, batch_size=args.batch_size, output_path=args.output_path, log_file=args.log_file, learning_rate=args.learning_rate, optimizer_type=args.optimizer_type)
+    # 分散学習では実験管理のRunもチーフだけが作成する
+    with start_script_run("character_recognizer", args) if not args.distributed or is_chief() else nullcontext() as run:
+        train_character_recognizer(epochs=args.epochs, batch_size=args.batch_size, output_path=args.output_path, log_file=args.log_file, learning_rate=args.learning_rate, optimizer_type=args.optimizer_type, **acceleration_kwargs(args), checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every, distributed=args.distributed, run=run)
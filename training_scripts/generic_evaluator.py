@@ -1,59 +1,97 @@
 import argparse
 import os
+import sys
 import joblib
-import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score, classification_report
 
-def evaluate_model(model_path, dataset_path, log_file):
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import add_tracking_args, start_script_run
+from tabular_data import DEFAULT_CHUNKSIZE, resolve_schema, load_split_arrays, load_preprocessing_bundle, build_label_encoder, build_scaler
+
+# Kerasの model.save で保存されるモデルと、model_exporter_agent で変換した TFLite のモデルの拡張子
+# (それ以外は joblib で保存されたモデルとして扱う)
+KERAS_MODEL_EXTENSIONS = (".keras", ".h5", ".tflite")
+
+def load_model(model_path):
+    """
+    拡張子に応じて Keras (または TFLite) のモデルか joblib で保存されたモデルを読み込み、(model, is_keras) を返す。
+    is_keras が True のモデルの predict はクラスごとの確率を返す。
+    """
+    if model_path.endswith(KERAS_MODEL_EXTENSIONS):
+        from model_export import load_inference_model
+        return load_inference_model(model_path), True
+    return joblib.load(model_path), False
+
+def evaluate_model(model_path, dataset_path, log_file, schema_path=None, chunksize=DEFAULT_CHUNKSIZE, test_size=0.2, split_seed=42, run=None):
     print(f"Evaluating model: {model_path}")
     print(f"Using dataset: {dataset_path}")
     print(f"Log file: {log_file}")
 
     try:
         # モデルをロード
-        model = joblib.load(model_path)
+        model, is_keras = load_model(model_path)
         print(f"Model loaded successfully from {model_path}")
 
-        # データセットをロード (訓練時と同じ方法で)
-        df = pd.read_csv(dataset_path, header=None, skiprows=1) # 最初の行をスキップ
-
-        # 最後の列がターゲット変数、それ以外が特徴量と仮定
-        X = df.iloc[:, :-1]
-        y = df.iloc[:, -1]
-
-        # ターゲット変数が文字列の場合、数値にエンコード (訓練時と同じエンコーダを使用すべきだが、ここでは簡略化)
-        if y.dtype == 'object':
-            from sklearn.preprocessing import LabelEncoder
-            le = LabelEncoder()
-            y = le.fit_transform(y)
+        # 学習時に保存された前処理バンドルがあれば、そのスキーマ・行分割・スケーラをそのまま使う
+        bundle = load_preprocessing_bundle(model_path, dataset_path)
+        if bundle:
+            schema = bundle["schema"]
+            split = bundle["split"]
+            scaler = bundle["scaler"]
+            label_encoder = bundle["label_encoder"]
+        else:
+            print("警告: 前処理バンドルが見つからないため、スキーマと行分割を再計算します。")
+            schema = resolve_schema(dataset_path, schema_path, chunksize)
+            split = {"chunksize": chunksize, "test_size": test_size, "validation_split": 0.0, "seed": split_seed}
+            # 欠損値の補完値を訓練分割から求める (学習時に標準化されていないため、スケーラは使わない)
+            build_scaler(schema, dataset_path, split)
+            scaler = None
+            label_encoder = build_label_encoder(schema)
 
-        # 訓練データとテストデータに分割 (訓練時と同じrandom_stateを使用)
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        # テスト分割の行だけをチャンク単位で読み込む
+        X_test, y_test = load_split_arrays(dataset_path, schema, "test", chunksize=split["chunksize"], test_size=split["test_size"],
+                                           validation_split=split["validation_split"], seed=split["seed"], scaler=scaler)
 
-        # 予測
-        y_pred = model.predict(X_test)
+        # 予測 (Kerasモデルはクラスごとの確率を返す)
+        y_pred = model.predict(X_test, verbose=0).argmax(axis=1) if is_keras else model.predict(X_test)
 
         # 評価指標を計算
         accuracy = accuracy_score(y_test, y_pred)
-        report = classification_report(y_test, y_pred)
+        class_indices = list(range(len(label_encoder.classes_)))
+        report = classification_report(y_test, y_pred, labels=class_indices,
+                                       target_names=[str(c) for c in label_encoder.classes_], zero_division=0)
 
         print(f"Test Accuracy: {accuracy}")
         print("Classification Report:\n", report)
+        if run:
+            run.log_metrics({"test_accuracy": accuracy, "test_samples": len(y_test)})
 
         with open(log_file, 'a') as f:
             f.write(f"\nEvaluation completed for {model_path}. Test Accuracy: {accuracy}\n")
             f.write(f"Classification Report:\n{report}\n")
 
     except Exception as e:
-        print(f"Error during evaluation: {e}")
+        print(f"Error during evaluation: {e}", file=sys.stderr)
+        if run:
+            run.end("FAILED")
+        sys.exit(1) # 呼び出し元 (パイプラインやジョブのスケジューラ) に失敗を伝える
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Generic Model Evaluator Script.")
     parser.add_argument("--model_path", type=str, required=True, help="Path to the trained model.")
     parser.add_argument("--dataset_path", type=str, required=True, help="Path to the dataset for evaluation.")
     parser.add_argument("--log_file", type=str, required=True, help="Path to the log file.")
+    parser.add_argument("--schema_path", type=str, default=None, help="JSON schema for the dataset columns (inferred from the CSV if omitted).")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Number of CSV rows read at a time.")
+    parser.add_argument("--test_size", type=float, default=0.2, help="Fraction of rows held out for testing.")
+    parser.add_argument("--split_seed", type=int, default=42, help="Seed of the deterministic row split.")
+    add_tracking_args(parser)
 
     args = parser.parse_args()
 
-    evaluate_model(args.model_path, args.dataset_path, args.log_file)
+    with start_script_run("generic_evaluator", args) as run:
+        evaluate_model(args.model_path, args.dataset_path, args.log_file, args.schema_path or None, args.chunksize, args.test_size, args.split_seed, run=run)
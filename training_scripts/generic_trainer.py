@@ -1,88 +1,196 @@
 import argparse
+import math
 import os
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import LabelEncoder
+import numpy as np
 from sklearn.metrics import accuracy_score, classification_report
-import tensorflow as tf
 from tensorflow import keras
-
-def train_model(dataset_path, output_path, log_file, epochs, batch_size, learning_rate, optimizer_type):
+import sys
+from contextlib import nullcontext
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from training_acceleration import add_acceleration_args, acceleration_kwargs, configure_acceleration
+from checkpointing import CheckpointCallback, create_keras_checkpointer
+from experiment_tracking import add_tracking_args, start_script_run, keras_callback
+from artifact_registry import register_output, release_path
+from distributed_training import (add_distribution_args, create_strategy, strategy_scope, is_chief, global_batch_size, shard_dataset,
+                                  DistributedTrainer, check_resume_consistency, wait_for_all_workers, warn_ignored_option)
+from tabular_data import DEFAULT_CHUNKSIZE, resolve_schema, split_counts, make_tf_dataset, iter_batches, build_scaler, save_preprocessing_bundle
+
+def build_tabular_model(num_features, num_classes):
+    # 出力層は混合精度でも数値的に安定するよう float32 で計算する
+    return keras.Sequential([
+        keras.layers.Dense(10, activation='relu', input_shape=(num_features,)),
+        keras.layers.Dense(num_classes, activation='softmax', dtype='float32')
+    ])
+
+def make_learning_rate(learning_rate, lr_schedule, decay_steps, min_lr):
+    """
+    lr_schedule に応じて、固定の学習率またはKerasの学習率スケジュールを返す。
+    """
+    if lr_schedule == "cosine":
+        alpha = min(1.0, min_lr / learning_rate) if learning_rate > 0 else 0.0
+        return keras.optimizers.schedules.CosineDecay(learning_rate, decay_steps=max(1, decay_steps), alpha=alpha)
+    return learning_rate
+
+def build_training_callbacks(monitor, early_stopping_patience, lr_schedule, lr_patience, lr_factor, min_lr):
+    """
+    早期終了と学習率調整のコールバックを作成し、(callbacks, early_stopping) を返す。
+    """
+    callbacks = []
+    early_stopping = None
+    if early_stopping_patience > 0:
+        early_stopping = keras.callbacks.EarlyStopping(monitor=monitor, patience=early_stopping_patience, restore_best_weights=True)
+        callbacks.append(early_stopping)
+    if lr_schedule == "plateau":
+        callbacks.append(keras.callbacks.ReduceLROnPlateau(monitor=monitor, factor=lr_factor, patience=lr_patience, min_lr=min_lr))
+    elif lr_schedule not in ("none", "cosine"):
+        print(f"Warning: Unknown lr_schedule '{lr_schedule}'. Using a constant learning rate.")
+    return callbacks, early_stopping
+
+def train_model(dataset_path, output_path, log_file, epochs, batch_size, learning_rate, optimizer_type,
+                jit_compile=False, mixed_precision=False, intra_op_threads=0, inter_op_threads=0,
+                checkpoint_dir=None, checkpoint_every=1,
+                validation_split=0.1, early_stopping_patience=0, lr_schedule="none", lr_patience=2, lr_factor=0.5, min_lr=1e-6,
+                schema_path=None, chunksize=DEFAULT_CHUNKSIZE, test_size=0.2, split_seed=42, distributed=False, run=None):
     print(f"Training model with dataset: {dataset_path}")
     print(f"Output model path: {output_path}")
     print(f"Log file: {log_file}")
     print(f"Epochs: {epochs}, Batch Size: {batch_size}, Learning Rate: {learning_rate}, Optimizer: {optimizer_type}")
+    print(f"Validation Split: {validation_split}, Early Stopping Patience: {early_stopping_patience}, LR Schedule: {lr_schedule}")
+    configure_acceleration(mixed_precision, intra_op_threads, inter_op_threads)
+    strategy = create_strategy(distributed)
+    chief = strategy is None or is_chief() # モデルの保存・評価・結果の記録はチーフだけが行う
+    if strategy and jit_compile:
+        warn_ignored_option("jit_compile", jit_compile)
 
     try:
-        # dataset_pathからデータを読み込む
-        # ここではCSVファイルを想定。必要に応じて他の形式にも対応
-        df = pd.read_csv(dataset_path, header=None, skiprows=1) # 最初の行をスキップ
-
-        # 最後の列がターゲット変数、それ以外が特徴量と仮定
-        X = df.iloc[:, :-1]
-        y = df.iloc[:, -1]
-
-        # ターゲット変数が文字列の場合、数値にエンコード
-        if y.dtype == 'object':
-            le = LabelEncoder()
-            y = le.fit_transform(y)
-            print("Target variable encoded to numerical values.")
-
-        # 特徴量Xに文字列が残っていないか確認し、あればエラーを出すか、適切に処理する
-        for col in X.columns:
-            if X[col].dtype == 'object':
-                raise ValueError(f"Feature column '{col}' contains non-numeric data after target separation.")
-
-        # 訓練データとテストデータに分割
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        # Kerasモデルの構築
-        num_classes = len(set(y_train))
-        model = keras.Sequential([
-            keras.layers.Dense(10, activation='relu', input_shape=(X_train.shape[1],)),
-            keras.layers.Dense(num_classes, activation='softmax')
-        ])
-
-        # オプティマイザの選択
-        if optimizer_type.lower() == "adam":
-            optimizer = keras.optimizers.Adam(learning_rate=learning_rate)
-        else:
-            optimizer = keras.optimizers.SGD(learning_rate=learning_rate) # デフォルトはSGD
-
-        model.compile(optimizer=optimizer,
-                      loss='sparse_categorical_crossentropy',
-                      metrics=['accuracy'])
+        # dataset_pathのCSVをスキーマ (明示的に指定、またはCSVから推定) に従ってチャンク単位で読み込む
+        # 最後の列がターゲット変数、それ以外が特徴量。文字列の列はカテゴリとしてエンコードされる
+        schema = resolve_schema(dataset_path, schema_path, chunksize)
+        split_options = {"chunksize": chunksize, "test_size": test_size, "validation_split": validation_split, "seed": split_seed}
+        counts = split_counts(schema["num_rows"], test_size, validation_split, split_seed, chunksize)
+        print(f"Rows: train={counts['train']}, validation={counts['validation']}, test={counts['test']}")
+        scaler = build_scaler(schema, dataset_path, split_options)
+
+        # 分散学習では全ワーカーが同じ順序でCSVを読み、グローバルバッチのうち自分の担当分だけを学習する
+        dataset_batch_size = global_batch_size(batch_size, strategy) if strategy else batch_size
+        train_dataset = make_tf_dataset(dataset_path, schema, "train", dataset_batch_size, shuffle=True, scaler=scaler, **split_options)
+        validation_dataset = make_tf_dataset(dataset_path, schema, "validation", dataset_batch_size, scaler=scaler, **split_options) if counts["validation"] else None
+        if strategy:
+            train_dataset = shard_dataset(train_dataset)
+            validation_dataset = shard_dataset(validation_dataset) if validation_dataset is not None else None
+
+        with strategy_scope(strategy):
+            # Kerasモデルの構築
+            num_classes = len(schema["target"]["classes"])
+            model = build_tabular_model(len(schema["features"]), num_classes)
+
+            # 学習率 (cosine の場合は学習全体のステップ数で減衰させる)
+            steps_per_epoch = math.ceil(counts["train"] / dataset_batch_size)
+            lr = make_learning_rate(learning_rate, lr_schedule, steps_per_epoch * epochs, min_lr)
+
+            # オプティマイザの選択
+            if optimizer_type.lower() == "adam":
+                optimizer = keras.optimizers.Adam(learning_rate=lr)
+            else:
+                optimizer = keras.optimizers.SGD(learning_rate=lr) # デフォルトはSGD
+
+            model.compile(optimizer=optimizer,
+                          loss='sparse_categorical_crossentropy',
+                          metrics=['accuracy'],
+                          jit_compile=jit_compile and strategy is None)
+
+            # チェックポイントがあれば途中のエポックから再開する
+            checkpointer, initial_epoch = create_keras_checkpointer(checkpoint_dir, model, optimizer)
+        if strategy:
+            check_resume_consistency(strategy, initial_epoch)
+        callbacks = [CheckpointCallback(checkpointer, checkpoint_every)] if checkpointer and chief else []
+
+        # 検証データがあれば検証損失で、なければ訓練損失で早期終了・学習率調整を判断する
+        monitor = "val_loss" if validation_dataset is not None else "loss"
+        schedule_callbacks, early_stopping = build_training_callbacks(monitor, early_stopping_patience, lr_schedule, lr_patience, lr_factor, min_lr)
+        callbacks.extend(schedule_callbacks)
+        if run:
+            callbacks.append(keras_callback(run)) # エポックごとのメトリクスをMLflowに記録
 
         # モデルの訓練
-        model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, verbose=0)
+        if strategy:
+            trainer = DistributedTrainer(model, 'sparse_categorical_crossentropy', strategy)
+            history = trainer.fit(train_dataset, epochs, initial_epoch=initial_epoch, validation_data=validation_dataset,
+                                  callbacks=callbacks, verbose=False)
+        else:
+            history = model.fit(train_dataset, epochs=epochs, initial_epoch=initial_epoch,
+                                validation_data=validation_dataset, callbacks=callbacks, verbose=0)
+        epochs_run = len(history.history.get("loss", []))
+        if early_stopping and early_stopping.stopped_epoch > 0:
+            print(f"Early stopping at epoch {early_stopping.stopped_epoch + 1}; restored weights from epoch {early_stopping.best_epoch + 1}.")
+        if not chief:
+            print("Distributed worker finished; waiting for the chief to save and evaluate the model.")
+            wait_for_all_workers(strategy)
+            return
 
         # モデルを保存
+        release_path(output_path)
         model.save(output_path)
         print(f"Model trained and saved to {output_path}")
 
-        # 訓練データでの精度をログに記録
-        _, train_accuracy = model.evaluate(X_train, y_train, verbose=0)
-        print(f"Training Accuracy: {train_accuracy}")
-
-        # テストデータでの評価
+        # 評価時に同じ前処理と行分割を再現できるよう、前処理バンドルをモデルの隣に保存する
+        bundle_path = save_preprocessing_bundle(output_path, dataset_path, schema, {**split_options, "counts": counts}, scaler)
+        print(f"Preprocessing bundle saved to {bundle_path}")
+        if run:
+            run.log_artifact(output_path, "model")
+            run.log_artifact(bundle_path, "model")
+        register_output(output_path, run, datasets=[dataset_path])
+
+        # 学習が完了したのでチェックポイントは不要
+        if checkpointer:
+            checkpointer.clear()
+
+        # 訓練データでの精度は、追加の評価パスを行わずに学習履歴から取得する
+        # (最良の重みを復元した場合はそのエポックの値を使う)
+        train_accuracy = None
+        if epochs_run:
+            best_index = early_stopping.best_epoch - initial_epoch if early_stopping else epochs_run - 1
+            train_accuracy = history.history["accuracy"][min(max(best_index, 0), epochs_run - 1)]
+        print(f"Training Accuracy: {train_accuracy} (from fit history, {epochs_run} epochs run)")
+
+        # テストデータでの評価 (テスト分割の行だけをバッチ単位で読み込んで予測する)
         print("\n--- Evaluating model on test data ---")
-        y_pred = model.predict(X_test)
-        y_pred_classes = tf.argmax(y_pred, axis=1)
+        y_test, y_pred_classes = [], []
+        for X_batch, y_batch in iter_batches(dataset_path, schema, "test", chunksize, scaler=scaler, **split_options):
+            # 分散学習のモデルでは predict_on_batch が全ワーカーの参加を待つため、直接呼び出す
+            y_pred = np.asarray(model(X_batch, training=False)) if strategy else model.predict_on_batch(X_batch)
+            y_pred_classes.append(np.argmax(y_pred, axis=1))
+            y_test.append(y_batch)
+        y_test = np.concatenate(y_test)
+        y_pred_classes = np.concatenate(y_pred_classes)
 
         test_accuracy = accuracy_score(y_test, y_pred_classes)
         report = classification_report(y_test, y_pred_classes)
 
         print(f"Test Accuracy: {test_accuracy}")
         print("Classification Report:\n", report)
+        if run:
+            run.log_metrics({"train_accuracy": train_accuracy, "test_accuracy": test_accuracy, "epochs_run": epochs_run}, step=initial_epoch + epochs_run)
 
         with open(log_file, 'a') as f:
             f.write(f"Training completed for {output_path}. Training Accuracy: {train_accuracy}\n")
             f.write(f"Evaluation completed for {output_path}. Test Accuracy: {test_accuracy}\n")
             f.write(f"Classification Report:\n{report}\n")
 
+        # チーフが保存と評価を終えるまで、他のワーカーもクラスタに残る
+        if strategy:
+            wait_for_all_workers(strategy)
+
     except Exception as e:
-        print(f"Error during training and evaluation: {e}")
-        # エラーログをファイルに書き込むことも可能
+        print(f"Error during training and evaluation: {e}", file=sys.stderr)
+        if run:
+            run.end("FAILED")
+        sys.exit(1) # 呼び出し元 (model_trainer やジョブのスケジューラ) に失敗を伝える
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Generic Model Trainer Script.")
@@ -93,7 +201,27 @@ if __name__ == '__main__':
     parser.add_argument("--batch_size", type=int, default=32, help="Batch size for training.")
     parser.add_argument("--learning_rate", type=float, default=0.001, help="Learning rate.")
     parser.add_argument("--optimizer_type", type=str, default="adam", help="Optimizer type.")
-
+    add_acceleration_args(parser)
+    parser.add_argument("--checkpoint_dir", type=str, default=None, help="Directory for periodic checkpoints; training resumes from the latest one.")
+    parser.add_argument("--checkpoint_every", type=int, default=1, help="Save a checkpoint every N epochs.")
+    parser.add_argument("--validation_split", type=float, default=0.1, help="Fraction of the training data held out for validation.")
+    parser.add_argument("--early_stopping_patience", type=int, default=0, help="Stop after N epochs without improvement (0 disables early stopping).")
+    parser.add_argument("--lr_schedule", type=str, default="none", choices=["none", "plateau", "cosine"], help="Learning rate schedule.")
+    parser.add_argument("--lr_patience", type=int, default=2, help="Epochs without improvement before ReduceLROnPlateau lowers the learning rate.")
+    parser.add_argument("--lr_factor", type=float, default=0.5, help="Factor by which ReduceLROnPlateau lowers the learning rate.")
+    parser.add_argument("--min_lr", type=float, default=1e-6, help="Lower bound on the learning rate for plateau and cosine schedules.")
+    parser.add_argument("--schema_path", type=str, default=None, help="JSON schema for the dataset columns (inferred from the CSV if omitted).")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Number of CSV rows read at a time.")
+    parser.add_argument("--test_size", type=float, default=0.2, help="Fraction of rows held out for testing.")
+    parser.add_argument("--split_seed", type=int, default=42, help="Seed of the deterministic row split.")
+
+    add_distribution_args(parser)
+    add_tracking_args(parser)
     args = parser.parse_args()
 
-    train_model(args.dataset_path, args.output_path, args.log_file, args.epochs, args.batch_size, args.learning_rate, args.optimizer_type)
+    # 分散学習では実験管理のRunもチーフだけが作成する
+    with start_script_run("generic_trainer", args) if not args.distributed or is_chief() else nullcontext() as run:
+        train_model(args.dataset_path, args.output_path, args.log_file, args.epochs, args.batch_size, args.learning_rate, args.optimizer_type, **acceleration_kwargs(args), checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                    validation_split=args.validation_split, early_stopping_patience=args.early_stopping_patience, lr_schedule=args.lr_schedule,
+                    lr_patience=args.lr_patience, lr_factor=args.lr_factor, min_lr=args.min_lr,
+                    schema_path=args.schema_path or None, chunksize=args.chunksize, test_size=args.test_size, split_seed=args.split_seed, distributed=args.distributed, run=run)
@@ -8,7 +8,14 @@ from datetime import datetime
 import sys
 import json
 
-def evaluate_model(model_path, input_data_path, log_file):
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import add_tracking_args, start_script_run
+
+def evaluate_model(model_path, input_data_path, log_file, run=None):
     print(f"--- モデル評価を開始します。モデル: {model_path}, データ: {input_data_path} ---")
 
     if not os.path.exists(model_path):
@@ -48,6 +55,8 @@ def evaluate_model(model_path, input_data_path, log_file):
     print(f"Test loss: {test_loss:.4f}")
     print(f"Test accuracy: {test_accuracy:.4f}")
     print("--- モデル評価が完了しました ---")
+    if run:
+        run.log_metrics({"evaluated_loss": test_loss, "evaluated_accuracy": test_accuracy})
 
     # 結果のロギング
     if log_file:
@@ -78,6 +87,8 @@ if __name__ == "__main__":
     parser.add_argument('--model_path', type=str, required=True, help='評価する学習済みモデルのパス')
     parser.add_argument('--input_data_path', type=str, default=None, help='評価用データファイルへのパス (NPZ形式)')
     parser.add_argument('--log_file', type=str, default=None, help='評価結果の記録用CSVファイル')
+    add_tracking_args(parser)
     args = parser.parse_args()
 
-    evaluate_model(model_path=args.model_path, input_data_path=args.input_data_path, log_file=args.log_file)
+    with start_script_run("model_evaluator", args) as run:
+        evaluate_model(model_path=args.model_path, input_data_path=args.input_data_path, log_file=args.log_file, run=run)
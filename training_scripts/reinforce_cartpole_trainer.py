@@ -5,8 +5,18 @@ import numpy as np
 import argparse
 import os
 import csv
+import sys
 from datetime import datetime
 
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from checkpointing import TrainingCheckpointer
+from experiment_tracking import add_tracking_args, start_script_run
+from artifact_registry import register_output, release_path
+
 # REINFORCEアルゴリズムの実装
 class REINFORCEAgent:
     def __init__(self, state_size, action_size, learning_rate=0.001, gamma=0.99):
@@ -15,6 +25,8 @@ class REINFORCEAgent:
         self.gamma = gamma
         self.optimizer = optimizers.Adam(learning_rate=learning_rate)
         self.policy_network = self._build_policy_network()
+        # 行動サンプリング用の乱数生成器 (状態をチェックポイントに保存して再開後も同じ系列を続ける)
+        self.rng = tf.random.Generator.from_non_deterministic_state()
 
     def _build_policy_network(self):
         model = models.Sequential([
@@ -27,7 +39,8 @@ class REINFORCEAgent:
     def choose_action(self, state):
         state_tensor = tf.convert_to_tensor(state[None, :], dtype=tf.float32) # Add batch dimension
         action_probs = self.policy_network(state_tensor) # Get probabilities from the policy network
-        action = tf.random.categorical(tf.math.log(action_probs), 1)[0, 0].numpy() # Sample action
+        seed = self.rng.make_seeds(1)[:, 0]
+        action = tf.random.stateless_categorical(tf.math.log(action_probs), 1, seed=seed)[0, 0].numpy() # Sample action
         return action, action_probs[0, action] # Return action and its probability tensor
 
     def learn(self, states, actions, rewards):
@@ -61,18 +74,31 @@ class REINFORCEAgent:
         grads = tape.gradient(loss, self.policy_network.trainable_variables)
         self.optimizer.apply_gradients(zip(grads, self.policy_network.trainable_variables))
 
-def train_reinforce_cartpole(episodes, learning_rate, gamma, output_path, log_file):
+def train_reinforce_cartpole(episodes, learning_rate, gamma, output_path, log_file, checkpoint_dir=None, checkpoint_every=50, run=None):
     env = gym.make('CartPole-v1')
     state_size = env.observation_space.shape[0]
-    action_size = env.action_space.n
+    action_size = int(env.action_space.n)
 
     agent = REINFORCEAgent(state_size, action_size, learning_rate, gamma)
 
     episode_rewards = []
+    start_episode = 0
+
+    # チェックポイントがあれば、ネットワーク・オプティマイザ・乱数状態・エピソード数を復元して再開する
+    checkpointer = None
+    if checkpoint_dir:
+        agent.optimizer.build(agent.policy_network.trainable_variables)
+        checkpointer = TrainingCheckpointer(checkpoint_dir, policy_network=agent.policy_network, optimizer=agent.optimizer, rng=agent.rng)
+        start_episode = checkpointer.restore()
+        if start_episode:
+            extra_state = checkpointer.extra_state
+            episode_rewards = extra_state.get("episode_rewards", [])
+            if "env_rng_state" in extra_state:
+                env.unwrapped.np_random.bit_generator.state = extra_state["env_rng_state"]
 
     print(f"--- CartPole REINFORCE学習を開始します (episodes: {episodes}, learning_rate: {learning_rate}, gamma: {gamma}) ---")
 
-    for e in range(episodes):
+    for e in range(start_episode, episodes):
         state, _ = env.reset()
         done = False
         states_history = []
@@ -94,10 +120,18 @@ def train_reinforce_cartpole(episodes, learning_rate, gamma, output_path, log_fi
         
         total_reward = sum(rewards)
         episode_rewards.append(total_reward)
+        if run:
+            run.log_metric("episode_reward", total_reward, step=e)
 
         if (e + 1) % 10 == 0:
             avg_reward = np.mean(episode_rewards[-10:])
             print(f"エピソード: {e+1}/{episodes}, 平均報酬 (過去10エピソード): {avg_reward:.2f}")
+
+        if checkpointer and (e + 1) % checkpoint_every == 0:
+            checkpointer.save(e + 1, {
+                "episode_rewards": episode_rewards,
+                "env_rng_state": env.unwrapped.np_random.bit_generator.state
+            })
         
         # CartPole-v1 の成功基準は200エピソードの平均報酬が195以上
         if len(episode_rewards) >= 100 and np.mean(episode_rewards[-100:]) >= 195:
@@ -113,8 +147,19 @@ def train_reinforce_cartpole(episodes, learning_rate, gamma, output_path, log_fi
         output_dir = os.path.dirname(output_path)
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
+        release_path(output_path)
         agent.policy_network.save(output_path)
+        if run:
+            run.log_artifact(output_path, "model")
         print("--- 保存が完了しました ---")
+        register_output(output_path, run, datasets=["gym:CartPole-v1"])
+
+    # 学習が完了したのでチェックポイントは不要
+    if checkpointer:
+        checkpointer.clear()
+
+    if run and episode_rewards:
+        run.log_metric("avg_last_100_rewards", np.mean(episode_rewards[-100:]), step=len(episode_rewards))
 
     # 結果のロギング
     if log_file:
@@ -152,6 +197,10 @@ if __name__ == "__main__":
     parser.add_argument('--gamma', type=float, default=0.99, help='割引率')
     parser.add_argument('--output_path', type=str, default=None, help='学習済みモデルの保存先パス')
     parser.add_argument('--log_file', type=str, default=None, help='実験結果の記録用CSVファイル')
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='チェックポイントの保存先 (指定時は既存のチェックポイントから自動再開)')
+    parser.add_argument('--checkpoint_every', type=int, default=50, help='チェックポイントを保存するエピソード間隔')
+    add_tracking_args(parser)
     args = parser.parse_args()
 
-    train_reinforce_cartpole(episodes=args.episodes, learning_rate=args.learning_rate, gamma=args.gamma, output_path=args.output_path, log_file=args.log_file)
\ No newline at end of file
+    with start_script_run("reinforce_cartpole_trainer", args) as run:
+        train_reinforce_cartpole(episodes=args.episodes, learning_rate=args.learning_rate, gamma=args.gamma, output_path=args.output_path, log_file=args.log_file, checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every, run=run)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from process_runner import ProcessStep, run_processes
+from distributed_training import free_local_addresses, worker_env
+from acceleration_benchmark import MODEL_SPECS, build_benchmark_model
+
+def run_worker(model_name, num_samples, batch_size, epochs):
+    """
+    TF_CONFIG のクラスタの1ワーカーとして合成データを学習する。チーフは全ワーカー合計の samples/sec を
+    JSON で標準出力に書き出す。ワーカー数が1の場合も同じ学習ループを使い、ワーカー数だけを比較する。
+    """
+    from distributed_training import DistributedTrainer, array_datasets, create_strategy, is_chief
+    import numpy as np
+    import tensorflow as tf
+
+    strategy = create_strategy(True)
+    spec = MODEL_SPECS[model_name]
+    # 全ワーカーが同じデータを生成し、グローバルバッチのうち自分の担当分だけを学習する
+    rng = np.random.default_rng(42)
+    x = rng.random((num_samples, *spec["input_shape"]), dtype=np.float32)
+    y = tf.keras.utils.to_categorical(rng.integers(0, spec["num_classes"], num_samples), spec["num_classes"])
+    dataset, _ = array_datasets(x, y, batch_size, strategy)
+
+    with strategy.scope():
+        model = build_benchmark_model(model_name)
+        model.compile(optimizer=tf.keras.optimizers.Adam(), loss='categorical_crossentropy')
+    trainer = DistributedTrainer(model, 'categorical_crossentropy', strategy)
+
+    # ウォームアップ (グラフ構築とワーカー間の接続の時間を計測から除外する)
+    trainer.fit(dataset, 1, verbose=False)
+
+    start_time = time.perf_counter()
+    trainer.fit(dataset, epochs, verbose=False)
+    elapsed = time.perf_counter() - start_time
+
+    if is_chief():
+        print(json.dumps({
+            "samples_per_sec": round(num_samples * epochs / elapsed, 2),
+            "elapsed_seconds": round(elapsed, 3)
+        }))
+
+def parse_worker_counts(worker_counts):
+    """
+    カンマ区切りのワーカー数を整数のリストに変換する。例: "1,2,4"
+    """
+    counts = [int(item) for item in worker_counts.split(",") if item.strip()]
+    if not counts or min(counts) < 1:
+        raise ValueError(f"ワーカー数は1以上の整数をカンマ区切りで指定してください: {worker_counts}")
+    return counts
+
+def run_benchmark(model_name, num_samples, batch_size, epochs, worker_counts, output_file):
+    """
+    ワーカー数ごとに同じホストでワーカーを起動して学習のスループットを計測し、最初のワーカー数に対する
+    速度向上率と効率 (速度向上率 / ワーカー数倍率) を表示・記録する。
+    ワーカーごとのバッチサイズは固定 (ワーカー数に比例してグローバルバッチが大きくなる) で計測する。
+    """
+    counts = parse_worker_counts(worker_counts)
+    cpu_count = os.cpu_count() or 1
+    print(f"--- スケーリングベンチマークを開始します (model: {model_name}, ワーカー数: {counts}, CPUコア数: {cpu_count}) ---")
+    if max(counts) > cpu_count:
+        print(f"注意: ワーカー数がCPUコア数 ({cpu_count}) を超える計測では、ワーカーがコアを奪い合うためスループットは伸びません。")
+
+    results = []
+    for count in counts:
+        workers = free_local_addresses(count)
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker",
+            "--model", model_name,
+            "--num_samples", str(num_samples),
+            "--batch_size", str(batch_size),
+            "--epochs", str(epochs)
+        ]
+        steps = [ProcessStep(f"worker{index}", command, env=worker_env(workers, index, local_workers=count)) for index in range(count)]
+        row = {
+            "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "model": model_name,
+            "num_workers": count,
+            "batch_size_per_worker": batch_size,
+            "global_batch_size": batch_size * count,
+            "samples_per_sec": "N/A",
+            "speedup": "N/A",
+            "efficiency": "N/A",
+            "error": ""
+        }
+        # ワーカーの出力は表示せず、結果の行とエラーの末尾だけを使う
+        chief, *_ = run_processes(steps, on_line=lambda step, stream_name, line: None, fail_fast=True)
+        result_lines = [line for line in chief.tail if line.startswith("{")]
+        if chief.status == "ok" and result_lines:
+            row.update(json.loads(result_lines[-1]))
+        else:
+            row["error"] = (chief.output.strip().splitlines() or ["unknown error"])[-1]
+        results.append(row)
+
+    baseline = results[0]
+    if isinstance(baseline["samples_per_sec"], float):
+        for row in results:
+            if isinstance(row["samples_per_sec"], float):
+                row["speedup"] = round(row["samples_per_sec"] / baseline["samples_per_sec"], 3)
+                row["efficiency"] = round(row["speedup"] / (row["num_workers"] / baseline["num_workers"]), 3)
+    for row in results:
+        print(f"workers={row['num_workers']:<3} global_batch={row['global_batch_size']:<5} -> {row['samples_per_sec']} samples/sec "
+              f"(speedup {row['speedup']}, efficiency {row['efficiency']}) {row['error']}")
+
+    if output_file:
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        file_exists = os.path.isfile(output_file)
+        with open(output_file, 'a', newline='') as csvfile:
+            fieldnames = ['timestamp', 'model', 'num_workers', 'batch_size_per_worker', 'global_batch_size', 'samples_per_sec', 'elapsed_seconds', 'speedup', 'efficiency', 'error']
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+            if not file_exists:
+                writer.writeheader()
+            writer.writerows(results)
+        print(f"--- ベンチマーク結果を記録しました: {output_file} ---")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='分散学習のワーカー数に対するスループットのベンチマークスクリプト')
+    parser.add_argument('--model', type=str, default='character', choices=sorted(MODEL_SPECS), help='計測するモデル')
+    parser.add_argument('--num_samples', type=int, default=8192, help='合成データのサンプル数')
+    parser.add_argument('--batch_size', type=int, default=128, help='ワーカーごとのバッチサイズ')
+    parser.add_argument('--epochs', type=int, default=2, help='計測するエポック数')
+    parser.add_argument('--worker_counts', type=str, default='1,2,4', help='計測するワーカー数のカンマ区切り')
+    parser.add_argument('--output_file', type=str, default=os.path.join(PROJECT_ROOT, "logs", "scaling_benchmark.csv"), help='結果の記録用CSVファイル')
+    # 以下はワーカープロセス用の内部オプション
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.model, args.num_samples, args.batch_size, args.epochs)
+    else:
+        run_benchmark(args.model, args.num_samples, args.batch_size, args.epochs, args.worker_counts, args.output_file)
@@ -7,8 +7,16 @@ from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
 import numpy as np
+import sys
 
-def train_regression_model(n_samples, random_state, output_path, log_file):
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, "utils"))
+from experiment_tracking import add_tracking_args, start_script_run
+
+def train_regression_model(n_samples, random_state, output_path, log_file, run=None):
     print(f"--- 回帰モデルの学習を開始します (n_samples: {n_samples}, random_state: {random_state}) ---")
 
     # ダミーデータの生成
@@ -30,6 +38,8 @@ def train_regression_model(n_samples, random_state, output_path, log_file):
     y_pred = model.predict(X_test)
     mse = mean_squared_error(y_test, y_pred)
     print(f"Mean Squared Error: {mse}")
+    if run:
+        run.log_metric("mean_squared_error", mse)
 
     # ログの記録
     if log_file:
@@ -65,6 +75,8 @@ if __name__ == "__main__":
     parser.add_argument('--random_state', type=int, default=42, help='乱数シード')
     parser.add_argument('--output_path', type=str, default=None, help='学習済みモデルの保存先パス (このスクリプトでは使用されません)')
     parser.add_argument('--log_file', type=str, default=None, help='実験結果の記録用CSVファイル')
+    add_tracking_args(parser)
     args = parser.parse_args()
 
-    train_regression_model(n_samples=args.n_samples, random_state=args.random_state, output_path=args.output_path, log_file=args.log_file)
+    with start_script_run("simple_regression", args) as run:
+        train_regression_model(n_samples=args.n_samples, random_state=args.random_state, output_path=args.output_path, log_file=args.log_file, run=run)
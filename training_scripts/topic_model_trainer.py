@@ -1,10 +1,14 @@
 
+import argparse
+import json
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.pipeline import make_pipeline
 import joblib
 import os
+import sys
 
 # プロジェクトのルートディレクトリを基準にパスを設定
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -12,7 +16,20 @@ DATA_FILE_PATH = os.path.join(PROJECT_ROOT, 'data', 'labeled_user_logs.csv')
 MODEL_DIR = os.path.join(PROJECT_ROOT, 'trained_models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'topic_classifier.joblib')
 
-def train_topic_model():
+# utilsディレクトリをパスに追加
+sys.path.append(os.path.join(PROJECT_ROOT, 'utils'))
+from text_analyzers import ANALYZERS, get_analyzer, prefetch
+from experiment_tracking import add_tracking_args, start_script_run
+from artifact_registry import register_output, release_path
+
+# テキストを単語に分割するアナライザ (日本語の文を1語として扱わないように)
+DEFAULT_ANALYZER = 'char_ngram'
+
+# オンライン学習の設定
+DEFAULT_CHUNKSIZE = 50000
+HASHING_N_FEATURES = 2 ** 20
+
+def train_topic_model(data_path=DATA_FILE_PATH, model_path=MODEL_PATH, analyzer_name=DEFAULT_ANALYZER, run=None):
     """
     ユーザーの対話ログからトピック分類モデルを学習し、保存する。
     """
@@ -20,10 +37,10 @@ def train_topic_model():
 
     # 1. データの読み込み
     try:
-        df = pd.read_csv(DATA_FILE_PATH)
-        print(f"学習データを読み込みました: {DATA_FILE_PATH}")
+        df = pd.read_csv(data_path)
+        print(f"学習データを読み込みました: {data_path}")
     except FileNotFoundError:
-        print(f"エラー: 学習データが見つかりません: {DATA_FILE_PATH}")
+        print(f"エラー: 学習データが見つかりません: {data_path}")
         return
 
     # 簡単な前処理
@@ -43,19 +60,160 @@ def train_topic_model():
     # TfidfVectorizer: テキストを数値ベクトルに変換
     # LogisticRegression: 分類モデル
     print("TF-IDFベクトル化とロジスティック回帰モデルを構築します。")
+    analyzer = get_analyzer(analyzer_name)
+    print(f"アナライザ: {analyzer}")
     pipeline = make_pipeline(
-        TfidfVectorizer(min_df=1), # 低頻度すぎる単語は無視しない
+        TfidfVectorizer(min_df=1, analyzer=analyzer), # 低頻度すぎる単語は無視しない
         LogisticRegression(random_state=42)
     )
 
     print("モデルの学習中...")
+    prefetch(analyzer, X)
     pipeline.fit(X, y)
     print("モデルの学習が完了しました。")
+    if run:
+        run.log_metrics({"train_samples": len(df), "num_topics": len(pipeline.classes_), "train_accuracy": pipeline.score(X, y)})
 
     # 3. モデルの保存
-    os.makedirs(MODEL_DIR, exist_ok=True)
-    joblib.dump(pipeline, MODEL_PATH)
-    print(f"学習済みモデルを保存しました: {MODEL_PATH}")
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    release_path(model_path)
+    joblib.dump(pipeline, model_path)
+    # 一括学習したモデルにはオンライン学習の進捗がないため、古い記録を削除する
+    if os.path.exists(state_path_for(model_path)):
+        os.remove(state_path_for(model_path))
+    print(f"学習済みモデルを保存しました: {model_path}")
+    if run:
+        run.log_artifact(model_path, "model")
+    register_output(model_path, run, datasets=[data_path])
+
+def state_path_for(model_path):
+    """
+    オンライン学習の進捗 (学習済みの行数など) を記録するサイドカーファイルのパス。
+    """
+    return f"{os.path.splitext(model_path)[0]}.state.json"
+
+def build_online_pipeline(analyzer_name=DEFAULT_ANALYZER, n_features=HASHING_N_FEATURES):
+    # HashingVectorizer は語彙を持たないため、コーパスが大きくなってもメモリ使用量が増えない
+    # SGDClassifier(log_loss) はロジスティック回帰を partial_fit で逐次学習でき、predict_proba も使える
+    return make_pipeline(
+        HashingVectorizer(n_features=n_features, alternate_sign=False, analyzer=get_analyzer(analyzer_name)),
+        SGDClassifier(loss='log_loss', random_state=42)
+    )
+
+def iter_labeled_chunks(data_path, chunksize, skip_rows=0):
+    """
+    ラベル付きCSVをチャンク単位で読み、欠損を除いた (テキスト, トピック) を順に返す。
+    先頭から skip_rows 行のデータ行 (前回までに学習済みの行) は読み飛ばす。
+    """
+    skiprows = range(1, skip_rows + 1) if skip_rows else None
+    for chunk in pd.read_csv(data_path, usecols=['text', 'topic'], skiprows=skiprows, chunksize=chunksize):
+        chunk = chunk.dropna(subset=['text', 'topic'])
+        if not chunk.empty:
+            yield chunk['text'].astype(str), chunk['topic'].astype(str)
+
+def count_data_rows(data_path, chunksize):
+    return sum(len(chunk) for chunk in pd.read_csv(data_path, usecols=['topic'], chunksize=chunksize))
+
+def collect_topics(data_path, chunksize, skip_rows=0):
+    """
+    partial_fit では最初にすべてのクラスを渡す必要があるため、トピック列を走査してクラスを集める。
+    """
+    topics = set()
+    for _, y in iter_labeled_chunks(data_path, chunksize, skip_rows):
+        topics.update(y.unique())
+    return topics
+
+def train_topic_model_online(data_path=DATA_FILE_PATH, model_path=MODEL_PATH, chunksize=DEFAULT_CHUNKSIZE,
+                             epochs=3, continue_training=True, analyzer_name=DEFAULT_ANALYZER, run=None):
+    """
+    ラベル付きデータをチャンク単位でストリーミングし、HashingVectorizer + SGDClassifier を
+    partial_fit で学習する。continue_training=True で前回のモデルがあれば、前回以降に
+    追加された行だけで学習を続ける。
+    """
+    print("オンライン学習モードでモデルの学習を開始します...")
+    if not os.path.exists(data_path):
+        print(f"エラー: 学習データが見つかりません: {data_path}")
+        return
+
+    state_path = state_path_for(model_path)
+    pipeline, skip_rows = None, 0
+    if continue_training and os.path.exists(model_path) and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("analyzer", DEFAULT_ANALYZER) != analyzer_name:
+            print(f"警告: アナライザが前回 ({state.get('analyzer')}) と異なるため、最初から学習し直します。")
+        elif state.get("mode") != "online":
+            print("警告: 前回のモデルはオンライン学習ではないため、最初から学習し直します。")
+        elif state.get("data_path") != os.path.abspath(data_path):
+            # 学習済みの行数は前回の学習データの行数のため、別のファイルからは続きを学習できない
+            print(f"警告: 学習データが前回 ({state.get('data_path')}) と異なるため、最初から学習し直します。")
+        else:
+            pipeline = joblib.load(model_path)
+            skip_rows = state["rows_seen"]
+            print(f"前回のモデルから学習を続けます: {model_path} (学習済み {skip_rows} 行)")
+
+    total_rows = count_data_rows(data_path, chunksize)
+    if total_rows < skip_rows:
+        print("警告: 学習データが前回より短くなっているため、最初から学習し直します。")
+        pipeline, skip_rows = None, 0
+
+    topics = collect_topics(data_path, chunksize, skip_rows)
+    if not topics:
+        print("新しい学習データはありません。" if pipeline is not None else "エラー: 学習データが空です。")
+        return
+
+    if pipeline is not None:
+        new_topics = topics - set(pipeline.classes_)
+        if new_topics:
+            # SGDClassifier は学習途中でクラスを追加できないため、最初から学習し直す
+            print(f"警告: 新しいトピック {sorted(new_topics)} が追加されたため、最初から学習し直します。")
+            pipeline, skip_rows = None, 0
+            topics = collect_topics(data_path, chunksize)
+    if pipeline is None:
+        pipeline = build_online_pipeline(analyzer_name)
+        classes = np.array(sorted(topics))
+    else:
+        classes = pipeline.classes_
+    vectorizer, classifier = pipeline.steps[0][1], pipeline.steps[-1][1]
+
+    print(f"学習対象: {total_rows - skip_rows} 行, トピック数: {len(classes)}, アナライザ: {vectorizer.analyzer}")
+    for epoch in range(epochs):
+        rows_in_epoch = 0
+        for X, y in iter_labeled_chunks(data_path, chunksize, skip_rows):
+            prefetch(vectorizer.analyzer, X)
+            classifier.partial_fit(vectorizer.transform(X), y, classes=classes)
+            rows_in_epoch += len(y)
+        print(f"エポック {epoch + 1}/{epochs}: {rows_in_epoch} 行を学習しました。")
+        if run:
+            run.log_metric("rows_in_epoch", rows_in_epoch, step=epoch)
+
+    # 3. モデルと学習済みの行数を保存
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    tmp_path = f"{model_path}.tmp"
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, model_path)
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({"mode": "online", "data_path": os.path.abspath(data_path), "rows_seen": total_rows, "analyzer": analyzer_name}, f, ensure_ascii=False)
+    print(f"学習済みモデルを保存しました: {model_path} (累計 {total_rows} 行)")
+    if run:
+        run.log_metrics({"rows_seen": total_rows, "new_rows": total_rows - skip_rows, "num_topics": len(classes)}, step=epochs)
+        run.log_artifact(model_path, "model")
+    register_output(model_path, run, datasets=[data_path])
 
 if __name__ == '__main__':
-    train_topic_model()
+    parser = argparse.ArgumentParser(description='トピック分類モデルの学習スクリプト')
+    parser.add_argument('--mode', type=str, default='batch', choices=['batch', 'online'], help='batch: TF-IDF + ロジスティック回帰を一括学習, online: HashingVectorizer + SGD を逐次学習')
+    parser.add_argument('--data_path', type=str, default=DATA_FILE_PATH, help='ラベル付き学習データ (text, topic 列を持つCSV)')
+    parser.add_argument('--model_path', type=str, default=MODEL_PATH, help='モデルの保存先')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help='オンライン学習で一度に読み込む行数')
+    parser.add_argument('--epochs', type=int, default=3, help='オンライン学習でデータを走査する回数')
+    parser.add_argument('--analyzer', type=str, default=DEFAULT_ANALYZER, choices=sorted(ANALYZERS), help='テキストの分割方法 (regex: 文字種の連続, char_ngram: 日本語を文字2-gram, janome: 形態素解析)')
+    parser.add_argument('--from_scratch', action='store_true', help='前回のモデルを使わずに最初から学習する (オンライン学習)')
+    add_tracking_args(parser)
+    args = parser.parse_args()
+
+    with start_script_run("topic_model_trainer", args) as run:
+        if args.mode == 'online':
+            train_topic_model_online(args.data_path, args.model_path, args.chunksize, args.epochs, not args.from_scratch, args.analyzer, run=run)
+        else:
+            train_topic_model(args.data_path, args.model_path, args.analyzer, run=run)
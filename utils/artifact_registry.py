@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Content-addressed artifact registry (SQLite index, reflink dedup, run manifests, evaluations)
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows ではリフリンクなし (コピー)
+    fcntl = None
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 保存先は環境変数 YGGDRASIL_ARTIFACT_DIR で変更できる
+ARTIFACT_DIR_ENV = "YGGDRASIL_ARTIFACT_DIR"
+DEFAULT_ARTIFACT_DIR = os.path.join(PROJECT_ROOT, "data", "artifacts")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+# Linux の FICLONE ioctl (btrfs, XFS などでファイルの中身を共有するコピーオンライトの複製)
+FICLONE = 0x40049409
+# dedup コマンドが既定で対象にするファイルの拡張子
+MODEL_SUFFIXES = (".keras", ".h5", ".joblib", ".pkl")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    suffix TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS manifests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL REFERENCES objects (digest),
+    kind TEXT NOT NULL,
+    path TEXT,
+    script TEXT,
+    run_name TEXT,
+    run_id TEXT,
+    config TEXT,
+    datasets TEXT,
+    dataset_digest TEXT,
+    metrics TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS manifests_by_digest ON manifests (digest, id);
+CREATE INDEX IF NOT EXISTS manifests_by_path ON manifests (path, id);
+CREATE INDEX IF NOT EXISTS manifests_by_script ON manifests (script, id);
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL REFERENCES objects (digest),
+    evaluator TEXT NOT NULL,
+    dataset TEXT,
+    dataset_digest TEXT,
+    metrics TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS evaluations_by_digest ON evaluations (digest, id);
+CREATE TABLE IF NOT EXISTS file_digests (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+def default_artifact_dir():
+    return os.environ.get(ARTIFACT_DIR_ENV) or DEFAULT_ARTIFACT_DIR
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _reflink(src, dst):
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+
+def clone_file(src, dst, allow_copy=True):
+    """
+    src と同じ内容の独立したファイル dst を作り、使った方法 ("reflink", "copy") を返す。
+    ディスクを消費しないリフリンクを優先し、使えなければコピーする (allow_copy=False の場合は何もせず None)。
+    ハードリンクは片方の上書きがもう片方に及ぶため使わない。
+    """
+    if fcntl is not None:
+        try:
+            _reflink(src, dst)
+            return "reflink"
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+    if not allow_copy:
+        return None
+    shutil.copy2(src, dst)
+    return "copy"
+
+def release_path(path):
+    """
+    保存先のファイルが他のファイルとハードリンクで共有されていれば切り離す (以前のバージョンで共有されたファイル向け)。
+    model.save などはファイルをその場で上書きするため、保存の前に呼び出して他のファイルが書き換わるのを防ぐ。
+    """
+    try:
+        if os.path.isfile(path) and os.stat(path).st_nlink > 1:
+            os.remove(path)
+    except OSError:
+        pass
+
+def _loads(value):
+    return json.loads(value) if value else None
+
+def _row_to_manifest(row):
+    if row is None:
+        return None
+    manifest = dict(row)
+    for key in ("config", "datasets", "metrics"):
+        manifest[key] = _loads(manifest[key])
+    return manifest
+
+def _row_to_evaluation(row):
+    evaluation = dict(row)
+    evaluation["metrics"] = _loads(evaluation["metrics"])
+    return evaluation
+
+class ArtifactRegistry:
+    """
+    モデルなどのファイルを内容のハッシュ (sha256) で1つだけ保存し、どのスクリプト・設定・データから作られ、
+    どのような指標だったか (マニフェスト) と評価結果を SQLite に記録する。
+    保存先 (objects/) には読み取り専用の独立した複製 (リフリンクまたはコピー) を置き、
+    同じ内容のファイルはリフリンクが使える場合だけ保存先とディスクを共有する。
+    """
+
+    def __init__(self, root=None):
+        self.root = os.path.abspath(root or default_artifact_dir())
+        self.objects_dir = os.path.join(self.root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        # トランザクションは _transaction で明示的に開始する
+        self.connection = sqlite3.connect(os.path.join(self.root, "registry.sqlite"), timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def object_path(self, digest, suffix=None):
+        if suffix is None:
+            row = self.connection.execute("SELECT suffix FROM objects WHERE digest = ?", (digest,)).fetchone()
+            suffix = row["suffix"] if row else ""
+        # Keras は拡張子でモデルの形式を判定するため、元のファイルの拡張子を残す
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}{suffix}")
+
+    def file_digest(self, path):
+        """
+        ファイルの sha256 を返す。サイズ・更新時刻・inode が前回と同じであればハッシュを計算し直さない。
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT * FROM file_digests WHERE path = ?", (path,)).fetchone()
+        if row and (row["size"], row["mtime_ns"], row["inode"]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return row["digest"]
+        digest = sha256_file(path)
+        self.connection.execute("INSERT OR REPLACE INTO file_digests (path, size, mtime_ns, inode, digest) VALUES (?, ?, ?, ?, ?)",
+                                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest))
+        return digest
+
+    def dataset_digests(self, datasets):
+        """
+        データセットのパス (ファイルまたはディレクトリ) ごとのハッシュと、それらをまとめた1つのハッシュを返す。
+        存在しないパス (例: "keras.datasets.mnist") は名前だけを記録する。
+        """
+        digests = {}
+        for dataset in datasets:
+            if not dataset:
+                continue
+            if os.path.isfile(dataset):
+                digests[os.path.abspath(dataset)] = self.file_digest(dataset)
+            elif os.path.isdir(dataset):
+                combined = hashlib.sha256()
+                for directory, _, files in sorted(os.walk(dataset)):
+                    for name in sorted(files):
+                        path = os.path.join(directory, name)
+                        combined.update(f"{os.path.relpath(path, dataset)}\0{self.file_digest(path)}\n".encode("utf-8"))
+                digests[os.path.abspath(dataset)] = combined.hexdigest()
+            else:
+                digests[str(dataset)] = None
+        if not digests:
+            return {}, None
+        return digests, hashlib.sha256(json.dumps(digests, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _store(self, path, digest):
+        """
+        内容が digest のファイルを objects/ に保存し、(保存先, 既に同じ内容があったか, 方法) を返す。
+        """
+        suffix = os.path.splitext(path)[1]
+        row = self.connection.execute("SELECT suffix FROM objects WHERE digest = ?", (digest,)).fetchone()
+        if row and os.path.exists(self.object_path(digest, row["suffix"])):
+            return self.object_path(digest, row["suffix"]), True, None
+        object_path = self.object_path(digest, suffix)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        tmp_path = f"{object_path}.{os.getpid()}.tmp"
+        method = clone_file(path, tmp_path)
+        if sha256_file(tmp_path) != digest:
+            os.remove(tmp_path)
+            raise OSError(f"保存中にファイルが変更されました: {path}")
+        # 成果物は登録したファイルとは独立しているため、読み取り専用にしてその場での上書きによる破損を防ぐ
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, object_path)
+        self.connection.execute("INSERT OR REPLACE INTO objects (digest, size, suffix, created_at) VALUES (?, ?, ?, ?)",
+                                (digest, os.path.getsize(object_path), suffix, time.time()))
+        return object_path, False, method
+
+    def _share(self, path, object_path):
+        """
+        path を保存済みの成果物のリフリンク (コピーオンライトの複製) に原子的に置き換え、方法を返す。
+        リフリンクが使えなければディスクを節約できないため、元のファイルを残して None を返す。
+        """
+        if os.path.samefile(path, object_path):
+            return None
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        if clone_file(object_path, tmp_path, allow_copy=False) is None:
+            return None
+        # 利用者のファイルは元の権限のまま書き込めるようにする
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+        return "reflink"
+
+    def register(self, path, kind="model", script=None, run_name=None, run_id=None, config=None, datasets=(), metrics=None, share=True):
+        """
+        ファイルを登録してマニフェストを記録し、マニフェストの辞書を返す。
+        同じ内容が登録済みで share=True の場合、リフリンクが使えれば path を既存の成果物のリフリンクに置き換える。
+        返り値の "deduplicated" は既存の成果物と同じ内容だったか、"method" はディスクの共有方法。
+        """
+        path = os.path.abspath(path)
+        dataset_digests, dataset_digest = self.dataset_digests(datasets)
+        # ハッシュの計算は書き込みロックの外で行う
+        digest = self.file_digest(path)
+        with self._transaction():
+            object_path, deduplicated, method = self._store(path, digest)
+            if deduplicated and share:
+                method = self._share(path, object_path)
+            cursor = self.connection.execute(
+                "INSERT INTO manifests (digest, kind, path, script, run_name, run_id, config, datasets, dataset_digest, metrics, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, kind, path, script, run_name, run_id, json.dumps(config, ensure_ascii=False, default=str) if config is not None else None,
+                 json.dumps(dataset_digests, ensure_ascii=False) if dataset_digests else None, dataset_digest,
+                 json.dumps(metrics, ensure_ascii=False) if metrics is not None else None, time.time())
+            )
+            # 置き換えたファイルの inode が変わったため、ハッシュのキャッシュを更新する
+            if method:
+                self.file_digest(path)
+        manifest = self.get_manifest(cursor.lastrowid)
+        manifest.update({"object_path": object_path, "deduplicated": deduplicated, "method": method})
+        return manifest
+
+    def get_manifest(self, manifest_id):
+        return _row_to_manifest(self.connection.execute("SELECT * FROM manifests WHERE id = ?", (manifest_id,)).fetchone())
+
+    def resolve(self, key):
+        """
+        ハッシュ (先頭の一部でもよい) または登録済みのファイルのパスからハッシュを返す。見つからなければ None。
+        """
+        if os.path.isfile(key):
+            digest = self.file_digest(key)
+            return digest if self.connection.execute("SELECT 1 FROM objects WHERE digest = ?", (digest,)).fetchone() else None
+        rows = self.connection.execute("SELECT digest FROM objects WHERE digest LIKE ? LIMIT 2", (f"{key}%",)).fetchall()
+        return rows[0]["digest"] if len(rows) == 1 else None
+
+    def lookup(self, key):
+        """
+        成果物の情報 (ハッシュ, サイズ, 保存先, マニフェストの一覧, 評価結果の一覧) を返す。登録されていなければ None。
+        """
+        digest = self.resolve(key)
+        if digest is None:
+            return None
+        row = self.connection.execute("SELECT * FROM objects WHERE digest = ?", (digest,)).fetchone()
+        return {
+            "digest": digest,
+            "size": row["size"],
+            "object_path": self.object_path(digest, row["suffix"]),
+            "manifests": [_row_to_manifest(r) for r in self.connection.execute("SELECT * FROM manifests WHERE digest = ? ORDER BY id", (digest,))],
+            "evaluations": [_row_to_evaluation(r) for r in self.connection.execute("SELECT * FROM evaluations WHERE digest = ? ORDER BY id", (digest,))]
+        }
+
+    def producer(self, key):
+        """
+        成果物を作成したスクリプトの最初のマニフェスト (なければ最初のマニフェスト) を返す。
+        """
+        digest = self.resolve(key)
+        if digest is None:
+            return None
+        row = self.connection.execute("SELECT * FROM manifests WHERE digest = ? ORDER BY script IS NULL, id LIMIT 1", (digest,)).fetchone()
+        return _row_to_manifest(row)
+
+    def record_evaluation(self, key, evaluator, metrics, dataset=None):
+        """
+        登録済みの成果物の評価結果を記録する。登録されていなければ False を返す。
+        """
+        digest = self.resolve(key)
+        if digest is None:
+            return False
+        _, dataset_digest = self.dataset_digests([dataset] if dataset else [])
+        with self._transaction():
+            self.connection.execute("INSERT INTO evaluations (digest, evaluator, dataset, dataset_digest, metrics, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                                    (digest, evaluator, dataset, dataset_digest, json.dumps(metrics, ensure_ascii=False), time.time()))
+        return True
+
+    def list_artifacts(self, kind=None, script=None, limit=None):
+        """
+        成果物ごとに最新のマニフェストと登録数を新しい順に返す。
+        """
+        query = ("SELECT m.*, o.size, COUNT(*) OVER (PARTITION BY m.digest) AS registrations,"
+                 " ROW_NUMBER() OVER (PARTITION BY m.digest ORDER BY m.id DESC) AS position"
+                 " FROM manifests m JOIN objects o ON o.digest = m.digest")
+        conditions, params = [], []
+        if kind:
+            conditions.append("m.kind = ?")
+            params.append(kind)
+        if script:
+            conditions.append("m.script = ?")
+            params.append(script)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query = f"SELECT * FROM ({query}) WHERE position = 1 ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [_row_to_manifest(row) for row in self.connection.execute(query, params)]
+
+    def best(self, metric, source="evaluations", lower_is_better=False):
+        """
+        指標 metric が最も良い成果物の (ハッシュ, 値) を返す。source は "evaluations" (評価結果) または
+        "manifests" (学習時の指標)。該当がなければ None。
+        """
+        table = "evaluations" if source == "evaluations" else "manifests"
+        order = "ASC" if lower_is_better else "DESC"
+        row = self.connection.execute(
+            f"SELECT digest, CAST(json_extract(metrics, '$.\"' || ? || '\"') AS REAL) AS value FROM {table}"
+            f" WHERE value IS NOT NULL ORDER BY value {order}, id DESC LIMIT 1", (metric,)
+        ).fetchone()
+        return (row["digest"], row["value"]) if row else None
+
+    def current_path(self, digest):
+        """
+        成果物と同じ内容のまま残っている登録時のパス (最新のもの) を返す。なければ保存先のパス。
+        """
+        for row in self.connection.execute("SELECT path FROM manifests WHERE digest = ? GROUP BY path ORDER BY MAX(id) DESC", (digest,)).fetchall():
+            if row["path"] and os.path.isfile(row["path"]) and self.file_digest(row["path"]) == digest:
+                return row["path"]
+        return self.object_path(digest)
+
+    def stats(self):
+        """
+        成果物の数、実際に使っているバイト数、登録されたファイルの合計バイト数 (重複を含む) を返す。
+        """
+        objects = self.connection.execute("SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS size FROM objects").fetchone()
+        files = self.connection.execute(
+            "SELECT COUNT(*) AS count, COALESCE(SUM(o.size), 0) AS size FROM (SELECT DISTINCT digest, path FROM manifests) m"
+            " JOIN objects o ON o.digest = m.digest").fetchone()
+        return {"objects": objects["count"], "stored_bytes": objects["size"], "files": files["count"], "file_bytes": files["size"]}
+
+    def verify(self):
+        """
+        保存されている成果物のハッシュを計算し直し、内容が壊れているか失われた成果物のハッシュのリストを返す。
+        """
+        broken = []
+        for row in self.connection.execute("SELECT digest, suffix FROM objects").fetchall():
+            path = self.object_path(row["digest"], row["suffix"])
+            if not os.path.isfile(path) or sha256_file(path) != row["digest"]:
+                broken.append(row["digest"])
+        return broken
+
+def register_output(path, run=None, datasets=(), kind="model", registry_dir=None, script=None):
+    """
+    学習スクリプトが保存したファイルを、実験管理の Run のパラメータと指標をマニフェストとして登録する。
+    script を省略した場合は実行中のスクリプト名を記録する。登録に失敗しても学習は失敗させず、警告だけを表示する。
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    try:
+        with ArtifactRegistry(registry_dir) as registry:
+            manifest = registry.register(
+                path, kind=kind, script=script or os.path.basename(sys.argv[0] or "") or None,
+                run_name=getattr(run, "run_name", None), run_id=getattr(run, "run_id", None),
+                config=dict(getattr(run, "params", {}) or {}) or None, datasets=datasets,
+                metrics=dict(getattr(run, "metrics", {}) or {}) or None
+            )
+    except (OSError, sqlite3.Error) as e:
+        print(f"警告: 成果物を登録できませんでした: {path}: {e}", file=sys.stderr)
+        return None
+    state = f"既存の成果物と共有 ({manifest['method']})" if manifest["deduplicated"] and manifest["method"] else ("既存の成果物と同じ内容" if manifest["deduplicated"] else "新規")
+    print(f"--- 成果物を登録しました: {manifest['digest'][:12]} ({state}) ---")
+    return manifest
+
+def _format_size(size):
+    return f"{size / (1024 * 1024):.1f}MB"
+
+def _iter_files(paths, suffixes, exclude_dir):
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirs, files in os.walk(path):
+                # レジストリ自身の保存先は対象にしない
+                subdirs[:] = [d for d in subdirs if os.path.abspath(os.path.join(directory, d)) != exclude_dir]
+                for name in sorted(files):
+                    if name.endswith(suffixes):
+                        yield os.path.join(directory, name)
+        elif os.path.isfile(path):
+            yield path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="成果物レジストリ (内容のハッシュによる保存と重複排除)")
+    parser.add_argument("--root", default=None, help=f"レジストリの場所 (省略時は環境変数 {ARTIFACT_DIR_ENV} または data/artifacts)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    list_parser = commands.add_parser("list", help="登録済みの成果物を新しい順に表示する")
+    list_parser.add_argument("--kind", help="種類で絞り込む (model, file など)")
+    list_parser.add_argument("--script", help="作成したスクリプトで絞り込む")
+    list_parser.add_argument("--limit", type=int, default=20)
+    show_parser = commands.add_parser("show", help="成果物のマニフェストと評価結果をJSONで表示する")
+    show_parser.add_argument("key", help="ハッシュ (先頭の一部でもよい) またはファイルのパス")
+    dedup_parser = commands.add_parser("dedup", help="ファイル (ディレクトリは再帰的に) を登録し、同じ内容のファイルのディスクを共有する")
+    dedup_parser.add_argument("paths", nargs="+")
+    dedup_parser.add_argument("--suffix", action="append", default=None, help=f"ディレクトリ内の対象の拡張子 (既定: {', '.join(MODEL_SUFFIXES)})")
+    commands.add_parser("verify", help="保存されている成果物のハッシュを検証する")
+    args = parser.parse_args(argv)
+
+    with ArtifactRegistry(args.root) as registry:
+        if args.command == "list":
+            for manifest in registry.list_artifacts(args.kind, args.script, args.limit):
+                metrics = ", ".join(f"{key}={value:.4f}" if isinstance(value, float) else f"{key}={value}" for key, value in (manifest["metrics"] or {}).items())
+                print(f"{manifest['digest'][:12]}  {_format_size(manifest['size']):>8}  {manifest['kind']:<6} {manifest['script'] or '-':<24} "
+                      f"x{manifest['registrations']}  {manifest['path']}" + (f"  [{metrics}]" if metrics else ""))
+            stats = registry.stats()
+            print(f"成果物 {stats['objects']} 個 ({_format_size(stats['stored_bytes'])}) / 登録されたファイル {stats['files']} 個 ({_format_size(stats['file_bytes'])})")
+        elif args.command == "show":
+            artifact = registry.lookup(args.key)
+            if artifact is None:
+                print(f"エラー: 成果物が見つかりません: {args.key}", file=sys.stderr)
+                return 1
+            print(json.dumps(artifact, ensure_ascii=False, indent=2))
+        elif args.command == "dedup":
+            saved = 0
+            for path in _iter_files(args.paths, tuple(args.suffix or MODEL_SUFFIXES), registry.root):
+                try:
+                    manifest = registry.register(path, kind="file")
+                except OSError as e:
+                    print(f"警告: {path}: {e}", file=sys.stderr)
+                    continue
+                if manifest["deduplicated"] and manifest["method"]:
+                    saved += os.path.getsize(path)
+                    print(f"{manifest['digest'][:12]}  {path} (既存の成果物と共有: {manifest['method']})")
+                else:
+                    print(f"{manifest['digest'][:12]}  {path}")
+            print(f"--- 重複の共有により {_format_size(saved)} を節約しました ---")
+        elif args.command == "verify":
+            broken = registry.verify()
+            for digest in broken:
+                print(f"破損または欠落: {digest}", file=sys.stderr)
+            print(f"--- {registry.stats()['objects']} 個の成果物を検証しました ({len(broken)} 個の問題) ---")
+            return 1 if broken else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,57 +2,166 @@
 
 import os
 import glob
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 # プロジェクトのルートディレクトリを基準にパスを設定
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CHAT_LOGS_DIR = os.path.join(PROJECT_ROOT, '..', 'my_gemini_project', 'chat_logs') # my_gemini_projectはyggdrasilの親ディレクトリにあると仮定
 OUTPUT_FILE_PATH = os.path.join(PROJECT_ROOT, 'data', 'user_utterances.txt')
+# ログファイルごとの解析済みの位置と更新時刻を記録するマニフェスト
+MANIFEST_PATH = os.path.join(PROJECT_ROOT, 'data', 'chat_log_manifest.json')
 
-def parse_chat_logs():
+USER_PREFIX = 'あなた:'
+# 解析が必要なファイルがこの数以上ある場合にだけ複数プロセスで解析する
+PARALLEL_THRESHOLD = 16
+# 最後の更新からこの秒数が経ったファイルは書き込みが終わったとみなし、改行で終わらない最終行も解析する
+TAIL_STABLE_SECONDS = 60
+
+def file_checksum_before(file_path, offset, window=4096):
+    """offset の直前のバイト列のハッシュ (ファイルが書き換えられたことの検出に使う)"""
+    with open(file_path, 'rb') as f:
+        f.seek(max(0, offset - window))
+        return hashlib.sha1(f.read(min(offset, window))).hexdigest()
+
+def extract_utterances(log_file, offset=0, include_partial=False):
+    """
+    ログファイルの offset バイト目以降からユーザーの発言を抽出し、(発言のリスト, 解析済みの位置) を返す。
+    改行で終わらない最終行は書き込み途中の可能性があるため、include_partial=True の場合を除いて次回の解析に回す。
+    """
+    utterances = []
+    with open(log_file, 'rb') as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b'\n') and not include_partial:
+                break
+            offset += len(raw)
+            line = raw.decode('utf-8')
+            if line.startswith(USER_PREFIX):
+                # 'あなた:' プレフィックスを削除し、前後の空白を削除
+                utterance = line[len(USER_PREFIX):].strip()
+                if utterance: # 空行は追加しない
+                    utterances.append(utterance)
+    return utterances, offset
+
+def _parse_file(job):
+    log_file, offset, mtime, size, include_partial = job
+    try:
+        utterances, offset = extract_utterances(log_file, offset, include_partial)
+        entry = {"offset": offset, "mtime": mtime, "size": size, "checksum": file_checksum_before(log_file, offset)}
+        return log_file, utterances, entry, None
+    except Exception as e:
+        return log_file, [], None, str(e)
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {"files": {}, "output_size": 0}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def plan_jobs(log_files, manifest, include_partial=False):
+    """
+    前回から変更のあったファイルだけを、解析を再開する位置とともに返す。
+    追記ではなく書き換えられたファイル (小さくなったか、解析済みの部分の末尾が変わったもの) があれば
+    None を返す (全体の再解析が必要)。改行で終わらない最終行は、include_partial=True の場合か、
+    ファイルの更新が TAIL_STABLE_SECONDS 秒以上止まっている場合に解析する。
+    """
+    jobs = []
+    now = time.time()
+    for log_file in log_files:
+        stat = os.stat(log_file)
+        entry = manifest["files"].get(log_file)
+        tail = include_partial or now - stat.st_mtime >= TAIL_STABLE_SECONDS
+        if entry is None:
+            jobs.append((log_file, 0, stat.st_mtime, stat.st_size, tail))
+        elif stat.st_size < entry["offset"] or file_checksum_before(log_file, entry["offset"]) != entry.get("checksum"):
+            return None
+        elif stat.st_size != entry["size"] or stat.st_mtime != entry["mtime"] or (tail and entry["offset"] < stat.st_size):
+            jobs.append((log_file, entry["offset"], stat.st_mtime, stat.st_size, tail))
+    return jobs
+
+def parse_chat_logs(incremental=True, num_workers=None):
     """
     チャットログからユーザーの発言を抽出し、一つのファイルにまとめる。
+    incremental=True の場合は、前回以降に追記された部分だけを解析して出力ファイルに追記する。
+    incremental=False の場合は、改行で終わらない最終行も含めてすべてのログを解析し直す。
     """
     print("チャットログの解析を開始します...")
 
     # 出力ディレクトリが存在しない場合は作成
     os.makedirs(os.path.dirname(OUTPUT_FILE_PATH), exist_ok=True)
 
-    extracted_utterances = []
-    log_files = glob.glob(os.path.join(CHAT_LOGS_DIR, 'gemini_chat_*.txt'))
+    log_files = sorted(glob.glob(os.path.join(CHAT_LOGS_DIR, 'gemini_chat_*.txt')))
 
     if not log_files:
         print(f"警告: チャットログファイルが見つかりません: {CHAT_LOGS_DIR}/gemini_chat_*.txt")
         print("ユーザーの発言抽出をスキップします。")
         return
 
-    for log_file in log_files:
-        try:
-            with open(log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.startswith('あなた:'):
-                        # 'あなた:' プレフィックスを削除し、前後の空白を削除
-                        utterance = line[len('あなた:'):].strip()
-                        if utterance: # 空行は追加しない
-                            extracted_utterances.append(utterance)
-        except Exception as e:
-            print(f"エラー: ファイル {log_file} の読み込み中にエラーが発生しました: {e}")
-            continue
-
-    if not extracted_utterances:
-        print("警告: ログファイルからユーザーの発言が見つかりませんでした。")
+    manifest = load_manifest() if incremental else {"files": {}, "output_size": 0}
+    output_size = os.path.getsize(OUTPUT_FILE_PATH) if os.path.exists(OUTPUT_FILE_PATH) else 0
+    jobs = plan_jobs(log_files, manifest) if manifest["files"] else None
+    if manifest["files"] and (jobs is None or output_size < manifest["output_size"]):
+        print("警告: ログファイルまたは出力ファイルが書き換えられたため、すべてのログを再解析します。")
+        manifest = {"files": {}, "output_size": 0}
+        jobs = None
+    if jobs is None:
+        jobs = plan_jobs(log_files, manifest, include_partial=not incremental)
+
+    if not jobs:
+        print("新しい発言はありません。")
+        print("チャットログの解析が完了しました。")
         return
 
-    # 抽出した発言をファイルに書き出す
+    # 前回の実行が出力の途中で中断していた場合は、マニフェストに記録した位置まで戻す
+    mode = 'r+b' if manifest["files"] and os.path.exists(OUTPUT_FILE_PATH) else 'wb'
+    num_workers = num_workers or os.cpu_count() or 1
+    extracted_count = 0
     try:
-        with open(OUTPUT_FILE_PATH, 'w', encoding='utf-8') as f:
-            for utterance in extracted_utterances:
-                f.write(utterance + '\n')
-        print(f"ユーザーの発言を {OUTPUT_FILE_PATH} に抽出しました。")
+        with open(OUTPUT_FILE_PATH, mode) as out:
+            out.truncate(manifest["output_size"])
+            out.seek(manifest["output_size"])
+            if num_workers > 1 and len(jobs) >= PARALLEL_THRESHOLD:
+                executor = ProcessPoolExecutor(max_workers=num_workers)
+                results = executor.map(_parse_file, jobs, chunksize=max(1, len(jobs) // (num_workers * 8)))
+            else:
+                executor = None
+                results = map(_parse_file, jobs)
+            try:
+                # ファイル順に結果を受け取り、抽出した発言をそのまま出力ファイルに追記する
+                for log_file, utterances, entry, error in results:
+                    if error:
+                        print(f"エラー: ファイル {log_file} の読み込み中にエラーが発生しました: {error}")
+                        continue
+                    if utterances:
+                        out.write(''.join(utterance + '\n' for utterance in utterances).encode('utf-8'))
+                        extracted_count += len(utterances)
+                    manifest["files"][log_file] = entry
+            finally:
+                if executor:
+                    executor.shutdown()
+            out.flush()
+            os.fsync(out.fileno())
+            manifest["output_size"] = out.tell()
+        save_manifest(manifest)
+        print(f"ユーザーの発言 {extracted_count} 件を {OUTPUT_FILE_PATH} に抽出しました ({len(jobs)} ファイルを解析)。")
     except Exception as e:
         print(f"エラー: 発言の書き出し中にエラーが発生しました: {e}")
 
     print("チャットログの解析が完了しました。")
 
 if __name__ == '__main__':
-    parse_chat_logs()
-
+    parser = argparse.ArgumentParser(description='チャットログからユーザーの発言を抽出します。')
+    parser.add_argument('--full', action='store_true', help='マニフェストを無視してすべてのログを再解析する')
+    parser.add_argument('--workers', type=int, default=None, help='解析に使うプロセス数 (デフォルトはCPU数)')
+    args = parser.parse_args()
+    parse_chat_logs(incremental=not args.full, num_workers=args.workers)
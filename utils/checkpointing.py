@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Periodic, asynchronous training checkpoints with automatic resume
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tensorflow as tf
+
+# 最新のチェックポイントを指すポインタファイル
+LATEST_POINTER_FILE = "latest.json"
+# このクラスが書き込むファイル (チェックポイント本体・ポインタと、それぞれの書き込み途中の一時ファイル)
+CHECKPOINT_FILE_PATTERN = re.compile(r"ckpt-\d+\.npz(\.tmp\.npz)?|" + re.escape(LATEST_POINTER_FILE) + r"(\.tmp)?")
+
+def _variables_of(trackable):
+    """
+    チェックポイント対象オブジェクトの変数を、毎回同じ順序で返す。
+    """
+    if isinstance(trackable, tf.random.Generator):
+        return [trackable.state]
+    if hasattr(trackable, "weights"): # Kerasモデル (BatchNormの移動平均など学習対象外の重みも含む)
+        return list(trackable.weights)
+    return list(trackable.variables) # オプティマイザなど
+
+class TrainingCheckpointer:
+    """
+    モデルの重み・オプティマイザの状態・進捗 (エポック数やエピソード数) をまとめて保存/復元する。
+    任意のJSON化可能な追加状態 (報酬履歴や乱数状態など) も同じチェックポイントに含める。
+
+    保存時は変数の値をメインスレッドでスナップショットし、ファイルへの書き込みはバックグラウンドの
+    スレッドで行うため、学習ループを止めない。
+    """
+
+    def __init__(self, checkpoint_dir, max_to_keep=3, async_write=True, **trackables):
+        self.checkpoint_dir = checkpoint_dir
+        self.max_to_keep = max_to_keep
+        self.trackables = trackables
+        self.extra_state = {}
+        self._executor = ThreadPoolExecutor(max_workers=1) if async_write else None
+        self._pending = []
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _snapshot(self):
+        arrays = {}
+        for name, trackable in self.trackables.items():
+            for i, variable in enumerate(_variables_of(trackable)):
+                arrays[f"{name}/{i}"] = np.array(variable.numpy(), copy=True)
+        return arrays
+
+    def _write(self, step, arrays, extra_state):
+        path = os.path.join(self.checkpoint_dir, f"ckpt-{step}.npz")
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+        # ポインタはチェックポイント本体の書き込み完了後に原子的に更新する
+        pointer = {"step": step, "path": os.path.basename(path), "extra_state": extra_state}
+        pointer_path = os.path.join(self.checkpoint_dir, LATEST_POINTER_FILE)
+        with open(f"{pointer_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(pointer, f)
+        os.replace(f"{pointer_path}.tmp", pointer_path)
+
+        # 古いチェックポイントを削除
+        checkpoints = sorted(
+            (f for f in os.listdir(self.checkpoint_dir) if f.startswith("ckpt-") and f.endswith(".npz") and not f.endswith(".tmp.npz")),
+            key=lambda f: int(f[len("ckpt-"):-len(".npz")])
+        )
+        for old in checkpoints[:-self.max_to_keep]:
+            os.remove(os.path.join(self.checkpoint_dir, old))
+        return path
+
+    def restore(self):
+        """
+        最新のチェックポイントがあれば復元し、保存時の進捗 (step) を返す。なければ 0 を返す。
+        """
+        pointer_path = os.path.join(self.checkpoint_dir, LATEST_POINTER_FILE)
+        if not os.path.exists(pointer_path):
+            return 0
+        with open(pointer_path, "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+        checkpoint_path = os.path.join(self.checkpoint_dir, pointer["path"])
+
+        with np.load(checkpoint_path) as arrays:
+            for name, trackable in self.trackables.items():
+                variables = _variables_of(trackable)
+                saved_count = sum(1 for key in arrays.files if key.startswith(f"{name}/"))
+                if saved_count != len(variables):
+                    raise ValueError(f"チェックポイントの構造が一致しません ({name}: 保存 {saved_count} 個, 現在 {len(variables)} 個): {checkpoint_path}")
+                for i, variable in enumerate(variables):
+                    variable.assign(arrays[f"{name}/{i}"])
+
+        self.extra_state = pointer.get("extra_state", {})
+        print(f"--- チェックポイントから再開します: {checkpoint_path} (step: {pointer['step']}) ---")
+        return int(pointer["step"])
+
+    def save(self, step, extra_state=None):
+        if extra_state is not None:
+            self.extra_state = extra_state
+        arrays = self._snapshot()
+        extra_state = json.loads(json.dumps(self.extra_state)) # 書き込み中に呼び出し元が変更しても影響しないようコピー
+        if self._executor is None:
+            return self._write(step, arrays, extra_state)
+        # 完了済みの書き込みの例外をここで表面化させる
+        for future in [f for f in self._pending if f.done()]:
+            future.result()
+            self._pending.remove(future)
+        self._pending.append(self._executor.submit(self._write, step, arrays, extra_state))
+
+    def wait(self):
+        """
+        非同期書き込みの完了を待つ。
+        """
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+    def clear(self):
+        """
+        学習が正常に完了した後にチェックポイントを削除する (再実行時に完了済みの状態から再開しないように)。
+        削除するのはこのクラスが書き込んだファイルだけで、ディレクトリは空になった場合だけ削除する。
+        """
+        self.wait()
+        if not os.path.isdir(self.checkpoint_dir):
+            return
+        for name in os.listdir(self.checkpoint_dir):
+            if CHECKPOINT_FILE_PATTERN.fullmatch(name):
+                os.remove(os.path.join(self.checkpoint_dir, name))
+        if not os.listdir(self.checkpoint_dir):
+            os.rmdir(self.checkpoint_dir)
+
+class CheckpointCallback(tf.keras.callbacks.Callback):
+    """
+    every_n_epochs エポックごとにチェックポイントを保存する Keras コールバック。
+    """
+
+    def __init__(self, checkpointer, every_n_epochs=1):
+        super().__init__()
+        self.checkpointer = checkpointer
+        self.every_n_epochs = max(1, int(every_n_epochs))
+
+    def on_epoch_end(self, epoch, logs=None):
+        if (epoch + 1) % self.every_n_epochs == 0:
+            self.checkpointer.save(epoch + 1)
+
+    def on_train_end(self, logs=None):
+        self.checkpointer.wait()
+
+def create_keras_checkpointer(checkpoint_dir, model, optimizer):
+    """
+    Kerasモデル用のチェックポインタを作成し、(checkpointer, 再開するエポック) を返す。
+    復元前にオプティマイザの変数を作成しておく必要がある。
+    """
+    if not checkpoint_dir:
+        return None, 0
+    optimizer.build(model.trainable_variables)
+    checkpointer = TrainingCheckpointer(checkpoint_dir, model=model, optimizer=optimizer)
+    return checkpointer, checkpointer.restore()
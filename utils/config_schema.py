@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Typed agent config schemas: --set/--agent-set value parsing, validation at dispatch and hashable frozen configs
+
+import difflib
+import json
+import re
+import sys
+from functools import lru_cache
+
+# yggdrasil.py は utils.config_schema として、エージェントは utils を sys.path に追加して config_schema として
+# インポートするため、両方の名前で同じモジュール (同じ ConfigSchema クラス) を参照させる
+sys.modules.setdefault("config_schema", sys.modules[__name__])
+sys.modules.setdefault("utils.config_schema", sys.modules[__name__])
+
+_INT_PATTERN = re.compile(r"[+-]?\d+")
+_FLOAT_PATTERN = re.compile(r"[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?")
+# 型が文字列でない nullable な項目で None として扱う文字列
+_NULL_STRINGS = ("none", "null")
+# bool の項目で受け付ける文字列 (training_acceleration.str2bool と同じ)
+_TRUE_STRINGS = ("1", "true", "yes", "on")
+_FALSE_STRINGS = ("0", "false", "no", "off")
+
+class ConfigError(ValueError):
+    """
+    設定がスキーマに合わない場合の例外。メッセージには問題のある項目をすべて含む。
+    """
+
+@lru_cache(maxsize=4096)
+def _parse_scalar(text):
+    lowered = text.lower()
+    if lowered == "true":
+        return True
+    if lowered == "false":
+        return False
+    if _INT_PATTERN.fullmatch(text):
+        return int(text)
+    if _FLOAT_PATTERN.fullmatch(text):
+        return float(text)
+    return text
+
+def _split_items(text):
+    # "[a, [b, c], d]" の内側を、括弧の中のカンマでは区切らずに要素に分ける
+    items, depth, current = [], 0, []
+    for char in text:
+        if char == "," and depth == 0:
+            items.append("".join(current))
+            current = []
+            continue
+        depth += {"[": 1, "]": -1}.get(char, 0)
+        current.append(char)
+    items.append("".join(current))
+    return [item.strip() for item in items]
+
+def parse_value(text):
+    """
+    --set/--agent-set の値の文字列を型付きの値に変換する。
+    true/false は bool、整数 (負数を含む) は int、小数・指数表記 (例: -0.5, 1e-5) は float、
+    "[...]" はリスト (JSON または "[a, b]" の簡易形式)、それ以外は文字列のまま返す。
+    """
+    stripped = text.strip()
+    if stripped.startswith("[") and stripped.endswith("]"):
+        try:
+            return json.loads(stripped)
+        except json.JSONDecodeError:
+            inner = stripped[1:-1].strip()
+            return [parse_value(item) for item in _split_items(inner)] if inner else []
+    return _parse_scalar(text)
+
+def freeze(value):
+    """
+    辞書を FrozenConfig に、リストをタプルに再帰的に変換する (ハッシュ可能な値にする)。
+    """
+    if isinstance(value, dict):
+        return value if isinstance(value, FrozenConfig) else FrozenConfig(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+class FrozenConfig(dict):
+    """
+    検証済みの変更できない設定。dict と同じように読み取れ、ハッシュ可能なのでキャッシュのキーに使える。
+    値を変えた設定が必要な場合は dict(config) や merge_configs で新しい辞書を作る。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__((key, freeze(value)) for key, value in dict(*args, **kwargs).items())
+        self._hash = None
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("検証済みの設定は変更できません (dict(config) で複製してください)。")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
+
+    def __reduce__(self):
+        return (FrozenConfig, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+class Field:
+    """
+    設定の1項目の型・既定値・制約。value_type は bool, int, float, str, list, dict またはそのタプル
+    (先頭から順に変換を試す)。既定値が None の項目は None を許す。
+    """
+
+    def __init__(self, value_type, default=None, choices=None, min=None, max=None, item_type=None, nullable=None):
+        self.types = value_type if isinstance(value_type, tuple) else (value_type,)
+        self.default = default
+        self.choices = tuple(choices) if choices is not None else None
+        self.min = min
+        self.max = max
+        self.item_type = item_type
+        self.nullable = default is None if nullable is None else nullable
+
+    def describe(self):
+        names = " または ".join(value_type.__name__ for value_type in self.types)
+        if self.choices:
+            names += f" ({', '.join(map(str, self.choices))} のいずれか)"
+        return names
+
+def _coerce(value, value_type):
+    """
+    値を value_type に変換する。変換できない場合は ValueError。
+    """
+    if value_type is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, int) and value in (0, 1):
+            return bool(value)
+        if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS + _FALSE_STRINGS:
+            return value.strip().lower() in _TRUE_STRINGS
+    elif value_type is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and _INT_PATTERN.fullmatch(value.strip()):
+            return int(value)
+    elif value_type is float:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str) and _FLOAT_PATTERN.fullmatch(value.strip()):
+            return float(value)
+    elif value_type is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif value_type is list:
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        if isinstance(value, str):
+            # "[a, b]" の形式と "a,b" のようなカンマ区切りの両方を受け付ける
+            if value.strip().startswith("["):
+                parsed = parse_value(value)
+                if isinstance(parsed, list):
+                    return parsed
+            return [parse_value(item.strip()) for item in value.split(",") if item.strip()]
+    elif value_type is dict:
+        if isinstance(value, dict):
+            return value
+    raise ValueError(value)
+
+def _compile_field(key, field):
+    """
+    1項目の検証関数を作る。検証関数は変換後の値を返し、問題があれば ConfigError を送出する。
+    """
+    def fail(value, reason=None):
+        raise ConfigError(f"{key}: {reason or field.describe() + ' を指定してください'} (値: {value!r})")
+
+    def check(value):
+        if value is None or (field.nullable and str not in field.types and isinstance(value, str) and value.lower() in _NULL_STRINGS):
+            if field.nullable:
+                return None
+            fail(value, "値が必要です")
+        # コマンドラインの文字列は先頭の型から順に変換を試し、それ以外の値は同じ型があればそのまま使う
+        # (bool は int として扱わない)
+        candidates = field.types if isinstance(value, str) else [value_type for value_type in field.types if type(value) is value_type] or field.types
+        for value_type in candidates:
+            try:
+                result = _coerce(value, value_type)
+                break
+            except ValueError:
+                continue
+        else:
+            fail(value)
+        if field.item_type is not None and isinstance(result, list):
+            try:
+                result = [_coerce(item, field.item_type) for item in result]
+            except ValueError:
+                fail(value, f"要素には {field.item_type.__name__} を指定してください")
+        if field.choices is not None and result not in field.choices:
+            fail(value)
+        if isinstance(result, (int, float)) and not isinstance(result, bool):
+            if field.min is not None and result < field.min:
+                fail(value, f"{field.min} 以上を指定してください")
+            if field.max is not None and result > field.max:
+                fail(value, f"{field.max} 以下を指定してください")
+        return result
+
+    return check
+
+class ConfigSchema:
+    """
+    エージェントの設定スキーマ。エージェントは CONFIG_SCHEMA = ConfigSchema({...}) を定義し、
+    yggdrasil.py はエージェントを実行する前に resolve() で設定を検証する。
+    検証関数は作成時に一度だけ組み立てる。allow_extra=True の場合、スキーマにない項目も
+    (学習スクリプトへの引数などとして) そのまま通す。
+    """
+
+    def __init__(self, fields, allow_extra=False):
+        self.fields = dict(fields)
+        self.allow_extra = allow_extra
+        self._checks = {key: _compile_field(key, field) for key, field in self.fields.items()}
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def defaults(self):
+        """
+        既定値の辞書 (エージェントの DEFAULT_CONFIG) を返す。
+        """
+        return {key: list(field.default) if isinstance(field.default, list) else field.default
+                for key, field in self.fields.items()}
+
+    def resolve(self, config):
+        """
+        既定値に config を重ねて検証し、FrozenConfig を返す。問題があればすべてまとめて ConfigError を送出する。
+        """
+        resolved, errors = self.defaults(), []
+        for key, value in config.items():
+            check = self._checks.get(key)
+            if check is None:
+                if self.allow_extra:
+                    resolved[key] = value
+                    continue
+                suggestion = difflib.get_close_matches(key, self.fields, n=1)
+                errors.append(f"{key}: 未知の設定項目です" + (f" (もしかして: {suggestion[0]})" if suggestion else ""))
+                continue
+            try:
+                resolved[key] = check(value)
+            except ConfigError as e:
+                errors.append(str(e))
+        if errors:
+            raise ConfigError("\n".join(errors))
+        return FrozenConfig(resolved)
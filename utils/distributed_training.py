@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Data-parallel multi-worker training (MultiWorkerMirroredStrategy, TF_CONFIG, sharded tf.data, chief-only outputs)
+
+import json
+import math
+import os
+import socket
+import sys
+import time
+from contextlib import nullcontext
+
+try:
+    from training_acceleration import str2bool
+except ImportError: # utils パッケージとしてインポートされた場合
+    from utils.training_acceleration import str2bool
+
+# 分散学習のクラスタ構成を渡す環境変数 (TensorFlow の規約)
+TF_CONFIG_ENV = "TF_CONFIG"
+# TensorFlow のスレッド数を決める環境変数 (同じホストで複数のワーカーを動かす場合に分け合う)
+INTRA_OP_THREADS_ENV = "TF_NUM_INTRAOP_THREADS"
+
+# 分散学習に対応した学習スクリプト
+DISTRIBUTED_SCRIPTS = ["mnist_trainer.py", "character_recognizer.py", "generic_trainer.py"]
+
+def add_distribution_args(parser):
+    """
+    学習スクリプトの ArgumentParser に分散学習のオプションを追加する。
+    """
+    parser.add_argument('--distributed', type=str2bool, default=False,
+                        help='環境変数 TF_CONFIG のワーカーと MultiWorkerMirroredStrategy でデータ並列学習する (--batch_size はワーカーごとのバッチサイズ)')
+    return parser
+
+def tf_config():
+    """
+    環境変数 TF_CONFIG を辞書で返す。設定されていなければ None。
+    """
+    value = os.environ.get(TF_CONFIG_ENV)
+    return json.loads(value) if value else None
+
+def make_tf_config(workers, index):
+    """
+    ワーカーのアドレス ("host:port") のリストと自身の番号から TF_CONFIG の値を作る。0番のワーカーがチーフになる。
+    """
+    return json.dumps({"cluster": {"worker": list(workers)}, "task": {"type": "worker", "index": int(index)}})
+
+def is_chief():
+    """
+    モデルの保存・結果の記録・実験管理を担当するプロセスかどうか。分散学習でなければ常に True。
+    """
+    config = tf_config()
+    if not config:
+        return True
+    task = config.get("task", {})
+    if "chief" in config.get("cluster", {}):
+        return task.get("type") == "chief"
+    return task.get("type", "worker") == "worker" and int(task.get("index", 0)) == 0
+
+def free_local_addresses(count, host="localhost"):
+    """
+    同じホストでワーカーを起動するための、空いているポートのアドレスを count 個返す。
+    """
+    sockets = []
+    try:
+        for _ in range(count):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            sockets.append(sock)
+        return [f"{host}:{sock.getsockname()[1]}" for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
+
+def worker_env(workers, index, base_env=None, local_workers=1):
+    """
+    ワーカープロセス用の環境変数辞書を返す。同じホストで local_workers 個のワーカーを動かす場合は、
+    スレッド数が明示されていなければCPUコアをワーカーで分け合う。
+    """
+    env = dict(os.environ if base_env is None else base_env)
+    env[TF_CONFIG_ENV] = make_tf_config(workers, index)
+    if local_workers > 1:
+        env.setdefault(INTRA_OP_THREADS_ENV, str(max(1, (os.cpu_count() or 1) // local_workers)))
+    return env
+
+def create_strategy(distributed):
+    """
+    distributed=True の場合は MultiWorkerMirroredStrategy を作成して返す (TF_CONFIG が必要)。それ以外は None。
+    ワーカー間の接続が確立されるまで待つため、configure_acceleration の後、モデルを作る前に呼び出す。
+    """
+    if not distributed:
+        return None
+    config = tf_config()
+    if not config:
+        raise ValueError(f"分散学習には環境変数 {TF_CONFIG_ENV} が必要です (model_trainer の num_workers または worker_hosts を指定してください)。")
+    import tensorflow as tf
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy()
+    task = config.get("task", {})
+    print(f"--- 分散学習: ワーカー {task.get('index', 0)} / {strategy.num_replicas_in_sync} レプリカ ({'チーフ' if is_chief() else 'ワーカー'}) ---")
+    return strategy
+
+def strategy_scope(strategy):
+    """
+    モデルとオプティマイザを作成するスコープ (分散学習でなければ何もしない)。
+    """
+    return strategy.scope() if strategy is not None else nullcontext()
+
+def shard_dataset(dataset):
+    """
+    グローバルバッチ単位の tf.data.Dataset を、各ワーカーが担当分だけ使うように設定する
+    (各ワーカーは同じ順序でデータを読み、グローバルバッチのうち自分の担当分だけを使う)。
+    """
+    import tensorflow as tf
+
+    options = tf.data.Options()
+    options.experimental_distribute.auto_shard_policy = tf.data.experimental.AutoShardPolicy.DATA
+    return dataset.with_options(options)
+
+def global_batch_size(batch_size, strategy):
+    return batch_size * strategy.num_replicas_in_sync
+
+def array_datasets(x, y, batch_size, strategy, validation_split=0.0, seed=42, shuffle=True):
+    """
+    配列から (学習用, 検証用) の tf.data.Dataset を作る。検証用は model.fit の validation_split と同じく
+    末尾の割合を使う。バッチはワーカーごとのバッチサイズ × レプリカ数 (グローバルバッチ)。
+    シャッフルの順序は全ワーカーで同じになるよう seed を固定する。
+    """
+    import tensorflow as tf
+
+    batch = global_batch_size(batch_size, strategy)
+    split_at = int(math.ceil(len(x) * (1.0 - validation_split))) if validation_split else len(x)
+    train = tf.data.Dataset.from_tensor_slices((x[:split_at], y[:split_at]))
+    if shuffle:
+        train = train.shuffle(min(split_at, 65536), seed=seed, reshuffle_each_iteration=True)
+    train = train.batch(batch).prefetch(tf.data.AUTOTUNE)
+    validation = None
+    if split_at < len(x):
+        validation = tf.data.Dataset.from_tensor_slices((x[split_at:], y[split_at:])).batch(batch).prefetch(tf.data.AUTOTUNE)
+    return shard_dataset(train), shard_dataset(validation) if validation is not None else None
+
+def _loss_and_accuracy(loss):
+    """
+    損失関数の名前から、サンプルごとの損失と正解数を計算する関数を作る。
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+
+    sparse = loss == "sparse_categorical_crossentropy"
+    if not sparse and loss != "categorical_crossentropy":
+        raise ValueError(f"分散学習が対応していない損失関数です: {loss}")
+    loss_object = (keras.losses.SparseCategoricalCrossentropy if sparse else keras.losses.CategoricalCrossentropy)(reduction=None)
+
+    def compute(y_true, y_pred):
+        per_example = loss_object(y_true, y_pred)
+        labels = tf.cast(tf.reshape(y_true, [-1]), tf.int64) if sparse else tf.argmax(y_true, axis=-1)
+        correct = tf.reduce_sum(tf.cast(tf.equal(tf.argmax(y_pred, axis=-1), labels), tf.float32))
+        return per_example, correct
+
+    return compute
+
+class DistributedTrainer:
+    """
+    MultiWorkerMirroredStrategy のスコープで作成・コンパイルしたモデルを、独自の学習ループで学習する
+    (Keras 3 の model.fit/evaluate は MultiWorkerMirroredStrategy に対応していないため)。
+    勾配はオプティマイザがワーカー間で集約し、損失と精度は全ワーカーで合計してから報告するため、
+    早期終了などのコールバックはすべてのワーカーで同じ判断をする。
+    """
+
+    def __init__(self, model, loss, strategy):
+        import tensorflow as tf
+
+        self.model = model
+        self.strategy = strategy
+        self._compute = _loss_and_accuracy(loss)
+        self._train_step = tf.function(self._train_step_fn)
+        self._test_step = tf.function(self._test_step_fn)
+
+    def _train_step_fn(self, batch):
+        import tensorflow as tf
+
+        def replica_step(x, y):
+            with tf.GradientTape() as tape:
+                y_pred = self.model(x, training=True)
+                per_example, correct = self._compute(y, y_pred)
+                loss = tf.nn.compute_average_loss(per_example)
+            gradients = tape.gradient(loss, self.model.trainable_variables)
+            self.model.optimizer.apply_gradients(zip(gradients, self.model.trainable_variables))
+            return tf.reduce_sum(per_example), correct, tf.cast(tf.shape(per_example)[0], tf.float32)
+
+        return self._reduce(self.strategy.run(replica_step, args=batch))
+
+    def _test_step_fn(self, batch):
+        import tensorflow as tf
+
+        def replica_step(x, y):
+            per_example, correct = self._compute(y, self.model(x, training=False))
+            return tf.reduce_sum(per_example), correct, tf.cast(tf.shape(per_example)[0], tf.float32)
+
+        return self._reduce(self.strategy.run(replica_step, args=batch))
+
+    def _reduce(self, values):
+        return [self.strategy.reduce("SUM", value, axis=None) for value in values]
+
+    def _run_epoch(self, step, dataset):
+        totals = [0.0, 0.0, 0.0]
+        for batch in self.strategy.experimental_distribute_dataset(dataset):
+            totals = [total + float(value) for total, value in zip(totals, step(batch))]
+        loss_sum, correct, count = totals
+        return {"loss": loss_sum / max(count, 1.0), "accuracy": correct / max(count, 1.0), "samples": count}
+
+    def evaluate(self, dataset):
+        """
+        データセット全体の (損失, 精度) を返す。すべてのワーカーで呼び出す必要がある。
+        """
+        result = self._run_epoch(self._test_step, dataset)
+        return result["loss"], result["accuracy"]
+
+    def fit(self, dataset, epochs, initial_epoch=0, validation_data=None, callbacks=(), verbose=True):
+        """
+        model.fit と同様に学習し、History コールバックを返す (history.history にエポックごとの値が入る)。
+        """
+        from tensorflow import keras
+
+        history = keras.callbacks.History()
+        callback_list = keras.callbacks.CallbackList([*callbacks, history], model=self.model)
+        self.model.stop_training = False
+        callback_list.on_train_begin()
+        for epoch in range(initial_epoch, epochs):
+            callback_list.on_epoch_begin(epoch)
+            start_time = time.perf_counter()
+            train = self._run_epoch(self._train_step, dataset)
+            logs = {"loss": train["loss"], "accuracy": train["accuracy"]}
+            if validation_data is not None:
+                logs["val_loss"], logs["val_accuracy"] = self.evaluate(validation_data)
+            elapsed = time.perf_counter() - start_time
+            if verbose:
+                print(f"Epoch {epoch + 1}/{epochs} - {elapsed:.1f}s - {train['samples'] / elapsed:.0f} samples/sec - "
+                      + " - ".join(f"{key}: {value:.4f}" for key, value in logs.items()))
+            callback_list.on_epoch_end(epoch, logs)
+            if self.model.stop_training:
+                break
+        callback_list.on_train_end()
+        return history
+
+def check_resume_consistency(strategy, initial_epoch):
+    """
+    チェックポイントから再開するエポックが全ワーカーで同じであることを確認する
+    (ワーカーごとに異なるチェックポイントを読むと重みが揃わないため)。
+    """
+    import tensorflow as tf
+
+    # 集約は合計と平均しかないため、値の合計と二乗の合計から全ワーカーで同じ値かを判定する (全ワーカーが同じ結論になる)
+    @tf.function
+    def gather():
+        value = strategy.run(lambda: tf.constant(float(initial_epoch), tf.float64))
+        return strategy.reduce("SUM", value, axis=None), strategy.reduce("SUM", value * value, axis=None)
+
+    total, total_squares = (float(value) for value in gather())
+    if abs(strategy.num_replicas_in_sync * total_squares - total * total) > 1e-6:
+        raise RuntimeError("ワーカーによって再開するエポックが異なります。"
+                           "複数のホストで学習する場合は、すべてのワーカーから読める共有の checkpoint_dir を指定してください。")
+
+def wait_for_all_workers(strategy):
+    """
+    すべてのワーカーがここに到達するまで待つ。チーフが保存や評価を終える前に他のワーカーが終了すると
+    (またはその逆)、残ったワーカーがクラスタとの通信エラーで失敗するため、学習スクリプトの最後に呼び出す。
+    """
+    import tensorflow as tf
+
+    @tf.function
+    def barrier():
+        return strategy.reduce("SUM", strategy.run(lambda: tf.constant(1.0)), axis=None)
+
+    barrier()
+
+def warn_ignored_option(option, value):
+    """
+    分散学習と組み合わせられないオプションが指定された場合に警告する。
+    """
+    print(f"警告: 分散学習では {option}={value} は使用されません。", file=sys.stderr)
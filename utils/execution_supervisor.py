@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Timeouts, process-group termination and cooperative cancellation for agents and steps
+
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+# yggdrasil.py は utils.execution_supervisor として、エージェントは utils を sys.path に追加して
+# execution_supervisor としてインポートするため、両方の名前で同じモジュール (同じキャンセルトークン) を参照させる
+sys.modules.setdefault("execution_supervisor", sys.modules[__name__])
+sys.modules.setdefault("utils.execution_supervisor", sys.modules[__name__])
+
+try:
+    from process_runner import DEFAULT_GRACE_SECONDS, ProcessResult, ProcessStep, run_processes
+except ImportError: # yggdrasil.py から utils パッケージとしてインポートされた場合
+    from utils.process_runner import DEFAULT_GRACE_SECONDS, ProcessResult, ProcessStep, run_processes
+
+class ExecutionCancelled(Exception):
+    """
+    キャンセルトークンがキャンセルされた (またはプロセスが SIGTERM を受け取った) ことを表す例外。
+    """
+
+class AgentTimeoutError(ExecutionCancelled):
+    """
+    エージェントまたはステップが制限時間を超えたことを表す例外。
+    """
+
+class CancellationToken:
+    """
+    協調的なキャンセルのためのトークン。長いループを持つエージェントは check_cancelled() を定期的に呼び、
+    run_supervised で起動した子プロセスはキャンセルされるとプロセスグループごと停止される。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise (AgentTimeoutError if self.reason == "timeout" else ExecutionCancelled)(self.reason)
+
+_current_token = CancellationToken()
+
+def current_token():
+    """
+    実行中のエージェントのキャンセルトークンを返す。
+    """
+    return _current_token
+
+def check_cancelled():
+    """
+    実行中のエージェントがキャンセル (タイムアウトを含む) されていれば ExecutionCancelled を送出する。
+    """
+    _current_token.raise_if_cancelled()
+
+def resolve_timeout(agent_name, agent_module, framework_config):
+    """
+    エージェントの制限時間 (秒) を決める。None または 0 以下は無制限。
+    優先順位: agent_execution.agent_timeouts.<agent_name> > エージェントの TIMEOUT_SECONDS > agent_execution.timeout_seconds
+    """
+    execution_config = framework_config.get("agent_execution", {})
+    agent_timeouts = execution_config.get("agent_timeouts") or {}
+    if agent_name in agent_timeouts:
+        timeout = agent_timeouts[agent_name]
+    elif "TIMEOUT_SECONDS" in vars(agent_module):
+        timeout = vars(agent_module)["TIMEOUT_SECONDS"]
+    else:
+        timeout = execution_config.get("timeout_seconds")
+    return float(timeout) if timeout and float(timeout) > 0 else None
+
+@contextmanager
+def deadline(timeout, grace_seconds=DEFAULT_GRACE_SECONDS):
+    """
+    同じプロセス内で実行するエージェントに制限時間を設ける。
+    制限時間を過ぎるとまずキャンセルトークンをキャンセルし (協調的な停止と子プロセスの停止)、
+    猶予時間内に終わらなければ SIGALRM により AgentTimeoutError を送出して処理を中断する。
+    SIGALRM はメインスレッドでしか使えないため、それ以外ではトークンのキャンセルだけを行う。
+    """
+    global _current_token
+    token = CancellationToken()
+    previous_token, _current_token = _current_token, token
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    timer = None
+    previous_handler = None
+
+    def on_alarm(signum, frame):
+        if not token.cancelled:
+            token.cancel("timeout")
+            signal.setitimer(signal.ITIMER_REAL, max(grace_seconds, 0.01))
+        else:
+            raise AgentTimeoutError(f"制限時間 ({timeout}秒) を超えました")
+
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    elif timeout:
+        timer = threading.Timer(timeout, token.cancel, args=("timeout",))
+        timer.daemon = True
+        timer.start()
+    try:
+        yield token
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        if timer:
+            timer.cancel()
+        _current_token = previous_token
+
+# run_supervised の結果 (status は "ok", "failed", "timeout", "cancelled" のいずれか。output に出力の末尾が残る)
+SupervisedResult = ProcessResult
+
+@contextmanager
+def _sigterm_as_cancellation():
+    # 自身が SIGTERM を受け取った場合も子プロセスのグループを停止してから終了できるよう、例外に変換する
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_sigterm(signum, frame):
+        raise ExecutionCancelled("SIGTERM")
+
+    previous_handler = signal.signal(signal.SIGTERM, on_sigterm)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+
+def run_supervised(command, timeout=None, grace_seconds=DEFAULT_GRACE_SECONDS, on_output=None, env=None, cwd=None,
+                   token=None, monitor=True, log_path=None, prefix=""):
+    """
+    コマンドを新しいプロセスグループで実行し、標準出力と標準エラー出力を1行ずつ on_output に渡す
+    (省略時は prefix を付けて sys.stdout / sys.stderr に書き出す。log_path を指定するとファイルにも書き出す)。
+    制限時間を超えた場合・トークンがキャンセルされた場合・自身が中断された場合は、
+    プロセスグループ全体を SIGTERM → SIGKILL で停止する。
+    monitor=True の場合は子プロセスツリーのリソース使用量を計測して result.usage に入れる。
+    """
+    step = ProcessStep("command", command, env=env, cwd=cwd, timeout=timeout,
+                       log_path=log_path, prefix=prefix)
+    on_line = (lambda step, stream_name, line: on_output(line)) if on_output else None
+    return run_supervised_steps([step], on_line=on_line, grace_seconds=grace_seconds, token=token, monitor=monitor)[0]
+
+def run_supervised_steps(steps, max_parallel=None, on_line=None, grace_seconds=DEFAULT_GRACE_SECONDS, token=None, monitor=True,
+                         fail_fast=False):
+    """
+    複数の ProcessStep を並行して実行し (max_parallel で同時実行数を制限)、出力をステップごとの
+    prefix を付けて多重化する。実行中のエージェントのトークンがキャンセルされた場合は、すべてのステップを停止する。
+    fail_fast=True の場合は、いずれかのステップが失敗した時点で残りのステップも停止する。
+    """
+    with _sigterm_as_cancellation():
+        return run_processes(steps, on_line=on_line, max_parallel=max_parallel, token=token or current_token(),
+                             grace_seconds=grace_seconds, monitor=monitor, fail_fast=fail_fast)
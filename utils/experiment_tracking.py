@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Batched, asynchronous MLflow tracking (params, per-epoch metrics, artifacts, parent/child runs)
+
+import os
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    from user_log import append_entry
+except ImportError: # utils パッケージとしてインポートされた場合
+    from utils.user_log import append_entry
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ローカルのファイルベースのストア (mlflow ui がデフォルトで参照する mlruns/)
+# MLFLOW_TRACKING_URI が設定されていればそちらを使う
+TRACKING_URI = Path(PROJECT_ROOT, "mlruns").as_uri()
+DEFAULT_EXPERIMENT = "yggdrasil"
+
+# MLflow 3 ではファイルベースのストアを使うために明示的な許可が必要
+os.environ.setdefault("MLFLOW_ALLOW_FILE_STORE", "true")
+
+# バックグラウンドスレッドがまとめて書き込む間隔と、1回の log_batch の上限 (MLflow の制限に合わせる)
+FLUSH_INTERVAL_SECONDS = 2.0
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_PARAM_LENGTH = 6000
+
+# この環境変数が設定されている場合は、メトリクスをそのファイルにも JSON lines で追記する
+# (job_cluster のワーカーがファイルを読み、コーディネーターに送る)
+METRICS_FILE_ENV = "YGGDRASIL_METRICS_FILE"
+
+_STOP = object()
+
+def add_tracking_args(parser):
+    """
+    実験管理の引数を学習・評価スクリプトの argparse に追加する。
+    (model_trainer エージェントは設定の parent_run_id を --parent_run_id として渡す)
+    """
+    parser.add_argument('--parent_run_id', type=str, default=None, help='親となるMLflowのRun ID (パイプラインの各ステップを子Runとして記録する)')
+    parser.add_argument('--experiment_name', type=str, default=None, help=f'MLflowの実験名 (デフォルト: {DEFAULT_EXPERIMENT})')
+
+class ExperimentRun:
+    """
+    1つの MLflow Run。パラメータ・メトリクス・アーティファクトの記録はキューに積むだけで、
+    Run の作成と書き込みはバックグラウンドのスレッドがまとめて (log_batch で) 行うため、学習ループを止めない。
+    mlflow がインストールされていない場合や書き込みに失敗した場合は、警告を出して記録をスキップする。
+    """
+
+    def __init__(self, run_name, experiment_name=None, parent_run_id=None, tags=None,
+                 tracking_uri=None, flush_interval=FLUSH_INTERVAL_SECONDS):
+        self.run_name = run_name
+        self.experiment_name = experiment_name or DEFAULT_EXPERIMENT
+        self.parent_run_id = parent_run_id or None
+        self.tags = dict(tags or {})
+        self.tracking_uri = tracking_uri or os.environ.get("MLFLOW_TRACKING_URI") or TRACKING_URI
+        self.flush_interval = flush_interval
+        self.metrics_file = os.environ.get(METRICS_FILE_ENV)
+        # 成果物のマニフェスト (artifact_registry.register_output) 用に、パラメータと各指標の最新値を残す
+        self.params = {}
+        self.metrics = {}
+        self._run_id = None
+        self._ready = threading.Event()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._worker, name="experiment-tracking", daemon=True)
+        self._thread.start()
+
+    @property
+    def run_id(self):
+        """
+        Run ID (子Runに渡すために使う)。Run の作成が終わるまで待つ。記録が無効な場合は None。
+        """
+        self._ready.wait()
+        return self._run_id
+
+    def log_params(self, params):
+        params = {key: value for key, value in params.items() if value is not None}
+        self.params.update(params)
+        self._queue.put(("params", params))
+
+    def log_metric(self, key, value, step=0):
+        self.log_metrics({key: value}, step)
+
+    def log_metrics(self, metrics, step=0):
+        timestamp = int(time.time() * 1000)
+        values = {}
+        for key, value in metrics.items():
+            try:
+                values[key] = float(value)
+            except (TypeError, ValueError):
+                continue
+        self.metrics.update(values)
+        self._queue.put(("metrics", (values, timestamp, int(step or 0))))
+
+    def set_tags(self, tags):
+        self._queue.put(("tags", dict(tags)))
+
+    def log_artifact(self, path, artifact_path=None):
+        """
+        ファイルまたはディレクトリをアーティファクトとして記録する。コピーはバックグラウンドで行う。
+        """
+        if path and os.path.exists(path):
+            self._queue.put(("artifact", (os.path.abspath(path), artifact_path)))
+
+    def end(self, status="FINISHED"):
+        """
+        キューに残った記録をすべて書き込んでから Run を終了する。
+        """
+        if self._thread.is_alive():
+            self._queue.put((_STOP, status))
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end("FINISHED" if exc_type is None else "FAILED")
+        return False
+
+    def _start(self):
+        try:
+            from mlflow.tracking import MlflowClient
+        except ImportError:
+            print("警告: mlflow がインストールされていないため、実験の記録をスキップします。", file=sys.stderr)
+            return None
+        client = MlflowClient(tracking_uri=self.tracking_uri)
+        tags = {"mlflow.runName": self.run_name, "mlflow.source.name": os.path.basename(sys.argv[0] or "")}
+        if self.parent_run_id:
+            # 子Runは親Runと同じ実験に作成する
+            experiment_id = client.get_run(self.parent_run_id).info.experiment_id
+            tags["mlflow.parentRunId"] = self.parent_run_id
+        else:
+            experiment = client.get_experiment_by_name(self.experiment_name)
+            experiment_id = experiment.experiment_id if experiment else client.create_experiment(self.experiment_name)
+        tags.update({key: str(value) for key, value in self.tags.items()})
+        self._run_id = client.create_run(experiment_id, tags=tags).info.run_id
+        return client
+
+    def _worker(self):
+        try:
+            client = self._start()
+        except Exception as e:
+            print(f"警告: MLflow の Run を作成できませんでした。実験の記録をスキップします: {e}", file=sys.stderr)
+            client = None
+        finally:
+            self._ready.set()
+
+        params, tags, metrics = {}, {}, []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            kind = item[0] if item else None
+            if kind == "params":
+                params.update({key: str(value)[:MAX_PARAM_LENGTH] for key, value in item[1].items()})
+            elif kind == "tags":
+                tags.update({key: str(value) for key, value in item[1].items()})
+            elif kind == "metrics":
+                values, timestamp, step = item[1]
+                metrics.extend((key, value, timestamp, step) for key, value in values.items())
+                if self.metrics_file and values:
+                    self._mirror_metrics(values, timestamp, step)
+
+            full = len(metrics) >= MAX_METRICS_PER_BATCH or len(params) >= MAX_PARAMS_PER_BATCH or len(tags) >= MAX_TAGS_PER_BATCH
+            if item is None or full or kind in ("artifact", _STOP):
+                if client is not None:
+                    client = self._flush(client, params, tags, metrics)
+                params, tags, metrics = {}, {}, []
+                deadline = time.monotonic() + self.flush_interval
+
+            if kind == "artifact" and client is not None:
+                path, artifact_path = item[1]
+                try:
+                    if os.path.isdir(path):
+                        client.log_artifacts(self._run_id, path, artifact_path)
+                    else:
+                        client.log_artifact(self._run_id, path, artifact_path)
+                except Exception as e:
+                    print(f"警告: アーティファクトを記録できませんでした: {path}: {e}", file=sys.stderr)
+            elif kind is _STOP:
+                if client is not None:
+                    try:
+                        client.set_terminated(self._run_id, item[1])
+                    except Exception as e:
+                        print(f"警告: MLflow の Run を終了できませんでした: {e}", file=sys.stderr)
+                return
+
+    def _mirror_metrics(self, values, timestamp, step):
+        try:
+            append_entry(self.metrics_file, {"run": self.run_name, "step": step, "timestamp": timestamp, "metrics": values})
+        except OSError as e:
+            print(f"警告: メトリクスをファイルに書き出せませんでした: {self.metrics_file}: {e}", file=sys.stderr)
+            self.metrics_file = None
+
+    def _flush(self, client, params, tags, metrics):
+        """
+        溜まった記録を log_batch で書き込む。失敗した場合は以降の記録を無効にする (None を返す)。
+        """
+        if not (params or tags or metrics):
+            return client
+        from mlflow.entities import Metric, Param, RunTag
+        try:
+            metric_items = [Metric(key, value, timestamp, step) for key, value, timestamp, step in metrics]
+            param_items = [Param(key, value) for key, value in params.items()]
+            tag_items = [RunTag(key, value) for key, value in tags.items()]
+            # 1回の log_batch の上限を超える分は複数回に分けて書き込む
+            while metric_items or param_items or tag_items:
+                client.log_batch(self._run_id, metrics=metric_items[:MAX_METRICS_PER_BATCH],
+                                 params=param_items[:MAX_PARAMS_PER_BATCH], tags=tag_items[:MAX_TAGS_PER_BATCH])
+                metric_items = metric_items[MAX_METRICS_PER_BATCH:]
+                param_items = param_items[MAX_PARAMS_PER_BATCH:]
+                tag_items = tag_items[MAX_TAGS_PER_BATCH:]
+            return client
+        except Exception as e:
+            print(f"警告: MLflow への記録に失敗したため、以降の記録をスキップします: {e}", file=sys.stderr)
+            return None
+
+def start_run(run_name, params=None, parent_run_id=None, experiment_name=None, tags=None):
+    """
+    Run を開始し、パラメータを記録して返す。with 文で使うと、例外で終了した場合は FAILED として記録する。
+    """
+    run = ExperimentRun(run_name, experiment_name=experiment_name, parent_run_id=parent_run_id, tags=tags)
+    if params:
+        run.log_params(params)
+    return run
+
+def start_script_run(run_name, args, exclude=()):
+    """
+    学習・評価スクリプトの引数 (add_tracking_args を含む argparse の結果) から Run を開始する。
+    引数はそのままパラメータとして記録する (チェックポイントの保存先など、結果に影響しない引数は除く)。
+    """
+    skip = {"parent_run_id", "experiment_name", "checkpoint_dir", *exclude}
+    params = {key: value for key, value in vars(args).items() if key not in skip}
+    return start_run(run_name, params, parent_run_id=getattr(args, "parent_run_id", None),
+                     experiment_name=getattr(args, "experiment_name", None))
+
+def keras_callback(run):
+    """
+    エポックごとのメトリクス (loss, accuracy, val_*, learning_rate など) を Run に記録する Keras コールバック。
+    """
+    from tensorflow import keras
+
+    class ExperimentTrackingCallback(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            if logs:
+                run.log_metrics(logs, step=epoch)
+
+    return ExperimentTrackingCallback()
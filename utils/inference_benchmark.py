@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Inference latency percentiles and batch throughput for Keras, TFLite and joblib models (per-thread-count worker process)
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# 推論のスレッド数を決める環境変数 (ワーカープロセスの起動時に設定する。0 の場合は設定しない)
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS")
+INTER_OP_THREADS_ENV = "TF_NUM_INTEROP_THREADS"
+KERAS_MODEL_SUFFIXES = (".keras", ".h5")
+# 入力シグネチャから合成するテキストの単語数 (テキスト分類のパイプライン用)
+SYNTHETIC_TEXT_WORDS = 12
+PERCENTILES = (50, 90, 99)
+
+def model_format(model_path):
+    """
+    拡張子からモデルの形式 ("keras", "tflite", "joblib") を返す。
+    """
+    if model_path.endswith(KERAS_MODEL_SUFFIXES):
+        return "keras"
+    if model_path.endswith(".tflite"):
+        return "tflite"
+    return "joblib"
+
+def thread_env(threads, base_env=None):
+    """
+    推論のスレッド数を threads に制限したワーカープロセス用の環境変数辞書を返す (0 の場合は既定のまま)。
+    """
+    env = dict(os.environ if base_env is None else base_env)
+    if threads:
+        env.update({name: str(threads) for name in THREAD_ENV_VARS})
+        env[INTER_OP_THREADS_ENV] = "1"
+    return env
+
+def load_model(model_path, threads=0):
+    """
+    モデルを読み込み、(model, 形式) を返す。TFLite はスレッド数をインタプリタに、Keras は TF のランタイムに設定する。
+    """
+    fmt = model_format(model_path)
+    if fmt == "joblib":
+        import joblib
+        return joblib.load(model_path), fmt
+    if fmt == "keras" and threads:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(int(threads))
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    try:
+        from model_export import load_inference_model
+    except ImportError: # utils パッケージとしてインポートされた場合
+        from utils.model_export import load_inference_model
+    return load_inference_model(model_path, threads or None), fmt
+
+def _text_vectorizer(model):
+    # テキストを入力とするパイプライン (先頭が CountVectorizer/TfidfVectorizer/HashingVectorizer) ならその変換器を返す
+    first = model.steps[0][1] if hasattr(model, "steps") else model
+    return first if hasattr(first, "build_analyzer") else None
+
+def synthesize_inputs(model, fmt, count, seed=42):
+    """
+    モデルの入力シグネチャから count 件の合成入力を作る。
+    Keras/TFLite は入力の形と型、joblib はテキストのパイプラインなら語彙の単語を並べた文、
+    それ以外は学習時の特徴量の数 (n_features_in_) を使う。
+    """
+    rng = np.random.default_rng(seed)
+    if fmt in ("keras", "tflite"):
+        inputs = model.inputs if fmt == "keras" else [None]
+        arrays = []
+        for model_input in inputs:
+            shape = model.input_shape if model_input is None else model_input.shape
+            dims = tuple(dim or 1 for dim in shape[1:])
+            dtype = np.dtype(getattr(model_input, "dtype", "float32") or "float32")
+            arrays.append(rng.integers(0, 10, (count, *dims)).astype(dtype) if np.issubdtype(dtype, np.integer) else rng.random((count, *dims), dtype=np.float32))
+        return arrays[0] if len(arrays) == 1 else arrays
+    vectorizer = _text_vectorizer(model)
+    if vectorizer is not None:
+        vocabulary = sorted(getattr(vectorizer, "vocabulary_", None) or [f"token{i}" for i in range(1000)])
+        words = rng.choice(len(vocabulary), (count, SYNTHETIC_TEXT_WORDS))
+        return [" ".join(vocabulary[i] for i in row) for row in words]
+    num_features = getattr(model, "n_features_in_", None)
+    if num_features is None:
+        raise ValueError("モデルの入力シグネチャ (n_features_in_) が分からないため、入力を合成できません。")
+    return rng.random((count, num_features), dtype=np.float32)
+
+def _slice(inputs, start, stop):
+    return [array[start:stop] for array in inputs] if isinstance(inputs, list) and not isinstance(inputs[0], str) else inputs[start:stop]
+
+def predict_function(model, fmt):
+    """
+    推論の関数を返す。Keras/TFLite は predict_on_batch (1回の呼び出しで推論する提供時の経路)、
+    joblib は predict_proba (なければ predict) を使う (topic_classifier_agent と同じ)。
+    """
+    if fmt in ("keras", "tflite"):
+        return model.predict_on_batch
+    if _text_vectorizer(model) is not None and hasattr(model, "steps"):
+        try:
+            from text_analyzers import prefetch
+        except ImportError: # utils パッケージとしてインポートされた場合
+            from utils.text_analyzers import prefetch
+        analyzer = getattr(model.steps[0][1], "analyzer", None)
+        predict = model.predict_proba if hasattr(model, "predict_proba") else model.predict
+        return lambda texts: (prefetch(analyzer, texts), predict(texts))[1]
+    return model.predict_proba if hasattr(model, "predict_proba") else model.predict
+
+def measure(predict, inputs, batch_size, requests, min_seconds, warmup):
+    """
+    batch_size 件ずつの推論を、requests 回以上かつ min_seconds 秒以上繰り返し、
+    1回あたりの所要時間の百分位 (ミリ秒) と1秒あたりの件数を返す。
+    """
+    total = len(inputs[0]) if isinstance(inputs, list) and not isinstance(inputs[0], str) else len(inputs)
+    offsets = list(range(0, max(1, total - batch_size + 1), batch_size)) or [0]
+    for i in range(warmup):
+        start = offsets[i % len(offsets)]
+        predict(_slice(inputs, start, start + batch_size))
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < requests or time.perf_counter() - started < min_seconds:
+        start = offsets[len(timings) % len(offsets)]
+        batch = _slice(inputs, start, start + batch_size)
+        call_start = time.perf_counter()
+        predict(batch)
+        timings.append(time.perf_counter() - call_start)
+    timings_ms = np.asarray(timings) * 1000
+    result = {f"latency_p{p}_ms": round(float(np.percentile(timings_ms, p)), 4) for p in PERCENTILES}
+    result.update({"calls": len(timings), "samples_per_sec": round(batch_size * len(timings) / float(np.sum(timings)), 2)})
+    return result
+
+def run_worker(model_path, threads, batch_sizes, requests, min_seconds, warmup):
+    """
+    1つのモデルとスレッド数で各バッチサイズを計測し、1行ずつ JSON で標準出力に書き出す。
+    スレッド数はプロセス単位の設定のため、スレッド数ごとに別プロセスで実行される。
+    """
+    model, fmt = load_model(model_path, threads)
+    inputs = synthesize_inputs(model, fmt, max(batch_sizes) * 4)
+    predict = predict_function(model, fmt)
+    for batch_size in batch_sizes:
+        result = {"format": fmt, "threads": threads, "batch_size": batch_size}
+        # バッチが大きいほど1回の推論が長いため、計測回数を減らして所要時間を揃える
+        result.update(measure(predict, inputs, batch_size, max(3, requests // batch_size), min_seconds, warmup))
+        print(json.dumps(result), flush=True)
+
+def parse_int_list(value):
+    """
+    カンマ区切りの整数 (またはそのリスト) を整数のリストに変換する。例: "1,8,32"
+    """
+    if isinstance(value, (list, tuple)):
+        return [int(item) for item in value]
+    return [int(item) for item in str(value).split(",") if item.strip()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="推論ベンチマークのワーカー (benchmark_agent が起動する)")
+    parser.add_argument("--model_path", required=True)
+    parser.add_argument("--threads", type=int, default=0, help="推論のスレッド数 (0 は既定)")
+    parser.add_argument("--batch_sizes", type=parse_int_list, default=[1])
+    parser.add_argument("--requests", type=int, default=200, help="バッチサイズ1での計測回数")
+    parser.add_argument("--min_seconds", type=float, default=1.0, help="バッチサイズごとの最短の計測時間 (秒)")
+    parser.add_argument("--warmup", type=int, default=10)
+    args = parser.parse_args()
+    run_worker(args.model_path, args.threads, args.batch_sizes, args.requests, args.min_seconds, args.warmup)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Shared Janome tokenizer with multi-process batch tokenization and a persistent token cache
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+# プロジェクトのルートディレクトリを基準にパスを設定
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE_PATH = os.path.join(PROJECT_ROOT, 'data', 'cache', 'token_cache.sqlite')
+
+# 頻出語の集計に使う品詞 (名詞、動詞、形容詞)
+CONTENT_WORD_POS = ('名詞', '動詞', '形容詞')
+
+# 未解析の行がこの数以上ある場合にだけ複数プロセスで解析する (辞書の読み込みコストがあるため)
+PARALLEL_THRESHOLD = 2000
+# SQLite の1クエリで扱うキーの数
+_SQLITE_BATCH = 500
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def get_tokenizer():
+    """
+    プロセス内で共有する Janome の Tokenizer を返す。辞書の読み込みは最初の呼び出し時に1回だけ行う。
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                from janome.tokenizer import Tokenizer
+                _tokenizer = Tokenizer()
+    return _tokenizer
+
+@lru_cache(maxsize=None)
+def _cache_namespace():
+    # Janome のバージョンが変わると解析結果も変わり得るため、キャッシュのキーに含める
+    try:
+        from importlib.metadata import version
+        return f"janome-{version('janome')}"
+    except Exception:
+        return "janome"
+
+def content_hash(text):
+    return hashlib.sha1(f"{_cache_namespace()}\0{text}".encode('utf-8')).hexdigest()
+
+def tokenize_text(text):
+    """
+    1つのテキストを形態素解析し、(表層形, 基本形, 品詞) のリストを返す。
+    """
+    return [(token.surface, token.base_form, token.part_of_speech.split(',')[0]) for token in get_tokenizer().tokenize(text)]
+
+def content_words(tokens, parts_of_speech=CONTENT_WORD_POS):
+    """
+    解析結果から指定した品詞の基本形だけを取り出す。
+    """
+    return [base_form for _, base_form, part_of_speech in tokens if part_of_speech in parts_of_speech]
+
+class TokenCache:
+    """
+    テキストの内容ハッシュをキーにした、解析結果の永続キャッシュ (SQLite)。
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        self.connection = sqlite3.connect(cache_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS tokens (hash TEXT PRIMARY KEY, tokens TEXT NOT NULL)")
+
+    def get_many(self, hashes):
+        found = {}
+        hashes = list(hashes)
+        for i in range(0, len(hashes), _SQLITE_BATCH):
+            batch = hashes[i:i + _SQLITE_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            for key, tokens in self.connection.execute(f"SELECT hash, tokens FROM tokens WHERE hash IN ({placeholders})", batch):
+                found[key] = [tuple(token) for token in json.loads(tokens)]
+        return found
+
+    def put_many(self, items):
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tokens (hash, tokens) VALUES (?, ?)",
+                [(key, json.dumps(tokens, ensure_ascii=False)) for key, tokens in items.items()]
+            )
+
+    def close(self):
+        self.connection.close()
+
+def _tokenize_many(texts):
+    return [tokenize_text(text) for text in texts]
+
+def tokenize_batch(texts, cache_path=DEFAULT_CACHE_PATH, num_workers=None):
+    """
+    複数のテキストをまとめて形態素解析し、入力と同じ順序で解析結果のリストを返す。
+    キャッシュ済みのテキストは解析せず、未解析のテキストが多い場合は複数プロセスで解析する。
+    cache_path に None を渡すとキャッシュを使わない。
+    """
+    texts = list(texts)
+    keys = [content_hash(text) for text in texts]
+    unique = dict(zip(keys, texts))
+
+    cache = TokenCache(cache_path) if cache_path else None
+    try:
+        results = cache.get_many(unique) if cache else {}
+        missing = [key for key in unique if key not in results]
+
+        if missing:
+            missing_texts = [unique[key] for key in missing]
+            num_workers = num_workers or os.cpu_count() or 1
+            if num_workers > 1 and len(missing_texts) >= PARALLEL_THRESHOLD:
+                chunk = max(1, len(missing_texts) // (num_workers * 4))
+                batches = [missing_texts[i:i + chunk] for i in range(0, len(missing_texts), chunk)]
+                with ProcessPoolExecutor(max_workers=num_workers, initializer=get_tokenizer) as executor:
+                    analyzed = [tokens for batch in executor.map(_tokenize_many, batches) for tokens in batch]
+            else:
+                analyzed = _tokenize_many(missing_texts)
+            new_results = dict(zip(missing, analyzed))
+            if cache:
+                cache.put_many(new_results)
+            results.update(new_results)
+    finally:
+        if cache:
+            cache.close()
+
+    return [results[key] for key in keys]
+
+def iter_file_tokens(file_path, batch_size=10000, cache_path=DEFAULT_CACHE_PATH, num_workers=None, start_offset=0, include_partial=True):
+    """
+    テキストファイルを batch_size 行ずつ読み、(行, 解析結果, 次の行の開始バイト位置) を順に返すジェネレータ。
+    ファイル全体をメモリに載せずに大きなコーパスを解析できる。空行は飛ばす。
+    改行で終わらない最終行は、include_partial=False の場合は書き込み途中とみなして飛ばす
+    (返されたバイト位置から続きを読む場合に、追記された残りの部分と合わせて1行として解析するため)。
+    """
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        while True:
+            lines, offsets = [], []
+            for raw in f:
+                if not raw.endswith(b'\n') and not include_partial:
+                    break
+                line = raw.decode('utf-8').strip()
+                if line:
+                    lines.append(line)
+                    offsets.append(f.tell())
+                if len(lines) >= batch_size:
+                    break
+            if not lines:
+                return
+            for line, tokens, offset in zip(lines, tokenize_batch(lines, cache_path, num_workers), offsets):
+                yield line, tokens, offset
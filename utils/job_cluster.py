@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+# DESCRIPTION: TCP coordinator/worker that runs queued jobs on other hosts (JSON lines, leases, log/metric/artifact streaming)
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import time
+import uuid
+
+try:
+    from job_queue import DEFAULT_LOG_DIR, RUNNING, build_command, default_memory_budget_mb
+    from process_runner import DEFAULT_GRACE_SECONDS, ProcessStep, stream_processes
+    from execution_supervisor import CancellationToken
+    from experiment_tracking import METRICS_FILE_ENV
+    from user_log import append_entry, iter_entries
+except ImportError: # yggdrasil.py から utils パッケージとしてインポートされた場合
+    from utils.job_queue import DEFAULT_LOG_DIR, RUNNING, build_command, default_memory_budget_mb
+    from utils.process_runner import DEFAULT_GRACE_SECONDS, ProcessStep, stream_processes
+    from utils.execution_supervisor import CancellationToken
+    from utils.experiment_tracking import METRICS_FILE_ENV
+    from utils.user_log import append_entry, iter_entries
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ARTIFACT_DIR = os.path.join(PROJECT_ROOT, "data", "jobs", "artifacts")
+
+DEFAULT_PORT = 7733
+# 既定ではこのホストからの接続だけを受け付ける (他のホストのワーカーを受け付けるにはトークンが必要)
+DEFAULT_HOST = "127.0.0.1"
+# ワーカーはリース期間の1/3ごとにハートビートを送る。期限までに届かなければジョブを再投入する
+DEFAULT_LEASE_SECONDS = 30.0
+DEFAULT_POLL_INTERVAL_SECONDS = 1.0
+# アーティファクトを送る単位と、1メッセージ (1行) の上限
+ARTIFACT_CHUNK_BYTES = 256 * 1024
+MAX_MESSAGE_BYTES = 4 * 1024 * 1024
+# コーディネーターに接続できない場合の再接続の間隔 (秒、失敗ごとに2倍)
+RECONNECT_DELAY_SECONDS = 1.0
+MAX_RECONNECT_DELAY_SECONDS = 30.0
+# ワーカーがメトリクスのファイルを読む間隔 (秒)
+METRICS_POLL_SECONDS = 0.5
+# 自動的に回収するアーティファクト (--agent-set で指定された出力先)
+DEFAULT_ARTIFACT_KEYS = ("output_path",)
+
+class Connection:
+    """
+    1行1メッセージの JSON で送受信する TCP 接続。複数のタスクから send しても行が混ざらない。
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self._lock = asyncio.Lock()
+
+    async def send(self, message):
+        async with self._lock:
+            self.send_nowait(message)
+            await self.writer.drain()
+
+    def send_nowait(self, message):
+        """
+        バッファに書き込むだけで送信を待たない (同期的なコールバックから送るため)。
+        """
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+
+    async def receive(self):
+        """
+        次のメッセージを返す。接続が閉じられた場合は None。
+        """
+        line = await self.reader.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        self.writer.close()
+
+class _WorkerState:
+    def __init__(self, worker_id, host, cpu_slots, memory_mb, connection):
+        self.worker_id = worker_id
+        self.host = host
+        self.cpu_slots = cpu_slots
+        self.memory_mb = memory_mb
+        self.connection = connection
+
+class _Lease:
+    def __init__(self, job_id, worker_id, expires, log_path):
+        # 再投入されたジョブが同じワーカーに再び割り当てられても、前回の実行からのメッセージと区別できるようにする
+        self.lease_id = uuid.uuid4().hex
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.expires = expires
+        self.log_path = log_path
+        self.cancel_sent = False
+        self.uploads = {} # アーティファクトの相対パス -> (一時ファイル, sha256)
+
+def is_loopback_address(host):
+    """
+    待ち受けるアドレスがこのホストからしか接続できないもの (localhost, 127.0.0.0/8, ::1) か。
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def _safe_relative_path(path):
+    """
+    ワーカーから送られたアーティファクトのパスが、保存先の外を指していないことを確認する。
+    """
+    normalized = os.path.normpath(path)
+    if os.path.isabs(normalized) or normalized == ".." or normalized.startswith(".." + os.sep):
+        raise ValueError(f"不正なアーティファクトのパスです: {path}")
+    return normalized
+
+class Coordinator:
+    """
+    ジョブキュー (job_queue.JobQueue) のジョブを、TCPで接続したワーカーに貸し出す (リース)。
+    ワーカーから送られる出力・メトリクス・アーティファクトは <log_dir>/<ジョブID>.log,
+    <log_dir>/<ジョブID>.metrics.jsonl, <artifact_dir>/<ジョブID>/ に保存する。
+    ワーカーとの接続が切れた場合やハートビートが途絶えた場合は、ジョブを試行回数を数えずに再投入する。
+    ワーカーはジョブの引数を受け取り、結果とアーティファクトを送れるため、他のホストから接続できるアドレスで
+    待ち受ける場合はトークンが必要 (トークンがなければ ValueError)。
+    """
+
+    def __init__(self, queue, host=DEFAULT_HOST, port=DEFAULT_PORT, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 log_dir=DEFAULT_LOG_DIR, artifact_dir=DEFAULT_ARTIFACT_DIR, token=None):
+        if not token and not is_loopback_address(host):
+            raise ValueError(f"トークンを設定せずに他のホストから接続できるアドレス ({host}) では待ち受けられません。"
+                             "cluster.token または環境変数 YGGDRASIL_CLUSTER_TOKEN を設定してください。")
+        self.queue = queue
+        self.host = host
+        self.port = port
+        self.lease_seconds = float(lease_seconds)
+        self.log_dir = log_dir
+        self.artifact_dir = artifact_dir
+        self.token = token
+        self.workers = {}
+        self.leases = {}
+        self._stop_event = None
+
+    def stop(self):
+        if self._stop_event:
+            self._stop_event.set()
+
+    def recover(self):
+        """
+        前回のコーディネーターが停止処理をせずに終了していた場合、実行中のままのジョブを待機中に戻す
+        (接続が切れたワーカーは自分で実行を止める)。
+        """
+        for job in self.queue.list_jobs([RUNNING]):
+            if job["cancel_requested"]:
+                self.queue.finish(job["id"], None)
+                continue
+            self.queue.requeue(job["id"], "コーディネーターの再起動により再投入されました")
+            print(f"ジョブ {job['id']} ({job['agent']}) を再投入しました (前回のコーディネーターが停止処理をせずに終了していました)。")
+
+    async def serve(self, ready=None):
+        """
+        stop() が呼ばれるまでワーカーからの接続を受け付ける。port=0 の場合は空いているポートを使い、
+        待ち受けを始めた時点で ready (asyncio.Event) をセットする。
+        """
+        self._stop_event = asyncio.Event()
+        self.recover()
+        server = await asyncio.start_server(self._handle_worker, self.host, self.port, limit=MAX_MESSAGE_BYTES)
+        self.port = server.sockets[0].getsockname()[1]
+        print(f"コーディネーターを開始しました: {self.host}:{self.port} (リース {self.lease_seconds}秒), キュー {self.queue.db_path}")
+        sweeper = asyncio.ensure_future(self._sweep())
+        if ready:
+            ready.set()
+        try:
+            async with server:
+                await self._stop_event.wait()
+        finally:
+            sweeper.cancel()
+            for lease in list(self.leases.values()):
+                self._requeue(lease, "コーディネーターの停止により再投入されました")
+            for worker in list(self.workers.values()):
+                worker.connection.close()
+            print("コーディネーターを停止しました。")
+
+    def _capacity(self):
+        # 接続中のワーカーのうち最大の資源。これを超えるジョブは今はどのワーカーでも実行できないが、
+        # 大きなワーカーが後から接続すれば実行できるため、失敗にせず待機させる
+        cpu = max((worker.cpu_slots for worker in self.workers.values()), default=0)
+        memories = [worker.memory_mb for worker in self.workers.values()]
+        memory = None if any(value is None for value in memories) else max(memories, default=0)
+        return cpu, memory
+
+    async def _handle_worker(self, reader, writer):
+        connection = Connection(reader, writer)
+        worker = None
+        try:
+            hello = await connection.receive()
+            if not hello or hello.get("type") != "register":
+                return
+            if self.token and not hmac.compare_digest(str(hello.get("token") or ""), self.token):
+                await connection.send({"type": "error", "message": "トークンが一致しません"})
+                return
+            if hello["worker_id"] in self.workers:
+                await connection.send({"type": "error", "message": f"ワーカーID {hello['worker_id']} はすでに接続しています"})
+                return
+            worker = _WorkerState(hello["worker_id"], hello.get("host"), int(hello["cpu_slots"]), hello.get("memory_mb"), connection)
+            self.workers[worker.worker_id] = worker
+            print(f"ワーカー {worker.worker_id} ({worker.host}, CPU {worker.cpu_slots}, メモリ {f'{worker.memory_mb}MB' if worker.memory_mb else '無制限'}) が接続しました。")
+            await connection.send({"type": "registered", "lease_seconds": self.lease_seconds})
+            while True:
+                message = await connection.receive()
+                if message is None:
+                    break
+                await self._dispatch(worker, message)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            print(f"警告: ワーカー {worker.worker_id if worker else '(未登録)'} との通信でエラーが発生しました: {e}", file=sys.stderr)
+        finally:
+            if worker is not None and self.workers.get(worker.worker_id) is worker:
+                del self.workers[worker.worker_id]
+                for lease in [lease for lease in self.leases.values() if lease.worker_id == worker.worker_id]:
+                    self._requeue(lease, f"ワーカー {worker.worker_id} との接続が切れたため再投入されました")
+                print(f"ワーカー {worker.worker_id} の接続が切れました。")
+            connection.close()
+
+    def _lease_for(self, worker, message):
+        """
+        メッセージが、このワーカーが現在保持しているリースに対するものであれば返す
+        (期限切れで再投入された後に届いた、古いリースでの実行の結果などは無視する)。
+        """
+        lease = self.leases.get(message.get("job_id"))
+        if lease and lease.worker_id == worker.worker_id and lease.lease_id == message.get("lease"):
+            return lease
+        return None
+
+    async def _dispatch(self, worker, message):
+        kind = message.get("type")
+        if kind == "request":
+            await self._assign(worker, message)
+            return
+        if kind == "heartbeat":
+            lease_ids = set(message.get("leases", []))
+            for lease in self.leases.values():
+                if lease.lease_id in lease_ids and lease.worker_id == worker.worker_id:
+                    lease.expires = time.monotonic() + self.lease_seconds
+            return
+
+        lease = self._lease_for(worker, message)
+        if lease is None:
+            if kind == "result":
+                print(f"警告: ワーカー {worker.worker_id} からリースのないジョブ {message.get('job_id')} の結果が届いたため無視します。", file=sys.stderr)
+                await worker.connection.send({"type": "ack", "job_id": message.get("job_id")})
+            return
+        lease.expires = time.monotonic() + self.lease_seconds
+        if kind == "log":
+            with open(lease.log_path, "a", encoding="utf-8") as f:
+                f.write(message["line"])
+        elif kind == "metrics":
+            append_entry(os.path.join(self.log_dir, f"{lease.job_id}.metrics.jsonl"), {"worker": worker.worker_id, **message["entry"]})
+        elif kind == "artifact":
+            try:
+                self._receive_artifact(lease, message)
+            except (KeyError, ValueError) as e:
+                # 不正なメッセージは接続を切らずにそのアーティファクトだけを破棄し、ワーカーに伝える
+                self._discard_upload(lease, message.get("path"))
+                print(f"警告: ジョブ {lease.job_id} のアーティファクトを受信できませんでした: {e}", file=sys.stderr)
+                await worker.connection.send({"type": "error", "job_id": lease.job_id, "message": f"アーティファクトを受信できませんでした: {e}"})
+        elif kind == "result":
+            del self.leases[lease.job_id]
+            status = self.queue.finish(lease.job_id, message["returncode"], message.get("usage"))
+            print(f"ジョブ {lease.job_id} がワーカー {worker.worker_id} で終了しました: {status} (リターンコード {message['returncode']})")
+            await worker.connection.send({"type": "ack", "job_id": lease.job_id})
+
+    async def _assign(self, worker, message):
+        total_cpu, total_memory = self._capacity()
+        job = self.queue.claim_next(int(message["free_cpu_slots"]), message.get("free_memory_mb"), total_cpu, total_memory, fail_oversized=False)
+        if job is None:
+            await worker.connection.send({"type": "idle"})
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = os.path.join(self.log_dir, f"{job['id']}.log")
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(f"=== ジョブ {job['id']} 試行 {job['attempts']}: ワーカー {worker.worker_id} ({worker.host}) ===\n")
+        self.queue.mark_started(job["id"], None, log_path, worker=worker.worker_id)
+        lease = _Lease(job["id"], worker.worker_id, time.monotonic() + self.lease_seconds, log_path)
+        self.leases[job["id"]] = lease
+        print(f"ジョブ {job['id']} ({job['agent']}) をワーカー {worker.worker_id} に割り当てました。試行 {job['attempts']}")
+        await worker.connection.send({"type": "job", "lease": lease.lease_id, "job": {
+            key: job[key] for key in ("id", "agent", "agent_args", "framework_args", "cpu_slots", "memory_mb", "attempts", "artifacts")
+        }})
+
+    def _receive_artifact(self, lease, message):
+        """
+        アーティファクトの1チャンクを書き込む。途中から始まるチャンクや、受信済みの大きさと offset が
+        合わないチャンクは ValueError にする。
+        """
+        relative_path = _safe_relative_path(message["path"])
+        target = os.path.join(self.artifact_dir, str(lease.job_id), relative_path)
+        offset = int(message["offset"])
+        if relative_path not in lease.uploads:
+            if offset != 0:
+                raise ValueError(f"{relative_path} の先頭のチャンクを受信していません (offset {offset})")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            lease.uploads[relative_path] = (open(f"{target}.part", "wb"), hashlib.sha256())
+        part_file, digest = lease.uploads[relative_path]
+        if part_file.tell() != offset:
+            raise ValueError(f"{relative_path} のチャンクの位置が受信済みの大きさと一致しません (offset {offset}, 受信済み {part_file.tell()})")
+        data = base64.b64decode(message.get("data", ""), validate=True)
+        part_file.write(data)
+        digest.update(data)
+        if message.get("final"):
+            part_file.close()
+            del lease.uploads[relative_path]
+            if digest.hexdigest() != message.get("sha256"):
+                os.remove(f"{target}.part")
+                print(f"警告: ジョブ {lease.job_id} のアーティファクト {relative_path} のハッシュが一致しないため破棄しました。", file=sys.stderr)
+                return
+            os.replace(f"{target}.part", target)
+            print(f"ジョブ {lease.job_id} のアーティファクトを受信しました: {target}")
+
+    def _discard_upload(self, lease, path):
+        # 受信途中のアーティファクトの一時ファイルを削除する
+        try:
+            relative_path = _safe_relative_path(path)
+        except (TypeError, ValueError):
+            return
+        upload = lease.uploads.pop(relative_path, None)
+        if upload:
+            upload[0].close()
+            os.remove(upload[0].name)
+
+    def _requeue(self, lease, reason):
+        self.leases.pop(lease.job_id, None)
+        for part_file, _ in lease.uploads.values():
+            part_file.close()
+        job = self.queue.get(lease.job_id)
+        if job and job["status"] == RUNNING and job["cancel_requested"]:
+            self.queue.finish(lease.job_id, None)
+            return
+        self.queue.requeue(lease.job_id, reason)
+        print(f"ジョブ {lease.job_id} を再投入しました: {reason}")
+
+    async def _sweep(self):
+        # 期限切れのリースの再投入と、キャンセルされたジョブの停止依頼を定期的に行う
+        while True:
+            await asyncio.sleep(min(1.0, self.lease_seconds / 4))
+            now = time.monotonic()
+            for lease in [lease for lease in self.leases.values() if lease.expires < now]:
+                worker = self.workers.get(lease.worker_id)
+                self._requeue(lease, f"ワーカー {lease.worker_id} からのハートビートが途絶えたため再投入されました")
+                if worker:
+                    # 応答のないワーカーで実行が続いていても結果は使わないため、停止を依頼する
+                    worker.connection.send_nowait({"type": "cancel", "job_id": lease.job_id, "lease": lease.lease_id})
+            for job_id in self.queue.cancel_requested_ids():
+                lease = self.leases.get(job_id)
+                worker = self.workers.get(lease.worker_id) if lease else None
+                if worker and not lease.cancel_sent:
+                    lease.cancel_sent = True
+                    await worker.connection.send({"type": "cancel", "job_id": job_id, "lease": lease.lease_id})
+
+def job_artifacts(job):
+    """
+    ジョブの実行後に回収するファイル。明示的に指定されたものに加えて、--agent-set の output_path を含む。
+    """
+    paths = list(job.get("artifacts") or [])
+    args = job["agent_args"]
+    for flag, value in zip(args, args[1:]):
+        key, _, path = value.partition("=")
+        if flag == "--agent-set" and key in DEFAULT_ARTIFACT_KEYS and path and path not in paths:
+            paths.append(path)
+    return paths
+
+class Worker:
+    """
+    コーディネーターに接続し、空いている資源の範囲でジョブを受け取って実行するワーカー。
+    ジョブの出力は1行ずつ、実験管理のメトリクスは記録されるたびにコーディネーターに送り、
+    ジョブが成功した場合はアーティファクトを送る。コーディネーターとの接続が切れた場合は、
+    実行中のジョブを停止して (コーディネーター側で再投入される) 再接続する。
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, worker_id=None, cpu_slots=None, memory_mb=None, token=None,
+                 python_executable=None, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS, grace_seconds=DEFAULT_GRACE_SECONDS):
+        self.host = host
+        self.port = int(port)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.cpu_slots = int(cpu_slots or os.cpu_count() or 1)
+        self.memory_mb = default_memory_budget_mb() if memory_mb is None else (int(memory_mb) or None)
+        self.token = token
+        self.python_executable = python_executable
+        self.poll_interval = poll_interval
+        self.grace_seconds = grace_seconds
+        self.running = {} # リースID -> (ジョブ, CancellationToken, タスク)
+        self._stopping = False
+        self._stop_event = None
+
+    def stop(self):
+        self._stopping = True
+        if self._stop_event:
+            self._stop_event.set()
+
+    def free_resources(self):
+        used_cpu = sum(job["cpu_slots"] for job, _, _ in self.running.values())
+        used_memory = sum(job["memory_mb"] for job, _, _ in self.running.values())
+        return self.cpu_slots - used_cpu, None if self.memory_mb is None else self.memory_mb - used_memory
+
+    async def run(self):
+        """
+        stop() が呼ばれるまで、接続が切れても再接続しながらジョブを実行する。
+        """
+        self._stop_event = asyncio.Event()
+        delay = RECONNECT_DELAY_SECONDS
+        while not self._stopping:
+            try:
+                await self._session()
+                delay = RECONNECT_DELAY_SECONDS
+            except (ConnectionError, OSError, asyncio.IncompleteReadError) as e:
+                print(f"警告: コーディネーター {self.host}:{self.port} に接続できません: {e}", file=sys.stderr)
+            if self._stopping:
+                break
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+
+    async def _session(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_MESSAGE_BYTES)
+        connection = Connection(reader, writer)
+        tasks = []
+        try:
+            await connection.send({"type": "register", "worker_id": self.worker_id, "host": socket.gethostname(),
+                                   "cpu_slots": self.cpu_slots, "memory_mb": self.memory_mb, "token": self.token})
+            reply = await connection.receive()
+            if not reply or reply.get("type") != "registered":
+                message = reply.get("message") if reply else "接続が閉じられました"
+                raise ConnectionError(f"ワーカーの登録に失敗しました: {message}")
+            lease_seconds = float(reply["lease_seconds"])
+            print(f"コーディネーター {self.host}:{self.port} に接続しました (ワーカーID {self.worker_id}, CPU {self.cpu_slots}, メモリ {f'{self.memory_mb}MB' if self.memory_mb else '無制限'})。")
+
+            replies = asyncio.Queue()
+            tasks = [asyncio.ensure_future(self._receive_loop(connection, replies)),
+                     asyncio.ensure_future(self._request_loop(connection, replies)),
+                     asyncio.ensure_future(self._heartbeat_loop(connection, lease_seconds / 3)),
+                     asyncio.ensure_future(self._stop_event.wait())]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception():
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 接続が切れたジョブはコーディネーターが再投入するため、このワーカーでの実行は止める
+            for _, token, _ in self.running.values():
+                token.cancel("disconnected")
+            if self.running:
+                await asyncio.gather(*(task for _, _, task in self.running.values()), return_exceptions=True)
+            connection.close()
+
+    async def _receive_loop(self, connection, replies):
+        while True:
+            message = await connection.receive()
+            if message is None:
+                raise ConnectionError("コーディネーターとの接続が切れました")
+            kind = message.get("type")
+            if kind in ("job", "idle"):
+                await replies.put(message)
+            elif kind == "cancel" and message["lease"] in self.running:
+                print(f"ジョブ {message['job_id']} の停止を依頼されました。")
+                self.running[message["lease"]][1].cancel("cancelled")
+            elif kind == "error":
+                print(f"警告: コーディネーターでエラーが発生しました (ジョブ {message.get('job_id')}): {message.get('message')}", file=sys.stderr)
+
+    async def _request_loop(self, connection, replies):
+        while True:
+            free_cpu, free_memory = self.free_resources()
+            if free_cpu < 1:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await connection.send({"type": "request", "free_cpu_slots": free_cpu, "free_memory_mb": free_memory})
+            reply = await replies.get()
+            if reply["type"] == "idle":
+                await asyncio.sleep(self.poll_interval)
+                continue
+            job = reply["job"]
+            token = CancellationToken()
+            lease_id = reply["lease"]
+            task = asyncio.ensure_future(self._run_job(connection, job, lease_id, token))
+            self.running[lease_id] = (job, token, task)
+            task.add_done_callback(lambda _, lease_id=lease_id: self.running.pop(lease_id, None))
+
+    async def _heartbeat_loop(self, connection, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await connection.send({"type": "heartbeat", "leases": list(self.running)})
+
+    async def _run_job(self, connection, job, lease_id, token):
+        print(f"ジョブ {job['id']} ({job['agent']}) を開始しました。試行 {job['attempts']}")
+        metrics_path = os.path.join(tempfile.gettempdir(), f"yggdrasil_job_{job['id']}_{lease_id}.metrics.jsonl")
+        env = dict(os.environ, YGGDRASIL_JOB_ID=str(job["id"]), **{METRICS_FILE_ENV: metrics_path})
+        env.setdefault("OMP_NUM_THREADS", str(job["cpu_slots"]))
+        step = ProcessStep(f"job-{job['id']}", build_command(job, self.python_executable), env=env, cwd=PROJECT_ROOT)
+        base = {"job_id": job["id"], "lease": lease_id}
+
+        async def on_line(step, stream_name, line):
+            # 送信が終わるまで待つため、コーディネーターへの送信が遅いと process_runner のキューを通じて子プロセスの出力も待たされる
+            await connection.send({"type": "log", **base, "stream": stream_name, "line": line})
+
+        metrics_done = asyncio.Event()
+        metrics_task = asyncio.ensure_future(self._stream_metrics(connection, base, metrics_path, metrics_done))
+        try:
+            [result] = await stream_processes([step], on_line=on_line, token=token, grace_seconds=self.grace_seconds)
+            metrics_done.set()
+            await metrics_task
+            if token.cancelled and token.reason == "disconnected":
+                return
+            if result.status == "ok":
+                await self._send_artifacts(connection, job, base)
+            await connection.send({"type": "result", **base, "returncode": result.returncode, "usage": result.usage})
+            print(f"ジョブ {job['id']} が終了しました: {result.status} (リターンコード {result.returncode})")
+        except (ConnectionError, OSError) as e:
+            print(f"警告: ジョブ {job['id']} の結果を送れませんでした: {e}", file=sys.stderr)
+        finally:
+            metrics_task.cancel()
+            if os.path.exists(metrics_path):
+                os.remove(metrics_path)
+
+    async def _stream_metrics(self, connection, base, metrics_path, done):
+        offset = 0
+        while True:
+            finished = done.is_set()
+            for entry, offset in iter_entries(metrics_path, offset):
+                await connection.send({"type": "metrics", **base, "entry": entry})
+            if finished:
+                return
+            try:
+                await asyncio.wait_for(done.wait(), METRICS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send_artifacts(self, connection, job, base):
+        for path in job_artifacts(job):
+            source = path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+            if not os.path.exists(source):
+                await connection.send({"type": "log", **base, "stream": "stderr", "line": f"警告: アーティファクトが見つかりません: {source}\n"})
+                continue
+            if os.path.isdir(source):
+                files = [os.path.join(root, name) for root, _, names in os.walk(source) for name in names]
+                names = [os.path.join(os.path.basename(source), os.path.relpath(file, source)) for file in files]
+            else:
+                files, names = [source], [os.path.basename(source)]
+            for file, name in zip(files, names):
+                digest, offset = hashlib.sha256(), 0
+                with open(file, "rb") as f:
+                    while True:
+                        chunk = f.read(ARTIFACT_CHUNK_BYTES)
+                        digest.update(chunk)
+                        final = len(chunk) < ARTIFACT_CHUNK_BYTES
+                        message = {"type": "artifact", **base, "path": name, "offset": offset,
+                                   "data": base64.b64encode(chunk).decode("ascii"), "final": final}
+                        if final:
+                            message["sha256"] = digest.hexdigest()
+                        await connection.send(message)
+                        offset += len(chunk)
+                        if final:
+                            break
+
+def run_until_signalled(component, coroutine):
+    """
+    コーディネーターまたはワーカーを、SIGTERM/SIGINT/SIGHUP を受け取るまで実行する。
+    """
+    async def main():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT, getattr(signal, "SIGHUP", None)):
+            if signum is not None:
+                loop.add_signal_handler(signum, component.stop)
+        await coroutine
+
+    asyncio.run(main())
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    """
+    "host:port" または "host" を (host, port) にする。
+    """
+    host, separator, port = address.rpartition(":")
+    if not separator:
+        return address, default_port
+    return host, int(port)
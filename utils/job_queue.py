@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Durable SQLite job queue and local scheduler daemon (CPU slots, memory budget, priorities, retries)
+
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows ではスケジューラの多重起動を防ぐロックなし
+    fcntl = None
+
+try:
+    from process_runner import process_exited, terminate_processes
+    from resource_monitor import ResourceMonitor
+except ImportError: # yggdrasil.py から utils パッケージとしてインポートされた場合
+    from utils.process_runner import process_exited, terminate_processes
+    from utils.resource_monitor import ResourceMonitor
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DB_PATH = os.path.join(PROJECT_ROOT, "data", "jobs", "job_queue.sqlite")
+DEFAULT_LOG_DIR = os.path.join(PROJECT_ROOT, "logs", "jobs")
+YGGDRASIL_MAIN_SCRIPT = os.path.join(PROJECT_ROOT, "yggdrasil.py")
+
+# ジョブの状態
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+DEFAULT_POLL_INTERVAL_SECONDS = 1.0
+# リトライまでの待ち時間は retry_backoff_seconds * 2^(試行回数 - 1) (上限 MAX_RETRY_BACKOFF_SECONDS)
+DEFAULT_RETRY_BACKOFF_SECONDS = 30.0
+MAX_RETRY_BACKOFF_SECONDS = 3600.0
+# memory_budget_mb を省略した場合に、ジョブに割り当てる物理メモリの割合
+MEMORY_BUDGET_FRACTION = 0.8
+# ジョブのキャンセル・スケジューラの停止時に SIGTERM から SIGKILL までの猶予 (秒)
+TERMINATE_GRACE_SECONDS = 10.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agent TEXT NOT NULL,
+    agent_args TEXT NOT NULL,
+    framework_args TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    cpu_slots INTEGER NOT NULL DEFAULT 1,
+    memory_mb INTEGER NOT NULL DEFAULT 0,
+    max_retries INTEGER NOT NULL DEFAULT 0,
+    retry_backoff_seconds REAL NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    pid INTEGER,
+    returncode INTEGER,
+    log_path TEXT,
+    usage TEXT,
+    message TEXT,
+    worker TEXT,
+    artifacts TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority DESC, id);
+"""
+
+# 後から追加した列 (既存のデータベースには ALTER TABLE で追加する)
+ADDED_COLUMNS = {
+    "worker": "TEXT", # ジョブを実行したワーカー (job_cluster のコーディネーター経由の場合)
+    "artifacts": "TEXT" # 実行後にワーカーから回収するファイル (JSONのリスト)
+}
+
+def default_memory_budget_mb():
+    """
+    物理メモリの MEMORY_BUDGET_FRACTION を MB で返す。/proc/meminfo が読めない場合は None (無制限)。
+    """
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(int(line.split()[1]) / 1024 * MEMORY_BUDGET_FRACTION)
+    except OSError:
+        pass
+    return None
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["agent_args"] = json.loads(job["agent_args"])
+    job["framework_args"] = json.loads(job["framework_args"])
+    job["usage"] = json.loads(job["usage"]) if job["usage"] else None
+    job["artifacts"] = json.loads(job["artifacts"]) if job["artifacts"] else []
+    return job
+
+class JobQueue:
+    """
+    エージェント実行ジョブの永続キュー (SQLite)。submit/status/cancel を行うプロセスと
+    スケジューラが同じデータベースを共有し、状態の変更はすべてトランザクション内で行う。
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # トランザクションは _transaction で明示的に開始する
+        self.connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+        for name, definition in ADDED_COLUMNS.items():
+            if name not in columns:
+                self.connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {definition}")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _transaction(self):
+        # 読み取りから更新までの間に他のプロセスが同じジョブを変更しないよう、最初に書き込みロックを取る
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def submit(self, agent, agent_args=(), framework_args=(), priority=0, cpu_slots=1, memory_mb=0, max_retries=0,
+               retry_backoff_seconds=DEFAULT_RETRY_BACKOFF_SECONDS, artifacts=()):
+        """
+        ジョブをキューに追加し、ジョブIDを返す。priority が大きいジョブほど先に実行される。
+        artifacts には、リモートのワーカーで実行した場合に回収するファイルを指定する。
+        """
+        if int(cpu_slots) < 1:
+            raise ValueError("cpu_slots は1以上を指定してください。")
+        if int(memory_mb) < 0 or int(max_retries) < 0 or float(retry_backoff_seconds) < 0:
+            raise ValueError("memory_mb, max_retries, retry_backoff_seconds は0以上を指定してください。")
+        with self._transaction():
+            cursor = self.connection.execute(
+                "INSERT INTO jobs (agent, agent_args, framework_args, priority, cpu_slots, memory_mb, max_retries,"
+                " retry_backoff_seconds, status, submitted_at, artifacts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (agent, json.dumps(list(agent_args), ensure_ascii=False), json.dumps(list(framework_args), ensure_ascii=False),
+                 int(priority), int(cpu_slots), int(memory_mb), int(max_retries), float(retry_backoff_seconds), QUEUED, time.time(),
+                 json.dumps(list(artifacts), ensure_ascii=False))
+            )
+        return cursor.lastrowid
+
+    def get(self, job_id):
+        return _row_to_job(self.connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list_jobs(self, statuses=None, limit=None):
+        """
+        ジョブを新しい順に返す。statuses を指定するとその状態のジョブだけを返す。
+        """
+        query, params = "SELECT * FROM jobs", []
+        if statuses:
+            query += f" WHERE status IN ({','.join('?' * len(statuses))})"
+            params.extend(statuses)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [_row_to_job(row) for row in self.connection.execute(query, params)]
+
+    def cancel(self, job_id):
+        """
+        待機中のジョブはすぐにキャンセルし、実行中のジョブはスケジューラに停止を依頼する。
+        変更後の状態 ("cancelled" または "cancelling") を返す。ジョブが存在しないか終了済みの場合は None。
+        """
+        with self._transaction():
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATES:
+                return None
+            if job["status"] == QUEUED:
+                self.connection.execute("UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ?",
+                                        (CANCELLED, time.time(), "実行前にキャンセルされました", job_id))
+                return CANCELLED
+            self.connection.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return "cancelling"
+
+    def claim_next(self, free_cpu_slots, free_memory_mb, total_cpu_slots, total_memory_mb, fail_oversized=True):
+        """
+        優先度が最も高い (同じ優先度では投入の早い) 実行可能なジョブを実行中にして返す。
+        そのジョブに必要な資源が空いていない場合は None を返し、資源が空くまで後続のジョブも実行しない
+        (小さいジョブが先に資源を使い続けて、大きいジョブがいつまでも実行されない状態を防ぐ)。
+        資源の総量を超えるジョブは、fail_oversized=True (総量が固定のスケジューラ) の場合は失敗にし、
+        False (接続中のワーカーによって総量が変わるコーディネーター) の場合は待機中のまま飛ばす。メモリの値が None の場合は無制限。
+        """
+        with self._transaction():
+            rows = self.connection.execute(
+                "SELECT * FROM jobs WHERE status = ? AND not_before <= ? ORDER BY priority DESC, id",
+                (QUEUED, time.time())
+            ).fetchall()
+            for row in rows:
+                job = _row_to_job(row)
+                if job["cpu_slots"] > total_cpu_slots or (total_memory_mb is not None and job["memory_mb"] > total_memory_mb):
+                    if fail_oversized:
+                        self.connection.execute(
+                            "UPDATE jobs SET status = ?, finished_at = ?, message = ? WHERE id = ?",
+                            (FAILED, time.time(), f"スケジューラの資源 (CPU {total_cpu_slots} スロット, メモリ {total_memory_mb}MB) を超えるため実行できません", job["id"])
+                        )
+                    continue
+                if job["cpu_slots"] > free_cpu_slots or (free_memory_mb is not None and job["memory_mb"] > free_memory_mb):
+                    return None
+                self.connection.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, finished_at = NULL, pid = NULL,"
+                    " returncode = NULL, message = NULL WHERE id = ?",
+                    (RUNNING, time.time(), job["id"])
+                )
+                return self.get(job["id"])
+        return None
+
+    def mark_started(self, job_id, pid, log_path, worker=None):
+        with self._transaction():
+            self.connection.execute("UPDATE jobs SET pid = ?, log_path = ?, worker = ? WHERE id = ?", (pid, log_path, worker, job_id))
+
+    def finish(self, job_id, returncode, usage=None, message=None):
+        """
+        実行が終わったジョブの状態を更新し、新しい状態を返す。失敗したジョブは max_retries まで
+        指数バックオフで再投入する。キャンセルを依頼されていたジョブはキャンセル済みにする。
+        """
+        with self._transaction():
+            job = self.get(job_id)
+            now = time.time()
+            not_before = job["not_before"]
+            if job["cancel_requested"]:
+                status, message = CANCELLED, message or "実行中にキャンセルされました"
+            elif returncode == 0:
+                status = SUCCEEDED
+            elif job["attempts"] <= job["max_retries"]:
+                status = QUEUED
+                delay = min(job["retry_backoff_seconds"] * 2 ** (job["attempts"] - 1), MAX_RETRY_BACKOFF_SECONDS)
+                not_before = now + delay
+                message = f"リターンコード {returncode} で失敗しました。{delay:.0f}秒後にリトライします ({job['attempts']}/{job['max_retries']})"
+            else:
+                status = FAILED
+                message = message or f"リターンコード {returncode} で失敗しました"
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, returncode = ?, finished_at = ?, not_before = ?, pid = NULL,"
+                " usage = COALESCE(?, usage), message = ? WHERE id = ?",
+                (status, returncode, None if status == QUEUED else now, not_before,
+                 json.dumps(usage) if usage is not None else None, message, job_id)
+            )
+        return status
+
+    def requeue(self, job_id, message):
+        """
+        実行中のジョブを、試行回数を数えずに待機中に戻す (スケジューラの停止・異常終了時)。
+        """
+        with self._transaction():
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, attempts = MAX(attempts - 1, 0), pid = NULL, message = ? WHERE id = ? AND status = ?",
+                (QUEUED, message, job_id, RUNNING)
+            )
+
+    def cancel_requested_ids(self):
+        return {row[0] for row in self.connection.execute("SELECT id FROM jobs WHERE status = ? AND cancel_requested = 1", (RUNNING,))}
+
+def _is_job_process(pid, job_id):
+    """
+    pid がこのジョブのために起動したプロセスか確認する (PIDが再利用されている場合に誤って停止しないため)。
+    """
+    try:
+        with open(f"/proc/{pid}/environ", "rb") as f:
+            return f"YGGDRASIL_JOB_ID={job_id}".encode() in f.read().split(b"\0")
+    except OSError:
+        return False
+
+def _kill_orphaned_group(pid, grace_seconds):
+    try:
+        os.killpg(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        return
+    end = time.monotonic() + grace_seconds
+    while time.monotonic() < end:
+        try:
+            os.killpg(pid, 0)
+        except (ProcessLookupError, PermissionError):
+            return
+        time.sleep(0.1)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def lock_queue(queue):
+    """
+    キューのロックファイルに排他ロックを取り、開いたファイルを返す (閉じるまで保持される)。
+    ほかのスケジューラまたはコーディネーターがロックを持っている場合は None。
+    """
+    lock_file = open(f"{queue.db_path}.lock", "w")
+    if fcntl is None:
+        return lock_file
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+    except OSError:
+        lock_file.close()
+        return None
+
+def build_command(job, python_executable=None):
+    """
+    ジョブを実行するコマンド (`yggdrasil.py <framework_args> <agent> <agent_args>`)。
+    """
+    return [python_executable or sys.executable, YGGDRASIL_MAIN_SCRIPT, *job["framework_args"], job["agent"], *job["agent_args"]]
+
+class Scheduler:
+    """
+    キューからジョブを取り出し、CPUスロットとメモリの予算の範囲内で並行して実行するデーモン。
+    各ジョブは `yggdrasil.py <agent>` を新しいプロセスグループで実行し、出力を <log_dir>/<id>.log に書き出す。
+    CPUスロットの数は OMP_NUM_THREADS としてジョブに渡す (未設定の場合)。
+    """
+
+    def __init__(self, queue, cpu_slots=None, memory_budget_mb=None, log_dir=DEFAULT_LOG_DIR,
+                 poll_interval=DEFAULT_POLL_INTERVAL_SECONDS, python_executable=None, grace_seconds=TERMINATE_GRACE_SECONDS):
+        self.queue = queue
+        self.cpu_slots = int(cpu_slots or os.cpu_count() or 1)
+        self.memory_budget_mb = default_memory_budget_mb() if memory_budget_mb is None else (int(memory_budget_mb) or None)
+        self.log_dir = log_dir
+        self.poll_interval = poll_interval
+        self.python_executable = python_executable or sys.executable
+        self.grace_seconds = grace_seconds
+        self.running = {} # ジョブID -> (ジョブ, Popen, ResourceMonitor, ログファイル)
+        self._stop_requested = False
+        self._lock_file = None
+
+    def acquire_lock(self):
+        """
+        同じキューに対してスケジューラが1つだけ動くようにロックを取る。取れなければ False。
+        """
+        self._lock_file = lock_queue(self.queue)
+        return self._lock_file is not None
+
+    def free_resources(self):
+        used_cpu = sum(job["cpu_slots"] for job, _, _, _ in self.running.values())
+        used_memory = sum(job["memory_mb"] for job, _, _, _ in self.running.values())
+        free_memory = None if self.memory_budget_mb is None else self.memory_budget_mb - used_memory
+        return self.cpu_slots - used_cpu, free_memory
+
+    def recover(self):
+        """
+        前回のスケジューラが停止処理をせずに終了していた場合、残っているジョブのプロセスグループを停止して待機中に戻す。
+        """
+        for job in self.queue.list_jobs([RUNNING]):
+            if job["pid"] and _is_job_process(job["pid"], job["id"]):
+                _kill_orphaned_group(job["pid"], self.grace_seconds)
+            if job["cancel_requested"]:
+                self.queue.finish(job["id"], None)
+                continue
+            self.queue.requeue(job["id"], "スケジューラの再起動により再投入されました")
+            print(f"ジョブ {job['id']} ({job['agent']}) を再投入しました (前回のスケジューラが停止処理をせずに終了していました)。")
+
+    def launch(self, job):
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = os.path.join(self.log_dir, f"{job['id']}.log")
+        command = build_command(job, self.python_executable)
+        env = dict(os.environ, YGGDRASIL_JOB_ID=str(job["id"]))
+        env.setdefault("OMP_NUM_THREADS", str(job["cpu_slots"]))
+        # リトライの出力も同じファイルに追記する
+        log_file = open(log_path, "a", encoding="utf-8")
+        log_file.write(f"=== ジョブ {job['id']} 試行 {job['attempts']}: {' '.join(command)} ===\n")
+        log_file.flush()
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                                       env=env, cwd=PROJECT_ROOT, start_new_session=True)
+        except OSError as e:
+            log_file.close()
+            self.queue.finish(job["id"], -1, message=f"起動に失敗しました: {e}")
+            return
+        self.queue.mark_started(job["id"], process.pid, log_path)
+        self.running[job["id"]] = (job, process, ResourceMonitor(process.pid).start(), log_file)
+        print(f"ジョブ {job['id']} ({job['agent']}, 優先度 {job['priority']}, CPU {job['cpu_slots']}, メモリ {job['memory_mb']}MB) を開始しました。試行 {job['attempts']}")
+
+    def reap(self):
+        for job_id, (job, process, monitor, log_file) in list(self.running.items()):
+            if not process_exited(process):
+                continue
+            usage = monitor.stop()
+            process.wait()
+            log_file.close()
+            del self.running[job_id]
+            status = self.queue.finish(job_id, process.returncode, usage)
+            print(f"ジョブ {job_id} ({job['agent']}) が終了しました: {status} (リターンコード {process.returncode})")
+
+    def handle_cancellations(self):
+        cancelled = [job_id for job_id in self.queue.cancel_requested_ids() if job_id in self.running]
+        if cancelled:
+            print(f"ジョブ {', '.join(map(str, cancelled))} を停止します (キャンセル)。")
+            terminate_processes([self.running[job_id][1] for job_id in cancelled], self.grace_seconds)
+
+    def run_once(self):
+        """
+        終了したジョブの回収・キャンセルの処理・新しいジョブの開始を1回行う。
+        """
+        self.reap()
+        self.handle_cancellations()
+        self.reap()
+        while not self._stop_requested:
+            free_cpu, free_memory = self.free_resources()
+            job = self.queue.claim_next(free_cpu, free_memory, self.cpu_slots, self.memory_budget_mb)
+            if job is None:
+                break
+            self.launch(job)
+
+    def _request_stop(self, signum, frame):
+        self._stop_requested = True
+
+    def run_forever(self, drain=False):
+        """
+        SIGTERM/SIGINT/SIGHUP を受け取るまでジョブを実行し続ける。drain=True の場合は、
+        待機中・実行中のジョブがなくなった時点で終了する。停止時に実行中のジョブは停止して待機中に戻す。
+        """
+        for signum in (signal.SIGTERM, signal.SIGINT, getattr(signal, "SIGHUP", None)):
+            if signum is not None:
+                signal.signal(signum, self._request_stop)
+        self.recover()
+        print(f"スケジューラを開始しました: CPU {self.cpu_slots} スロット, メモリ予算 {self.memory_budget_mb or '無制限'}MB, キュー {self.queue.db_path}")
+        try:
+            while not self._stop_requested:
+                self.run_once()
+                if drain and not self.running and not self.queue.list_jobs([QUEUED, RUNNING], limit=1):
+                    break
+                time.sleep(self.poll_interval)
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self.running:
+            print(f"実行中のジョブ {', '.join(map(str, self.running))} を停止して再投入します。")
+            terminate_processes([process for _, process, _, _ in self.running.values()], self.grace_seconds)
+            cancel_requested = self.queue.cancel_requested_ids()
+            for job_id, (job, process, monitor, log_file) in self.running.items():
+                usage = monitor.stop()
+                process.wait()
+                log_file.close()
+                if job_id in cancel_requested:
+                    self.queue.finish(job_id, process.returncode, usage)
+                else:
+                    self.queue.requeue(job_id, "スケジューラの停止により再投入されました")
+            self.running = {}
+        print("スケジューラを停止しました。")
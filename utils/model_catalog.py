@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Indexed SQLite model catalog (names, tags, metrics, paging/search, artifact and evaluation links, models.json migration)
+
+import json
+import math
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 保存先は環境変数 YGGDRASIL_MODEL_CATALOG で変更できる
+MODEL_CATALOG_ENV = "YGGDRASIL_MODEL_CATALOG"
+DEFAULT_CATALOG_PATH = os.path.join(PROJECT_ROOT, "data", "models.sqlite")
+
+DEFAULT_PAGE_SIZE = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    comment TEXT NOT NULL DEFAULT '',
+    path TEXT,
+    digest TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_by_digest ON models (digest);
+CREATE TABLE IF NOT EXISTS model_tags (
+    tag TEXT NOT NULL,
+    model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+    PRIMARY KEY (tag, model_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS model_tags_by_model ON model_tags (model_id);
+CREATE TABLE IF NOT EXISTS model_metrics (
+    model_id INTEGER NOT NULL REFERENCES models (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (model_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS model_metrics_by_value ON model_metrics (name, value);
+CREATE TABLE IF NOT EXISTS migrations (
+    source TEXT PRIMARY KEY,
+    models INTEGER NOT NULL,
+    migrated_at REAL NOT NULL
+);
+"""
+
+def default_catalog_path():
+    return os.environ.get(MODEL_CATALOG_ENV) or DEFAULT_CATALOG_PATH
+
+def _numeric_metrics(metrics):
+    # 検索・並べ替えに使える数値の指標だけを残す (bool と NaN は除く)
+    return {str(key): float(value) for key, value in (metrics or {}).items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and not math.isnan(value)}
+
+def _normalize_tags(tags):
+    return sorted({tag.strip() for tag in tags or () if tag and tag.strip()})
+
+class ModelCatalog:
+    """
+    モデルの一覧 (名前, コメント, タグ, 指標, 成果物のハッシュ) を SQLite に記録するカタログ。
+    名前・タグ・指標には索引があり、検索とページングはデータベース側で行う。更新は1件ずつのトランザクションで
+    原子的に行うため、複数のエージェントが同時に更新しても他の更新を上書きしない。
+    モデルファイルの内容と評価結果は成果物レジストリ (artifact_registry) のハッシュで参照する。
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or default_catalog_path())
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # トランザクションは _transaction で明示的に開始する
+        self.connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @contextmanager
+    def _transaction(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def _model_id(self, name):
+        row = self.connection.execute("SELECT id FROM models WHERE name = ?", (name,)).fetchone()
+        return row["id"] if row else None
+
+    def _set_tags(self, model_id, tags):
+        self.connection.execute("DELETE FROM model_tags WHERE model_id = ?", (model_id,))
+        self.connection.executemany("INSERT INTO model_tags (tag, model_id) VALUES (?, ?)", [(tag, model_id) for tag in _normalize_tags(tags)])
+
+    def _merge_metrics(self, model_id, metrics):
+        self.connection.executemany("INSERT OR REPLACE INTO model_metrics (model_id, name, value) VALUES (?, ?, ?)",
+                                    [(model_id, key, value) for key, value in _numeric_metrics(metrics).items()])
+
+    def _upsert(self, name, comment, path, digest, tags, metrics, replace):
+        now = time.time()
+        model_id = self._model_id(name)
+        if model_id is None:
+            model_id = self.connection.execute(
+                "INSERT INTO models (name, comment, path, digest, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (name, comment or "", path, digest, now, now)
+            ).lastrowid
+        elif not replace:
+            raise ValueError(f"モデル '{name}' は既にカタログにあります。")
+        else:
+            self.connection.execute("UPDATE models SET comment = ?, path = COALESCE(?, path), digest = COALESCE(?, digest), updated_at = ? WHERE id = ?",
+                                    (comment or "", path, digest, now, model_id))
+        self._set_tags(model_id, tags)
+        self._merge_metrics(model_id, metrics)
+        return model_id
+
+    def add(self, name, comment="", path=None, digest=None, tags=(), metrics=None):
+        """
+        モデルを追加する。同じ名前のモデルがあれば ValueError。
+        """
+        with self._transaction():
+            self._upsert(name, comment, os.path.abspath(path) if path else None, digest, tags, metrics, replace=False)
+        return self.get(name)
+
+    def update(self, name, comment=None, path=None, digest=None, tags=None, add_tags=(), remove_tags=(), metrics=None):
+        """
+        指定した項目だけを更新する (tags は置き換え、add_tags/remove_tags は追加・削除、metrics は追加・上書き)。
+        モデルが見つからなければ None を返す。
+        """
+        with self._transaction():
+            model_id = self._model_id(name)
+            if model_id is None:
+                return None
+            fields, params = ["updated_at = ?"], [time.time()]
+            for column, value in (("comment", comment), ("path", os.path.abspath(path) if path else None), ("digest", digest)):
+                if value is not None:
+                    fields.append(f"{column} = ?")
+                    params.append(value)
+            self.connection.execute(f"UPDATE models SET {', '.join(fields)} WHERE id = ?", (*params, model_id))
+            if tags is not None:
+                self._set_tags(model_id, tags)
+            self.connection.executemany("INSERT OR IGNORE INTO model_tags (tag, model_id) VALUES (?, ?)", [(tag, model_id) for tag in _normalize_tags(add_tags)])
+            self.connection.executemany("DELETE FROM model_tags WHERE tag = ? AND model_id = ?", [(tag, model_id) for tag in _normalize_tags(remove_tags)])
+            self._merge_metrics(model_id, metrics)
+        return self.get(name)
+
+    def remove(self, name):
+        """
+        モデルをカタログから削除する (成果物レジストリの成果物は残す)。削除したら True。
+        """
+        with self._transaction():
+            return self.connection.execute("DELETE FROM models WHERE name = ?", (name,)).rowcount > 0
+
+    def _attach_details(self, rows):
+        models = [dict(row) for row in rows]
+        if not models:
+            return models
+        by_id = {model["id"]: model for model in models}
+        for model in models:
+            model.update({"tags": [], "metrics": {}})
+        placeholders = ", ".join("?" * len(by_id))
+        for row in self.connection.execute(f"SELECT model_id, tag FROM model_tags WHERE model_id IN ({placeholders}) ORDER BY tag", tuple(by_id)):
+            by_id[row["model_id"]]["tags"].append(row["tag"])
+        for row in self.connection.execute(f"SELECT model_id, name, value FROM model_metrics WHERE model_id IN ({placeholders}) ORDER BY name", tuple(by_id)):
+            by_id[row["model_id"]]["metrics"][row["name"]] = row["value"]
+        return models
+
+    def get(self, name):
+        """
+        名前でモデル (タグと指標を含む辞書) を返す。見つからなければ None。
+        """
+        models = self._attach_details(self.connection.execute("SELECT * FROM models WHERE name = ?", (name,)).fetchall())
+        return models[0] if models else None
+
+    def search(self, text=None, tags=(), metric=None, min_value=None, max_value=None, sort_by=None, descending=True,
+               page=1, page_size=DEFAULT_PAGE_SIZE):
+        """
+        条件に合うモデルの1ページ分のリストと、条件に合うモデルの総数を返す。
+        text は名前またはコメントの部分一致、tags はすべてのタグを持つモデル、metric/min_value/max_value は
+        指標の範囲で絞り込む。sort_by に指標の名前を指定すると、その指標を持つモデルを値の順に返す
+        (省略時は追加した順)。
+        """
+        conditions, params = [], []
+        if text:
+            conditions.append("(m.name LIKE ? ESCAPE '\\' OR m.comment LIKE ? ESCAPE '\\')")
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params += [pattern, pattern]
+        for tag in _normalize_tags(tags):
+            conditions.append("EXISTS (SELECT 1 FROM model_tags t WHERE t.tag = ? AND t.model_id = m.id)")
+            params.append(tag)
+        if metric and (min_value is not None or max_value is not None):
+            bounds = ["f.name = ?"]
+            params_bounds = [metric]
+            if min_value is not None:
+                bounds.append("f.value >= ?")
+                params_bounds.append(float(min_value))
+            if max_value is not None:
+                bounds.append("f.value <= ?")
+                params_bounds.append(float(max_value))
+            conditions.append(f"EXISTS (SELECT 1 FROM model_metrics f WHERE f.model_id = m.id AND {' AND '.join(bounds)})")
+            params += params_bounds
+        if sort_by:
+            # 並べ替えは model_metrics の (name, value) の索引を使う
+            source = "model_metrics s JOIN models m ON m.id = s.model_id"
+            conditions.insert(0, "s.name = ?")
+            params.insert(0, sort_by)
+            order = f"s.value {'DESC' if descending else 'ASC'}, m.id"
+        else:
+            source = "models m"
+            order = f"m.id {'DESC' if descending else 'ASC'}"
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        total = self.connection.execute(f"SELECT COUNT(*) FROM {source}{where}", params).fetchone()[0]
+        page_size = max(1, int(page_size))
+        rows = self.connection.execute(f"SELECT m.* FROM {source}{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                                       (*params, page_size, (max(1, int(page)) - 1) * page_size)).fetchall()
+        return self._attach_details(rows), total
+
+    def tag_counts(self):
+        """
+        タグごとのモデル数を返す。
+        """
+        return {row["tag"]: row["count"] for row in self.connection.execute("SELECT tag, COUNT(*) AS count FROM model_tags GROUP BY tag ORDER BY tag")}
+
+    def sync_from_registry(self, registry, names=None):
+        """
+        成果物レジストリに記録された学習時の指標と評価結果 (評価者ごとに最新のもの) をカタログの指標に反映する。
+        同じ名前の指標は評価結果を優先する。更新したモデルの数を返す。
+        """
+        query, params = "SELECT id, digest FROM models WHERE digest IS NOT NULL", []
+        if names:
+            query += f" AND name IN ({', '.join('?' * len(names))})"
+            params = list(names)
+        updated = 0
+        for row in self.connection.execute(query, params).fetchall():
+            artifact = registry.lookup(row["digest"])
+            if artifact is None:
+                continue
+            metrics = {}
+            for manifest in artifact["manifests"]:
+                metrics.update(manifest["metrics"] or {})
+            for evaluation in artifact["evaluations"]:
+                metrics.update(evaluation["metrics"] or {})
+            if not _numeric_metrics(metrics):
+                continue
+            with self._transaction():
+                self._merge_metrics(row["id"], metrics)
+                self.connection.execute("UPDATE models SET updated_at = ? WHERE id = ?", (time.time(), row["id"]))
+            updated += 1
+        return updated
+
+    def migrate_json(self, json_path):
+        """
+        旧形式の models.json (name, comment の辞書のリスト) を1回のトランザクションで取り込む。
+        同じファイルは一度だけ取り込み、元のファイルはそのまま残す。取り込んだモデルの数を返す (取り込み済みなら None)。
+        """
+        json_path = os.path.abspath(json_path)
+        if not os.path.exists(json_path):
+            return None
+        if self.connection.execute("SELECT 1 FROM migrations WHERE source = ?", (json_path,)).fetchone():
+            return None
+        with open(json_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        with self._transaction():
+            # 別のプロセスが先に取り込んでいないかをロックを取ってから確認する
+            if self.connection.execute("SELECT 1 FROM migrations WHERE source = ?", (json_path,)).fetchone():
+                return None
+            count = 0
+            for entry in entries:
+                if not isinstance(entry, dict) or not entry.get("name"):
+                    continue
+                # 旧形式では同じ名前が重複しうるため、後のエントリで上書きする
+                self._upsert(str(entry["name"]), entry.get("comment", ""), entry.get("path"), entry.get("digest"),
+                             entry.get("tags", ()), entry.get("metrics"), replace=True)
+                count += 1
+            self.connection.execute("INSERT INTO migrations (source, models, migrated_at) VALUES (?, ?, ?)", (json_path, count, time.time()))
+        return count
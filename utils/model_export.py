@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# DESCRIPTION: TFLite export with post-training quantization (dynamic range / calibrated int8), TFLite inference and latency measurement
+
+import os
+import shutil
+import sys
+import time
+import warnings
+
+import numpy as np
+
+try:
+    from tabular_data import iter_batches, load_preprocessing_bundle, preprocessing_bundle_path
+except ImportError: # utils パッケージとしてインポートされた場合
+    from utils.tabular_data import iter_batches, load_preprocessing_bundle, preprocessing_bundle_path
+
+# float32: 量子化なし, dynamic: 重みだけを int8 にする (校正データ不要),
+# int8: 校正データで活性化の範囲を求め、重みと活性化を int8 にする (入出力は float32 のまま)
+QUANTIZATION_MODES = ("float32", "dynamic", "int8")
+TFLITE_SUFFIX = ".tflite"
+DEFAULT_CALIBRATION_SAMPLES = 200
+
+def is_tflite_path(path):
+    return str(path).endswith(TFLITE_SUFFIX)
+
+def default_export_path(model_path, quantization):
+    """
+    エクスポート先の既定のパス (例: trained_models/model.keras -> trained_models/model.int8.tflite)。
+    """
+    return f"{os.path.splitext(model_path)[0]}.{quantization}{TFLITE_SUFFIX}"
+
+def _interpreter_class():
+    try:
+        # LiteRT (tf.lite.Interpreter の後継) がインストールされていればそれを使う
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+class TFLiteModel:
+    """
+    TFLite のモデルを Keras のモデルと同じように predict/predict_on_batch/evaluate で使えるようにするラッパー。
+    入力はモデルの入力の形に合わせて変形し (例: (N, 28, 28, 1) -> (N, 28, 28))、バッチサイズが変わると
+    入力テンソルの大きさを変更する。量子化された入出力は自動的に変換する。
+    """
+
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        with warnings.catch_warnings():
+            # tf.lite.Interpreter の非推奨の警告は推論ごとに表示しない
+            warnings.simplefilter("ignore", UserWarning)
+            self.interpreter = _interpreter_class()(model_path=path, num_threads=num_threads or None)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+        self.input_shape = (None, *self._input["shape_signature"][1:])
+        self.output_shape = (None, *self._output["shape_signature"][1:])
+
+    def _refresh_details(self):
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+
+    def _prepare_input(self, x):
+        x = np.asarray(x)
+        x = x.reshape((len(x), *self._input["shape"][1:]))
+        if len(x) != self._input["shape"][0]:
+            self.interpreter.resize_tensor_input(self._input["index"], [len(x), *self._input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self._refresh_details()
+        dtype = self._input["dtype"]
+        scale, zero_point = self._input["quantization"]
+        if np.issubdtype(dtype, np.integer) and scale:
+            info = np.iinfo(dtype)
+            return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(dtype)
+        return x.astype(dtype, copy=False)
+
+    def predict_on_batch(self, x):
+        self.interpreter.set_tensor(self._input["index"], self._prepare_input(x))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output["index"])
+        scale, zero_point = self._output["quantization"]
+        if np.issubdtype(output.dtype, np.integer) and scale:
+            return (output.astype(np.float32) - zero_point) * scale
+        return output.copy()
+
+    def predict(self, x, batch_size=32, verbose=0):
+        x = np.asarray(x)
+        if not len(x):
+            return np.empty((0, *self.output_shape[1:]), dtype=np.float32)
+        return np.concatenate([self.predict_on_batch(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+    def evaluate(self, x, y, batch_size=256, verbose=0):
+        """
+        Keras の model.evaluate と同じ [loss, accuracy] を返す (y は one-hot 形式、損失はカテゴリカル交差エントロピー)。
+        """
+        probabilities = self.predict(x, batch_size=batch_size)
+        y = np.asarray(y)
+        clipped = np.clip(probabilities / np.sum(probabilities, axis=-1, keepdims=True), 1e-7, 1.0 - 1e-7)
+        loss = float(-np.mean(np.sum(y * np.log(clipped), axis=-1)))
+        accuracy = float(np.mean(np.argmax(probabilities, axis=-1) == np.argmax(y, axis=-1)))
+        return [loss, accuracy]
+
+def load_inference_model(model_path, num_threads=None):
+    """
+    推論用にモデルを読み込む。.tflite は TFLiteModel、それ以外は Keras のモデルとして読み込む。
+    """
+    if is_tflite_path(model_path):
+        return TFLiteModel(model_path, num_threads)
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
+
+def single_request_latency_ms(model, x, requests=50, warmup=5):
+    """
+    1件ずつの推論 (predict_on_batch) の所要時間の中央値をミリ秒で返す。
+    """
+    samples = np.asarray(x[:max(1, min(len(x), requests))])
+    for i in range(warmup):
+        model.predict_on_batch(samples[i % len(samples):i % len(samples) + 1])
+    timings = []
+    for i in range(requests):
+        sample = samples[i % len(samples):i % len(samples) + 1]
+        start_time = time.perf_counter()
+        model.predict_on_batch(sample)
+        timings.append(time.perf_counter() - start_time)
+    return float(np.median(timings) * 1000)
+
+def load_calibration_data(model_path, data_path=None, num_samples=DEFAULT_CALIBRATION_SAMPLES, seed=42):
+    """
+    int8 量子化の校正に使う学習データの標本 (最大 num_samples 件) を返す。
+    data_path が NPZ ファイルであれば X_train (なければ x_train, X_test)、CSV でモデルの隣に前処理バンドルがあれば
+    学習時と同じ前処理をした学習分割の行、data_path が None であれば MNIST の学習データを使う。
+    別のデータで校正すると活性化の範囲が合わないため、data_path が見つからない・対応していない形式の場合は MNIST を使わずにエラーにする。
+    """
+    rng = np.random.default_rng(seed)
+    if data_path and not os.path.exists(data_path):
+        raise FileNotFoundError(f"校正データが見つかりません: {data_path}")
+    if data_path and not data_path.endswith((".csv", ".npz")):
+        raise ValueError(f"校正データには NPZ または CSV ファイルを指定してください: {data_path}")
+    if data_path and data_path.endswith(".csv"):
+        bundle = load_preprocessing_bundle(model_path, data_path)
+        if bundle is None:
+            raise ValueError(f"CSV の校正データには学習時の前処理バンドルが必要です: {preprocessing_bundle_path(model_path)}")
+        split = bundle["split"]
+        batches = iter_batches(data_path, bundle["schema"], "train", num_samples, split["chunksize"], split["test_size"],
+                               split["validation_split"], split["seed"], rng=rng, scaler=bundle["scaler"])
+        return next(batches, (np.empty((0, len(bundle["schema"]["features"])), dtype=np.float32), None))[0]
+    if data_path:
+        data = np.load(data_path)
+        key = next((key for key in ("X_train", "x_train", "X_test", "x_test") if key in data.files), None)
+        if key is None:
+            raise ValueError(f"校正データに X_train (または x_train, X_test) がありません: {data_path}")
+        x = data[key]
+    else:
+        import tensorflow as tf
+        (x, _), _ = tf.keras.datasets.mnist.load_data()
+    x = x[rng.choice(len(x), size=min(len(x), num_samples), replace=False)]
+    # 学習スクリプトと同じく、整数型の画像データは0-1の範囲に正規化する
+    return x.astype("float32") / 255 if np.issubdtype(x.dtype, np.integer) else x.astype("float32")
+
+def export_tflite(model_path, output_path=None, quantization="dynamic", calibration_data_path=None,
+                  num_calibration_samples=DEFAULT_CALIBRATION_SAMPLES):
+    """
+    Keras のモデルを TFLite に変換して保存し、(保存先, 情報の辞書) を返す。
+    int8 は校正データで活性化を量子化し、int8 で実行できない演算がある場合は float のままの演算を残して変換し直す。
+    モデルの隣に前処理バンドルがあれば、エクスポートしたモデル用にも複製する。
+    """
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"quantization には {', '.join(QUANTIZATION_MODES)} のいずれかを指定してください: {quantization}")
+    import tensorflow as tf
+
+    output_path = output_path or default_export_path(model_path, quantization)
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    info = {"source": os.path.abspath(model_path), "quantization": quantization, "calibration_samples": 0, "int8_fallback": False}
+    if quantization != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "int8":
+        samples = load_calibration_data(model_path, calibration_data_path, num_calibration_samples)
+        if not len(samples):
+            raise ValueError("int8 量子化の校正データがありません。")
+        input_shape = tuple(dim or 1 for dim in model.inputs[0].shape[1:])
+        converter.representative_dataset = lambda: ([sample.reshape((1, *input_shape)).astype(np.float32)] for sample in samples)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        info["calibration_samples"] = len(samples)
+    try:
+        content = converter.convert()
+    except Exception as e:
+        if quantization != "int8":
+            raise
+        print(f"警告: すべての演算を int8 にできないため、一部を float のまま変換します: {e}", file=sys.stderr)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+        content = converter.convert()
+        info["int8_fallback"] = True
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, output_path)
+    bundle_path = preprocessing_bundle_path(model_path)
+    if os.path.exists(bundle_path):
+        shutil.copy2(bundle_path, preprocessing_bundle_path(output_path))
+    info.update({"source_size_bytes": os.path.getsize(model_path), "size_bytes": os.path.getsize(output_path)})
+    return output_path, info
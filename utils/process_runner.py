@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# DESCRIPTION: asyncio runner that streams stdout/stderr of many child processes with per-step prefixes, log files and tails
+
+import asyncio
+import codecs
+import inspect
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+
+try:
+    from resource_monitor import ResourceMonitor
+except ImportError: # yggdrasil.py から utils パッケージとしてインポートされた場合
+    from utils.resource_monitor import ResourceMonitor
+
+# パイプの読み取り側と書き込み側の間に溜める行数の上限。これを超えると読み取りが止まり、
+# パイプが埋まった子プロセスは書き込みで待たされる (出力の速さに合わせて子プロセスが減速する)
+DEFAULT_QUEUE_SIZE = 1024
+# エラー報告用にメモリ上に残す、各ステップの末尾の行数
+DEFAULT_TAIL_LINES = 200
+# パイプから一度に読むバイト数と、改行のない出力を1行として区切る長さ
+READ_CHUNK_BYTES = 64 * 1024
+MAX_LINE_CHARS = 64 * 1024
+# SIGTERM を送ってから SIGKILL するまでの猶予 (秒) と、子プロセスの終了を確認する間隔 (秒)
+DEFAULT_GRACE_SECONDS = 10.0
+POLL_INTERVAL_SECONDS = 0.1
+
+class ProcessStep:
+    """
+    並行して実行する1つの子プロセス。出力の各行には prefix (省略時は "[name] ") を付けて表示し、
+    log_path を指定すると標準出力と標準エラー出力を届いた順にそのファイルにも書き出す。
+    """
+
+    def __init__(self, name, command, env=None, cwd=None, timeout=None, log_path=None, prefix=None):
+        self.name = name
+        self.command = list(command)
+        self.env = env
+        self.cwd = cwd
+        self.timeout = timeout
+        self.log_path = log_path
+        self.prefix = f"[{name}] " if prefix is None else prefix
+
+class ProcessResult:
+    """
+    子プロセスの実行結果。status は "ok", "failed", "timeout", "cancelled" のいずれか。
+    tail には標準出力と標準エラー出力の末尾の行が残る (エラー報告用)。
+    """
+
+    def __init__(self, name, command, returncode, status, wall_seconds, usage=None, log_path=None, tail=()):
+        self.name = name
+        self.command = command
+        self.returncode = returncode
+        self.status = status
+        self.wall_seconds = wall_seconds
+        self.usage = usage
+        self.log_path = log_path
+        self.tail = list(tail)
+
+    @property
+    def timed_out(self):
+        return self.status == "timeout"
+
+    @property
+    def output(self):
+        return "".join(self.tail)
+
+    def __repr__(self):
+        return f"ProcessResult(name={self.name!r}, status={self.status!r}, returncode={self.returncode}, wall_seconds={self.wall_seconds:.2f})"
+
+def step_log_path(log_dir, step_name):
+    """
+    ステップの出力を書き出すログファイルのパス。log_dir が None の場合は None (ファイルに書き出さない)。
+    """
+    return os.path.join(log_dir, f"{step_name}.log") if log_dir else None
+
+def write_prefixed(step, stream_name, line):
+    """
+    デフォルトの出力先。標準エラー出力の行は sys.stderr、それ以外は sys.stdout に prefix を付けて書き出す。
+    """
+    (sys.stderr if stream_name == "stderr" else sys.stdout).write(step.prefix + line)
+
+def process_exited(process):
+    """
+    子プロセスが終了したかを、回収 (wait) せずに確認する (回収前に終了時点のリソース使用量を読むため)。
+    """
+    if not hasattr(os, "waitid"):
+        return process.poll() is not None
+    try:
+        return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+def _signal_group(process, signum):
+    try:
+        os.killpg(process.pid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def terminate_processes(processes, grace_seconds=DEFAULT_GRACE_SECONDS):
+    """
+    子プロセスのプロセスグループすべてに SIGTERM を送り、猶予時間内に終了しなければ SIGKILL を送る。
+    SIGTERM で子プロセスが終了した後も、グループ内に残ったプロセスは SIGKILL で停止する。
+    """
+    for process in processes:
+        _signal_group(process, signal.SIGTERM)
+    try:
+        end = time.monotonic() + grace_seconds
+        while not all(process_exited(process) for process in processes):
+            if time.monotonic() > end:
+                pids = ", ".join(str(process.pid) for process in processes if not process_exited(process))
+                print(f"警告: プロセス {pids} が SIGTERM から {grace_seconds} 秒以内に終了しないため、SIGKILL を送ります。", file=sys.stderr)
+                break
+            time.sleep(min(POLL_INTERVAL_SECONDS, grace_seconds))
+    finally:
+        # 待機中に例外 (タイムアウトなど) で中断された場合も、グループを確実に停止する
+        for process in processes:
+            _signal_group(process, signal.SIGKILL)
+
+async def _terminate_process(process, grace_seconds):
+    # 他のステップの出力を止めないよう、イベントループをブロックせずに終了を待つ
+    _signal_group(process, signal.SIGTERM)
+    end = time.monotonic() + grace_seconds
+    while not process_exited(process) and time.monotonic() < end:
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    if not process_exited(process):
+        print(f"警告: プロセス {process.pid} が SIGTERM から {grace_seconds} 秒以内に終了しないため、SIGKILL を送ります。", file=sys.stderr)
+    _signal_group(process, signal.SIGKILL)
+
+async def _open_reader(pipe):
+    loop = asyncio.get_running_loop()
+    # StreamReader はバッファが limit の2倍を超えるとパイプの読み取りを止める
+    reader = asyncio.StreamReader(limit=READ_CHUNK_BYTES)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return reader
+
+async def _pump_lines(reader, step_state, stream_name, queue):
+    """
+    パイプから読んだバイト列を行に分けてキューに入れる。キューが一杯の間はパイプを読まない。
+    UTF-8 の文字がチャンクの境目で分かれても壊れないよう、インクリメンタルにデコードする。
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    pending = ""
+    while True:
+        chunk = await reader.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        if len(pending) > MAX_LINE_CHARS:
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            await queue.put((step_state, stream_name, line + "\n"))
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        await queue.put((step_state, stream_name, pending + "\n"))
+
+async def _write_lines(queue, on_line):
+    """
+    キューから行を取り出し、末尾の保持・ログファイルへの書き出し・表示を行う。
+    キューが空になったときにまとめてフラッシュする。
+    """
+    dirty = set()
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        step_state, stream_name, line = item
+        step_state.tail.append(line)
+        if step_state.log_file:
+            step_state.log_file.write(line)
+            dirty.add(step_state.log_file)
+        written = on_line(step_state.step, stream_name, line)
+        if inspect.isawaitable(written):
+            # コルーチンの on_line (ネットワークへの送信など) は完了を待つ。送信が遅いとキューが埋まり、読み取りが止まる
+            await written
+        if queue.empty():
+            for log_file in dirty:
+                if not log_file.closed:
+                    log_file.flush()
+            dirty.clear()
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+class _StepState:
+    def __init__(self, step, tail_lines):
+        self.step = step
+        self.tail = deque(maxlen=tail_lines)
+        self.log_file = None
+
+async def _run_step(step, queue, semaphore, running, token, grace_seconds, monitor, tail_lines, abort):
+    async with semaphore:
+        state = _StepState(step, tail_lines)
+        if (token is not None and token.cancelled) or (abort is not None and abort.is_set()):
+            return ProcessResult(step.name, step.command, None, "cancelled", 0.0, log_path=step.log_path)
+        if step.log_path:
+            os.makedirs(os.path.dirname(os.path.abspath(step.log_path)), exist_ok=True)
+            state.log_file = open(step.log_path, "w", encoding="utf-8")
+
+        start_time = time.monotonic()
+        try:
+            process = subprocess.Popen(step.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                       env=step.env, cwd=step.cwd, start_new_session=True)
+        except BaseException:
+            if state.log_file:
+                state.log_file.close()
+            raise
+        running[step.name] = process
+        resource_monitor = ResourceMonitor(process.pid).start() if monitor else None
+
+        readers = []
+        try:
+            readers = [asyncio.ensure_future(_pump_lines(await _open_reader(process.stdout), state, "stdout", queue)),
+                       asyncio.ensure_future(_pump_lines(await _open_reader(process.stderr), state, "stderr", queue))]
+            status = None
+            while not process_exited(process):
+                if step.timeout and time.monotonic() - start_time > step.timeout:
+                    status = "timeout"
+                    break
+                if token is not None and token.cancelled:
+                    status = "timeout" if token.reason == "timeout" else "cancelled"
+                    break
+                if abort is not None and abort.is_set():
+                    status = "cancelled"
+                    break
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            if status is not None:
+                await _terminate_process(process, grace_seconds)
+            usage = resource_monitor.stop() if resource_monitor else None
+            # 残りの出力をすべて読み終えてから回収する
+            await asyncio.gather(*readers)
+            process.wait()
+        except BaseException:
+            # 中断された場合のプロセスグループの停止は stream_processes がまとめて行う
+            for reader in readers:
+                reader.cancel()
+            if resource_monitor:
+                resource_monitor.stop(wait_for_exit=False)
+            raise
+        finally:
+            if state.log_file:
+                state.log_file.close()
+
+        del running[step.name]
+        if status is None:
+            status = "ok" if process.returncode == 0 else "failed"
+        if status != "ok" and abort is not None:
+            abort.set()
+        return ProcessResult(step.name, step.command, process.returncode, status, time.monotonic() - start_time,
+                             usage, step.log_path, state.tail)
+
+async def stream_processes(steps, on_line=None, max_parallel=None, token=None, grace_seconds=DEFAULT_GRACE_SECONDS,
+                           monitor=True, queue_size=DEFAULT_QUEUE_SIZE, tail_lines=DEFAULT_TAIL_LINES, fail_fast=False):
+    """
+    複数のコマンドをそれぞれ新しいプロセスグループで並行して実行し (max_parallel で同時実行数を制限)、
+    標準出力と標準エラー出力を1行ずつ on_line(step, "stdout" または "stderr", line) に渡す
+    (省略時は prefix を付けて sys.stdout / sys.stderr に書き出す)。on_line はコルーチン関数でもよく、その場合は
+    完了を待ってから次の行を渡す。ステップと同じ順序で ProcessResult を返す。
+    ステップごとの制限時間を超えた場合やトークンがキャンセルされた場合は、そのプロセスグループを
+    SIGTERM → SIGKILL で停止する。自身が中断された場合は、実行中のすべてのプロセスグループを停止する。
+    fail_fast=True の場合は、いずれかのステップが成功しなかった時点で残りのステップを停止する ("cancelled")。
+    """
+    steps = list(steps)
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError(f"ステップ名が重複しています: {names}")
+    queue = asyncio.Queue(maxsize=queue_size)
+    semaphore = asyncio.Semaphore(max_parallel or max(len(steps), 1))
+    running = {}
+    writer = asyncio.ensure_future(_write_lines(queue, on_line or write_prefixed))
+    abort = asyncio.Event() if fail_fast else None
+    tasks = [asyncio.ensure_future(_run_step(step, queue, semaphore, running, token, grace_seconds, monitor, tail_lines, abort))
+             for step in steps]
+    gathered = asyncio.gather(*tasks)
+    try:
+        # 書き込み側で例外が起きた場合も (読み取りが止まったまま) 待ち続けないようにする
+        await asyncio.wait([gathered, writer], return_when=asyncio.FIRST_COMPLETED)
+        if writer.done():
+            writer.result()
+        results = gathered.result()
+    except BaseException:
+        gathered.cancel()
+        # 中断の原因となった例外はこの後送出するため、キャンセルされた gather の結果は読み捨てる
+        gathered.add_done_callback(lambda future: future.cancelled() or future.exception())
+        for task in tasks:
+            task.cancel()
+        writer.cancel()
+        terminate_processes(list(running.values()), grace_seconds)
+        raise
+    await queue.put(None)
+    await writer
+    return results
+
+def run_processes(steps, **kwargs):
+    """
+    stream_processes を新しいイベントループで実行する (同期的なコードから使うための入口)。
+    実行中に例外 (SIGALRM によるタイムアウトなど) が発生した場合も、子プロセスのグループを停止してから送出する。
+    """
+    return asyncio.run(stream_processes(steps, **kwargs))
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Sample CPU time, RSS and I/O of a process tree via /proc
+
+import os
+import threading
+import time
+
+PROC_DIR = "/proc"
+
+# サンプリング間隔 (秒)。環境変数で変更できる
+DEFAULT_INTERVAL_SECONDS = float(os.environ.get("YGGDRASIL_RESOURCE_MONITOR_INTERVAL", "0.5"))
+
+# サマリーに含める、ピークRSSの大きいプロセスの数
+TOP_PROCESSES = 3
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def proc_available():
+    return os.path.isdir(os.path.join(PROC_DIR, "self"))
+
+def read_process_stat(pid):
+    """
+    /proc/<pid>/stat を読み、CPU時間 (秒) と RSS (バイト) を返す。プロセスが存在しない場合は None。
+    cutime/cstime には、このプロセスが回収 (wait) 済みの子孫プロセスのCPU時間が含まれる。
+    """
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "stat"), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # プロセス名は括弧で囲まれ、空白や括弧を含むことがあるため、最後の ')' より後ろを分割する
+    end = data.rindex(b")")
+    fields = data[end + 2:].split()
+    return {
+        "name": data[data.index(b"(") + 1:end].decode("utf-8", "replace"),
+        "ppid": int(fields[1]),
+        "utime": int(fields[11]) / CLOCK_TICKS,
+        "stime": int(fields[12]) / CLOCK_TICKS,
+        "cutime": int(fields[13]) / CLOCK_TICKS,
+        "cstime": int(fields[14]) / CLOCK_TICKS,
+        "rss_bytes": int(fields[21]) * PAGE_SIZE
+    }
+
+def read_process_io(pid):
+    """
+    /proc/<pid>/io からストレージへの読み書きバイト数を返す (回収済みの子孫プロセスの分を含む)。
+    権限がない場合などは 0 とする。
+    """
+    values = {"read_bytes": 0, "write_bytes": 0}
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "io"), "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in values:
+                    values[key] = int(value)
+    except OSError:
+        pass
+    return values
+
+def _children_of(pid):
+    """
+    /proc/<pid>/task/<tid>/children から子プロセスを返す。このファイルがないカーネルでは None。
+    """
+    children = []
+    try:
+        tids = os.listdir(os.path.join(PROC_DIR, str(pid), "task"))
+    except OSError:
+        return children
+    for tid in tids:
+        try:
+            with open(os.path.join(PROC_DIR, str(pid), "task", tid, "children"), "r") as f:
+                children.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            if not os.path.exists(os.path.join(PROC_DIR, str(pid), "task", tid)):
+                continue
+            return None
+        except OSError:
+            continue
+    return children
+
+def list_process_tree(root_pid):
+    """
+    root_pid とそのすべての子孫プロセスのPIDを返す。
+    """
+    pids = [root_pid]
+    index = 0
+    while index < len(pids):
+        children = _children_of(pids[index])
+        if children is None:
+            return _scan_process_tree(root_pid)
+        pids.extend(children)
+        index += 1
+    return pids
+
+def _scan_process_tree(root_pid):
+    # children ファイルがない場合は、すべてのプロセスの親PIDを読んで木を作る
+    children = {}
+    for entry in os.listdir(PROC_DIR):
+        if entry.isdigit():
+            stat = read_process_stat(entry)
+            if stat:
+                children.setdefault(stat["ppid"], []).append(int(entry))
+    pids = [root_pid]
+    index = 0
+    while index < len(pids):
+        pids.extend(children.get(pids[index], []))
+        index += 1
+    return pids
+
+def format_bytes(num_bytes):
+    if num_bytes is None:
+        return "N/A"
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024 or unit == "GB":
+            return f"{num_bytes:.0f}{unit}" if unit == "B" else f"{num_bytes:.1f}{unit}"
+        num_bytes /= 1024
+
+def format_summary(summary):
+    """
+    サマリーを1行のログメッセージ用の文字列にする。
+    """
+    text = f"実行時間 {summary['wall_seconds']:.2f}秒"
+    if summary.get("cpu_seconds") is None:
+        return text + " (/proc が利用できないためCPU・メモリ・I/Oは計測していません)"
+    text += (f", CPU {summary['cpu_seconds']:.2f}秒 (user {summary['user_seconds']:.2f}秒 / sys {summary['system_seconds']:.2f}秒)"
+             f", ピークRSS {format_bytes(summary['peak_rss_bytes'])}"
+             f", 読み込み {format_bytes(summary['read_bytes'])}, 書き込み {format_bytes(summary['write_bytes'])}"
+             f", 最大プロセス数 {summary['max_processes']}")
+    if len(summary["top_processes"]) > 1:
+        text += ", メモリ上位: " + ", ".join(f"{p['name']}[{p['pid']}] {format_bytes(p['peak_rss_bytes'])}" for p in summary["top_processes"])
+    return text
+
+class ResourceMonitor:
+    """
+    プロセスとその子孫プロセスを一定間隔でサンプリングし、実行時間・CPU時間 (user/sys)・
+    ピークRSS (プロセスツリー全体の合計)・ストレージの読み書きバイト数を集計する。
+    pid を省略した場合は現在のプロセス (yggdrasil.py 内で実行されるエージェント) を計測する。
+
+    CPU時間とI/Oは、ルートプロセスの累積値 (回収済みの子孫の分を含む) と実行中の子孫の値の合計の
+    開始時からの差分として求めるため、サンプリングの間に終了した子孫の分も失われない。
+    """
+
+    def __init__(self, pid=None, interval=DEFAULT_INTERVAL_SECONDS, keep_timeseries=False):
+        self.pid = pid or os.getpid()
+        self.interval = max(0.01, float(interval))
+        self.keep_timeseries = keep_timeseries
+        self.enabled = proc_available()
+        self.timeseries = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._baseline = None
+        self._last = None
+        self._peak_rss = 0
+        self._max_processes = 0
+        self._process_peaks = {}
+        self._start_time = None
+        self._summary = None
+
+    def _sample(self):
+        """
+        プロセスツリーを1回サンプリングし、累積値を返す。ルートプロセスが存在しない場合は None。
+        """
+        totals = {"user": 0.0, "system": 0.0, "read_bytes": 0, "write_bytes": 0, "rss_bytes": 0, "processes": 0}
+        for pid in list_process_tree(self.pid):
+            stat = read_process_stat(pid)
+            if stat is None:
+                if pid == self.pid:
+                    return None
+                continue
+            io = read_process_io(pid)
+            totals["user"] += stat["utime"] + stat["cutime"]
+            totals["system"] += stat["stime"] + stat["cstime"]
+            totals["read_bytes"] += io["read_bytes"]
+            totals["write_bytes"] += io["write_bytes"]
+            totals["rss_bytes"] += stat["rss_bytes"]
+            totals["processes"] += 1
+            peak = self._process_peaks.get(pid)
+            if peak is None or stat["rss_bytes"] > peak["peak_rss_bytes"]:
+                self._process_peaks[pid] = {"pid": pid, "name": stat["name"], "peak_rss_bytes": stat["rss_bytes"]}
+
+        with self._lock:
+            self._peak_rss = max(self._peak_rss, totals["rss_bytes"])
+            self._max_processes = max(self._max_processes, totals["processes"])
+            # 子孫が回収される瞬間の読み取りの揺らぎで累積値が減らないようにする
+            if self._last:
+                for key in ("user", "system", "read_bytes", "write_bytes"):
+                    totals[key] = max(totals[key], self._last[key])
+            self._last = totals
+            if self.keep_timeseries and self._baseline:
+                self.timeseries.append({
+                    "elapsed_seconds": round(time.monotonic() - self._start_time, 3),
+                    "rss_bytes": totals["rss_bytes"],
+                    "cpu_seconds": round(totals["user"] + totals["system"] - self._baseline["user"] - self._baseline["system"], 3),
+                    "processes": totals["processes"]
+                })
+        return totals
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            if self._sample() is None:
+                return
+
+    def start(self):
+        self._start_time = time.monotonic()
+        if self.enabled:
+            self._baseline = self._sample()
+            if self._baseline is None:
+                self.enabled = False
+            else:
+                self._thread = threading.Thread(target=self._run, name="resource-monitor", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, wait_for_exit=True):
+        """
+        サンプリングを止めてサマリーを返す。子プロセスを計測している場合は、回収 (wait) する前に
+        呼ぶと、終了時点の正確な値を読める (終了まで待ってから最後のサンプルを取る)。
+        wait_for_exit=False の場合は終了を待たずに、その時点の値でサマリーを作る。
+        """
+        if self._summary is not None:
+            return self._summary
+        if self._thread:
+            self._stop_event.set()
+            self._thread.join()
+        if wait_for_exit and self.enabled and self.pid != os.getpid() and hasattr(os, "waitid"):
+            try:
+                # 回収せずに終了を待つ (ゾンビ状態の /proc/<pid>/stat に最終的なCPU時間が残る)
+                os.waitid(os.P_PID, self.pid, os.WEXITED | os.WNOWAIT)
+            except (ChildProcessError, OSError):
+                pass
+        if self.enabled:
+            self._sample()
+
+        summary = {"wall_seconds": round(time.monotonic() - self._start_time, 3)}
+        if self.enabled and self._last:
+            user = self._last["user"] - self._baseline["user"]
+            system = self._last["system"] - self._baseline["system"]
+            summary.update({
+                "cpu_seconds": round(user + system, 3),
+                "user_seconds": round(user, 3),
+                "system_seconds": round(system, 3),
+                "peak_rss_bytes": self._peak_rss,
+                "read_bytes": self._last["read_bytes"] - self._baseline["read_bytes"],
+                "write_bytes": self._last["write_bytes"] - self._baseline["write_bytes"],
+                "max_processes": self._max_processes,
+                "top_processes": sorted(self._process_peaks.values(), key=lambda p: p["peak_rss_bytes"], reverse=True)[:TOP_PROCESSES]
+            })
+        else:
+            summary.update({"cpu_seconds": None, "peak_rss_bytes": None})
+        if self.keep_timeseries:
+            summary["timeseries"] = self.timeseries
+        self._summary = summary
+        return summary
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
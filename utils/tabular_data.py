@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Chunked, typed CSV ingestion for tabular training and evaluation
+
+import json
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+# 一度に読み込む行数 (メモリ使用量はこの行数分のチャンクに比例する)
+DEFAULT_CHUNKSIZE = 100_000
+# これを超える種類の値を持つカテゴリ列は、語彙を持たずにハッシュでエンコードする
+DEFAULT_MAX_CATEGORIES = 1000
+# 目的変数のクラス数の上限 (分類タスクを想定)
+MAX_TARGET_CLASSES = 10000
+
+# 行ごとの分割先
+SPLIT_TRAIN = 0
+SPLIT_VALIDATION = 1
+SPLIT_TEST = 2
+SPLIT_NAMES = {"train": SPLIT_TRAIN, "validation": SPLIT_VALIDATION, "test": SPLIT_TEST}
+
+# 前処理バンドルのファイル名の接尾辞 (モデルと同じディレクトリに保存する)
+BUNDLE_SUFFIX = "_preprocessing.joblib"
+
+# 整数列のダウンキャスト候補 (小さい順)
+_INT_DTYPES = [np.int8, np.int16, np.int32]
+
+def _numeric_dtype(stats):
+    """
+    列の統計から、値を失わずに表現できる最小の数値型を返す。
+    """
+    if stats["is_integer"] and stats["missing"] == 0 and stats["count"] > 0:
+        for dtype in _INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= stats["min"] and stats["max"] <= info.max:
+                return np.dtype(dtype).name
+    return "float32"
+
+def infer_schema(dataset_path, chunksize=DEFAULT_CHUNKSIZE, max_categories=DEFAULT_MAX_CATEGORIES):
+    """
+    CSVをチャンク単位で1回走査し、列ごとの型・カテゴリ・統計量と行数を推定したスキーマを返す。
+    最初の行はヘッダとして扱い、最後の列を目的変数とする (従来の読み込み方法と同じ)。
+    """
+    columns = pd.read_csv(dataset_path, nrows=0).columns.tolist()
+    if len(columns) < 2:
+        raise ValueError(f"特徴量と目的変数の列が必要です: {dataset_path}")
+
+    stats = [{"count": 0, "missing": 0, "non_numeric": False, "is_integer": True, "min": np.inf, "max": -np.inf,
+              "values": set(), "overflow": False} for _ in columns]
+    num_rows = 0
+
+    # すべての列を文字列として読み、数値として解釈できるかを列ごとに判定する
+    for chunk in pd.read_csv(dataset_path, header=None, skiprows=1, dtype=str, chunksize=chunksize):
+        num_rows += len(chunk)
+        for i, column_stats in enumerate(stats):
+            raw = chunk.iloc[:, i]
+            present = raw.notna()
+            numeric = pd.to_numeric(raw, errors="coerce")
+            valid = numeric.dropna().to_numpy(dtype=np.float64)
+            column_stats["missing"] += int((~present).sum())
+            if numeric.notna().sum() < present.sum():
+                column_stats["non_numeric"] = True
+            if len(valid):
+                column_stats["count"] += len(valid)
+                column_stats["min"] = min(column_stats["min"], float(valid.min()))
+                column_stats["max"] = max(column_stats["max"], float(valid.max()))
+                column_stats["is_integer"] = column_stats["is_integer"] and bool(np.all(np.floor(valid) == valid))
+            # 目的変数は常に、特徴量は上限までカテゴリ値を集める
+            limit = MAX_TARGET_CLASSES if i == len(columns) - 1 else max_categories
+            if not column_stats["overflow"]:
+                column_stats["values"].update(raw[present].unique().tolist())
+                if len(column_stats["values"]) > limit:
+                    column_stats["overflow"] = True
+                    column_stats["values"] = set()
+
+    features = []
+    for name, column_stats in zip(columns[:-1], stats[:-1]):
+        if not column_stats["non_numeric"]:
+            feature = {"name": name, "kind": "numeric", "dtype": _numeric_dtype(column_stats), "fill_value": None}
+            # 欠損値がある列だけ平均値で補完する (欠損がなければ整数型のまま読み込める)。
+            # 補完値は検証・テスト分割の値を含まないよう、build_scaler で訓練分割の行だけから求める
+            if column_stats["missing"]:
+                feature["impute"] = "mean"
+            features.append(feature)
+        elif column_stats["overflow"]:
+            features.append({"name": name, "kind": "hashed", "num_buckets": max_categories})
+        else:
+            features.append({"name": name, "kind": "categorical", "categories": sorted(column_stats["values"])})
+
+    target_stats = stats[-1]
+    if target_stats["overflow"]:
+        raise ValueError(f"目的変数の種類が多すぎます (上限 {MAX_TARGET_CLASSES}): {columns[-1]}")
+    if target_stats["non_numeric"]:
+        target = {"name": columns[-1], "kind": "categorical", "classes": sorted(target_stats["values"])}
+    else:
+        # 数値ラベルは数値として並べる ("10" が "2" より前に来ないように)
+        classes = sorted({float(v) for v in target_stats["values"]})
+        target = {"name": columns[-1], "kind": "numeric", "classes": [int(c) if c.is_integer() else c for c in classes]}
+
+    return {"num_rows": num_rows, "features": features, "target": target}
+
+def save_schema(schema, schema_path):
+    output_dir = os.path.dirname(schema_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(schema_path, "w", encoding="utf-8") as f:
+        json.dump(schema, f, ensure_ascii=False, indent=2)
+
+def load_schema(schema_path):
+    with open(schema_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def count_rows(dataset_path):
+    """
+    ヘッダを除いたデータ行数を数える (行数を含まない明示的なスキーマ用)。
+    """
+    lines = 0
+    last_byte = b"\n"
+    with open(dataset_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last_byte = block[-1:]
+    if last_byte != b"\n":
+        lines += 1 # 最終行に改行がない場合
+    return max(lines - 1, 0)
+
+def resolve_schema(dataset_path, schema_path=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    schema_path が指定されていれば明示的なスキーマを、なければCSVから推定したスキーマを返す。
+    """
+    if schema_path:
+        schema = load_schema(schema_path)
+        if "num_rows" not in schema:
+            schema["num_rows"] = count_rows(dataset_path)
+        print(f"--- スキーマを読み込みました: {schema_path} ---")
+        return schema
+    schema = infer_schema(dataset_path, chunksize=chunksize)
+    kinds = [feature["kind"] for feature in schema["features"]]
+    print(f"--- スキーマを推定しました: {schema['num_rows']} 行, 特徴量 {len(kinds)} 列 "
+          f"(カテゴリ {kinds.count('categorical') + kinds.count('hashed')} 列), クラス数 {len(schema['target']['classes'])} ---")
+    return schema
+
+def _read_dtypes(schema):
+    """
+    read_csv に渡す列ごとの型。数値列はダウンキャストした型で、カテゴリ列は文字列で読む。
+    """
+    dtypes = {}
+    for i, feature in enumerate(schema["features"]):
+        if feature["kind"] != "numeric":
+            dtypes[i] = str
+        elif feature["dtype"] != "float32" and feature.get("fill_value") is None:
+            dtypes[i] = feature["dtype"]
+        else:
+            dtypes[i] = "float32" # 欠損値 (NaN) を表現できる型で読み込む
+    dtypes[len(schema["features"])] = str
+    return dtypes
+
+def read_chunks(dataset_path, schema, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    スキーマの型でCSVをチャンク単位に読み込み、(先頭行の行番号, DataFrame) を順に返す。
+    """
+    start = 0
+    for chunk in pd.read_csv(dataset_path, header=None, skiprows=1, dtype=_read_dtypes(schema), chunksize=chunksize):
+        yield start, chunk
+        start += len(chunk)
+
+def encode_chunk(chunk, schema):
+    """
+    チャンクを (特徴量 float32 配列, クラス番号 int32 配列) に変換する。
+    カテゴリ列はカテゴリ番号 (未知の値は -1) またはハッシュのバケット番号にエンコードする。
+    """
+    X = np.empty((len(chunk), len(schema["features"])), dtype=np.float32)
+    for i, feature in enumerate(schema["features"]):
+        column = chunk.iloc[:, i]
+        if feature["kind"] == "numeric":
+            values = column.to_numpy(dtype=np.float32, na_value=np.nan)
+            if feature.get("fill_value") is not None:
+                values = np.where(np.isnan(values), np.float32(feature["fill_value"]), values)
+            X[:, i] = values
+        elif feature["kind"] == "categorical":
+            X[:, i] = pd.Categorical(column, categories=feature["categories"]).codes
+        else:
+            hashes = pd.util.hash_pandas_object(column.fillna(""), index=False).to_numpy()
+            X[:, i] = hashes % np.uint64(feature["num_buckets"])
+
+    target = schema["target"]
+    labels = chunk.iloc[:, -1]
+    if target["kind"] == "numeric":
+        labels = pd.to_numeric(labels)
+        classes = pd.Series(target["classes"], dtype=np.float64)
+        y = pd.Categorical(labels.astype(np.float64), categories=classes).codes
+    else:
+        y = pd.Categorical(labels, categories=target["classes"]).codes
+    return X, y.astype(np.int32)
+
+def split_assignments(row_indices, test_size=0.2, validation_split=0.0, seed=42):
+    """
+    行番号のハッシュから各行の分割先 (train/validation/test) を決める。
+    全体をシャッフルせずにチャンク単位で決定的に分割でき、同じ引数なら常に同じ分割になる。
+    """
+    x = np.asarray(row_indices, dtype=np.uint64) + np.uint64((seed * 0x9E3779B97F4A7C15) % (1 << 64))
+    # splitmix64 のミキシング関数
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    uniform = (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+    assignments = np.full(len(uniform), SPLIT_TRAIN, dtype=np.int8)
+    assignments[uniform < test_size + (1 - test_size) * validation_split] = SPLIT_VALIDATION
+    assignments[uniform < test_size] = SPLIT_TEST
+    return assignments
+
+def split_counts(num_rows, test_size=0.2, validation_split=0.0, seed=42, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    各分割に含まれる行数を、CSVを読まずに行番号だけから数える。
+    """
+    counts = np.zeros(len(SPLIT_NAMES), dtype=np.int64)
+    for start in range(0, num_rows, chunksize):
+        rows = np.arange(start, min(start + chunksize, num_rows))
+        counts += np.bincount(split_assignments(rows, test_size, validation_split, seed), minlength=len(SPLIT_NAMES))
+    return {name: int(counts[code]) for name, code in SPLIT_NAMES.items()}
+
+def iter_batches(dataset_path, schema, subset=None, batch_size=32, chunksize=DEFAULT_CHUNKSIZE,
+                 test_size=0.2, validation_split=0.0, seed=42, rng=None, scaler=None):
+    """
+    指定した分割 (None の場合は全行) の (X, y) を batch_size ごとに返すジェネレータ。
+    rng を渡すとチャンク内の行をシャッフルし、scaler を渡すと特徴量を標準化する。
+    """
+    pending_X, pending_y = [], []
+    pending_count = 0
+    for start, chunk in read_chunks(dataset_path, schema, chunksize):
+        X, y = encode_chunk(chunk, schema)
+        if scaler is not None:
+            X = scaler.transform(X).astype(np.float32, copy=False)
+        if subset is not None:
+            mask = split_assignments(np.arange(start, start + len(chunk)), test_size, validation_split, seed) == SPLIT_NAMES[subset]
+            X, y = X[mask], y[mask]
+        if rng is not None:
+            order = rng.permutation(len(y))
+            X, y = X[order], y[order]
+        pending_X.append(X)
+        pending_y.append(y)
+        pending_count += len(y)
+        if pending_count < batch_size:
+            continue
+        X, y = np.concatenate(pending_X), np.concatenate(pending_y)
+        full = len(y) - len(y) % batch_size
+        for i in range(0, full, batch_size):
+            yield X[i:i + batch_size], y[i:i + batch_size]
+        pending_X, pending_y = [X[full:]], [y[full:]]
+        pending_count = len(y) - full
+    if pending_count:
+        yield np.concatenate(pending_X), np.concatenate(pending_y)
+
+def make_tf_dataset(dataset_path, schema, subset=None, batch_size=32, chunksize=DEFAULT_CHUNKSIZE,
+                    test_size=0.2, validation_split=0.0, seed=42, shuffle=False, scaler=None):
+    """
+    iter_batches を tf.data.Dataset として包み、読み込みと学習を並行させる。
+    shuffle=True の場合、エポックごとに異なる順序でチャンク内の行をシャッフルする。
+    """
+    import tensorflow as tf
+
+    rng = np.random.default_rng(seed) if shuffle else None
+    num_features = len(schema["features"])
+    dataset = tf.data.Dataset.from_generator(
+        lambda: iter_batches(dataset_path, schema, subset, batch_size, chunksize, test_size, validation_split, seed, rng, scaler),
+        output_signature=(
+            tf.TensorSpec(shape=(None, num_features), dtype=tf.float32),
+            tf.TensorSpec(shape=(None,), dtype=tf.int32)
+        )
+    )
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def load_split_arrays(dataset_path, schema, subset, chunksize=DEFAULT_CHUNKSIZE, test_size=0.2, validation_split=0.0, seed=42, scaler=None):
+    """
+    指定した分割の行だけを読み込み、(X, y) の配列として返す (テスト用など小さい分割向け)。
+    """
+    batches = list(iter_batches(dataset_path, schema, subset, chunksize, chunksize, test_size, validation_split, seed, scaler=scaler))
+    if not batches:
+        return np.empty((0, len(schema["features"])), dtype=np.float32), np.empty((0,), dtype=np.int32)
+    return np.concatenate([X for X, _ in batches]), np.concatenate([y for _, y in batches])
+
+def build_label_encoder(schema):
+    """
+    スキーマのクラス一覧から、クラス番号と元のラベルを相互に変換する LabelEncoder を作成する。
+    """
+    label_encoder = LabelEncoder()
+    label_encoder.classes_ = np.asarray(schema["target"]["classes"])
+    return label_encoder
+
+def build_scaler(schema, dataset_path, split_options=None):
+    """
+    訓練分割を1回走査し、数値列を標準化する StandardScaler を作成する。カテゴリ列はそのまま (平均0, 標準偏差1) 通す。
+    平均値で補完する列 ("impute": "mean") には、訓練分割の平均値を補完値 (fill_value) としてスキーマに設定する。
+    検証・テスト分割の値が前処理に混ざらないよう、統計量はすべて訓練分割の行だけから求める。
+    """
+    features = schema["features"]
+    numeric = [i for i, feature in enumerate(features) if feature["kind"] == "numeric"]
+    imputed = [i for i in numeric if features[i].get("impute") == "mean"]
+    # 補完する列は欠損値 (NaN) のまま読み込んで集計する
+    scan_schema = {**schema, "features": [{**feature, "fill_value": None} if i in imputed else feature for i, feature in enumerate(features)]}
+    count = np.zeros(len(features))
+    total = np.zeros(len(features))
+    total_sq = np.zeros(len(features))
+    n_samples_seen = 0
+    for X, _ in iter_batches(dataset_path, scan_schema, "train", DEFAULT_CHUNKSIZE, **(split_options or {})):
+        X = X.astype(np.float64)
+        present = ~np.isnan(X)
+        count += present.sum(axis=0)
+        total += np.where(present, X, 0.0).sum(axis=0)
+        total_sq += np.where(present, np.square(X), 0.0).sum(axis=0)
+        n_samples_seen += len(X)
+
+    column_mean = np.divide(total, count, out=np.zeros(len(features)), where=count > 0)
+    for i in imputed:
+        features[i]["fill_value"] = float(column_mean[i])
+    # 補完した値は平均値と等しく偏差が0のため、補完後の分散は欠損値を除いた偏差平方和を全行数で割ったものになる
+    rows = count.copy()
+    rows[imputed] = n_samples_seen
+    squared_deviation = np.maximum(total_sq - count * np.square(column_mean), 0.0)
+    mean = np.zeros(len(features))
+    var = np.ones(len(features))
+    mean[numeric] = column_mean[numeric]
+    var[numeric] = np.divide(squared_deviation, rows, out=np.zeros(len(features)), where=rows > 0)[numeric]
+
+    scaler = StandardScaler()
+    scaler.mean_ = mean
+    scaler.var_ = var
+    scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0) # 定数列は0除算しない
+    scaler.n_features_in_ = len(features)
+    scaler.n_samples_seen_ = n_samples_seen
+    return scaler
+
+def dataset_fingerprint(dataset_path):
+    """
+    データセットの内容が学習時から変わっていないかを確認するための、サイズと更新時刻の組。
+    """
+    stat = os.stat(dataset_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def preprocessing_bundle_path(model_path):
+    return f"{os.path.splitext(model_path)[0]}{BUNDLE_SUFFIX}"
+
+def save_preprocessing_bundle(model_path, dataset_path, schema, split, scaler):
+    """
+    評価や推論で学習時と同じ前処理を再現するための情報 (スキーマ、行分割の設定、ラベルエンコーダ、
+    スケーラ) をモデルの隣に保存する。行分割は行番号のハッシュで決まるため、分割の設定が
+    そのまま各分割の行番号を表す。
+    """
+    bundle = {
+        "dataset_path": os.path.abspath(dataset_path),
+        "dataset_fingerprint": dataset_fingerprint(dataset_path),
+        "schema": schema,
+        "split": split,
+        "label_encoder": build_label_encoder(schema),
+        "scaler": scaler
+    }
+    bundle_path = preprocessing_bundle_path(model_path)
+    tmp_path = f"{bundle_path}.tmp"
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, bundle_path)
+    return bundle_path
+
+def load_preprocessing_bundle(model_path, dataset_path=None):
+    """
+    モデルの隣に保存された前処理バンドルを読み込む。存在しなければ None を返す。
+    dataset_path が学習時と異なる内容の場合は警告する。
+    """
+    bundle_path = preprocessing_bundle_path(model_path)
+    if not os.path.exists(bundle_path):
+        return None
+    bundle = joblib.load(bundle_path)
+    if dataset_path and os.path.exists(dataset_path) and dataset_fingerprint(dataset_path) != bundle["dataset_fingerprint"]:
+        print(f"警告: データセットが学習時から変更されています。学習時と同じ行分割にならない可能性があります: {dataset_path}")
+    print(f"--- 前処理バンドルを読み込みました: {bundle_path} ---")
+    return bundle
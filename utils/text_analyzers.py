@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Pluggable, picklable Japanese-aware analyzers for TF-IDF / hashing vectorizers
+
+import re
+import threading
+from collections import OrderedDict
+from japanese_tokenizer import CONTENT_WORD_POS, tokenize_text, tokenize_batch
+
+# 日本語の文字の連続と英数字の連続を取り出す正規表現 (モジュール読み込み時に1回だけコンパイルする)
+WORD_PATTERN = re.compile(r'[ぁ-んァ-ヶー一-龠々]+|[a-zA-Z0-9]+')
+JAPANESE_RUN_PATTERN = re.compile(r'[ぁ-んァ-ヶー一-龠々]+')
+
+# 形態素解析結果のプロセス内キャッシュの上限件数
+TOKEN_CACHE_SIZE = 200000
+
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def _remember(text, tokens):
+    with _token_cache_lock:
+        _token_cache[text] = tokens
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+
+def _cached_tokens(text):
+    with _token_cache_lock:
+        tokens = _token_cache.get(text)
+        if tokens is not None:
+            _token_cache.move_to_end(text)
+            return tokens
+    tokens = tokenize_text(text)
+    _remember(text, tokens)
+    return tokens
+
+class RegexAnalyzer:
+    """
+    正規表現による高速なアナライザ。ngram_range を指定しない場合は日本語の文字の連続と英数字の連続を
+    そのまま単語とし、指定した場合は日本語の部分を文字 n-gram に分割する (分かち書きの代わり)。
+    """
+
+    def __init__(self, ngram_range=None, min_length=2):
+        self.ngram_range = tuple(ngram_range) if ngram_range else None
+        self.min_length = min_length
+
+    def __call__(self, text):
+        if not self.ngram_range:
+            return [word.lower() for word in WORD_PATTERN.findall(text) if len(word) >= self.min_length]
+        min_n, max_n = self.ngram_range
+        terms = []
+        for word in WORD_PATTERN.findall(text):
+            if not JAPANESE_RUN_PATTERN.fullmatch(word):
+                terms.append(word.lower())
+                continue
+            if len(word) < min_n:
+                terms.append(word)
+                continue
+            for n in range(min_n, max_n + 1):
+                terms.extend(word[i:i + n] for i in range(len(word) - n + 1))
+        return terms
+
+    def prefetch(self, texts):
+        pass
+
+    def __repr__(self):
+        return f"RegexAnalyzer(ngram_range={self.ngram_range}, min_length={self.min_length})"
+
+class JanomeAnalyzer:
+    """
+    共有の Janome インスタンスによる形態素解析のアナライザ。指定した品詞の基本形を返す。
+    解析結果はプロセス内でキャッシュし、prefetch でまとめて (永続キャッシュと複数プロセスを使って) 解析できる。
+    """
+
+    def __init__(self, parts_of_speech=CONTENT_WORD_POS):
+        self.parts_of_speech = tuple(parts_of_speech)
+
+    def __call__(self, text):
+        return [base_form.lower() for _, base_form, part_of_speech in _cached_tokens(text) if part_of_speech in self.parts_of_speech]
+
+    def prefetch(self, texts):
+        """
+        ベクトル化の前に、未解析のテキストをまとめて解析してキャッシュに載せる。
+        """
+        with _token_cache_lock:
+            missing = list({text for text in texts if text not in _token_cache})
+        if missing:
+            for text, tokens in zip(missing, tokenize_batch(missing)):
+                _remember(text, tokens)
+
+    def __repr__(self):
+        return f"JanomeAnalyzer(parts_of_speech={self.parts_of_speech})"
+
+# 名前で選べるアナライザ
+ANALYZERS = {
+    "regex": lambda: RegexAnalyzer(),
+    "char_ngram": lambda: RegexAnalyzer(ngram_range=(2, 2)),
+    "janome": lambda: JanomeAnalyzer()
+}
+
+def get_analyzer(name):
+    if name not in ANALYZERS:
+        raise ValueError(f"不明なアナライザです: {name} (選択肢: {', '.join(ANALYZERS)})")
+    return ANALYZERS[name]()
+
+def prefetch(analyzer, texts):
+    """
+    アナライザが事前の一括解析に対応していれば実行する (sklearn の既定のアナライザなどは何もしない)。
+    """
+    if hasattr(analyzer, "prefetch"):
+        analyzer.prefetch(texts)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# DESCRIPTION: CPU training acceleration options (XLA, mixed precision, threading, oneDNN)
+
+import os
+
+# oneDNN の有効/無効を切り替える環境変数 (TensorFlow のインポート前に設定する必要がある)
+ONEDNN_ENV_VAR = "TF_ENABLE_ONEDNN_OPTS"
+
+# 学習スクリプトが受け付ける高速化オプションとそのデフォルト値
+ACCELERATION_DEFAULTS = {
+    "jit_compile": False,
+    "mixed_precision": False,
+    "intra_op_threads": 0, # 0 は TensorFlow の自動設定
+    "inter_op_threads": 0
+}
+
+def str2bool(value):
+    """
+    "true"/"false" などの文字列を bool に変換する (argparse の type として使用)。
+    """
+    if isinstance(value, bool):
+        return value
+    if str(value).strip().lower() in ("1", "true", "yes", "on"):
+        return True
+    if str(value).strip().lower() in ("0", "false", "no", "off", "none", ""):
+        return False
+    raise ValueError(f"真偽値として解釈できません: {value}")
+
+def add_acceleration_args(parser):
+    """
+    学習スクリプトの ArgumentParser に高速化オプションを追加する。
+    """
+    parser.add_argument('--jit_compile', type=str2bool, default=ACCELERATION_DEFAULTS["jit_compile"], help='XLA JITコンパイルを有効にする')
+    parser.add_argument('--mixed_precision', type=str2bool, default=ACCELERATION_DEFAULTS["mixed_precision"], help='bfloat16混合精度を有効にする (対応CPUのみ)')
+    parser.add_argument('--intra_op_threads', type=int, default=ACCELERATION_DEFAULTS["intra_op_threads"], help='演算内並列スレッド数 (0は自動)')
+    parser.add_argument('--inter_op_threads', type=int, default=ACCELERATION_DEFAULTS["inter_op_threads"], help='演算間並列スレッド数 (0は自動)')
+    return parser
+
+def acceleration_kwargs(args):
+    """
+    argparse の結果から高速化オプションだけを取り出して辞書で返す。
+    """
+    return {key: getattr(args, key) for key in ACCELERATION_DEFAULTS}
+
+def onednn_env(onednn, base_env=None):
+    """
+    oneDNN の設定を反映した子プロセス用の環境変数辞書を返す。onednn が None の場合は変更しない。
+    """
+    env = dict(os.environ if base_env is None else base_env)
+    if onednn is not None:
+        env[ONEDNN_ENV_VAR] = "1" if str2bool(onednn) else "0"
+    return env
+
+def cpu_supports_bf16():
+    """
+    CPU が bfloat16 演算命令 (AVX512_BF16 または AMX_BF16) をサポートしているかを判定する。
+    """
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = line.split(":", 1)[1].split()
+                    return "avx512_bf16" in flags or "amx_bf16" in flags
+    except OSError:
+        pass
+    return False
+
+def configure_acceleration(mixed_precision=False, intra_op_threads=0, inter_op_threads=0):
+    """
+    TensorFlow のスレッド設定と混合精度ポリシーを適用し、有効になった精度ポリシー名を返す。
+    スレッド設定は TensorFlow ランタイムの初期化前 (最初の演算の前) に呼び出す必要がある。
+    """
+    import tensorflow as tf
+
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(int(intra_op_threads))
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(int(inter_op_threads))
+
+    policy = "float32"
+    if mixed_precision:
+        if cpu_supports_bf16():
+            policy = "mixed_bfloat16"
+        else:
+            print("警告: このCPUはbfloat16命令をサポートしていないため、混合精度を無効にします。")
+    tf.keras.mixed_precision.set_global_policy(policy)
+
+    print(f"--- 高速化設定: precision={policy}, intra_op_threads={intra_op_threads or 'auto'}, "
+          f"inter_op_threads={inter_op_threads or 'auto'}, {ONEDNN_ENV_VAR}={os.environ.get(ONEDNN_ENV_VAR, 'default')} ---")
+    return policy
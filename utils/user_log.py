@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# DESCRIPTION: Append-only JSON-lines daily user logs with atomic appends and streaming reads
+
+import glob
+import json
+import os
+import sys
+
+try:
+    import fcntl
+except ImportError: # Windows ではファイルロックなし (O_APPEND による追記のみ)
+    fcntl = None
+
+# プロジェクトルートを定義
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOGS_DIR = os.path.join(PROJECT_ROOT, "logs", "user_logs")
+
+LOG_FILE_FORMAT = "%Y%m%d_user_log.jsonl"
+LEGACY_LOG_FILE_FORMAT = "%Y%m%d_user_log.json"
+
+def get_log_file_path(logs_dir, date_obj):
+    return os.path.join(logs_dir, date_obj.strftime(LOG_FILE_FORMAT))
+
+def _open_locked(log_path):
+    """
+    追記用にファイルを開いて排他ロックを取得する。ロック待ちの間に移行処理でファイルが
+    置き換えられていた場合は、新しいファイルを開き直す。
+    """
+    while True:
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.path.samestat(os.fstat(fd), os.stat(log_path)):
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+def _close_locked(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+def append_entry(log_path, entry):
+    """
+    1件のエントリを1行のJSONとして追記する。1回の write で書き込むため、複数のプロセスが
+    同時に追記しても行が混ざらない。
+    """
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+    fd = _open_locked(log_path)
+    try:
+        os.write(fd, line)
+    finally:
+        _close_locked(fd)
+
+def iter_entries(log_path, start_offset=0):
+    """
+    ログを先頭 (または start_offset) から1行ずつ読み、(エントリ, 次の行の開始バイト位置) を返す。
+    書き込み途中 (改行で終わらない) の最終行と壊れた行は飛ばす。
+    """
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, "rb") as f:
+        f.seek(start_offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(raw)
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping malformed line in {log_path}", file=sys.stderr)
+                continue
+            yield entry, f.tell()
+
+def migrate_legacy_log(legacy_path):
+    """
+    JSON配列形式の旧ログを JSON lines 形式に変換する。移行前に追記されたエントリがあれば、
+    旧ログのエントリの後ろに残す。変換後、旧ログは .migrated を付けて残す。
+    """
+    log_path = os.path.splitext(legacy_path)[0] + ".jsonl"
+    fd = _open_locked(log_path)
+    try:
+        if not os.path.exists(legacy_path): # 別のプロセスが移行済み
+            return log_path
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        with open(log_path, "rb") as f:
+            appended = f.read()
+
+        tmp_path = f"{log_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            for entry in entries:
+                f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            f.write(appended)
+        os.replace(tmp_path, log_path) # ロック待ちの追記は新しいファイルを開き直す
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        print(f"--- ログを JSON lines 形式に移行しました: {log_path} ({len(entries)} 件) ---")
+    finally:
+        _close_locked(fd)
+    return log_path
+
+def migrate_logs_dir(logs_dir=DEFAULT_LOGS_DIR):
+    """
+    ディレクトリ内のすべての旧形式の日次ログを移行する。
+    """
+    migrated = []
+    for legacy_path in sorted(glob.glob(os.path.join(logs_dir, "*_user_log.json"))):
+        try:
+            migrated.append(migrate_legacy_log(legacy_path))
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"エラー: ログの移行に失敗しました: {legacy_path}: {e}", file=sys.stderr)
+    return migrated
+
+if __name__ == "__main__":
+    migrate_logs_dir(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOGS_DIR)
@@ -5,8 +5,15 @@ import argparse
 import os
 import sys
 import json
+import subprocess
+from datetime import datetime
 from utils import logger
 from utils.config_utils import merge_configs
+from utils.config_schema import ConfigError, ConfigSchema, parse_value
+from utils.resource_monitor import ResourceMonitor, format_summary
+from utils.execution_supervisor import AgentTimeoutError, ExecutionCancelled, deadline, resolve_timeout
+from utils.user_log import append_entry
+from utils import job_queue, job_cluster
 
 # プロジェクトルートを定義
 PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -23,10 +30,38 @@ DEFAULT_FRAMEWORK_CONFIG = {
         "file": "yggdrasil.log"
     },
     "agent_execution": {
-        "timeout_seconds": 60
+        "timeout_seconds": None, # エージェントの既定の制限時間 (秒)。None または 0 で無制限 (既定)
+        "agent_timeouts": {} # エージェントごとの制限時間 (例: {"model_trainer": 3600})。エージェントの TIMEOUT_SECONDS より優先
+    },
+    # エージェント実行中のプロセスツリーのCPU時間・ピークRSS・I/Oを /proc から計測する
+    "resource_monitor": {
+        "enabled": True,
+        "interval_seconds": 0.5,
+        "timeseries": False, # True の場合はサンプルごとの時系列も usage_log に記録する
+        "usage_log": None # 例: "agent_resource_usage.jsonl" (logs/ 以下に1実行1行のJSONで追記)
+    },
+    # submit/status/cancel/scheduler コマンドで使うジョブキューとスケジューラ
+    "job_scheduler": {
+        "db_path": None, # None の場合は data/jobs/job_queue.sqlite
+        "log_dir": None, # None の場合は logs/jobs (ジョブごとに <ジョブID>.log)
+        "cpu_slots": None, # 同時に使うCPUスロットの数。None の場合はCPUコア数
+        "memory_budget_mb": None, # 実行中のジョブのメモリ (申告値) の合計の上限。None の場合は物理メモリの80%、0 の場合は無制限
+        "poll_interval_seconds": 1.0,
+        "retry_backoff_seconds": 30 # 失敗したジョブを再実行するまでの待ち時間 (試行ごとに2倍)
+    },
+    # coordinator/worker コマンドで、キューのジョブを他のホストのワーカーで実行する
+    "cluster": {
+        "host": "127.0.0.1", # コーディネーターが待ち受けるアドレス。他のホストからの接続を受け付ける場合 (例: 0.0.0.0) は token が必要
+        "port": 7733,
+        "lease_seconds": 30, # この時間ワーカーから応答がなければジョブを再投入する
+        "token": None, # ワーカーの登録に必要な共有トークン。None の場合は環境変数 YGGDRASIL_CLUSTER_TOKEN (未設定なら認証なし)
+        "artifact_dir": None # None の場合は data/jobs/artifacts (ジョブごとに <ジョブID>/)
     }
 }
 
+# エージェント名の代わりに指定できる、ジョブキューを操作するコマンド
+JOB_COMMANDS = ("submit", "status", "cancel", "scheduler", "coordinator", "worker")
+
 # 設定ファイルをロードする関数
 def load_config():
     config_path = os.path.join(CONFIG_DIR, "framework_config.json")
@@ -54,7 +89,9 @@ def load_agent_config(agent_name):
         return {}
 
 # コマンドライン引数から設定をパースするヘルパー関数
-def parse_set_args(set_args):
+# schema を指定した場合、スキーマの項目の値は文字列のまま残し、項目の型に合わせてスキーマが変換する
+# (文字列の項目で "0123" や "12e45" のような値が数値として解釈されないようにする)
+def parse_set_args(set_args, schema=None):
     parsed_config = {}
     for arg in set_args:
         if '=' not in arg:
@@ -65,16 +102,8 @@ def parse_set_args(set_args):
         current_dict = parsed_config
         for i, k in enumerate(keys):
             if i == len(keys) - 1:
-                if value.lower() == 'true':
-                    current_dict[k] = True
-                elif value.lower() == 'false':
-                    current_dict[k] = False
-                elif value.isdigit():
-                    current_dict[k] = int(value)
-                elif value.replace('.', '', 1).isdigit():
-                    current_dict[k] = float(value)
-                else:
-                    current_dict[k] = value
+                # 負数・指数表記 (例: 1e-5)・リスト ("[a, b]") も型付きの値に変換する
+                current_dict[k] = value if schema is not None and len(keys) == 1 and k in schema else parse_value(value)
             else:
                 if k not in current_dict:
                     current_dict[k] = {}
@@ -84,41 +113,254 @@ def parse_set_args(set_args):
                 current_dict = current_dict[k]
     return parsed_config
 
+# エージェント実行中のリソース使用量の計測を開始する関数
+def start_resource_monitor(framework_config):
+    monitor_config = merge_configs(DEFAULT_FRAMEWORK_CONFIG["resource_monitor"], framework_config.get("resource_monitor", {}))
+    if not monitor_config["enabled"]:
+        return None
+    return ResourceMonitor(interval=monitor_config["interval_seconds"], keep_timeseries=monitor_config["timeseries"]).start()
+
+def log_resource_usage(agent_name, monitor, framework_config, status):
+    """
+    エージェントのリソース使用量をログに出力し、usage_log が設定されていればJSON linesで記録する。
+    """
+    usage = monitor.stop()
+    logger.info(f"--- エージェント '{agent_name}' のリソース使用量: {format_summary(usage)} ---")
+    usage_log = framework_config.get("resource_monitor", {}).get("usage_log")
+    if usage_log:
+        usage_log_path = usage_log if os.path.isabs(usage_log) else os.path.join(LOGS_DIR, usage_log)
+        try:
+            append_entry(usage_log_path, {"timestamp": datetime.now().isoformat(timespec="seconds"), "agent": agent_name, "status": status, **usage})
+        except OSError as e:
+            logger.warning(f"リソース使用量の記録に失敗しました: {usage_log_path}: {e}")
+
+# エージェントの設定 (DEFAULT_CONFIG, 設定ファイル, --agent-set) をマージして検証する関数
+def resolve_agent_config(agent_module, agent_config_from_file, args):
+    """
+    (最終的な設定, エージェントに渡す残りの引数) を返す。エージェントが CONFIG_SCHEMA を宣言していれば
+    実行 (と重いライブラリのインポート) の前に設定を検証し、不正な場合は ConfigError を送出する。
+    """
+    default_agent_config = getattr(agent_module, 'DEFAULT_CONFIG', {})
+
+    agent_parser = argparse.ArgumentParser(add_help=False)
+    agent_parser.add_argument('--agent-set', action='append', default=[], help='エージェント固有の設定を KEY=VALUE 形式で上書き')
+    parsed_agent_args, remaining_agent_args = agent_parser.parse_known_args(args)
+    schema = getattr(agent_module, 'CONFIG_SCHEMA', None)
+    schema = schema if isinstance(schema, ConfigSchema) else None
+    agent_config_from_cli = parse_set_args(parsed_agent_args.agent_set, schema)
+
+    final_agent_config = merge_configs(default_agent_config, agent_config_from_file, agent_config_from_cli)
+    if schema is not None:
+        final_agent_config = schema.resolve(final_agent_config)
+    return final_agent_config, remaining_agent_args
+
 # エージェントを実行する関数
 def run_agent(agent_name, args, framework_config):
     agent_path = os.path.join(AGENTS_DIR, f"{agent_name}.py")
     if not os.path.exists(agent_path):
         logger.error(f"エージェント '{agent_name}' が見つかりません。")
-        return
+        return "error"
 
     agent_config_from_file = load_agent_config(agent_name)
     sys.path.insert(0, AGENTS_DIR)
+    monitor = None
+    status = "ok" # 実行結果: ok, error, timeout, cancelled
 
     try:
         agent_module = __import__(agent_name)
-        default_agent_config = getattr(agent_module, 'DEFAULT_CONFIG', {})
-
-        agent_parser = argparse.ArgumentParser(add_help=False)
-        agent_parser.add_argument('--agent-set', action='append', default=[], help='エージェント固有の設定を KEY=VALUE 形式で上書き')
-        parsed_agent_args, remaining_agent_args = agent_parser.parse_known_args(args)
-        agent_config_from_cli = parse_set_args(parsed_agent_args.agent_set)
-
-        final_agent_config = merge_configs(default_agent_config, agent_config_from_file, agent_config_from_cli)
+        final_agent_config, remaining_agent_args = resolve_agent_config(agent_module, agent_config_from_file, args)
 
         logger.info(f"--- エージェント '{agent_name}' を実行中 ---")
         if hasattr(agent_module, 'main') and callable(agent_module.main):
-            agent_module.main(remaining_agent_args, final_agent_config)
+            timeout = resolve_timeout(agent_name, agent_module, framework_config)
+            monitor = start_resource_monitor(framework_config)
+            with deadline(timeout) as token:
+                agent_module.main(remaining_agent_args, final_agent_config)
+            if token.cancelled: # 制限時間後のキャンセルに応じてエージェントが自ら終了した
+                status = "timeout"
+                logger.error(f"エラー: エージェント '{agent_name}' が制限時間 ({timeout}秒) を超えたため停止しました。")
         else:
             logger.warning(f"警告: エージェント '{agent_name}' に 'main' 関数が見つからないか、呼び出し可能ではありません。")
     except ImportError:
+        status = "error"
         logger.error(f"エラー: エージェント '{agent_name}' のインポートに失敗しました。")
+    except ConfigError as e:
+        status = "error"
+        logger.error(f"エラー: エージェント '{agent_name}' の設定が不正です:\n{e}")
+    except AgentTimeoutError:
+        status = "timeout"
+        logger.error(f"エラー: エージェント '{agent_name}' が制限時間 ({timeout}秒) を超えたため中断しました。")
+    except ExecutionCancelled as e:
+        status = "cancelled"
+        logger.error(f"エラー: エージェント '{agent_name}' の実行がキャンセルされました: {e}")
+    except SystemExit as e:
+        # エージェントが sys.exit で終了した場合も、完了とリソース使用量を記録して終了コードで結果を返す
+        if e.code not in (0, None):
+            status = "error"
+            logger.error(f"エラー: エージェント '{agent_name}' が終了コード {e.code} で終了しました。")
     except Exception as e:
+        status = "error"
         logger.error(f"エラー: エージェント '{agent_name}' の実行中に例外が発生しました: {str(e)}")
     finally:
         if AGENTS_DIR in sys.path:
             sys.path.remove(AGENTS_DIR)
 
     logger.info(f"--- エージェント '{agent_name}' の実行が完了しました ---")
+    if monitor:
+        log_resource_usage(agent_name, monitor, framework_config, status)
+    return status
+
+def _job_paths(framework_config):
+    scheduler_config = merge_configs(DEFAULT_FRAMEWORK_CONFIG["job_scheduler"], framework_config.get("job_scheduler", {}))
+    db_path = scheduler_config["db_path"] or job_queue.DEFAULT_DB_PATH
+    log_dir = scheduler_config["log_dir"] or job_queue.DEFAULT_LOG_DIR
+    resolve = lambda path: path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+    return scheduler_config, resolve(db_path), resolve(log_dir)
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%m-%d %H:%M:%S") if timestamp else "-"
+
+def _log_job(job, detail=False):
+    logger.info(f"{job['id']:>5}  {job['status']:<10} 優先度 {job['priority']:>3}  CPU {job['cpu_slots']:>2}  メモリ {job['memory_mb']:>6}MB"
+                f"  試行 {job['attempts']}/{job['max_retries'] + 1}  投入 {_format_time(job['submitted_at'])}  {job['agent']}"
+                + (f"  ({job['message']})" if job["message"] else ""))
+    if detail:
+        logger.info(f"  コマンド: {' '.join([*job['framework_args'], job['agent'], *job['agent_args']])}")
+        logger.info(f"  開始: {_format_time(job['started_at'])}  終了: {_format_time(job['finished_at'])}  リターンコード: {job['returncode']}")
+        if job["worker"]:
+            logger.info(f"  ワーカー: {job['worker']}")
+        if job["log_path"]:
+            logger.info(f"  ログ: {job['log_path']}")
+        if job["artifacts"]:
+            logger.info(f"  アーティファクト: {', '.join(job['artifacts'])}")
+        if job["usage"]:
+            logger.info(f"  リソース使用量: {format_summary(job['usage'])}")
+
+# ジョブキューを操作するコマンドを実行する関数 (終了コードを返す)
+def run_job_command(command, args, set_args, framework_config):
+    scheduler_config, db_path, log_dir = _job_paths(framework_config)
+    cluster_config = merge_configs(DEFAULT_FRAMEWORK_CONFIG["cluster"], framework_config.get("cluster", {}))
+    cluster_token = cluster_config["token"] or os.environ.get("YGGDRASIL_CLUSTER_TOKEN")
+    parser = argparse.ArgumentParser(prog=f"yggdrasil.py {command}")
+    if command == "submit":
+        parser.add_argument("--priority", type=int, default=0, help="優先度 (大きいほど先に実行)")
+        parser.add_argument("--cpus", type=int, default=1, help="ジョブが使うCPUスロットの数")
+        parser.add_argument("--memory-mb", type=int, default=0, help="ジョブが使うメモリの見積もり (MB)")
+        parser.add_argument("--retries", type=int, default=0, help="失敗した場合に再実行する回数")
+        parser.add_argument("--retry-backoff", type=float, default=scheduler_config["retry_backoff_seconds"], help="再実行までの待ち時間 (秒、試行ごとに2倍)")
+        parser.add_argument("--artifact", action="append", default=[], help="ワーカーで実行した場合にコーディネーターに回収するファイル (複数指定可)")
+        parser.add_argument("agent", help="実行するエージェントの名前")
+        parser.add_argument("agent_args", nargs=argparse.REMAINDER, help="エージェントの引数 (--agent-set KEY=VALUE など)")
+    elif command == "status":
+        parser.add_argument("job_ids", nargs="*", type=int, help="詳細を表示するジョブID")
+        parser.add_argument("--all", action="store_true", help="終了したジョブもすべて表示する")
+        parser.add_argument("--limit", type=int, default=20, help="表示するジョブの数 (--all を指定しない場合)")
+    elif command == "cancel":
+        parser.add_argument("job_ids", nargs="+", type=int, help="キャンセルするジョブID")
+    elif command == "coordinator":
+        parser.add_argument("--host", default=cluster_config["host"], help="待ち受けるアドレス")
+        parser.add_argument("--port", type=int, default=cluster_config["port"], help="待ち受けるポート")
+        parser.add_argument("--lease-seconds", type=float, default=cluster_config["lease_seconds"], help="ワーカーの応答が途絶えてからジョブを再投入するまでの時間 (秒)")
+    elif command == "worker":
+        parser.add_argument("--coordinator", required=True, help="コーディネーターのアドレス (HOST:PORT)")
+        parser.add_argument("--cpus", type=int, default=scheduler_config["cpu_slots"], help="このワーカーが使うCPUスロットの数 (省略時はCPUコア数)")
+        parser.add_argument("--memory-mb", type=int, default=scheduler_config["memory_budget_mb"], help="このワーカーのメモリ予算 (MB、省略時は物理メモリの80%%、0 で無制限)")
+        parser.add_argument("--worker-id", help="ワーカーID (省略時は <ホスト名>-<PID>)")
+    else:
+        parser.add_argument("--detach", action="store_true", help="端末から切り離してバックグラウンドで実行する")
+        parser.add_argument("--drain", action="store_true", help="待機中・実行中のジョブがなくなったら終了する")
+    parsed = parser.parse_args(args)
+
+    if command == "scheduler" and parsed.detach:
+        # 新しいセッションで起動するため、端末を閉じてもスケジューラは停止しない
+        os.makedirs(log_dir, exist_ok=True)
+        scheduler_log = os.path.join(log_dir, "scheduler.log")
+        framework_args = [arg for value in set_args for arg in ("--set", value)]
+        with open(scheduler_log, "a", encoding="utf-8") as log_file:
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__), *framework_args, "scheduler"] + (["--drain"] if parsed.drain else []),
+                                       stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT, cwd=PROJECT_ROOT, start_new_session=True)
+        logger.info(f"スケジューラをバックグラウンドで開始しました (PID {process.pid})。ログ: {scheduler_log}")
+        return 0
+
+    if command == "worker":
+        # ワーカーはキューに直接アクセスせず、コーディネーターからジョブを受け取る
+        host, port = job_cluster.parse_address(parsed.coordinator, cluster_config["port"])
+        worker = job_cluster.Worker(host, port, worker_id=parsed.worker_id, cpu_slots=parsed.cpus, memory_mb=parsed.memory_mb,
+                                    token=cluster_token, poll_interval=scheduler_config["poll_interval_seconds"])
+        job_cluster.run_until_signalled(worker, worker.run())
+        return 0
+
+    with job_queue.JobQueue(db_path) as queue:
+        if command == "submit":
+            if not os.path.exists(os.path.join(AGENTS_DIR, f"{parsed.agent}.py")):
+                logger.error(f"エージェント '{parsed.agent}' が見つかりません。")
+                return 1
+            # 不正な設定のジョブは、キューで順番を待ってから失敗しないよう投入時に拒否する
+            sys.path.insert(0, AGENTS_DIR)
+            try:
+                resolve_agent_config(__import__(parsed.agent), load_agent_config(parsed.agent), parsed.agent_args)
+            except ConfigError as e:
+                logger.error(f"エラー: エージェント '{parsed.agent}' の設定が不正です:\n{e}")
+                return 1
+            except ImportError:
+                pass # このホストでインポートできないエージェントは、実行するワーカーで検証する
+            finally:
+                sys.path.remove(AGENTS_DIR)
+            try:
+                job_id = queue.submit(parsed.agent, parsed.agent_args, [arg for value in set_args for arg in ("--set", value)],
+                                      priority=parsed.priority, cpu_slots=parsed.cpus, memory_mb=parsed.memory_mb,
+                                      max_retries=parsed.retries, retry_backoff_seconds=parsed.retry_backoff, artifacts=parsed.artifact)
+            except ValueError as e:
+                logger.error(f"エラー: {e}")
+                return 1
+            logger.info(f"ジョブ {job_id} ({parsed.agent}) をキューに追加しました。")
+        elif command == "status":
+            if parsed.job_ids:
+                for job_id in parsed.job_ids:
+                    job = queue.get(job_id)
+                    if job is None:
+                        logger.warning(f"ジョブ {job_id} が見つかりません。")
+                    else:
+                        _log_job(job, detail=True)
+            else:
+                active = queue.list_jobs([job_queue.RUNNING, job_queue.QUEUED])
+                finished = queue.list_jobs(job_queue.FINISHED_STATES, limit=None if parsed.all else parsed.limit)
+                logger.info(f"実行中 {sum(job['status'] == job_queue.RUNNING for job in active)} 件, 待機中 {sum(job['status'] == job_queue.QUEUED for job in active)} 件")
+                for job in active + finished:
+                    _log_job(job)
+        elif command == "cancel":
+            for job_id in parsed.job_ids:
+                result = queue.cancel(job_id)
+                if result is None:
+                    logger.warning(f"ジョブ {job_id} は存在しないか、すでに終了しています。")
+                elif result == job_queue.CANCELLED:
+                    logger.info(f"ジョブ {job_id} をキャンセルしました。")
+                else:
+                    logger.info(f"ジョブ {job_id} は実行中のため、スケジューラに停止を依頼しました。")
+        elif command == "coordinator":
+            # ローカルのスケジューラと同時に動かすと、互いに相手の実行中のジョブを再投入してしまうため同じロックを使う
+            artifact_dir = cluster_config["artifact_dir"] or job_cluster.DEFAULT_ARTIFACT_DIR
+            try:
+                coordinator = job_cluster.Coordinator(queue, parsed.host, parsed.port, parsed.lease_seconds, log_dir=log_dir,
+                                                      artifact_dir=artifact_dir if os.path.isabs(artifact_dir) else os.path.join(PROJECT_ROOT, artifact_dir),
+                                                      token=cluster_token)
+            except ValueError as e:
+                logger.error(f"エラー: {e}")
+                return 1
+            lock_file = job_queue.lock_queue(queue)
+            if lock_file is None:
+                logger.error(f"エラー: このキューのスケジューラまたはコーディネーターはすでに実行中です: {db_path}")
+                return 1
+            with lock_file:
+                job_cluster.run_until_signalled(coordinator, coordinator.serve())
+        else:
+            scheduler = job_queue.Scheduler(queue, cpu_slots=scheduler_config["cpu_slots"], memory_budget_mb=scheduler_config["memory_budget_mb"],
+                                            log_dir=log_dir, poll_interval=scheduler_config["poll_interval_seconds"])
+            if not scheduler.acquire_lock():
+                logger.error(f"エラー: このキューのスケジューラまたはコーディネーターはすでに実行中です: {db_path}")
+                return 1
+            scheduler.run_forever(drain=parsed.drain)
+    return 0
 
 def main():
     framework_parser = argparse.ArgumentParser(add_help=False)
@@ -130,11 +372,18 @@ def main():
     framework_config_from_cli = parse_set_args(known_args.set)
     final_framework_config = merge_configs(DEFAULT_FRAMEWORK_CONFIG, framework_config_from_file, framework_config_from_cli)
 
-    if known_args.agent:
-        run_agent(known_args.agent, agent_args, final_framework_config)
+    if known_args.agent in JOB_COMMANDS:
+        sys.exit(run_job_command(known_args.agent, agent_args, known_args.set, final_framework_config))
+    elif known_args.agent:
+        status = run_agent(known_args.agent, agent_args, final_framework_config)
+        # スケジューラや他のエージェントが失敗を検知できるよう、終了コードで結果を返す
+        if status in ("error", "timeout", "cancelled"):
+            sys.exit(1)
     else:
         logger.info("Yggdrasil Agent Framework")
         logger.info("使用方法: python3 yggdrasil.py <agent_name> [agent_args...] [--set KEY=VALUE] [--agent-set KEY=VALUE]")
+        logger.info("ジョブキュー: python3 yggdrasil.py {submit [options] <agent_name> [agent_args...] | status [job_id...] | cancel <job_id...> | scheduler [--detach] [--drain]}")
+        logger.info("分散実行: python3 yggdrasil.py {coordinator [--port PORT] | worker --coordinator HOST:PORT [--cpus N]}")
         logger.info("")
         logger.info("利用可能なエージェント:")
         for f in os.listdir(AGENTS_DIR):